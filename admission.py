@@ -0,0 +1,212 @@
+"""
+Общее состояние воркеров uvicorn в локальном SQLite (WAL).
+
+Несколько процессов сервиса делят один файл: глобальный лимит одновременных
+исходящих звонков (слоты с арендой), token bucket на пассажира и окно
+дедупликации SOS. Каждая проверка - один атомарный SQL-оператор, поэтому
+процессы не могут одновременно занять один и тот же слот или токен.
+"""
+import asyncio
+import sqlite3
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Optional, Tuple
+
+from metrics import STAGE_LATENCY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS call_slots (
+    provider TEXT NOT NULL,
+    token TEXT NOT NULL,
+    lease_until REAL NOT NULL,
+    PRIMARY KEY (provider, token)
+);
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sos_window (
+    key TEXT PRIMARY KEY,
+    incident_id TEXT NOT NULL,
+    severity INTEGER NOT NULL,
+    call_id TEXT,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Как часто чистить просроченные записи окна SOS и корзин
+CLEANUP_EVERY = 1000
+
+
+class CallQuotaExceeded(Exception):
+    pass
+
+
+class AdmissionControl:
+    def __init__(self, path: str, slot_lease: float = 30.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.slot_lease = slot_lease
+        self.clock = clock
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._writes = 0
+
+    def open(self) -> None:
+        if self._db is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="admission")
+        self._executor.submit(self._connect).result()
+
+    def _connect(self) -> None:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # busy_timeout первым: воркеры открывают файл одновременно при старте
+        db.execute("PRAGMA busy_timeout=5000")
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        self._db = db
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await self._run(self._db.close)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._db = None
+
+    async def _run(self, fn, *args):
+        if self._db is None:
+            self.open()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # --- Лимит одновременных звонков на провайдера (общий для всех воркеров) ---
+
+    async def acquire_call_slot(self, provider: str, limit: int, timeout: float) -> str:
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        # Уведомлений между процессами нет - ждём освобождения слота с экспоненциальной паузой
+        while not await self._run(self._try_acquire, provider, token, limit):
+            if time.monotonic() >= deadline:
+                raise CallQuotaExceeded(f"{provider}: {limit} concurrent calls already in progress")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return token
+
+    def _try_acquire(self, provider: str, token: str, limit: int) -> bool:
+        now = self.clock()
+        self._db.execute("DELETE FROM call_slots WHERE provider = ? AND lease_until <= ?", (provider, now))
+        cursor = self._db.execute(
+            "INSERT INTO call_slots (provider, token, lease_until) "
+            "SELECT ?, ?, ? WHERE (SELECT COUNT(*) FROM call_slots WHERE provider = ?) < ?",
+            (provider, token, now + self.slot_lease, provider, limit),
+        )
+        return cursor.rowcount == 1
+
+    async def release_call_slot(self, provider: str, token: str) -> None:
+        await self._run(self._release, provider, token)
+
+    def _release(self, provider: str, token: str) -> None:
+        self._db.execute("DELETE FROM call_slots WHERE provider = ? AND token = ?", (provider, token))
+
+    async def calls_in_progress(self, provider: str) -> int:
+        return await self._run(self._count_slots, provider)
+
+    def _count_slots(self, provider: str) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM call_slots WHERE provider = ? AND lease_until > ?", (provider, self.clock())
+        ).fetchone()[0]
+
+    @asynccontextmanager
+    async def call_slot(self, provider: str, limit: int, timeout: float):
+        if limit <= 0:
+            yield
+            return
+        started = time.perf_counter()
+        token = await self.acquire_call_slot(provider, limit, timeout)
+        STAGE_LATENCY.observe(time.perf_counter() - started, "call_slot", provider)
+        try:
+            yield
+        finally:
+            # Если процесс упадёт до освобождения, слот вернётся по истечении аренды
+            await self.release_call_slot(provider, token)
+
+    # --- Token bucket на пассажира ---
+
+    async def take_token(self, key: str, per_second: float, burst: float) -> float:
+        """Возвращает 0, если токен выдан, иначе сколько секунд ждать следующего"""
+        return await self._run(self._take_token, key, per_second, burst)
+
+    def _take_token(self, key: str, per_second: float, burst: float) -> float:
+        now = self.clock()
+        self._maybe_cleanup(now)
+        refill = "MIN(:burst, rate_buckets.tokens + (:now - rate_buckets.updated_at) * :rate)"
+        row = self._db.execute(
+            "INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (:key, :burst - 1, :now) "
+            f"ON CONFLICT (key) DO UPDATE SET tokens = {refill} - 1, updated_at = :now "
+            f"WHERE {refill} >= 1 RETURNING tokens",
+            {"key": key, "burst": burst, "now": now, "rate": per_second},
+        ).fetchone()
+        if row is not None:
+            return 0.0
+        tokens, updated_at = self._db.execute(
+            "SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)
+        ).fetchone()
+        available = min(burst, tokens + (now - updated_at) * per_second)
+        return max((1 - available) / per_second, 0.001) if per_second > 0 else float("inf")
+
+    # --- Окно дедупликации SOS, общее для воркеров ---
+
+    @staticmethod
+    def sos_key(key: tuple) -> str:
+        return "|".join("" if part is None else str(part) for part in key)
+
+    async def claim_sos(self, key: tuple, incident_id: str, severity: int, ttl: float) -> Tuple[str, int, Optional[str]]:
+        """Занимает окно SOS; возвращает владельца окна (incident_id, severity, call_id)"""
+        return await self._run(self._claim_sos, self.sos_key(key), incident_id, severity, ttl)
+
+    def _claim_sos(self, key: str, incident_id: str, severity: int, ttl: float) -> Tuple[str, int, Optional[str]]:
+        now = self.clock()
+        self._maybe_cleanup(now)
+        # Запись заменяется, только если окно истекло или тяжесть выросла
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute(
+                "INSERT INTO sos_window (key, incident_id, severity, call_id, expires_at) VALUES (?, ?, ?, NULL, ?) "
+                "ON CONFLICT (key) DO UPDATE SET incident_id = excluded.incident_id, severity = excluded.severity, "
+                "call_id = NULL, expires_at = excluded.expires_at "
+                "WHERE sos_window.expires_at <= ? OR excluded.severity > sos_window.severity",
+                (key, incident_id, severity, now + ttl, now),
+            )
+            row = self._db.execute(
+                "SELECT incident_id, severity, call_id FROM sos_window WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            self._db.execute("COMMIT")
+        return row
+
+    async def record_sos_call(self, key: tuple, incident_id: str, call_id: Optional[str]) -> None:
+        await self._run(self._record_sos_call, self.sos_key(key), incident_id, call_id)
+
+    def _record_sos_call(self, key: str, incident_id: str, call_id: Optional[str]) -> None:
+        self._db.execute("UPDATE sos_window SET call_id = ? WHERE key = ? AND incident_id = ?",
+                         (call_id, key, incident_id))
+
+    def forget_sos(self, key: tuple, incident_id: str) -> Future:
+        # Вызывается из синхронных колбэков очереди - не ждём завершения
+        if self._db is None:
+            self.open()
+        return self._executor.submit(self._forget_sos, self.sos_key(key), incident_id)
+
+    def _forget_sos(self, key: str, incident_id: str) -> None:
+        self._db.execute("DELETE FROM sos_window WHERE key = ? AND incident_id = ?", (key, incident_id))
+
+    def _maybe_cleanup(self, now: float) -> None:
+        self._writes += 1
+        if self._writes % CLEANUP_EVERY:
+            return
+        self._db.execute("DELETE FROM sos_window WHERE expires_at <= ?", (now,))
+        # Корзина, простоявшая сутки, наверняка снова полная - хранить её незачем
+        self._db.execute("DELETE FROM rate_buckets WHERE updated_at <= ?", (now - 86400,))
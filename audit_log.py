@@ -0,0 +1,298 @@
+"""
+Журнал аудита SOS: append-only сегменты на диске.
+
+Каждая запись кадрируется как длина + CRC32 + время + JSON, поэтому хвост,
+оборванный падением процесса, распознаётся и отбрасывается при чтении.
+Горячий путь только кладёт запись в буфер; фоновый писатель сбрасывает
+буфер пачкой и делает fsync по времени или объёму. Каждый процесс пишет
+в свой сегмент, поэтому воркеры uvicorn делят каталог без блокировок.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from metrics import AUDIT_DROPPED, AUDIT_FLUSH_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Заголовок кадра: длина JSON, CRC32 JSON, время записи
+HEADER = struct.Struct("<IId")
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".log"
+
+_sync = getattr(os, "fdatasync", os.fsync)
+
+
+def encode_record(timestamp: float, record: dict) -> bytes:
+    payload = json.dumps(record, separators=(",", ":"), default=str).encode()
+    return HEADER.pack(len(payload), zlib.crc32(payload), timestamp) + payload
+
+
+def segment_name(seq: int) -> str:
+    return f"{SEGMENT_PREFIX}{seq:010d}{SEGMENT_SUFFIX}"
+
+
+def segment_paths(directory: str) -> List[str]:
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in sorted(names)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+
+
+def _segment_seq(path: str) -> int:
+    return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def _needle(field: str, value: str) -> bytes:
+    # Записи сериализуются без пробелов, так что поле ищется как подстрока до разбора JSON
+    return f'"{field}":{json.dumps(value)}'.encode()
+
+
+class AuditLog:
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, flush_interval: float = 0.2,
+                 flush_bytes: int = 256 * 1024, max_pending: int = 100000, retention: float = 0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        # Если диск не успевает, новые записи отбрасываются, а не раздувают память процесса
+        self.max_pending = max_pending
+        # 0 - хранить сегменты вечно, иначе удалять не изменявшиеся дольше retention секунд
+        self.retention = retention
+        self.segment: Optional[str] = None
+        self._fd: Optional[int] = None
+        self._size = 0
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._closing = False
+        self._listeners: List[Callable[[dict], object]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def add_listener(self, callback: Callable[[dict], object]) -> None:
+        # Слушатель вызывается синхронно на каждой записи и не должен блокировать
+        self._listeners.append(callback)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def open(self) -> None:
+        if self._executor is not None or not self.enabled:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit-log")
+        self._executor.submit(self._open_segment).result()
+
+    def start(self) -> None:
+        self.open()
+        if self.enabled:
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._run_writer())
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            # Писатель останавливается флагом: cancel() во время wait_for в Python 3.11 может потеряться
+            self._closing = True
+            self._wakeup.set()
+            await self._writer
+            self._writer = None
+        await self.flush()
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._close_segment)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def append(self, kind: str, incident_id: Optional[str] = None, **fields) -> bool:
+        if not self.enabled and not self._listeners:
+            return False
+        timestamp = time.time()
+        record = dict(fields, kind=kind, incident_id=incident_id)
+        for listener in self._listeners:
+            # Слушатели получают запись и при выключенном журнале
+            listener(dict(record, ts=timestamp))
+        if not self.enabled:
+            return False
+        if len(self._pending) >= self.max_pending:
+            AUDIT_DROPPED.inc()
+            return False
+        frame = encode_record(timestamp, record)
+        self._pending.append(frame)
+        self._pending_bytes += len(frame)
+        if self._pending_bytes >= self.flush_bytes and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        self.open()
+        # Буфер подменяется до await: записи, пришедшие во время fsync, уйдут следующей пачкой
+        batch, self._pending, self._pending_bytes = self._pending, [], 0
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batch)
+
+    async def _run_writer(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except OSError as e:
+                # Диск переполнен или недоступен: пачка потеряна, но SOS продолжают обслуживаться
+                logger.error("Audit log write failed: %s", e)
+
+    def _open_segment(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        existing = segment_paths(self.directory)
+        seq = _segment_seq(existing[-1]) + 1 if existing else 1
+        # Сегмент всегда новый: после падения не дописываем за возможно оборванным хвостом,
+        # а O_EXCL не даёт двум процессам занять один номер
+        while True:
+            path = os.path.join(self.directory, segment_name(seq))
+            try:
+                self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+                break
+            except FileExistsError:
+                seq += 1
+        self.segment = path
+        self._size = 0
+        self._sync_directory()
+
+    def _close_segment(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _sync_directory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _write(self, batch: List[bytes]) -> None:
+        started = time.perf_counter()
+        data = b"".join(batch)
+        if self._size and self._size + len(data) > self.segment_bytes:
+            self._rotate()
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+        _sync(self._fd)
+        self._size += len(data)
+        AUDIT_FLUSH_LATENCY.observe(time.perf_counter() - started)
+
+    def _rotate(self) -> None:
+        self._close_segment()
+        self._open_segment()
+        if self.retention > 0:
+            expired = time.time() - self.retention
+            for path in segment_paths(self.directory):
+                if path != self.segment and os.path.getmtime(path) < expired:
+                    os.remove(path)
+
+
+class AuditReader:
+    """Чтение сегментов через mmap; JSON разбирается только у записей, прошедших фильтр"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # Сегменты, чтение которых остановилось на оборванном или повреждённом кадре
+        self.torn: List[str] = []
+
+    def scan(self, since: Optional[float] = None, until: Optional[float] = None, kind: Optional[str] = None,
+             incident_id: Optional[str] = None) -> Iterator[Tuple[float, bytes]]:
+        needles = [_needle(field, value) for field, value in (("kind", kind), ("incident_id", incident_id))
+                   if value is not None]
+        segments = []
+        for path in segment_paths(self.directory):
+            # mtime сегмента не раньше его последней записи - старые сегменты пропускаем целиком
+            if since is not None and os.path.getmtime(path) < since:
+                continue
+            segments.append(self._read_segment(path, since, until, needles))
+        # Сегменты разных процессов пересекаются по времени - сливаем их по времени записи
+        return heapq.merge(*segments, key=lambda item: item[0])
+
+    def replay(self, since: Optional[float] = None, until: Optional[float] = None, kind: Optional[str] = None,
+               incident_id: Optional[str] = None) -> Iterator[dict]:
+        for timestamp, payload in self.scan(since, until, kind, incident_id):
+            record = json.loads(payload)
+            # Подстрока могла найтись во вложенном поле - сверяем точно
+            if kind is not None and record.get("kind") != kind:
+                continue
+            if incident_id is not None and record.get("incident_id") != incident_id:
+                continue
+            record["ts"] = timestamp
+            yield record
+
+    def _read_segment(self, path: str, since: Optional[float], until: Optional[float],
+                      needles: List[bytes]) -> Iterator[Tuple[float, bytes]]:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                offset = 0
+                header_size = HEADER.size
+                while offset + header_size <= size:
+                    length, crc, timestamp = HEADER.unpack_from(mm, offset)
+                    start = offset + header_size
+                    end = start + length
+                    if end > size:
+                        break
+                    # Записи сегмента идут по времени: после until читать дальше незачем
+                    if until is not None and timestamp > until:
+                        return
+                    # Отфильтрованные записи не копируются и не проверяются по CRC - их не отдаём
+                    if (since is not None and timestamp < since) or \
+                            not all(mm.find(needle, start, end) >= 0 for needle in needles):
+                        offset = end
+                        continue
+                    payload = mm[start:end]
+                    if zlib.crc32(payload) != crc:
+                        break
+                    offset = end
+                    yield timestamp, payload
+                if offset != size:
+                    # Хвост, оборванный падением, или запись, которую процесс дописывает прямо сейчас
+                    self.torn.append(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print audit log records as NDJSON")
+    parser.add_argument("directory", nargs="?", default=os.getenv("AUDIT_LOG_DIR", "audit_log"))
+    parser.add_argument("--incident", help="only records of this incident")
+    parser.add_argument("--kind", help="only records of this kind (sos_received, call_placed, ...)")
+    parser.add_argument("--since", type=float, help="unix time")
+    parser.add_argument("--until", type=float, help="unix time")
+    args = parser.parse_args()
+
+    reader = AuditReader(args.directory)
+    for record in reader.replay(args.since, args.until, args.kind, args.incident):
+        sys.stdout.write(json.dumps(record) + "\n")
+    for path in reader.torn:
+        print(f"torn tail ignored: {path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Журнал аудита: цена append на event loop, пропускная способность писателя
+(fsync пачкой против fsync на каждую запись) и скорость чтения сегментов
+через mmap - полный replay, фильтр по инциденту и по окну времени.
+
+    python -m benchmarks.bench_audit_log --records 1000000
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audit_log import AuditLog, AuditReader, segment_paths
+from benchmarks.loadtest import percentile
+
+REQUEST = {"ride_id": "RG-2024-1215-001", "incident_type": "medical_emergency", "severity": "high",
+           "language": "en", "additional_info": None, "passenger_phone": "+15550001111"}
+
+
+async def write(directory: str, records: int, fsync_each: bool) -> tuple:
+    log = AuditLog(directory, segment_bytes=64 * 1024 * 1024, flush_interval=0.05)
+    log.start()
+    latencies = []
+    started = time.perf_counter()
+    for i in range(records):
+        append_started = time.perf_counter()
+        log.append("sos_received", f"inc-{i % 50000:05d}", request=REQUEST, seq=i)
+        latencies.append(time.perf_counter() - append_started)
+        if fsync_each:
+            await log.flush()
+        elif i % 1000 == 0:
+            # Отдаём управление писателю, как это происходит между запросами
+            await asyncio.sleep(0)
+    await log.close()
+    return time.perf_counter() - started, latencies
+
+
+def timed(label: str, fn, total: int) -> None:
+    started = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {count:>8} matched {elapsed:>6.2f}s  {total / elapsed:>10,.0f} records scanned/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--fsync-each-records", type=int, default=500,
+                        help="records written with an fsync per record (slow, kept small)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        each_dir = os.path.join(workdir, "each")
+        elapsed, _ = asyncio.run(write(each_dir, args.fsync_each_records, fsync_each=True))
+        print(f"fsync per record:   {args.fsync_each_records / elapsed:>10,.0f} rec/s")
+
+        batch_dir = os.path.join(workdir, "batch")
+        elapsed, latencies = asyncio.run(write(batch_dir, args.records, fsync_each=False))
+        size = sum(os.path.getsize(path) for path in segment_paths(batch_dir))
+        print(f"batched fsync:      {args.records / elapsed:>10,.0f} rec/s, "
+              f"{size / 1e6:.0f} MB in {len(segment_paths(batch_dir))} segments")
+        print(f"append on event loop: p50 {percentile(latencies, 0.5) * 1e6:.1f}us, "
+              f"p99 {percentile(latencies, 0.99) * 1e6:.1f}us")
+
+        reader = AuditReader(batch_dir)
+        timed("replay (decode every record)", lambda: sum(1 for _ in reader.replay()), args.records)
+        timed("scan headers + CRC, no decode", lambda: sum(1 for _ in reader.scan()), args.records)
+        timed("filter one incident", lambda: sum(1 for _ in reader.replay(incident_id="inc-01234")), args.records)
+        records = reader.replay()
+        first = next(records)["ts"]
+        last = max(os.path.getmtime(path) for path in segment_paths(batch_dir))
+        middle = first + (last - first) * 0.9
+        timed("filter last 10% of time window", lambda: sum(1 for _ in reader.replay(since=middle)), args.records)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Записи звонков: загрузка у фейкового провайдера целиком в память
+(response.content) против потоковой записи кусками в .part, и отдача
+случайных диапазонов через GET /api/recordings.
+
+Считаются МБ/с и пик памяти Python (tracemalloc) во время загрузки.
+
+    python -m benchmarks.bench_call_recordings --recordings 8 --size-mb 32 --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_providers import BackgroundServer, create_fake_recordings_app
+from call_recordings import RecordingFetcher
+
+
+async def buffered(url: str, directory: str, recordings: int, concurrency: int) -> None:
+    # Как качают «в лоб»: тело ответа целиком в памяти, потом одной записью на диск
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def one(i: int):
+            async with semaphore:
+                response = await client.get(f"{url}/recordings/call-{i}.mp3")
+                with open(os.path.join(directory, f"call-{i}.mp3"), "wb") as f:
+                    f.write(response.content)
+
+        await asyncio.gather(*(one(i) for i in range(recordings)))
+
+
+async def streamed(url: str, directory: str, recordings: int, concurrency: int) -> None:
+    fetcher = RecordingFetcher(directory, max_concurrent=concurrency, allowed_hosts=["127.0.0.1"])
+    await fetcher.start()
+    for i in range(recordings):
+        fetcher.enqueue("bland", f"call-{i}", f"{url}/recordings/call-{i}.mp3")
+    await fetcher.wait()
+    await fetcher.close()
+
+
+def measure(label: str, download, url: str, args) -> None:
+    # Скорость и пик памяти меряются отдельными прогонами: tracemalloc сам замедляет загрузку
+    results = []
+    for traced in (False, True):
+        directory = tempfile.mkdtemp()
+        try:
+            if traced:
+                tracemalloc.start()
+            started = time.perf_counter()
+            asyncio.run(download(url, directory, args.recordings, args.concurrency))
+            results.append(time.perf_counter() - started)
+            if traced:
+                results.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+        finally:
+            shutil.rmtree(directory)
+    elapsed, _, peak = results
+    total = args.recordings * args.size_mb
+    print(f"{label:<28} {total / elapsed:>8.1f} MB/s   peak Python memory {peak / 1e6:>8.1f} MB")
+
+
+async def serve_ranges(url: str, size: int, requests: int, range_bytes: int) -> float:
+    rng = random.Random(1)
+    async with httpx.AsyncClient() as client:
+        started = time.perf_counter()
+        for _ in range(requests):
+            start = rng.randrange(0, size - range_bytes)
+            response = await client.get(url, headers={"Range": f"bytes={start}-{start + range_bytes - 1}"})
+            assert response.status_code == 206
+        return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recordings", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--range-requests", type=int, default=500)
+    parser.add_argument("--range-kb", type=int, default=256)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 * 1024
+
+    # Сервер и клиент делят процесс: tracemalloc видит и буферы фейкового провайдера
+    with BackgroundServer(create_fake_recordings_app(size=size)) as provider:
+        measure("buffered (response.content)", buffered, provider.url, args)
+        measure("streamed to .part", streamed, provider.url, args)
+
+    import main as service
+
+    directory = tempfile.mkdtemp()
+    try:
+        service.call_recordings = RecordingFetcher(directory)
+        with BackgroundServer(create_fake_recordings_app(size=size)) as provider:
+            asyncio.run(streamed(provider.url, directory, 1, 1))
+        app = FastAPI()
+        app.add_api_route("/api/recordings/{call_id}", service.get_recording)
+        with BackgroundServer(app) as server:
+            rps = asyncio.run(serve_ranges(server.url + "/api/recordings/call-0", size, args.range_requests,
+                                           args.range_kb * 1024))
+        print(f"{'GET with Range, ' + str(args.range_kb) + ' KB':<28} {rps:>8.0f} req/s "
+              f"({rps * args.range_kb / 1024:.0f} MB/s)")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
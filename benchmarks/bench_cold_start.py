@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Холодный старт: время от запуска процесса uvicorn до первого SOS,
+звонок по которому принят провайдером. Сравнивает старт с прогревом
+соединений к провайдеру и без него (PROVIDER_WARMUP=0).
+
+Фейковый Bland.ai добавляет connect-delay к первому запросу каждого
+соединения - так имитируются DNS и TLS-рукопожатие с api.bland.ai.
+
+    python -m benchmarks.bench_cold_start --runs 3 --connect-delay 0.3
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_providers import BackgroundServer, create_fake_bland_app
+from benchmarks.loadtest import free_port
+
+SOS = {"incident_type": "taxi_service_emergency", "severity": "high"}
+
+
+def cold_start(bland_url: str, warmup: bool, workdir: str) -> dict:
+    port = free_port()
+    env = dict(
+        os.environ,
+        BLAND_API_URL=bland_url,
+        BLAND_API_KEY="bench-key",
+        EMERGENCY_PHONE="+10000000000",
+        INCIDENT_DB_PATH=os.path.join(workdir, f"incidents-{port}.db"),
+        AUDIT_LOG_DIR=os.path.join(workdir, f"audit-{port}"),
+        RECORDINGS_DIR=os.path.join(workdir, f"recordings-{port}"),
+        PROVIDER_WARMUP="1" if warmup else "0",
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        with httpx.Client(base_url=base_url, timeout=10) as client:
+            # Первый SOS отправляется, как только порт начал принимать соединения
+            while True:
+                try:
+                    response = client.post("/api/emergency", json=SOS)
+                    break
+                except httpx.TransportError:
+                    if process.poll() is not None or time.perf_counter() - started > 30:
+                        raise RuntimeError("Service did not start")
+                    time.sleep(0.005)
+            accepted = time.perf_counter()
+            status_url = response.json()["status_url"]
+            while True:
+                incident = client.get(status_url).json()
+                if incident["status"] in ("dispatched", "failed"):
+                    break
+                time.sleep(0.005)
+            return {
+                "accepted": accepted - started,
+                "dispatched": incident["updated_at"] - incident["created_at"] + (accepted - started),
+                "call": incident["updated_at"] - incident["created_at"],
+                "status": incident["status"],
+            }
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Bland.ai response time")
+    parser.add_argument("--connect-delay", type=float, default=0.3, help="simulated DNS + TLS handshake")
+    args = parser.parse_args()
+
+    fake_app = create_fake_bland_app(latency=args.latency, connect_delay=args.connect_delay)
+    with tempfile.TemporaryDirectory() as workdir, BackgroundServer(fake_app) as fake_bland:
+        print(f"{'mode':<10} {'first 202':>10} {'SOS call':>10} {'first call accepted':>21}")
+        for warmup in (False, True):
+            runs = [cold_start(fake_bland.url, warmup, workdir) for _ in range(args.runs)]
+            if any(run["status"] != "dispatched" for run in runs):
+                sys.exit(f"FAIL: first SOS was not dispatched: {runs}")
+            median = {key: statistics.median(run[key] for run in runs) * 1000
+                      for key in ("accepted", "call", "dispatched")}
+            print(f"{'warm' if warmup else 'cold':<10} {median['accepted']:>8.0f}ms {median['call']:>8.0f}ms "
+                  f"{median['dispatched']:>19.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: N одновременных POST /api/emergency против локального фейкового Bland.ai.
+Каждый запрос считается завершённым, когда воркер очереди принял звонок у провайдера.
+
+При блокирующем клиенте время растёт как N * latency, с асинхронным
+пулом - примерно как latency * ceil(N / BLAND_MAX_CONCURRENT_CALLS).
+
+    python -m benchmarks.bench_concurrent_emergency --requests 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_providers import BackgroundServer, create_fake_bland_app
+
+
+async def fire(base_url: str, n: int) -> list:
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        async def one():
+            start = time.perf_counter()
+            response = await client.post("/api/emergency", json={"incident_type": "medical_emergency"})
+            if response.status_code != 202:
+                return response.status_code, time.perf_counter() - start
+            status_url = response.json()["status_url"]
+            while True:
+                incident = (await client.get(status_url)).json()
+                if incident["status"] in ("dispatched", "failed"):
+                    break
+                await asyncio.sleep(0.01)
+            status = 200 if incident["status"] == "dispatched" else 500
+            return status, time.perf_counter() - start
+
+        return await asyncio.gather(*(one() for _ in range(n)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake provider latency, seconds")
+    args = parser.parse_args()
+
+    with BackgroundServer(create_fake_bland_app(args.latency)) as fake_bland:
+        os.environ["BLAND_API_URL"] = fake_bland.url
+        os.environ.setdefault("BLAND_API_KEY", "bench-key")
+        os.environ.setdefault("EMERGENCY_PHONE", "+10000000000")
+        os.environ.setdefault("INCIDENT_WORKERS", str(args.requests))
+        os.environ.setdefault("INCIDENT_DB_PATH", os.path.join(tempfile.mkdtemp(), "incidents.db"))
+        os.environ.setdefault("AUDIT_LOG_DIR", os.path.join(tempfile.mkdtemp(), "audit"))
+        os.environ.setdefault("RECORDINGS_DIR", os.path.join(tempfile.mkdtemp(), "recordings"))
+
+        import main as service
+
+        with BackgroundServer(service.app) as api:
+            # Прогрев: первое соединение к фейковому провайдеру
+            asyncio.run(fire(api.url, 1))
+
+            for n in (1, args.requests // 4 or 1, args.requests):
+                start = time.perf_counter()
+                results = asyncio.run(fire(api.url, n))
+                elapsed = time.perf_counter() - start
+                ok = sum(1 for status, _ in results if status < 300)
+                serial = n * args.latency
+                print(
+                    f"N={n:4d}  ok={ok:4d}  wall={elapsed:6.3f}s  "
+                    f"throughput={n / elapsed:7.1f} req/s  "
+                    f"serialized would be ~{serial:.1f}s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк маршрутизации SOS по диспетчерским центрам: KD-дерево против
+линейного перебора всего реестра.
+
+    python -m benchmarks.bench_dispatch_centers --centers 50000 --queries 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatch_centers import DispatchCenter, DispatchRegistry, haversine_km
+
+
+def generate_centers(count: int, rnd: random.Random) -> list:
+    # Центры группируются вокруг "городов", как в реальном реестре
+    cities = [(rnd.uniform(-55, 65), rnd.uniform(-180, 180)) for _ in range(max(1, count // 50))]
+    centers = []
+    for i in range(count):
+        lat, lng = rnd.choice(cities)
+        centers.append(DispatchCenter(
+            f"DC-{i}", f"Dispatch {i}", f"+1555{i:07d}",
+            lat + rnd.gauss(0, 0.5), (lng + rnd.gauss(0, 0.5) + 180) % 360 - 180,
+            rnd.uniform(5, 40),
+        ))
+    return centers
+
+
+def linear_nearest(centers: list, lat: float, lng: float):
+    return min(centers, key=lambda c: haversine_km(lat, lng, c.lat, c.lng))
+
+
+def linear_jurisdiction(centers: list, lat: float, lng: float):
+    best = None
+    best_distance = float("inf")
+    for center in centers:
+        distance = haversine_km(lat, lng, center.lat, center.lng)
+        if distance <= center.radius_km and distance < best_distance:
+            best, best_distance = center, distance
+    return best
+
+
+def timed(fn, queries: list) -> tuple:
+    start = time.perf_counter()
+    results = [fn(lat, lng) for lat, lng in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--centers", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--linear-queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    centers = generate_centers(args.centers, rnd)
+    # Половина запросов рядом с центрами (городские поездки), половина - где угодно
+    queries = [
+        (c.lat + rnd.gauss(0, 0.1), c.lng + rnd.gauss(0, 0.1)) if i % 2 else (rnd.uniform(-60, 70), rnd.uniform(-180, 180))
+        for i, c in enumerate(rnd.choices(centers, k=args.queries))
+    ]
+
+    start = time.perf_counter()
+    registry = DispatchRegistry(centers)
+    build = time.perf_counter() - start
+
+    nearest_time, nearest = timed(lambda lat, lng: registry.nearest(lat, lng)[0], queries)
+    jurisdiction_time, jurisdiction = timed(
+        lambda lat, lng: (registry.find_jurisdiction(lat, lng) or (None,))[0], queries)
+
+    sample = queries[:args.linear_queries]
+    linear_nearest_time, expected_nearest = timed(lambda lat, lng: linear_nearest(centers, lat, lng), sample)
+    linear_jurisdiction_time, expected_jurisdiction = timed(
+        lambda lat, lng: linear_jurisdiction(centers, lat, lng), sample)
+
+    mismatches = sum(a is not b for a, b in zip(nearest, expected_nearest))
+    mismatches += sum(a is not b for a, b in zip(jurisdiction, expected_jurisdiction))
+
+    print(f"Centers: {args.centers}, index build: {build * 1000:.0f}ms")
+    print(f"{'lookup':<14} {'kd-tree':>12} {'linear':>12} {'speedup':>9}")
+    for name, indexed, linear in (("nearest", nearest_time, linear_nearest_time),
+                                  ("jurisdiction", jurisdiction_time, linear_jurisdiction_time)):
+        print(f"{name:<14} {indexed * 1e6:>10.1f}us {linear * 1e6:>10.1f}us {linear / indexed:>8.0f}x")
+    print(f"Mismatches vs linear scan: {mismatches}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
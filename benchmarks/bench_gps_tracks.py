@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Приём живого GPS: запись пингов в кольцевые буферы поездок, разбор строк
+CSV/JSON и потоковый POST /api/gps через настоящий HTTP-сервер.
+
+    python -m benchmarks.bench_gps_tracks --pings 500000 --rides 10000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_providers import BackgroundServer
+from gps_tracks import GpsTracks, ingest_lines
+
+
+def make_pings(pings: int, rides: int, start: float) -> list:
+    # Каждая поездка шлёт пинг раз в секунду, поездки едут на северо-восток
+    pings_list = []
+    for i in range(pings):
+        ride = i % rides
+        step = i // rides
+        pings_list.append((f"RIDE-{ride}", start + step, 35.0 + ride * 1e-4 + step * 1e-4,
+                           33.0 + step * 1e-4, 45.0, 12.5))
+    return pings_list
+
+
+def report(label: str, count: int, elapsed: float) -> None:
+    print(f"{label:<38} {count / elapsed:>12,.0f} pings/s  ({elapsed * 1e6 / count:.2f} us/ping)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pings", type=int, default=500000)
+    parser.add_argument("--rides", type=int, default=10000)
+    parser.add_argument("--chunk-bytes", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    start = time.time() - args.pings // args.rides - 1
+    pings = make_pings(args.pings, args.rides, start)
+    csv_lines = [f"{r},{ts},{lat:.6f},{lng:.6f},{h},{s}".encode() for r, ts, lat, lng, h, s in pings]
+    json_lines = [json.dumps({"ride_id": r, "ts": ts, "lat": round(lat, 6), "lng": round(lng, 6),
+                              "heading": h, "speed": s}).encode() for r, ts, lat, lng, h, s in pings]
+
+    tracks = GpsTracks()
+    record = tracks.record
+    started = time.perf_counter()
+    for ping in pings:
+        record(*ping)
+    report("GpsTracks.record", args.pings, time.perf_counter() - started)
+    points = len(tracks._ts)
+    print(f"{'':<38} {len(tracks)} rides, {points * 32 / 1e6:.1f} MB of track arrays")
+
+    for label, lines in (("ingest_lines CSV", csv_lines), ("ingest_lines JSON", json_lines)):
+        tracks = GpsTracks()
+        started = time.perf_counter()
+        accepted, _ = ingest_lines(tracks, lines, time.time())
+        report(label, accepted, time.perf_counter() - started)
+
+    # Сервер и клиент делят одно ядро: клиент только отправляет заранее собранные куски
+    import main as service
+
+    app = FastAPI()
+    app.add_api_route("/api/gps", service.ingest_gps, methods=["POST"])
+    service.Config.GPS_INGEST_TOKEN = "bench"
+    for label, lines in (("POST /api/gps, CSV stream", csv_lines), ("POST /api/gps, NDJSON stream", json_lines)):
+        service.gps_tracks = GpsTracks()
+        body = b"\n".join(lines) + b"\n"
+        chunks = [body[i:i + args.chunk_bytes] for i in range(0, len(body), args.chunk_bytes)]
+        with BackgroundServer(app) as server:
+            started = time.perf_counter()
+            response = httpx.post(server.url + "/api/gps", params={"token": "bench"}, content=iter(chunks),
+                                  timeout=120)
+            elapsed = time.perf_counter() - started
+        report(label, response.json()["accepted"], elapsed)
+
+
+if __name__ == "__main__":
+    main()
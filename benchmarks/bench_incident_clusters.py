@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Кластеры массовых инцидентов: задержка вставки SOS и поиска кластера при
+тысячах живых инцидентов - сетка против линейного перебора открытых кластеров.
+Поток: фоновые одиночные SOS по городу плюс массовые события, где десятки
+поездок жмут SOS в паре сотен метров друг от друга.
+
+    python -m benchmarks.bench_incident_clusters --sos 50000 --window 12000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from incident_clusters import IncidentClusters, distance_m
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def sos_stream(count: int, rnd: random.Random, mass_share: float) -> list:
+    # Город ~40x40 км; массовое событие - до 60 SOS в радиусе ~150 м
+    events = []
+    while len(events) < count:
+        lat, lng = 35.0 + rnd.uniform(0, 0.36), 33.0 + rnd.uniform(0, 0.44)
+        if rnd.random() < mass_share:
+            for _ in range(rnd.randint(10, 60)):
+                events.append((lat + rnd.gauss(0, 0.0007), lng + rnd.gauss(0, 0.0008)))
+        else:
+            events.append((lat, lng))
+    return events[:count]
+
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+    # Максимум - обычно пауза сборщика мусора, а не сам индекс
+    return (f"p50 {pick(0.5):7.2f} us  p99 {pick(0.99):7.2f} us  p99.9 {pick(0.999):8.2f} us  "
+            f"max {samples[-1] * 1e6:8.2f} us")
+
+
+def linear_find(open_clusters: list, radius_m: float, lat: float, lng: float):
+    best = None
+    for cluster in open_clusters:
+        distance = distance_m(cluster.lat, cluster.lng, lat, lng)
+        if distance <= radius_m and (best is None or distance < best[1]):
+            best = cluster, distance
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--window", type=float, default=12000.0,
+                        help="cluster window in seconds; the stream sends one SOS per second")
+    parser.add_argument("--sos", type=int, default=50000)
+    parser.add_argument("--radius", type=float, default=300.0)
+    parser.add_argument("--mass-share", type=float, default=0.02)
+    parser.add_argument("--linear-queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=23)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    events = sos_stream(args.sos, rnd, args.mass_share)
+    clock = Clock()
+    # Один SOS в секунду: при окне по умолчанию открыто несколько тысяч кластеров
+    clusters = IncidentClusters(radius_m=args.radius, window=args.window, max_members=100,
+                                max_clusters=args.sos, clock=clock)
+
+    attach_times, find_times = [], []
+    joined = 0
+    live_peak = 0
+    for i, (lat, lng) in enumerate(events):
+        clock.now = float(i)
+        started = time.perf_counter()
+        clusters.find(lat, lng)
+        find_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        _, opened = clusters.attach(f"inc-{i}", lat, lng, f"R-{i}", "assault", "high")
+        attach_times.append(time.perf_counter() - started)
+        joined += not opened
+        live_peak = max(live_peak, len(clusters))
+
+    print(f"{len(events)} SOS, {joined} joined an existing cluster, {len(events) - joined} calls, "
+          f"up to {live_peak} open clusters")
+    print(f"grid find     {percentiles(find_times)}")
+    print(f"grid attach   {percentiles(attach_times)}")
+
+    open_clusters = list(clusters._open)
+    queries = [rnd.choice(events) for _ in range(args.linear_queries)]
+    linear_times = []
+    for lat, lng in queries:
+        started = time.perf_counter()
+        linear_find(open_clusters, args.radius, lat, lng)
+        linear_times.append(time.perf_counter() - started)
+    print(f"linear find   {percentiles(linear_times)}  ({len(open_clusters)} open clusters)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность очереди инцидентов: запись (как при всплеске SOS)
+и разбор воркерами с мгновенным фейковым провайдером.
+
+    python -m benchmarks.bench_incident_queue --incidents 5000 --workers 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from incident_queue import DISPATCHED, IncidentQueue
+
+PAYLOAD = {"ride_id": "RG-2024-1215-001", "incident_type": "medical_emergency",
+           "severity": "high", "language": "en", "additional_info": None}
+
+
+async def run(incidents: int, workers: int, concurrency: int):
+    path = os.path.join(tempfile.mkdtemp(), "incidents.db")
+    queue = IncidentQueue(path, poll_interval=0.05)
+    queue.open()
+
+    # Всплеск: concurrency одновременных запросов пишут в очередь
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def accept():
+        async with semaphore:
+            start = time.perf_counter()
+            await queue.enqueue(PAYLOAD)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(accept() for _ in range(incidents)))
+    enqueue_elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"enqueue: {incidents / enqueue_elapsed:9.0f} incidents/s  "
+          f"p50={latencies[len(latencies) // 2] * 1000:.2f}ms  "
+          f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms")
+
+    async def handler(incident_id, payload):
+        return {"call_id": incident_id}
+
+    start = time.perf_counter()
+    queue.start_workers(handler, workers)
+    while (await queue.counts()).get(DISPATCHED, 0) < incidents:
+        await asyncio.sleep(0.05)
+    drain_elapsed = time.perf_counter() - start
+    print(f"drain:   {incidents / drain_elapsed:9.0f} incidents/s  with {workers} workers")
+    await queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incidents", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.incidents, args.workers, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Стоимость инструментации горячего пути: одна запись в гистограмму/счётчик
+против рендера сценария, который она измеряет.
+
+    python -m benchmarks.bench_metrics_overhead
+"""
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Counter, Gauge, Histogram, Registry
+from ride_store import RideStore
+from script_templates import ScriptEngine
+
+
+def per_op(fn, number: int = 200000) -> float:
+    return timeit.timeit(fn, number=number) / number * 1e9
+
+
+def main():
+    histogram = Histogram("bench_seconds", "bench", labels=("stage", "provider"))
+    counter = Counter("bench_calls", "bench", labels=("provider", "outcome"))
+    gauge = Gauge("bench_in_flight", "bench", labels=("provider",))
+
+    observe_ns = per_op(lambda: histogram.observe(0.0123, "render", "bland"))
+    inc_ns = per_op(lambda: counter.inc("bland", "success"))
+    gauge_ns = per_op(lambda: (gauge.inc("bland"), gauge.dec("bland")))
+    clock_ns = per_op(time.perf_counter)
+
+    store = RideStore()
+    store.load_file(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data.json"))
+    record = store.get(store.default_ride_id)
+    engine = ScriptEngine()
+
+    def bare():
+        engine.render(record, "medical_emergency")
+
+    def instrumented():
+        started = time.perf_counter()
+        engine.render(record, "medical_emergency")
+        histogram.observe(time.perf_counter() - started, "render", "bland")
+
+    bare_ns = per_op(bare, 50000)
+    instrumented_ns = per_op(instrumented, 50000)
+
+    print(f"histogram.observe        {observe_ns:8.0f} ns")
+    print(f"counter.inc              {inc_ns:8.0f} ns")
+    print(f"gauge.inc + dec          {gauge_ns:8.0f} ns")
+    print(f"time.perf_counter        {clock_ns:8.0f} ns")
+    print(f"render (cached ride)     {bare_ns:8.0f} ns")
+    print(f"render + stage timing    {instrumented_ns:8.0f} ns  (+{instrumented_ns - bare_ns:.0f} ns)")
+
+    # Полный SOS с инструментацией: ~6 записей метрик + 8 вызовов часов
+    per_sos_us = (6 * observe_ns + 4 * inc_ns + 8 * clock_ns) / 1000
+    print(f"estimated overhead per SOS: {per_sos_us:.1f} us "
+          f"(vs ~200000 us provider round-trip: {per_sos_us / 200000 * 100:.4f}%)")
+
+    registry = Registry()
+    for metric in (histogram, counter, gauge):
+        registry.register(metric)
+    render_us = per_op(registry.render, 2000) / 1000
+    print(f"/metrics render          {render_us:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Симуляция насыщения лимита звонков: задержка в очереди по классам тяжести
+для FIFO и для приоритетного планировщика (дедлайн по тяжести + сброс).
+
+Поток SOS приходит быстрее, чем провайдер успевает принимать звонки.
+Допустимые задержки SEVERITY_TARGETS сжимаются в --time-scale раз вместе
+со временем звонка, чтобы симуляция шла секунды, а не минуты.
+
+    python -m benchmarks.bench_priority_scheduler --overload 1.3 --duration 3
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.loadtest import percentile
+from priority_scheduler import SEVERITY_TARGETS, CallShed, PriorityScheduler
+
+SEVERITIES = ("critical", "high", "medium", "low")
+
+
+async def simulate(scheduler: PriorityScheduler, args, seed: int) -> dict:
+    rnd = random.Random(seed)
+    service_rate = args.capacity / args.call_time
+    arrival_rate = service_rate * args.overload
+    waits = defaultdict(list)
+    shed = defaultdict(int)
+
+    async def call(severity: str):
+        arrived = time.time()
+        try:
+            async with scheduler.slot(severity, arrived):
+                waits[severity].append(time.time() - arrived)
+                await asyncio.sleep(args.call_time)
+        except CallShed:
+            shed[severity] += 1
+
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival - start < args.duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        severity = rnd.choices(SEVERITIES, weights=args.mix)[0]
+        tasks.append(asyncio.create_task(call(severity)))
+        next_arrival += rnd.expovariate(arrival_rate)
+    await asyncio.gather(*tasks)
+    return {severity: (waits[severity], shed[severity]) for severity in SEVERITIES}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--capacity", type=int, default=4, help="concurrent provider calls")
+    parser.add_argument("--call-time", type=float, default=0.02, help="seconds a call holds a slot")
+    parser.add_argument("--overload", type=float, default=1.3, help="arrival rate / service rate")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--max-waiting", type=int, default=100)
+    parser.add_argument("--time-scale", type=float, default=100.0)
+    parser.add_argument("--mix", type=float, nargs=4, default=[0.1, 0.3, 0.3, 0.3],
+                        metavar=("CRITICAL", "HIGH", "MEDIUM", "LOW"))
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    scaled = {severity: target / args.time_scale for severity, target in SEVERITY_TARGETS.items()}
+    fifo_targets = {severity: 0.0 for severity in SEVERITY_TARGETS}
+    modes = {
+        # Без сброса и с одинаковыми дедлайнами планировщик - обычная FIFO-очередь
+        "fifo": PriorityScheduler(args.capacity, targets=fifo_targets),
+        "priority": PriorityScheduler(args.capacity, max_waiting=args.max_waiting, targets=scaled),
+    }
+    print(f"capacity {args.capacity}, call {args.call_time * 1000:.0f}ms, overload x{args.overload}, "
+          f"targets scaled 1/{args.time_scale:g}")
+    print(f"{'mode':<9} {'severity':<9} {'calls':>6} {'shed':>5} {'p50 wait':>10} {'p95 wait':>10} {'max wait':>10}")
+    for mode, scheduler in modes.items():
+        results = asyncio.run(simulate(scheduler, args, args.seed))
+        for severity in SEVERITIES:
+            waits, shed = results[severity]
+            print(f"{mode:<9} {severity:<9} {len(waits):>6} {shed:>5} "
+                  f"{percentile(waits, 0.5) * 1000:>8.0f}ms {percentile(waits, 0.95) * 1000:>8.0f}ms "
+                  f"{max(waits, default=0) * 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
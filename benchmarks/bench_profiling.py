@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Цена профилирования по запросу: время запроса через ASGI-приложение без
+обёртки, с выключенным профилировщиком (без ADMIN_TOKEN и с ним) и во время
+сессий deterministic/sampling. Запросы идут напрямую в ASGI, без сети.
+
+    python -m benchmarks.bench_profiling --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+
+from profiling import ProfilingMiddleware, RequestProfiler
+
+
+def create_app(profiler=None, header_trigger: bool = False) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/emergency/{incident_id}")
+    async def status(incident_id: str):
+        return {"incident_id": incident_id, "status": "dispatched"}
+
+    if profiler is not None:
+        app.add_middleware(ProfilingMiddleware, profiler=profiler, authorize=lambda token: token == "admin",
+                           header_trigger=lambda: header_trigger)
+    return app
+
+
+async def drive(app, requests: int) -> float:
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": "/api/emergency/inc-1", "raw_path": b"/api/emergency/inc-1",
+             "query_string": b"", "root_path": "", "server": ("bench", 80), "client": ("bench", 1),
+             "headers": [(b"host", b"bench"), (b"user-agent", b"bench"), (b"accept", b"*/*")]}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(200):
+        await app(dict(scope), receive, send)
+    # Лучший из трёх прогонов: на одном ядре шум от фоновых процессов сравним с измеряемой разницей
+    best = None
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), receive, send)
+        elapsed = (time.perf_counter() - started) / requests * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+async def passthrough_ns(header_trigger: bool, calls: int = 200000) -> float:
+    # Сама обёртка без приложения за ней: на полном запросе её цена тонет в шуме
+    async def noop(scope, receive, send):
+        pass
+
+    app = ProfilingMiddleware(noop, RequestProfiler(), authorize=lambda token: False,
+                              header_trigger=lambda: header_trigger)
+    scope = {"type": "http", "path": "/api/emergency", "headers": [(b"host", b"bench"), (b"accept", b"*/*")]}
+    timings = []
+    for target in (noop, app):
+        started = time.perf_counter()
+        for _ in range(calls):
+            await target(scope, None, None)
+        timings.append((time.perf_counter() - started) / calls * 1e9)
+    return timings[1] - timings[0]
+
+
+async def run(requests: int) -> None:
+    print(f"middleware pass-through, profiler off: {await passthrough_ns(False):.0f} ns/request, "
+          f"with ADMIN_TOKEN set (X-Profile header check): {await passthrough_ns(True):.0f} ns/request\n")
+    baseline = await drive(create_app(), requests)
+    print(f"{'scenario':<36} {'us/request':>11} {'overhead':>10}")
+
+    def line(name: str, value: float) -> None:
+        print(f"{name:<36} {value:>10.1f} {value - baseline:>+9.1f}")
+
+    line("no middleware", baseline)
+    line("profiler off", await drive(create_app(RequestProfiler()), requests))
+    line("profiler off, ADMIN_TOKEN set", await drive(create_app(RequestProfiler(), header_trigger=True), requests))
+
+    for mode in ("deterministic", "sampling"):
+        profiler = RequestProfiler()
+        app = create_app(profiler)
+        # Прогрев и все прогоны попадают в сессию; после последнего запроса она закрывается сама.
+        # Лаг loop здесь не показателен: цикл запросов не отдаёт управление и сам держит loop
+        session = profiler.arm(mode, 3 * requests + 200, "/api/emergency")
+        value = await drive(app, requests)
+        line(f"{mode} session", value)
+        print(f"{'':<4}pstats {len(session.pstats) // 1024} KiB"
+              + (f", {session.summary()['samples']} samples" if mode == "sampling" else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Офлайн-геокодер: сборка справочника из миллионов адресных точек, размер
+файла, RSS процесса после mmap и после поиска, задержка поиска без кеша и
+для горячих районов из кеша. Для сравнения - память тех же точек как
+списка кортежей Python (замер на части точек, пересчёт на все).
+
+    python -m benchmarks.bench_reverse_geocoder --points 2000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reverse_geocoder import DEFAULT_CELL_DEG, ReverseGeocoder, build_index
+
+CITIES = (("Limassol", 34.68, 33.04), ("Nicosia", 35.17, 33.36), ("Larnaca", 34.92, 33.62),
+          ("Paphos", 34.77, 32.42), ("Berlin", 52.52, 13.40), ("Oslo", 59.91, 10.75))
+
+
+def gazetteer(count: int, rnd: random.Random):
+    # Адресные точки вдоль улиц вокруг городов: плотно в центре, реже на окраинах
+    streets = 2000
+    for i in range(count):
+        city, lat, lng = CITIES[i % len(CITIES)]
+        spread = 0.08 * rnd.expovariate(2.0)
+        yield (lat + rnd.gauss(0, spread), lng + rnd.gauss(0, spread),
+               f"Street {i // len(CITIES) % streets} {i // (len(CITIES) * streets) + 1}, {city}")
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1e6
+    return f"p50 {pick(0.5):7.2f} us  p99 {pick(0.99):7.2f} us  p99.9 {pick(0.999):8.2f} us"
+
+
+def tuples_bytes_per_point(count: int, seed: int) -> float:
+    tracemalloc.start()
+    points = list(gazetteer(count, random.Random(seed)))
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del points
+    return used / count
+
+
+def query_points(count: int, rnd: random.Random) -> list:
+    queries = []
+    for _ in range(count):
+        _, lat, lng = rnd.choice(CITIES)
+        queries.append((lat + rnd.gauss(0, 0.05), lng + rnd.gauss(0, 0.05)))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=2000000)
+    parser.add_argument("--queries", type=int, default=50000)
+    parser.add_argument("--hot-areas", type=int, default=500, help="distinct pickup spots hit repeatedly")
+    parser.add_argument("--cell-deg", type=float, default=DEFAULT_CELL_DEG)
+    parser.add_argument("--seed", type=int, default=25)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    data = build_index(gazetteer(args.points, random.Random(args.seed)), args.cell_deg)
+    build_seconds = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "gazetteer.rgeo")
+        with open(path, "wb") as f:
+            f.write(data)
+        del data
+
+        baseline = rss_mb()
+        started = time.perf_counter()
+        geocoder = ReverseGeocoder.load(path, max_distance_m=1000, cache_size=100000)
+        load_ms = (time.perf_counter() - started) * 1000
+        print(f"{len(geocoder)} places, index file {geocoder.nbytes / 2 ** 20:.1f} MiB "
+              f"({geocoder.nbytes / len(geocoder):.1f} B/place), build {build_seconds:.1f} s, mmap load {load_ms:.2f} ms")
+        print(f"RSS after mmap load   +{rss_mb() - baseline:7.1f} MiB")
+
+        rnd = random.Random(args.seed + 1)
+        cold = []
+        for lat, lng in query_points(args.queries, rnd):
+            started = time.perf_counter()
+            geocoder.nearest(lat, lng)
+            cold.append(time.perf_counter() - started)
+        print(f"RSS after {args.queries} lookups +{rss_mb() - baseline:7.1f} MiB")
+        print(f"nearest (no cache)    {percentiles(cold)}")
+
+        # Горячие районы: вокзал, торговый центр - много SOS с одних и тех же ~10 м
+        spots = query_points(args.hot_areas, rnd)
+        hot = []
+        for _ in range(args.queries):
+            lat, lng = rnd.choice(spots)
+            lat, lng = lat + rnd.uniform(-2e-5, 2e-5), lng + rnd.uniform(-2e-5, 2e-5)
+            started = time.perf_counter()
+            geocoder.describe(lat, lng)
+            hot.append(time.perf_counter() - started)
+        print(f"describe (hot areas)  {percentiles(hot)}  cache hits {geocoder.hits / len(hot):.0%}")
+        geocoder.close()
+
+    sample = min(args.points, 200000)
+    per_point = tuples_bytes_per_point(sample, args.seed)
+    print(f"list of (lat, lng, label) tuples: {per_point:.0f} B/place, "
+          f"~{per_point * args.points / 2 ** 20:.0f} MiB for {args.points} places (measured on {sample})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Микро-бенчмарк рендера сценариев: прежние f-string функции против
+скомпилированных шаблонов (с кешем поездки и пакетным рендером).
+
+    python -m benchmarks.bench_script_templates
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ride_store import RideStore
+from script_templates import ScriptEngine
+
+
+def legacy_create_emergency_script(data: dict, incident_type: str = "medical_emergency") -> str:
+    passenger = data["passenger"]
+    driver = data["driver"]
+    vehicle = data["vehicle"]
+    location = data["location"]
+
+    script = f"""
+URGENT EMERGENCY CALL - PASSENGER IN DANGER
+
+This is an automated emergency call from RideGuard Safety System by inDrive Company.
+I am calling on behalf of a passenger who is currently in danger and needs immediate assistance.
+
+PASSENGER IN DISTRESS:
+- Passenger Name: {passenger['name']}
+- Passenger Phone: {passenger['phone']}
+- The passenger activated emergency SOS from the inDrive app
+
+INCIDENT DETAILS:
+- Emergency Type: {incident_type.replace('_', ' ').title()}
+- Time: {datetime.now().strftime('%H:%M %Z')}
+- Severity: HIGH PRIORITY - PASSENGER IN IMMEDIATE DANGER
+
+THREATENING DRIVER INFORMATION:
+- Driver Name: {driver['name']}
+- Driver Phone: {driver['phone']}
+- Driver License: {driver['license']}
+
+VEHICLE IDENTIFICATION:
+- Vehicle: {vehicle['year']} {vehicle['make']} {vehicle['model']}
+- Color: {vehicle['color']}
+- License Plate: {vehicle['plate']}
+
+CURRENT LOCATION:
+- Address: {location['address']}
+- GPS Coordinates: {location['gps_lat']}, {location['gps_lng']}
+- This is the exact location where the passenger needs help
+
+IMMEDIATE ACTION REQUIRED:
+The passenger is in danger and requires immediate police assistance.
+This call is made by RideGuard Safety System from inDrive Company on behalf of the passenger who pressed the emergency SOS button.
+Please dispatch police units to the location immediately.
+
+For urgent follow-up, contact the passenger directly at {passenger['phone']}.
+The driver's number is {driver['phone']}.
+
+This is an automated emergency call from inDrive's RideGuard Safety System protecting passenger safety.
+"""
+    return script.strip()
+
+
+def legacy_create_emergency_voice_message(data: dict, incident_type: str = "medical_emergency") -> str:
+    passenger = data["passenger"]
+    driver = data["driver"]
+    vehicle = data["vehicle"]
+    location = data["location"]
+
+    simplified_script = f"""
+    Emergency Alert from RideGuard Safety System.
+
+    This is a {incident_type.replace('_', ' ')} emergency.
+
+    Passenger {passenger['name']} requires immediate assistance.
+
+    Location: {location['address']}.
+
+    Vehicle: {vehicle['color']} {vehicle['make']} {vehicle['model']}, license plate {vehicle['plate']}.
+
+    Driver: {driver['name']}, phone {driver['phone']}.
+
+    Passenger phone: {passenger['phone']}.
+
+    Please dispatch emergency services immediately.
+
+    Repeating location: {location['address']}.
+
+    This is an automated emergency call from RideGuard.
+    """
+    return simplified_script.strip()
+
+
+def report(name: str, seconds: float, number: int, baseline: float = None):
+    per_call = seconds / number * 1e6
+    speedup = f"  x{baseline / seconds:.1f}" if baseline else ""
+    print(f"{name:42s} {per_call:8.2f} us/render{speedup}")
+    return seconds
+
+
+def main():
+    number = 20000
+    store = RideStore()
+    store.load_file(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_data.json"))
+    record = store.get(store.default_ride_id)
+    ride_dict = record.to_dict()
+    engine = ScriptEngine()
+
+    base = report("legacy bland f-string", timeit.timeit(
+        lambda: legacy_create_emergency_script(ride_dict, "taxi_service_emergency"), number=number), number)
+    report("engine bland, plain dict (no ride cache)", timeit.timeit(
+        lambda: engine.render(ride_dict, "taxi_service_emergency"), number=number), number, base)
+    report("engine bland, cached ride", timeit.timeit(
+        lambda: engine.render(record, "taxi_service_emergency"), number=number), number, base)
+
+    base = report("legacy twilio f-string", timeit.timeit(
+        lambda: legacy_create_emergency_voice_message(ride_dict, "taxi_service_emergency"), number=number), number)
+    report("engine twilio, cached ride", timeit.timeit(
+        lambda: engine.render(record, "taxi_service_emergency", provider="twilio"), number=number), number, base)
+
+    # Пакетный рендер: 1000 разных поездок за один вызов
+    store.ingest(dict(ride_dict, ride_info={"ride_id": f"BATCH-{i}"}) for i in range(1000))
+    batch = [(store.get(f"BATCH-{i}"), "taxi_service_emergency") for i in range(1000)]
+    rounds = 20
+    base = report("legacy bland x1000 rides", timeit.timeit(
+        lambda: [legacy_create_emergency_script(r.to_dict(), t) for r, t in batch], number=rounds), rounds * 1000)
+    engine.render_batch(batch)
+    report("engine render_batch x1000 rides (warm)", timeit.timeit(
+        lambda: engine.render_batch(batch), number=rounds), rounds * 1000, base)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Время до главного в голосовом сценарии: сколько секунд речи (TTS ~150 слов
+в минуту) проходит, пока диспетчер услышит тип инцидента, адрес и номер машины.
+Печатает все варианты каждого провайдера и сверяет рабочие сценарии с baseline.
+
+    python -m benchmarks.bench_script_timing
+    python -m benchmarks.bench_script_timing --check            # exit 1, если главное звучит позже baseline
+    python -m benchmarks.bench_script_timing --write-baseline   # обновить baseline
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ride_store import RideStore
+from script_composer import CRITICAL_FACTS, SPEECH_WPM, measure
+from script_templates import (SAMPLE_FIELDS, SCRIPT_WORDINGS, TEMPLATES, incident_fields, ride_fields,
+                              script_variants, severity_label)
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "script_timing_baseline.json")
+INCIDENT_TYPES = ("medical_emergency", "taxi_service_emergency", "assault")
+
+
+def scenario_fields(data, incident_type: str) -> dict:
+    fields = dict(SAMPLE_FIELDS, **ride_fields(data), **incident_fields(incident_type))
+    fields["severity_label"] = severity_label("high")
+    return fields
+
+
+def shipped_timing(provider: str, language: str, fields: dict, wpm: float):
+    # Рабочий сценарий - тот вариант, чей текст попал в TEMPLATES
+    for variant in script_variants(provider, language):
+        if variant.source == TEMPLATES[(provider, language)]:
+            return measure(variant.segments, fields, wpm)
+    raise LookupError(f"Shipped {provider} template is not one of the variants")
+
+
+def report(data, wpm: float) -> dict:
+    results = {}
+    for provider, language in SCRIPT_WORDINGS:
+        print(f"\n{provider}/{language}: {'variant':<22} {'total':>7} {'incident':>9} {'location':>9} "
+              f"{'plate':>7}  violations")
+        for variant in script_variants(provider, language):
+            timing = variant.timing
+            shipped = "*" if variant.source == TEMPLATES[(provider, language)] else " "
+            print(f"{'':<{len(provider) + len(language) + 2}}{shipped}{variant.name:<22} {timing.seconds:>6.1f}s "
+                  + " ".join(f"{timing.time_to(fact):>8.1f}s" for fact in CRITICAL_FACTS[:2])
+                  + f" {timing.time_to('plate'):>6.1f}s  {', '.join(variant.violations) or '-'}")
+
+        # Худший случай по типам инцидентов на данных поездки
+        timings = [shipped_timing(provider, language, scenario_fields(data, incident_type), wpm)
+                   for incident_type in INCIDENT_TYPES]
+        results[provider] = {
+            "seconds": max(timing.seconds for timing in timings),
+            **{f"time_to_{fact}": max(timing.time_to(fact) for timing in timings) for fact in CRITICAL_FACTS},
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict, slack: float) -> list:
+    regressions = []
+    for provider, values in results.items():
+        for key, value in values.items():
+            limit = baseline.get(provider, {}).get(key)
+            if limit is not None and value > limit + slack:
+                regressions.append(f"{provider} {key}: {value:.1f}s > {limit:.1f}s + {slack}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wpm", type=float, default=SPEECH_WPM)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--check", action="store_true", help="fail if critical facts are spoken later than baseline")
+    parser.add_argument("--write-baseline", action="store_true")
+    parser.add_argument("--slack", type=float, default=0.5, help="seconds allowed over the baseline")
+    args = parser.parse_args()
+
+    store = RideStore()
+    store.load_file(os.path.join(ROOT, "test_data.json"))
+    results = report(store.get(store.default_ride_id), args.wpm)
+    print("\nshipped scripts, worst case over " + ", ".join(INCIDENT_TYPES) + ":")
+    print(json.dumps(results, indent=2))
+
+    if args.write_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.slack)
+        if regressions:
+            print("Script timing regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест дедупликации: шторм повторных нажатий SOS одной поездки
+должен привести ровно к одному исходящему звонку.
+
+    python -m benchmarks.bench_sos_dedup --presses 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_providers import BackgroundServer, create_fake_bland_app
+
+PRESS = {"incident_type": "taxi_service_emergency", "severity": "high"}
+
+
+async def storm(service, presses: int, concurrency: int):
+    transport = httpx.ASGITransport(app=service.app)
+    async with service.app.router.lifespan_context(service.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://rideguard") as client:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def press():
+                async with semaphore:
+                    return (await client.post("/api/emergency", json=PRESS)).json()
+
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(press() for _ in range(presses)))
+            elapsed = time.perf_counter() - start
+
+            incident_ids = {response["incident_id"] for response in responses}
+            status_url = responses[0]["status_url"]
+            for _ in range(200):
+                incident = (await client.get(status_url)).json()
+                if incident["status"] in ("dispatched", "failed"):
+                    break
+                await asyncio.sleep(0.05)
+
+            # Нажатие после звонка сразу получает call_id
+            late = (await client.post("/api/emergency", json=PRESS)).json()
+            return elapsed, incident_ids, incident, late
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--presses", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    fake_app = create_fake_bland_app(latency=0.2)
+    with BackgroundServer(fake_app) as fake_bland:
+        os.environ["BLAND_API_URL"] = fake_bland.url
+        os.environ.setdefault("BLAND_API_KEY", "bench-key")
+        os.environ.setdefault("EMERGENCY_PHONE", "+10000000000")
+        workdir = tempfile.mkdtemp()
+        os.environ.setdefault("INCIDENT_DB_PATH", os.path.join(workdir, "incidents.db"))
+        os.environ.setdefault("AUDIT_LOG_DIR", os.path.join(workdir, "audit"))
+        os.environ.setdefault("RECORDINGS_DIR", os.path.join(workdir, "recordings"))
+        os.environ.setdefault("SHARED_STATE_PATH", os.path.join(workdir, "state.db"))
+
+        import main as service
+
+        elapsed, incident_ids, incident, late = asyncio.run(storm(service, args.presses, args.concurrency))
+
+    print(f"presses:         {args.presses}")
+    print(f"wall time:       {elapsed:.2f}s ({args.presses / elapsed:.0f} presses/s)")
+    print(f"incidents:       {len(incident_ids)}")
+    print(f"outbound calls:  {fake_app.state.calls}")
+    print(f"incident status: {incident['status']}, late press call_id: {late['call_id']}")
+    if fake_app.state.calls != 1 or len(incident_ids) != 1:
+        sys.exit("FAIL: duplicate presses produced more than one call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Отдача страницы SOS: старые обработчики (FileResponse с диска и StaticFiles)
+против статики из памяти с заранее сжатыми телами, ETag и 304.
+
+Считаются запросы в секунду и байты по сети для первой загрузки
+(Accept-Encoding: gzip, br) и для повторной с If-None-Match.
+
+    python -m benchmarks.bench_static_assets --requests 2000 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_providers import BackgroundServer
+from static_assets import AssetStore
+
+BROWSER_HEADERS = {"Accept-Encoding": "gzip, deflate, br"}
+
+
+def create_legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/")
+    async def serve_demo():
+        return FileResponse(os.path.join(ROOT, "static", "demo.html"))
+
+    app.mount("/static", StaticFiles(directory=os.path.join(ROOT, "static")), name="static")
+    return app
+
+
+def create_assets_app() -> FastAPI:
+    # Те же обработчики, что в main.py, без запуска всего сервиса
+    import main
+
+    main.static_assets = AssetStore(os.path.join(ROOT, "static"))
+    main.static_assets.load()
+    app = FastAPI()
+    app.add_api_route("/", main.serve_demo)
+    app.add_api_route("/static/{name:path}", main.serve_static)
+    return app
+
+
+async def hammer(url: str, requests: int, concurrency: int, revalidate: bool) -> tuple:
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency)) as client:
+        first = await client.get(url, headers=BROWSER_HEADERS)
+        headers = dict(BROWSER_HEADERS)
+        if revalidate and "etag" in first.headers:
+            headers["If-None-Match"] = first.headers["etag"]
+        statuses = {}
+        downloaded = 0
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            nonlocal downloaded
+            async with semaphore:
+                response = await client.get(url, headers=headers)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                downloaded += response.num_bytes_downloaded
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+    return requests / elapsed, downloaded / requests, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'handler':<30} {'mode':<11} {'req/s':>8} {'body bytes/req':>15}  statuses")
+    for label, factory in (("legacy", create_legacy_app), ("in-memory", create_assets_app)):
+        with BackgroundServer(factory()) as server:
+            for path in ("/", "/static/demo.html"):
+                for revalidate in (False, True):
+                    rps, body_bytes, statuses = asyncio.run(
+                        hammer(server.url + path, args.requests, args.concurrency, revalidate))
+                    mode = "revalidate" if revalidate else "full load"
+                    print(f"{label + ' ' + path:<30} {mode:<11} {rps:>8.0f} {body_bytes:>15.0f}  {statuses}")
+
+
+if __name__ == "__main__":
+    main()
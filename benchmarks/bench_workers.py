@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность приёма SOS в зависимости от числа воркеров uvicorn.
+
+Для каждого значения --workers сервис запускается заново (uvicorn --workers N)
+и получает замкнутую нагрузку из --clients параллельных клиентов. Звонки
+уходят в фейковый Bland.ai; общий лимит CALL_CONCURRENCY_LIMIT должен
+соблюдаться при любом числе воркеров.
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --duration 5
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_providers import BackgroundServer, create_fake_bland_app
+from benchmarks.loadtest import free_port, write_rides
+
+
+def start_service(workers: int, bland_url: str, workdir: str, rides_path: str, call_limit: int):
+    port = free_port()
+    env = dict(
+        os.environ,
+        BLAND_API_URL=bland_url,
+        BLAND_API_KEY="bench-key",
+        EMERGENCY_PHONE="+10000000000",
+        INCIDENT_DB_PATH=os.path.join(workdir, f"incidents-{workers}.db"),
+        AUDIT_LOG_DIR=os.path.join(workdir, f"audit-{workers}"),
+        RECORDINGS_DIR=os.path.join(workdir, f"recordings-{workers}"),
+        SHARED_STATE_PATH=os.path.join(workdir, f"state-{workers}.db"),
+        RIDE_DATA_PATH=rides_path,
+        CALL_CONCURRENCY_LIMIT=str(call_limit),
+        INCIDENT_WORKERS="32",
+        PROVIDER_WARMUP="0",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/ready", timeout=1).status_code == 200:
+                # Даём остальным воркерам закончить старт
+                time.sleep(0.5 * workers)
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Service did not start")
+
+
+async def drive(base_url: str, clients: int, duration: float, rides: int) -> dict:
+    ride_ids = itertools.count()
+    accepted = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                response = await client.post("/api/emergency", json={
+                    "ride_id": f"LOAD-{next(ride_ids) % rides}",
+                    "incident_type": "taxi_service_emergency",
+                })
+                if response.status_code == 202:
+                    accepted.append(response.json()["status_url"])
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+        # Ждём, пока фоновые воркеры дозвонятся по всем принятым SOS
+        pending = list(accepted)
+        while pending:
+            statuses = await asyncio.gather(*(client.get(url) for url in pending[:200]))
+            done = {url for url, response in zip(pending, statuses)
+                    if response.json()["status"] in ("dispatched", "failed")}
+            pending = [url for url in pending if url not in done]
+            if pending:
+                await asyncio.sleep(0.1)
+        drained = time.perf_counter() - start
+
+    return {"accepted_rps": len(accepted) / elapsed, "dispatched_rps": len(accepted) / drained,
+            "accepted": len(accepted), "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--rides", type=int, default=50000)
+    parser.add_argument("--latency", type=float, default=0.1, help="fake Bland.ai response time")
+    parser.add_argument("--call-limit", type=int, default=10, help="CALL_CONCURRENCY_LIMIT shared by all workers")
+    args = parser.parse_args()
+
+    print(f"CPU cores: {os.cpu_count()}, call limit: {args.call_limit}")
+    print(f"{'workers':>7} {'accepted/s':>11} {'dispatched/s':>13} {'errors':>7} {'peak provider calls':>20}")
+    with tempfile.TemporaryDirectory() as workdir:
+        rides_path = os.path.join(workdir, "rides.json")
+        write_rides(rides_path, args.rides)
+        for workers in args.workers:
+            fake_app = create_fake_bland_app(latency=args.latency)
+            with BackgroundServer(fake_app) as fake_bland:
+                process, base_url = start_service(workers, fake_bland.url, workdir, rides_path, args.call_limit)
+                try:
+                    report = asyncio.run(drive(base_url, args.clients, args.duration, args.rides))
+                finally:
+                    process.terminate()
+                    process.wait(timeout=15)
+            peak = fake_app.state.peak_in_flight
+            print(f"{workers:>7} {report['accepted_rps']:>11.0f} {report['dispatched_rps']:>13.0f} "
+                  f"{report['errors']:>7} {peak:>20}")
+            if peak > args.call_limit:
+                sys.exit(f"FAIL: {peak} concurrent provider calls exceed the limit of {args.call_limit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Локальные заглушки провайдеров звонков для бенчмарков и тестов.
+Никаких реальных звонков: серверы только имитируют задержку и ошибки
+Bland.ai и Twilio, раздают большие "записи звонков" и принимают экспорт событий. Задержка - логнормальная вокруг медианы latency
+с разбросом jitter, доля ответов 500 задаётся error_rate. connect_delay
+имитирует DNS и TLS-рукопожатие: его платит первый запрос каждого соединения.
+"""
+import asyncio
+import gzip
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qsl
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+class FaultProfile:
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, error_rate: float = 0.0,
+                 seed: Optional[int] = None, connect_delay: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.connect_delay = connect_delay
+        self.random = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency * math.exp(self.random.gauss(0, self.jitter))
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+
+def _fake_app(profile: FaultProfile) -> FastAPI:
+    app = FastAPI()
+    app.state.profile = profile
+    app.state.calls = 0
+    app.state.errors = 0
+    app.state.connections = set()
+    app.state.in_flight = 0
+    app.state.peak_in_flight = 0
+
+    @app.middleware("http")
+    async def handshake(request: Request, call_next):
+        # Новое соединение узнаём по порту клиента
+        if request.client not in app.state.connections:
+            app.state.connections.add(request.client)
+            if profile.connect_delay:
+                await asyncio.sleep(profile.connect_delay)
+        return await call_next(request)
+
+    return app
+
+
+def create_fake_bland_app(latency: float = 0.2, jitter: float = 0.0, error_rate: float = 0.0,
+                          seed: Optional[int] = None, connect_delay: float = 0.0) -> FastAPI:
+    app = _fake_app(FaultProfile(latency, jitter, error_rate, seed, connect_delay))
+    counter = itertools.count(1)
+
+    @app.post("/v1/calls")
+    async def create_call(payload: dict):
+        profile = app.state.profile
+        app.state.in_flight += 1
+        app.state.peak_in_flight = max(app.state.peak_in_flight, app.state.in_flight)
+        try:
+            await asyncio.sleep(profile.sample_latency())
+        finally:
+            app.state.in_flight -= 1
+        if profile.should_fail():
+            app.state.errors += 1
+            return JSONResponse({"status": "error", "message": "fake outage"}, status_code=500)
+        app.state.calls += 1
+        return {"status": "success", "call_id": f"fake-bland-{next(counter)}"}
+
+    return app
+
+
+def create_fake_twilio_app(latency: float = 0.3, jitter: float = 0.0, error_rate: float = 0.0,
+                           seed: Optional[int] = None) -> FastAPI:
+    app = _fake_app(FaultProfile(latency, jitter, error_rate, seed))
+    counter = itertools.count(1)
+
+    # Тот же путь, что у REST API Twilio: SDK шлёт сюда form-encoded запрос
+    @app.post("/2010-04-01/Accounts/{account_sid}/Calls.json")
+    async def create_call(account_sid: str, request: Request):
+        await request.body()
+        profile = app.state.profile
+        await asyncio.sleep(profile.sample_latency())
+        if profile.should_fail():
+            app.state.errors += 1
+            return JSONResponse({"code": 20500, "message": "fake outage", "status": 500}, status_code=500)
+        app.state.calls += 1
+        sid = f"CAfake{next(counter):026d}"
+        return JSONResponse({"sid": sid, "account_sid": account_sid, "status": "queued"}, status_code=201)
+
+    app.state.messages = []
+
+    @app.post("/2010-04-01/Accounts/{account_sid}/Messages.json")
+    async def create_message(account_sid: str, request: Request):
+        form = dict(parse_qsl((await request.body()).decode()))
+        profile = app.state.profile
+        await asyncio.sleep(profile.sample_latency())
+        if profile.should_fail():
+            app.state.errors += 1
+            return JSONResponse({"code": 20500, "message": "fake outage", "status": 500}, status_code=500)
+        app.state.messages.append(form)
+        sid = f"SMfake{len(app.state.messages):026d}"
+        return JSONResponse({"sid": sid, "to": form.get("To"), "status": "queued"}, status_code=201)
+
+    return app
+
+
+def create_fake_sink_app(latency: float = 0.02, jitter: float = 0.0, error_rate: float = 0.0,
+                         throttle_every: int = 0, retry_after: float = 0.05, seed: Optional[int] = None) -> FastAPI:
+    """
+    Приёмник экспорта событий: POST /events с gzip NDJSON.
+    throttle_every > 0 - каждая такая пачка получает 429 с Retry-After;
+    app.state.down = True - 503 на всё, app.state.reject = True - 400 на всё.
+    """
+    app = _fake_app(FaultProfile(latency, jitter, error_rate, seed))
+    app.state.events = []
+    app.state.batches = []
+    app.state.down = False
+    app.state.reject = False
+    counter = itertools.count(1)
+
+    @app.post("/events")
+    async def receive_events(request: Request):
+        body = await request.body()
+        profile = app.state.profile
+        app.state.in_flight += 1
+        app.state.peak_in_flight = max(app.state.peak_in_flight, app.state.in_flight)
+        try:
+            await asyncio.sleep(profile.sample_latency())
+        finally:
+            app.state.in_flight -= 1
+        if app.state.down or profile.should_fail():
+            app.state.errors += 1
+            return JSONResponse({"message": "fake outage"}, status_code=503)
+        if throttle_every and next(counter) % throttle_every == 0:
+            return JSONResponse({"message": "slow down"}, status_code=429,
+                                headers={"Retry-After": str(retry_after)})
+        if app.state.reject:
+            return JSONResponse({"message": "bad batch"}, status_code=400)
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        events = [json.loads(line) for line in body.splitlines() if line]
+        app.state.calls += 1
+        app.state.batches.append((request.headers.get("idempotency-key"), len(events), len(body)))
+        app.state.events.extend(events)
+        return {"accepted": len(events)}
+
+    return app
+
+
+_RECORDING_BLOCK = random.Random(7).randbytes(1 << 20)
+
+
+def recording_bytes(start: int, length: int) -> bytes:
+    """Содержимое фейковой записи: блок 1 МБ псевдослучайных байт, повторённый до нужного размера"""
+    block_size = len(_RECORDING_BLOCK)
+    parts = []
+    while length > 0:
+        offset = start % block_size
+        part = _RECORDING_BLOCK[offset:offset + length]
+        parts.append(part)
+        start += len(part)
+        length -= len(part)
+    return b"".join(parts)
+
+
+def create_fake_recordings_app(size: int = 32 * 1024 * 1024, chunk_bytes: int = 64 * 1024,
+                               drop_after: int = 0, chunk_delay: float = 0.0) -> FastAPI:
+    """
+    Записи /recordings/{name}.mp3 размером size с поддержкой Range.
+    drop_after > 0 - первая загрузка каждой записи обрывается после стольких байт.
+    """
+    app = FastAPI()
+    app.state.requests = []
+    app.state.authorization = []
+    app.state.in_flight = 0
+    app.state.peak_in_flight = 0
+    dropped = set()
+
+    @app.get("/redirect/{name}.mp3")
+    async def redirect_recording(name: str, to: str, request: Request):
+        # Как API провайдера: отвечает редиректом на CDN
+        app.state.authorization.append((name, request.headers.get("authorization")))
+        return Response(status_code=302, headers={"Location": to})
+
+    @app.get("/recordings/{name}.mp3")
+    async def get_recording(name: str, request: Request):
+        start = 0
+        header = request.headers.get("range", "")
+        if header.startswith("bytes=") and header.endswith("-"):
+            start = int(header[6:-1])
+        app.state.requests.append((name, start))
+        app.state.authorization.append((name, request.headers.get("authorization")))
+        if name == "missing":
+            return JSONResponse({"message": "not found"}, status_code=404)
+        if start >= size:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        stop = size
+        if drop_after and name not in dropped:
+            dropped.add(name)
+            stop = min(size, start + drop_after)
+
+        async def body():
+            app.state.in_flight += 1
+            app.state.peak_in_flight = max(app.state.peak_in_flight, app.state.in_flight)
+            try:
+                for offset in range(start, stop, chunk_bytes):
+                    if chunk_delay:
+                        await asyncio.sleep(chunk_delay)
+                    yield recording_bytes(offset, min(chunk_bytes, stop - offset))
+                if stop < size:
+                    raise ConnectionResetError("fake recording download dropped")
+            finally:
+                app.state.in_flight -= 1
+
+        headers = {"Content-Length": str(size - start), "Accept-Ranges": "bytes"}
+        if start:
+            headers["Content-Range"] = f"bytes {start}-{size - 1}/{size}"
+        return StreamingResponse(body(), status_code=206 if start else 200, media_type="audio/mpeg",
+                                 headers=headers)
+
+    return app
+
+
+class BackgroundServer:
+    """uvicorn в отдельном потоке на свободном порту"""
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 0):
+        self.config = uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(self.config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("Fake server did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
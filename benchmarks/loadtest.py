@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Воспроизводимый нагрузочный тест RideGuard без реальных звонков.
+
+Поднимает фейковые Bland.ai и Twilio с заданной задержкой и долей ошибок,
+запускает сервис отдельным процессом uvicorn и подаёт открытую нагрузку
+(запросы уходят по расписанию target RPS, не дожидаясь ответов).
+Считает p50/p95/p99 времени приёма SOS (202) и времени до принятия звонка
+провайдером, пропускную способность и долю ошибок.
+
+    python -m benchmarks.loadtest --rps 50 --duration 10
+    python -m benchmarks.loadtest --check            # сравнить с baseline, exit 1 при регрессии
+    python -m benchmarks.loadtest --write-baseline   # обновить baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_providers import BackgroundServer, create_fake_bland_app, create_fake_twilio_app
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "loadtest_baseline.json")
+LATENCY_KEYS = ("accept_p50_ms", "accept_p95_ms", "accept_p99_ms",
+                "call_accepted_p50_ms", "call_accepted_p95_ms", "call_accepted_p99_ms")
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_rides(path: str, count: int) -> None:
+    with open(os.path.join(ROOT, "test_data.json")) as f:
+        template = json.load(f)
+    rides = []
+    for i in range(count):
+        ride = dict(template)
+        ride["ride_info"] = dict(template["ride_info"], ride_id=f"LOAD-{i}")
+        ride["passenger"] = dict(template["passenger"], phone=f"+1555{i:07d}")
+        rides.append(ride)
+    with open(path, "w") as f:
+        json.dump({"rides": rides}, f)
+
+
+def start_service(args, bland_url: str, twilio_url: str, workdir: str):
+    port = free_port()
+    rides_path = os.path.join(workdir, "rides.json")
+    write_rides(rides_path, args.rides)
+    env = dict(
+        os.environ,
+        BLAND_API_URL=bland_url,
+        BLAND_API_KEY="loadtest-key",
+        EMERGENCY_PHONE="+10000000000",
+        TWILIO_API_URL=twilio_url,
+        TWILIO_ACCOUNT_SID="ACloadtest",
+        TWILIO_AUTH_TOKEN="loadtest-token",
+        TWILIO_PHONE="+10000000001",
+        CALL_HEDGE_DELAY=str(args.hedge_delay),
+        INCIDENT_DB_PATH=os.path.join(workdir, "incidents.db"),
+        AUDIT_LOG_DIR=os.path.join(workdir, "audit"),
+        RECORDINGS_DIR=os.path.join(workdir, "recordings"),
+        SHARED_STATE_PATH=os.path.join(workdir, "state.db"),
+        INCIDENT_WORKERS=str(args.workers),
+        RIDE_DATA_PATH=rides_path,
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/test", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Service did not start")
+
+
+async def drive(base_url: str, rps: float, duration: float, rides: int) -> dict:
+    total = int(rps * duration)
+    accept_latencies = []
+    call_latencies = []
+    outcomes = Counter()
+    providers = Counter()
+
+    limits = httpx.Limits(max_connections=500, max_keepalive_connections=500)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, limits=limits) as client:
+        async def one(i: int):
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/emergency", json={
+                    "ride_id": f"LOAD-{i % rides}",
+                    "incident_type": "taxi_service_emergency",
+                })
+            except httpx.HTTPError:
+                outcomes["http_error"] += 1
+                return
+            accept_latencies.append(time.perf_counter() - started)
+            if response.status_code != 202:
+                outcomes[f"http_{response.status_code}"] += 1
+                return
+
+            status_url = response.json()["status_url"]
+            while True:
+                await asyncio.sleep(0.05)
+                incident = (await client.get(status_url)).json()
+                if incident["status"] in ("dispatched", "failed"):
+                    break
+            outcomes[incident["status"]] += 1
+            if incident["status"] == "dispatched":
+                # Серверные отметки времени не зависят от частоты опроса
+                call_latencies.append(incident["updated_at"] - incident["created_at"])
+                providers[incident["result"]["provider"]] += 1
+
+        # Открытая нагрузка: запрос уходит по расписанию, даже если предыдущие ещё не ответили
+        tasks = []
+        start = time.perf_counter()
+        for i in range(total):
+            delay = start + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(i)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    errors = total - outcomes["dispatched"]
+    return {
+        "requests": total,
+        "target_rps": rps,
+        "throughput_rps": round(outcomes["dispatched"] / elapsed, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "outcomes": dict(outcomes),
+        "providers": dict(providers),
+        "accept_p50_ms": round(percentile(accept_latencies, 0.50) * 1000, 2),
+        "accept_p95_ms": round(percentile(accept_latencies, 0.95) * 1000, 2),
+        "accept_p99_ms": round(percentile(accept_latencies, 0.99) * 1000, 2),
+        "call_accepted_p50_ms": round(percentile(call_latencies, 0.50) * 1000, 2),
+        "call_accepted_p95_ms": round(percentile(call_latencies, 0.95) * 1000, 2),
+        "call_accepted_p99_ms": round(percentile(call_latencies, 0.99) * 1000, 2),
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    regressions = []
+    for key in LATENCY_KEYS:
+        limit = baseline[key] * tolerance + slack_ms
+        if report[key] > limit:
+            regressions.append(f"{key}: {report[key]:.2f}ms > {limit:.2f}ms (baseline {baseline[key]:.2f}ms)")
+    if report["error_rate"] > baseline["error_rate"] + 0.01:
+        regressions.append(f"error_rate: {report['error_rate']:.4f} > baseline {baseline['error_rate']:.4f} + 0.01")
+    if report["throughput_rps"] < baseline["throughput_rps"] / tolerance:
+        regressions.append(f"throughput_rps: {report['throughput_rps']} < baseline {baseline['throughput_rps']} / {tolerance}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=50)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--rides", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=64, help="INCIDENT_WORKERS of the service")
+    parser.add_argument("--hedge-delay", type=float, default=1.0)
+    parser.add_argument("--bland-latency", type=float, default=0.2)
+    parser.add_argument("--bland-jitter", type=float, default=0.3)
+    parser.add_argument("--bland-error-rate", type=float, default=0.02)
+    parser.add_argument("--twilio-latency", type=float, default=0.3)
+    parser.add_argument("--twilio-jitter", type=float, default=0.3)
+    parser.add_argument("--twilio-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--check", action="store_true", help="fail if latency regressed against the baseline")
+    parser.add_argument("--write-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.3)
+    parser.add_argument("--slack-ms", type=float, default=10.0)
+    args = parser.parse_args()
+
+    bland_app = create_fake_bland_app(args.bland_latency, args.bland_jitter, args.bland_error_rate, args.seed)
+    twilio_app = create_fake_twilio_app(args.twilio_latency, args.twilio_jitter, args.twilio_error_rate, args.seed)
+
+    with tempfile.TemporaryDirectory() as workdir, \
+            BackgroundServer(bland_app) as bland, BackgroundServer(twilio_app) as twilio:
+        process, base_url = start_service(args, bland.url, twilio.url, workdir)
+        try:
+            report = asyncio.run(drive(base_url, args.rps, args.duration, args.rides))
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report["scenario"] = {key: value for key, value in vars(args).items()
+                          if key not in ("baseline", "check", "write_baseline", "tolerance", "slack_ms")}
+    print(json.dumps(report, indent=2))
+
+    if args.write_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.slack_ms)
+        if regressions:
+            print("Latency regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
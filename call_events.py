@@ -0,0 +1,135 @@
+"""
+Состояние звонков в памяти и рассылка изменений подписчикам (SSE).
+
+Событие сериализуется один раз и раздаётся всем подписчикам инцидента.
+У каждого подписчика ограниченная очередь: медленный клиент теряет самые
+старые события, а не раздувает память процесса.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional, Tuple
+
+# Статусы звонка у провайдера, после которых по нему больше ничего не придёт
+FINAL_CALL_STATUSES = {"completed", "failed", "busy", "no-answer", "canceled"}
+
+
+def is_final(state: dict) -> bool:
+    return state.get("status") == "failed" or state.get("call_status") in FINAL_CALL_STATUSES
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    __slots__ = ("topic", "_events", "_ready", "dropped")
+
+    def __init__(self, topic: str, max_queue: int):
+        self.topic = topic
+        self._events: deque = deque(maxlen=max_queue)
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def push(self, event: Tuple[str, bool]) -> None:
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append(event)
+        self._ready.set()
+
+    async def get(self) -> Tuple[str, bool]:
+        while not self._events:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._events.popleft()
+
+
+class BroadcastHub:
+    def __init__(self, max_queue: int = 32):
+        self.max_queue = max_queue
+        self._topics: Dict[str, set] = {}
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(topic, self.max_queue)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    def subscribers(self, topic: Optional[str] = None) -> int:
+        if topic is not None:
+            return len(self._topics.get(topic, ()))
+        return sum(len(subscribers) for subscribers in self._topics.values())
+
+    def publish(self, topic: str, frame: str, final: bool = False) -> int:
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return 0
+        event = (frame, final)
+        for subscription in subscribers:
+            subscription.push(event)
+        return len(subscribers)
+
+
+class CallTracker:
+    """Последнее известное состояние инцидента и его звонка"""
+
+    def __init__(self, hub: BroadcastHub, max_entries: int = 10000):
+        self.hub = hub
+        self.max_entries = max_entries
+        self._states: OrderedDict = OrderedDict()
+        self._by_call: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def get(self, incident_id: str) -> Optional[dict]:
+        return self._states.get(incident_id)
+
+    def find_by_call(self, call_id: str) -> Optional[dict]:
+        incident_id = self._by_call.get(call_id)
+        return self._states.get(incident_id) if incident_id else None
+
+    def update(self, incident_id: str, **fields) -> dict:
+        # status - этап инцидента (queued/dispatching/dispatched/failed), call_status - статус у провайдера
+        state = self._states.get(incident_id)
+        if state is None:
+            state = self._states[incident_id] = {"incident_id": incident_id, "status": "queued"}
+            self._evict()
+        else:
+            self._states.move_to_end(incident_id)
+        state.update(fields, updated_at=time.time())
+        call_id = fields.get("call_id")
+        if call_id:
+            self._by_call[call_id] = incident_id
+        self.hub.publish(incident_id, format_sse("status", state), is_final(state))
+        return state
+
+    def update_call(self, incident_id: Optional[str], call_id: Optional[str], call_status: str,
+                    **fields) -> Optional[dict]:
+        # События провайдера: инцидент берём из callback URL, иначе ищем по call_id
+        state = self._states.get(incident_id) if incident_id else self.find_by_call(call_id or "")
+        if state is None:
+            return None
+        # Хеджирование могло создать второй звонок: пока победитель неизвестен,
+        # финальные события не принимаем, после - слушаем только его call_id
+        winner = state.get("call_id")
+        if winner and call_id and winner != call_id:
+            return None
+        if is_final(state) or (not winner and call_status in FINAL_CALL_STATUSES):
+            return state
+        return self.update(state["incident_id"], call_status=call_status, **fields)
+
+    def _evict(self) -> None:
+        while len(self._states) > self.max_entries:
+            _, state = self._states.popitem(last=False)
+            self._by_call.pop(state.get("call_id"), None)
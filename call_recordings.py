@@ -0,0 +1,379 @@
+"""
+Записи звонков: фоновая загрузка у провайдера и отдача по HTTP Range.
+
+Запись качается потоком, кусками по chunk_bytes, в файл .part и
+переименовывается, только когда скачана целиком, - обрезанных записей
+в каталоге не бывает. Одновременных загрузок не больше max_concurrent.
+Оборванная загрузка продолжается с места обрыва (Range), незавершённые
+задания хранятся в файлах .job и подхватываются после перезапуска.
+
+URL записи приходит в webhook, поэтому качаем только с хостов провайдеров
+из списка - и по редиректам тоже. Учётные данные провайдера уходят только
+на его origin (схема, хост, порт), на CDN после редиректа - без них.
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from metrics import RECORDING_DOWNLOADS, RECORDING_FETCH_LATENCY
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".ogg": "audio/ogg", ".m4a": "audio/mp4"}
+CONTENT_TYPE_EXTENSIONS = {
+    "audio/mpeg": ".mp3", "audio/mp3": ".mp3", "audio/wav": ".wav", "audio/x-wav": ".wav",
+    "audio/wave": ".wav", "audio/ogg": ".ogg", "audio/mp4": ".m4a", "audio/x-m4a": ".m4a",
+}
+# 4xx, кроме этих, не исправится повтором: записи нет или нет доступа
+RETRYABLE_STATUSES = {408, 425, 429}
+MAX_REDIRECTS = 5
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_-]")
+
+
+class RecordingBusy(Exception):
+    pass
+
+
+class RecordingError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def recording_name(call_id: str) -> str:
+    # call_id приходит от провайдера и попадает в имя файла - оставляем только безопасные символы
+    return _UNSAFE_NAME.sub("_", call_id)[:128]
+
+
+def host_allowed(host: str, allowed_hosts) -> bool:
+    # ".twilio.com" - домен и все поддомены, иначе точное совпадение
+    host = host.lower()
+    return any(host == entry or (entry.startswith(".") and (host.endswith(entry) or host == entry[1:]))
+               for entry in allowed_hosts)
+
+
+def url_origin(url: httpx.URL) -> str:
+    return f"{url.scheme}://{url.netloc.decode('ascii')}"
+
+
+def recording_extension(content_type: Optional[str], url: str) -> str:
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    if media_type in CONTENT_TYPE_EXTENSIONS:
+        return CONTENT_TYPE_EXTENSIONS[media_type]
+    extension = os.path.splitext(httpx.URL(url).path)[1].lower()
+    return extension if extension in MEDIA_TYPES else ".mp3"
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Один диапазон bytes=a-b, bytes=a- или bytes=-n; возвращает (start, end) включительно.
+    None - заголовка нет, он не разобран или диапазонов несколько: отдаётся весь файл.
+    ValueError - диапазон за пределами файла (416).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash or not (first or last) or not (first or "0").isdigit() or not (last or "0").isdigit():
+        return None
+    if not first:
+        suffix = int(last)
+        if not suffix or not size:
+            raise ValueError("Empty suffix range")
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    if start >= size:
+        raise ValueError("Range starts past the end of the file")
+    end = min(int(last), size - 1) if last else size - 1
+    return (start, end) if start <= end else None
+
+
+def range_headers(size: int, mtime: float, range_header: str = "",
+                  if_range: str = "") -> Tuple[int, int, int, dict]:
+    """Статус, первый и последний байт и заголовки ответа на GET записи"""
+    etag = f'"{size:x}-{int(mtime * 1000):x}"'
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, "Cache-Control": "private, max-age=3600"}
+    # If-Range с другим ETag: файл изменился, частичный ответ склеился бы с чужими байтами
+    byte_range = None
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return 416, 0, -1, headers
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return 200, 0, size - 1, headers
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return 206, start, end, headers
+
+
+async def iter_file(path: str, start: int, end: int, chunk_bytes: int = 64 * 1024) -> AsyncIterator[bytes]:
+    # Чтение в потоке: event loop не ждёт диск, в памяти только текущий кусок
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_bytes, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+class RecordingFetcher:
+    def __init__(self, directory: str, max_concurrent: int = 4, chunk_bytes: int = 256 * 1024,
+                 timeout: float = 60.0, max_attempts: int = 5, retry_delay: float = 5.0,
+                 allowed_hosts: Iterable[str] = (), credentials: Optional[Dict[str, Tuple[str, str]]] = None):
+        self.directory = directory
+        self.max_concurrent = max_concurrent
+        self.chunk_bytes = chunk_bytes
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        # Хосты, с которых можно качать записи; пустой список - не качаем ничего
+        self.allowed_hosts = tuple(host.strip().lower() for host in allowed_hosts if host.strip())
+        # Учётные данные по origin ("https://api.twilio.com"): записи Twilio отдаются только с Basic auth
+        self.credentials = credentials or {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._on_stored: Optional[Callable[[dict, str], None]] = None
+        self._on_failed: Optional[Callable[[dict, str], None]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def open(self) -> List[dict]:
+        """Создаёт каталог и возвращает незавершённые задания прошлых запусков"""
+        if not self.enabled:
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+        jobs = []
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".job"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    jobs.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping unreadable recording job %s: %s", filename, e)
+        return jobs
+
+    async def start(self, on_stored: Optional[Callable[[dict, str], None]] = None,
+                    on_failed: Optional[Callable[[dict, str], None]] = None) -> int:
+        if not self.enabled or self._client is not None:
+            return 0
+        self._on_stored = on_stored
+        self._on_failed = on_failed
+        # Редиректы на CDN провайдера проходим сами: каждый адрес сверяется со списком хостов
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=self.max_concurrent),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        jobs = await asyncio.to_thread(self.open)
+        for job in jobs:
+            self._spawn(job, persist=False)
+        return len(jobs)
+
+    async def close(self) -> None:
+        # Незавершённые загрузки остаются в .job/.part и продолжатся после перезапуска
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def path(self, call_id: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        base = os.path.join(self.directory, recording_name(call_id))
+        for extension in MEDIA_TYPES:
+            if os.path.exists(base + extension):
+                return base + extension
+        return None
+
+    def enqueue(self, provider: str, call_id: str, url: str, incident_id: Optional[str] = None) -> bool:
+        """Ставит запись в загрузку; False - загрузка отключена, уже идёт или запись уже есть"""
+        if self._client is None or not call_id or not url:
+            return False
+        if recording_name(call_id) in self._tasks or self.path(call_id):
+            return False
+        if not self.allowed(url):
+            logger.warning("Refusing %s recording %s from %s: host is not allowed", provider, call_id, url)
+            return False
+        job = {"provider": provider, "call_id": call_id, "url": url, "incident_id": incident_id,
+               "queued_at": time.time()}
+        self._spawn(job, persist=True)
+        return True
+
+    def allowed(self, url) -> bool:
+        try:
+            url = httpx.URL(url)
+        except (httpx.InvalidURL, TypeError):
+            return False
+        return url.scheme in ("http", "https") and host_allowed(url.host, self.allowed_hosts)
+
+    async def wait(self) -> None:
+        await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    def _spawn(self, job: dict, persist: bool) -> None:
+        name = recording_name(job["call_id"])
+        task = asyncio.create_task(self._run(job, persist))
+        self._tasks[name] = task
+        task.add_done_callback(lambda _: self._tasks.pop(name, None))
+
+    def _job_path(self, job: dict) -> str:
+        return os.path.join(self.directory, recording_name(job["call_id"]) + ".job")
+
+    def _write_job(self, job: dict) -> None:
+        path = self._job_path(job)
+        with open(path + ".tmp", "w") as f:
+            json.dump(job, f)
+        os.replace(path + ".tmp", path)
+
+    def _remove_job(self, job: dict, partial: bool = False) -> None:
+        paths = [self._job_path(job)]
+        if partial:
+            paths.append(os.path.join(self.directory, recording_name(job["call_id"]) + ".part"))
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    async def _run(self, job: dict, persist: bool) -> Optional[str]:
+        if persist:
+            await asyncio.to_thread(self._write_job, job)
+        error = "not attempted"
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    path = await self._download(job)
+                RECORDING_FETCH_LATENCY.observe(time.perf_counter() - started, job["provider"])
+            except RecordingBusy:
+                return None
+            except (httpx.HTTPError, OSError, RecordingError) as e:
+                error = str(e) or type(e).__name__
+                if isinstance(e, RecordingError) and not e.retryable:
+                    break
+                if attempt < self.max_attempts:
+                    RECORDING_DOWNLOADS.inc(job["provider"], "retried")
+                    logger.warning("Recording %s download attempt %d failed: %s", job["call_id"], attempt, error)
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                continue
+            await asyncio.to_thread(self._remove_job, job)
+            RECORDING_DOWNLOADS.inc(job["provider"], "stored")
+            if self._on_stored is not None:
+                self._on_stored(job, path)
+            return path
+
+        logger.error("Recording %s download failed: %s", job["call_id"], error)
+        await asyncio.to_thread(self._remove_job, job, True)
+        RECORDING_DOWNLOADS.inc(job["provider"], "failed")
+        if self._on_failed is not None:
+            self._on_failed(job, error)
+        return None
+
+    def _open_part(self, part: str) -> int:
+        fd = os.open(part, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Несколько воркеров uvicorn подхватывают одни и те же .job - качает тот, кто взял блокировку
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise RecordingBusy(part)
+        return fd
+
+    def _commit(self, fd: int, part: str, final: str) -> None:
+        os.fsync(fd)
+        os.replace(part, final)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    async def _download(self, job: dict) -> str:
+        base = os.path.join(self.directory, recording_name(job["call_id"]))
+        part = base + ".part"
+        fd = await asyncio.to_thread(self._open_part, part)
+        try:
+            offset = os.fstat(fd).st_size
+            # Сжатие выключено: смещения Range и Content-Length считаются по байтам файла
+            headers = {"Accept-Encoding": "identity"}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+            response = await self._open(job["url"], headers)
+            try:
+                if response.status_code == 416 and offset:
+                    # Недокачанный файл больше записи у провайдера - начинаем заново
+                    os.ftruncate(fd, 0)
+                    raise RecordingError("Partial recording is larger than the remote file")
+                if response.status_code >= 400:
+                    retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES
+                    raise RecordingError(f"Recording download returned HTTP {response.status_code}", retryable)
+                if response.status_code != 206:
+                    # Сервер проигнорировал Range и отдаёт файл целиком
+                    offset = 0
+                elif not response.headers.get("content-range", "").startswith(f"bytes {offset}-"):
+                    os.ftruncate(fd, 0)
+                    raise RecordingError("Unexpected Content-Range in resumed download")
+                os.ftruncate(fd, offset)
+                os.lseek(fd, offset, os.SEEK_SET)
+                length = response.headers.get("content-length")
+                expected = offset + int(length) if length and length.isdigit() else None
+                written = offset
+                async for chunk in response.aiter_raw(self.chunk_bytes):
+                    await asyncio.to_thread(_write_all, fd, chunk)
+                    written += len(chunk)
+                if expected is not None and written != expected:
+                    raise RecordingError(f"Recording truncated at {written} of {expected} bytes")
+                final = base + recording_extension(response.headers.get("content-type"), job["url"])
+            finally:
+                await response.aclose()
+            await asyncio.to_thread(self._commit, fd, part, final)
+            return final
+        finally:
+            os.close(fd)
+
+    async def _open(self, url: str, headers: dict) -> httpx.Response:
+        # .job прошлых запусков тоже проверяются: список хостов мог сузиться
+        for _ in range(MAX_REDIRECTS + 1):
+            if not self.allowed(url):
+                raise RecordingError(f"Recording host is not allowed: {httpx.URL(url).host}", retryable=False)
+            request = self._client.build_request("GET", url, headers=headers)
+            response = await self._client.send(request, stream=True,
+                                               auth=self.credentials.get(url_origin(request.url)))
+            if not response.is_redirect:
+                return response
+            await response.aclose()
+            url = str(request.url.join(response.headers["location"]))
+        raise RecordingError("Too many redirects", retryable=False)
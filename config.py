@@ -9,13 +9,174 @@ class Config:
     # Railway автоматически подставит эти переменные из настроек
     BLAND_API_KEY = os.getenv("BLAND_API_KEY", "")
     EMERGENCY_PHONE = os.getenv("EMERGENCY_PHONE", "")
-    
+
+    # HTTP-клиент провайдера: создаётся один раз при старте приложения
+    BLAND_API_URL = os.getenv("BLAND_API_URL", "https://api.bland.ai")
+    BLAND_MAX_CONCURRENT_CALLS = int(os.getenv("BLAND_MAX_CONCURRENT_CALLS", "20"))
+    BLAND_CONNECT_TIMEOUT = float(os.getenv("BLAND_CONNECT_TIMEOUT", "3"))
+    BLAND_READ_TIMEOUT = float(os.getenv("BLAND_READ_TIMEOUT", "15"))
+
+    # Twilio - резервный провайдер звонков
+    TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
+    TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
+    TWILIO_PHONE = os.getenv("TWILIO_PHONE", "")
+    TWILIO_API_URL = os.getenv("TWILIO_API_URL", "https://api.twilio.com")
+    TWILIO_HTTP_TIMEOUT = float(os.getenv("TWILIO_HTTP_TIMEOUT", "15"))
+    TWILIO_MAX_WORKERS = int(os.getenv("TWILIO_MAX_WORKERS", "8"))
+
+    # Хеджирование: через сколько секунд без ответа Bland параллельно звоним через Twilio
+    CALL_HEDGE_DELAY = float(os.getenv("CALL_HEDGE_DELAY", "2"))
+    CALL_DISPATCH_BUDGET = float(os.getenv("CALL_DISPATCH_BUDGET", "20"))
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+    BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+    # Очередь инцидентов: /api/emergency отвечает 202, звонят фоновые воркеры
+    INCIDENT_DB_PATH = os.getenv("INCIDENT_DB_PATH", "incidents.db")
+    INCIDENT_WORKERS = int(os.getenv("INCIDENT_WORKERS", "8"))
+    INCIDENT_MAX_ATTEMPTS = int(os.getenv("INCIDENT_MAX_ATTEMPTS", "3"))
+    INCIDENT_RETRY_DELAY = float(os.getenv("INCIDENT_RETRY_DELAY", "2"))
+    INCIDENT_LEASE_SECONDS = float(os.getenv("INCIDENT_LEASE_SECONDS", "30"))
+
+    # Окно дедупликации повторных нажатий SOS
+    SOS_DEDUP_TTL = float(os.getenv("SOS_DEDUP_TTL", "120"))
+    SOS_DEDUP_MAX_ENTRIES = int(os.getenv("SOS_DEDUP_MAX_ENTRIES", "100000"))
+
+    # Массовые инциденты: SOS разных поездок в радиусе (м) от первого за окно (с) - один звонок.
+    # CLUSTER_RADIUS_M=0 выключает; сверх CLUSTER_MAX_MEMBERS открывается новый кластер со своим звонком
+    CLUSTER_RADIUS_M = float(os.getenv("CLUSTER_RADIUS_M", "300"))
+    CLUSTER_WINDOW = float(os.getenv("CLUSTER_WINDOW", "300"))
+    CLUSTER_MAX_MEMBERS = int(os.getenv("CLUSTER_MAX_MEMBERS", "50"))
+    CLUSTER_MAX_ACTIVE = int(os.getenv("CLUSTER_MAX_ACTIVE", "10000"))
+
+    # Несколько воркеров uvicorn (WEB_CONCURRENCY читает и сам uvicorn).
+    # Общее состояние воркеров - в локальном SQLite: глобальный лимит одновременных
+    # исходящих звонков на провайдера и token bucket новых звонков на пассажира
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", "rideguard_state.db")
+    CALL_CONCURRENCY_LIMIT = int(os.getenv("CALL_CONCURRENCY_LIMIT", "20"))
+    CALL_SLOT_LEASE = float(os.getenv("CALL_SLOT_LEASE", "30"))
+    PASSENGER_SOS_BURST = float(os.getenv("PASSENGER_SOS_BURST", "3"))
+    PASSENGER_SOS_PER_MINUTE = float(os.getenv("PASSENGER_SOS_PER_MINUTE", "6"))
+
+    # Приоритетный планировщик звонков: сколько звонков может ждать слота, прежде чем
+    # начнут сбрасываться звонки тяжести не выше CALL_SCHEDULER_SHED_SEVERITY (0 - не сбрасывать)
+    CALL_SCHEDULER_MAX_WAITING = int(os.getenv("CALL_SCHEDULER_MAX_WAITING", "200"))
+    CALL_SCHEDULER_SHED_SEVERITY = os.getenv("CALL_SCHEDULER_SHED_SEVERITY", "low")
+
+    # Пакетный endpoint: максимум инцидентов в запросе
+    BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+    # Контекст активных поездок загружается в память при старте
+    RIDE_DATA_PATH = os.getenv("RIDE_DATA_PATH", "test_data.json")
+    RIDE_DATA_RELOAD_INTERVAL = float(os.getenv("RIDE_DATA_RELOAD_INTERVAL", "5"))
+
+    # Реестр диспетчерских центров: звонок уходит в центр, чей радиус покрывает GPS поездки.
+    # Вне всех радиусов - ближайший центр не дальше DISPATCH_MAX_DISTANCE_KM, иначе EMERGENCY_PHONE
+    DISPATCH_CENTERS_PATH = os.getenv("DISPATCH_CENTERS_PATH", "")
+    DISPATCH_MAX_DISTANCE_KM = float(os.getenv("DISPATCH_MAX_DISTANCE_KM", "100"))
+
+    # Холодный старт: какие сценарии компилировать заранее и сколько соединений к провайдерам открыть
+    PRELOAD_INCIDENT_TYPES = [t.strip() for t in os.getenv(
+        "PRELOAD_INCIDENT_TYPES", "medical_emergency,taxi_service_emergency,assault").split(",") if t.strip()]
+    PROVIDER_WARMUP = os.getenv("PROVIDER_WARMUP", "1") == "1"
+    PROVIDER_WARM_CONNECTIONS = int(os.getenv("PROVIDER_WARM_CONNECTIONS", "2"))
+    WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "5"))
+
+    # Вебхуки статуса звонков: публичный адрес сервиса, по которому провайдеры шлют события.
+    # Bland подписи не ставит, поэтому его callback URL содержит WEBHOOK_TOKEN
+    PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+    WEBHOOK_TOKEN = os.getenv("WEBHOOK_TOKEN", "")
+
+    # Server-sent events: очередь на подписчика, keep-alive и сколько инцидентов держим в памяти
+    EVENTS_SUBSCRIBER_QUEUE = int(os.getenv("EVENTS_SUBSCRIBER_QUEUE", "32"))
+    EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+    CALL_STATE_MAX_ENTRIES = int(os.getenv("CALL_STATE_MAX_ENTRIES", "10000"))
+
+    # Живой GPS поездок: точек в кольце на поездку, прореживание, сколько секунд точка считается живой,
+    # насколько пинг может опережать часы сервера; без GPS_INGEST_TOKEN приём пингов выключен
+    GPS_TRACK_POINTS = int(os.getenv("GPS_TRACK_POINTS", "60"))
+    GPS_MIN_INTERVAL = float(os.getenv("GPS_MIN_INTERVAL", "2"))
+    GPS_MAX_AGE = float(os.getenv("GPS_MAX_AGE", "300"))
+    GPS_MAX_RIDES = int(os.getenv("GPS_MAX_RIDES", "100000"))
+    GPS_MAX_LINE_BYTES = int(os.getenv("GPS_MAX_LINE_BYTES", "4096"))
+    GPS_MAX_CLOCK_SKEW = float(os.getenv("GPS_MAX_CLOCK_SKEW", "30"))
+    GPS_INGEST_TOKEN = os.getenv("GPS_INGEST_TOKEN", "")
+
+    # Каталог статики: файлы загружаются в память и сжимаются при старте
+    STATIC_DIR = os.getenv("STATIC_DIR", "static")
+
+    # Журнал аудита SOS: каталог сегментов (пусто - отключён), размер сегмента, когда делать fsync
+    AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "audit_log")
+    AUDIT_SEGMENT_BYTES = int(os.getenv("AUDIT_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.2"))
+    AUDIT_FLUSH_BYTES = int(os.getenv("AUDIT_FLUSH_BYTES", str(256 * 1024)))
+    AUDIT_MAX_PENDING = int(os.getenv("AUDIT_MAX_PENDING", "100000"))
+    AUDIT_RETENTION_DAYS = float(os.getenv("AUDIT_RETENTION_DAYS", "0"))
+
+    # Записи звонков: каталог (пусто - не качаем), параллельные загрузки, размер куска, повторы.
+    # RECORDINGS_TOKEN нужен в ?token= для GET /api/recordings (пусто - записи не отдаются).
+    # RECORDING_HOSTS - хосты провайдеров и их CDN через запятую (".bland.ai" - с поддоменами)
+    RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "recordings")
+    RECORDING_FETCH_CONCURRENCY = int(os.getenv("RECORDING_FETCH_CONCURRENCY", "4"))
+    RECORDING_CHUNK_BYTES = int(os.getenv("RECORDING_CHUNK_BYTES", str(256 * 1024)))
+    RECORDING_FETCH_TIMEOUT = float(os.getenv("RECORDING_FETCH_TIMEOUT", "60"))
+    RECORDING_MAX_ATTEMPTS = int(os.getenv("RECORDING_MAX_ATTEMPTS", "5"))
+    RECORDING_RETRY_DELAY = float(os.getenv("RECORDING_RETRY_DELAY", "5"))
+    RECORDINGS_TOKEN = os.getenv("RECORDINGS_TOKEN", "")
+    RECORDING_HOSTS = os.getenv("RECORDING_HOSTS", "api.twilio.com,.bland.ai")
+
+    # Оповещения по SOS (SMS диспетчеру и контактам, смена безопасности): дедлайн и число попыток
+    # на канал, пауза перед повтором удваивается. Пустой SAFETY_OPS_WEBHOOK_URL - канал выключен
+    SAFETY_OPS_WEBHOOK_URL = os.getenv("SAFETY_OPS_WEBHOOK_URL", "")
+    NOTIFY_SMS_DEADLINE = float(os.getenv("NOTIFY_SMS_DEADLINE", "20"))
+    NOTIFY_SMS_ATTEMPTS = int(os.getenv("NOTIFY_SMS_ATTEMPTS", "3"))
+    NOTIFY_OPS_DEADLINE = float(os.getenv("NOTIFY_OPS_DEADLINE", "10"))
+    NOTIFY_OPS_ATTEMPTS = int(os.getenv("NOTIFY_OPS_ATTEMPTS", "3"))
+    NOTIFY_RETRY_DELAY = float(os.getenv("NOTIFY_RETRY_DELAY", "0.5"))
+
+    # Профилирование по запросу: ADMIN_TOKEN в X-Admin-Token (пусто - выключено), лимит запросов
+    # в сессии, интервал сэмплов, порог лага event loop, сколько готовых профилей хранить
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    PROFILE_MAX_REQUESTS = int(os.getenv("PROFILE_MAX_REQUESTS", "1000"))
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+    PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+    PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "5"))
+    LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.01"))
+    LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.05"))
+
+    # Экспорт событий журнала аудита партнёру: URL приёмника (пусто - выключен), пачка по числу
+    # событий или по времени, сколько пачек держать в памяти до спула на диск, лимит спула.
+    # EXPORT_KINDS - виды записей через запятую (пусто - все)
+    EXPORT_URL = os.getenv("EXPORT_URL", "")
+    EXPORT_TOKEN = os.getenv("EXPORT_TOKEN", "")
+    EXPORT_SPOOL_DIR = os.getenv("EXPORT_SPOOL_DIR", "export_spool")
+    EXPORT_BATCH_EVENTS = int(os.getenv("EXPORT_BATCH_EVENTS", "500"))
+    EXPORT_FLUSH_INTERVAL = float(os.getenv("EXPORT_FLUSH_INTERVAL", "1.0"))
+    EXPORT_MAX_MEMORY_BATCHES = int(os.getenv("EXPORT_MAX_MEMORY_BATCHES", "8"))
+    EXPORT_MAX_SPOOL_BYTES = int(os.getenv("EXPORT_MAX_SPOOL_BYTES", str(1024 * 1024 * 1024)))
+    EXPORT_TIMEOUT = float(os.getenv("EXPORT_TIMEOUT", "10"))
+    EXPORT_RETRY_DELAY = float(os.getenv("EXPORT_RETRY_DELAY", "1"))
+    EXPORT_MAX_RETRY_DELAY = float(os.getenv("EXPORT_MAX_RETRY_DELAY", "60"))
+    EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+    EXPORT_KINDS = [kind.strip() for kind in os.getenv("EXPORT_KINDS", "").split(",") if kind.strip()]
+
+    # Офлайн-геокодер для поездок без адреса: справочник (.rgeo из reverse_geocoder.py build или
+    # CSV/JSON, пусто - выключен), дальше какого расстояния адреса нет, до какого - без "near"
+    GEOCODER_PATH = os.getenv("GEOCODER_PATH", "")
+    GEOCODER_MAX_DISTANCE_M = float(os.getenv("GEOCODER_MAX_DISTANCE_M", "1000"))
+    GEOCODER_NEAR_M = float(os.getenv("GEOCODER_NEAR_M", "75"))
+    GEOCODER_CACHE_SIZE = int(os.getenv("GEOCODER_CACHE_SIZE", "100000"))
+
+    @classmethod
+    def twilio_configured(cls) -> bool:
+        return bool(cls.TWILIO_ACCOUNT_SID and cls.TWILIO_AUTH_TOKEN and cls.TWILIO_PHONE)
+
     # Для Railway не делаем жесткую проверку при импорте
     @classmethod
     def validate(cls):
         """Проверка конфигурации при первом использовании"""
         if not cls.BLAND_API_KEY:
             raise ValueError("BLAND_API_KEY not configured! Add it in Railway dashboard.")
-        if not cls.EMERGENCY_PHONE:
+        if not cls.EMERGENCY_PHONE and not cls.DISPATCH_CENTERS_PATH:
             raise ValueError("EMERGENCY_PHONE not configured! Add it in Railway dashboard.")
-        return True
\ No newline at end of file
+        return True
@@ -0,0 +1,194 @@
+"""
+Реестр диспетчерских центров с пространственным индексом.
+
+Центры хранятся как точки на единичной сфере (x, y, z) в KD-дереве,
+поэтому поиск ближайшего центра и центров в радиусе идёт за O(log n)
+и корректен на любых широтах, включая переход через 180-й меридиан.
+"""
+import csv
+import json
+import math
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class DispatchCenter:
+    __slots__ = ("id", "name", "phone", "lat", "lng", "radius_km")
+
+    def __init__(self, id: str, name: str, phone: str, lat: float, lng: float, radius_km: float):
+        self.id = id
+        self.name = name
+        self.phone = phone
+        self.lat = lat
+        self.lng = lng
+        self.radius_km = radius_km
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DispatchCenter":
+        return cls(
+            str(data["id"]),
+            data.get("name", ""),
+            data["phone"],
+            float(data["lat"]),
+            float(data["lng"]),
+            float(data.get("radius_km") or 0),
+        )
+
+
+def to_unit_vector(lat: float, lng: float) -> Tuple[float, float, float]:
+    lat_rad = math.radians(lat)
+    lng_rad = math.radians(lng)
+    cos_lat = math.cos(lat_rad)
+    return cos_lat * math.cos(lng_rad), cos_lat * math.sin(lng_rad), math.sin(lat_rad)
+
+
+def chord_to_km(chord_sq: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_sq) / 2))
+
+
+def km_to_chord_sq(km: float) -> float:
+    chord = 2 * math.sin(min(math.pi / 2, km / (2 * EARTH_RADIUS_KM)))
+    return chord * chord
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    ax, ay, az = to_unit_vector(lat1, lng1)
+    bx, by, bz = to_unit_vector(lat2, lng2)
+    return chord_to_km((ax - bx) ** 2 + (ay - by) ** 2 + (az - bz) ** 2)
+
+
+class DispatchRegistry:
+    def __init__(self, centers: Iterable[DispatchCenter]):
+        self.centers: List[DispatchCenter] = list(centers)
+        self.max_radius_km = max((center.radius_km for center in self.centers), default=0.0)
+
+        coords = [to_unit_vector(center.lat, center.lng) for center in self.centers]
+        self._x = array("d", (c[0] for c in coords))
+        self._y = array("d", (c[1] for c in coords))
+        self._z = array("d", (c[2] for c in coords))
+
+        # Узел дерева = индекс центра; для каждого узла храним ось разбиения и потомков
+        count = len(self.centers)
+        self._axis = array("b", bytes(count))
+        self._left = array("l", [-1]) * count
+        self._right = array("l", [-1]) * count
+        self._root = self._build(list(range(count)), coords)
+
+    def __len__(self) -> int:
+        return len(self.centers)
+
+    def _build(self, indices: list, coords: list) -> int:
+        # Итеративное построение: медиана по оси с наибольшим разбросом
+        if not indices:
+            return -1
+        root = -1
+        stack = [(indices, -1, False)]
+        while stack:
+            items, parent, is_right = stack.pop()
+            if not items:
+                continue
+            spreads = [
+                max(coords[i][axis] for i in items) - min(coords[i][axis] for i in items)
+                for axis in range(3)
+            ]
+            axis = spreads.index(max(spreads))
+            items.sort(key=lambda i: coords[i][axis])
+            middle = len(items) // 2
+            node = items[middle]
+            self._axis[node] = axis
+            if parent < 0:
+                root = node
+            elif is_right:
+                self._right[parent] = node
+            else:
+                self._left[parent] = node
+            stack.append((items[:middle], node, False))
+            stack.append((items[middle + 1:], node, True))
+        return root
+
+    def nearest(self, lat: float, lng: float) -> Optional[Tuple[DispatchCenter, float]]:
+        if self._root < 0:
+            return None
+        qx, qy, qz = to_unit_vector(lat, lng)
+        query = (qx, qy, qz)
+        xs, ys, zs = self._x, self._y, self._z
+        axes, left, right = self._axis, self._left, self._right
+
+        best = -1
+        best_sq = float("inf")
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, plane_sq = stack.pop()
+            if plane_sq >= best_sq:
+                continue
+            dx = xs[node] - qx
+            dy = ys[node] - qy
+            dz = zs[node] - qz
+            dist_sq = dx * dx + dy * dy + dz * dz
+            if dist_sq < best_sq:
+                best_sq = dist_sq
+                best = node
+            axis = axes[node]
+            diff = query[axis] - (xs[node], ys[node], zs[node])[axis]
+            near, far = (left[node], right[node]) if diff < 0 else (right[node], left[node])
+            # Дальнюю ветку кладём первой, чтобы ближняя обрабатывалась раньше
+            if far >= 0:
+                stack.append((far, diff * diff))
+            if near >= 0:
+                stack.append((near, 0.0))
+        return self.centers[best], chord_to_km(best_sq)
+
+    def within(self, lat: float, lng: float, radius_km: float) -> List[Tuple[DispatchCenter, float]]:
+        if self._root < 0:
+            return []
+        qx, qy, qz = to_unit_vector(lat, lng)
+        query = (qx, qy, qz)
+        limit_sq = km_to_chord_sq(radius_km)
+        xs, ys, zs = self._x, self._y, self._z
+        axes, left, right = self._axis, self._left, self._right
+
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            dx = xs[node] - qx
+            dy = ys[node] - qy
+            dz = zs[node] - qz
+            dist_sq = dx * dx + dy * dy + dz * dz
+            if dist_sq <= limit_sq:
+                found.append((dist_sq, node))
+            diff = query[axes[node]] - (xs[node], ys[node], zs[node])[axes[node]]
+            near, far = (left[node], right[node]) if diff < 0 else (right[node], left[node])
+            if near >= 0:
+                stack.append(near)
+            if far >= 0 and diff * diff <= limit_sq:
+                stack.append(far)
+        found.sort()
+        return [(self.centers[node], chord_to_km(dist_sq)) for dist_sq, node in found]
+
+    def find_jurisdiction(self, lat: float, lng: float) -> Optional[Tuple[DispatchCenter, float]]:
+        # Ближайший центр, в чей радиус обслуживания попадает точка
+        for center, distance in self.within(lat, lng, self.max_radius_km):
+            if distance <= center.radius_km:
+                return center, distance
+        return None
+
+    def route(self, lat: float, lng: float, max_distance_km: float = 0.0) -> Optional[DispatchCenter]:
+        match = self.find_jurisdiction(lat, lng)
+        if match is None and max_distance_km > 0:
+            match = self.nearest(lat, lng)
+            if match is not None and match[1] > max_distance_km:
+                match = None
+        return match[0] if match else None
+
+    @classmethod
+    def load(cls, path: str) -> "DispatchRegistry":
+        with open(path, "r", newline="") as f:
+            if path.endswith(".csv"):
+                rows = list(csv.DictReader(f))
+            else:
+                payload = json.load(f)
+                rows = payload["centers"] if isinstance(payload, dict) else payload
+        return cls(DispatchCenter.from_dict(row) for row in rows)
@@ -0,0 +1,185 @@
+"""
+Хеджированная отправка экстренного звонка через нескольких провайдеров.
+
+Основной провайдер (Bland.ai) стартует сразу. Если он не принял звонок
+за hedge_delay секунд или упал, параллельно запускается следующий (Twilio).
+Побеждает первый успешный ответ, остальные попытки отменяются.
+У каждого провайдера свой circuit breaker: упавший провайдер пропускается сразу.
+Попытка, не ответившая за hedge_delay и отменённая или упёршаяся в бюджет,
+считается отказом: всегда медленный провайдер тоже выбивает breaker.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import CALLS_IN_FLIGHT, PROVIDER_CALLS, TIME_TO_ACCEPT
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        # После паузы пропускаем одну пробную попытку
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+
+    def release(self) -> None:
+        # Попытка отменена без результата - пробный слот освобождаем
+        self._trial_in_flight = False
+
+
+class AllProvidersFailed(Exception):
+    def __init__(self, errors: Dict[str, str]):
+        self.errors = errors
+        details = "; ".join(f"{name}: {error}" for name, error in errors.items()) or "no providers available"
+        super().__init__(details)
+
+
+class DispatchResult:
+    def __init__(self, provider: str, response: dict, time_to_accept: float,
+                 errors: Dict[str, str], hedged: bool, cancelled: List[str]):
+        self.provider = provider
+        self.response = response
+        self.time_to_accept = time_to_accept
+        self.errors = errors
+        self.hedged = hedged
+        self.cancelled = cancelled
+
+
+class HedgedDispatcher:
+    def __init__(self, providers: List[str], hedge_delay: float = 2.0, budget: float = 20.0,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.providers = list(providers)
+        self.hedge_delay = hedge_delay
+        self.budget = budget
+        self.breakers = {
+            name: CircuitBreaker(failure_threshold, reset_timeout) for name in self.providers
+        }
+
+    async def dispatch(self, calls: Dict[str, Callable[[], Awaitable[dict]]]) -> DispatchResult:
+        """calls: имя провайдера -> корутина-фабрика, которая бросает исключение при отказе"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.budget
+        errors: Dict[str, str] = {}
+
+        pending_providers = []
+        for name in self.providers:
+            if name not in calls:
+                continue
+            if not self.breakers[name].allow():
+                errors[name] = "circuit open"
+                PROVIDER_CALLS.inc(name, "circuit_open")
+                continue
+            pending_providers.append(name)
+
+        running: Dict[asyncio.Task, str] = {}
+        launched: Dict[asyncio.Task, float] = {}
+        hedged = False
+
+        def launch_next() -> bool:
+            if not pending_providers:
+                return False
+            name = pending_providers.pop(0)
+            task = asyncio.ensure_future(calls[name]())
+            CALLS_IN_FLIGHT.inc(name)
+            task.add_done_callback(lambda _, name=name: CALLS_IN_FLIGHT.dec(name))
+            running[task] = name
+            launched[task] = loop.time()
+            return True
+
+        launch_next()
+        try:
+            while running:
+                now = loop.time()
+                if now >= deadline:
+                    for name in running.values():
+                        errors[name] = "latency budget exceeded"
+                        PROVIDER_CALLS.inc(name, "timeout")
+                    break
+
+                # Ждём либо первый результат, либо момент запуска следующего провайдера
+                timeout = deadline - now
+                if pending_providers:
+                    timeout = min(timeout, self.hedge_delay)
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if launch_next():
+                        hedged = True
+                    continue
+
+                for task in done:
+                    name = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        self.breakers[name].record_success()
+                        PROVIDER_CALLS.inc(name, "success")
+                        time_to_accept = loop.time() - started
+                        TIME_TO_ACCEPT.observe(time_to_accept, name)
+                        cancelled = list(running.values())
+                        return DispatchResult(name, task.result(), time_to_accept,
+                                              errors, hedged, cancelled)
+                    self.breakers[name].record_failure()
+                    PROVIDER_CALLS.inc(name, "error")
+                    errors[name] = str(error) or repr(error)
+
+                # Провайдер упал - следующий запускаем сразу, не дожидаясь hedge_delay
+                if not running and launch_next():
+                    hedged = True
+        finally:
+            for task, name in running.items():
+                if task.done():
+                    # Завершилась одновременно с победителем - просто забираем результат
+                    if not task.cancelled():
+                        task.exception()
+                    continue
+                task.cancel()
+                if loop.time() - launched[task] >= self.hedge_delay:
+                    # Не ответил за hedge_delay - штраф за задержку, как за отказ
+                    self.breakers[name].record_failure()
+                    if name not in errors:
+                        PROVIDER_CALLS.inc(name, "slow")
+                else:
+                    self.breakers[name].release()
+                    if name not in errors:
+                        PROVIDER_CALLS.inc(name, "cancelled")
+            for name in pending_providers:
+                self.breakers[name].release()
+
+        raise AllProvidersFailed(errors)
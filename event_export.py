@@ -0,0 +1,344 @@
+"""
+Экспорт событий SOS и исходов звонков в бэкенд партнёра.
+
+Горячий путь только сериализует событие в буфер. Упаковщик режет буфер на
+пачки по числу событий или по времени и сжимает их gzip (NDJSON); отправщик
+шлёт пачки по одной через одно keep-alive соединение. Очередь готовых пачек
+в памяти ограничена: если партнёр тормозит или лежит, пачки уходят в спул
+на диске и отправляются оттуда, начиная со старых, в том числе после
+рестарта. Пачка удаляется только после 2xx, поэтому доставка - at-least-once:
+у события есть event_id, у пачки - Idempotency-Key для дедупликации у партнёра.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+
+import httpx
+
+from metrics import EXPORT_BACKLOG, EXPORT_BATCHES, EXPORT_EVENTS, EXPORT_SEND_LATENCY
+
+logger = logging.getLogger(__name__)
+
+SPOOL_PREFIX = "batch-"
+SPOOL_SUFFIX = ".ndjson.gz"
+REJECTED_DIR = "rejected"
+# Эти 4xx - временные: партнёр просит подождать, пачку отправим позже
+RETRYABLE_STATUSES = {408, 409, 425, 429}
+
+_sync = getattr(os, "fdatasync", os.fsync)
+
+
+class ExportBatch:
+    __slots__ = ("id", "body", "events", "path")
+
+    def __init__(self, id: str, events: int, body: bytes = b"", path: Optional[str] = None):
+        self.id = id
+        self.body = body
+        self.events = events
+        # Файл в спуле, если пачка уже на диске
+        self.path = path
+
+
+def spool_name(batch_id: str, events: int) -> str:
+    # Число событий в имени файла: после рестарта метрики считают события без распаковки
+    return f"{SPOOL_PREFIX}{batch_id}_{events}{SPOOL_SUFFIX}"
+
+
+def parse_spool_name(name: str) -> tuple:
+    batch_id, events = name[len(SPOOL_PREFIX):-len(SPOOL_SUFFIX)].rsplit("_", 1)
+    return batch_id, int(events)
+
+
+def retry_after_seconds(value: Optional[str]) -> float:
+    try:
+        return max(0.0, float(value)) if value else 0.0
+    except ValueError:
+        return 0.0
+
+
+class EventExporter:
+    def __init__(self, url: str, spool_dir: str = "export_spool", token: str = "", batch_events: int = 500,
+                 flush_interval: float = 1.0, max_memory_batches: int = 8, max_pending: int = 50000,
+                 max_spool_bytes: int = 1024 * 1024 * 1024, timeout: float = 10.0, retry_delay: float = 1.0,
+                 max_retry_delay: float = 60.0, gzip_level: int = 6, kinds: Iterable[str] = ()):
+        self.url = url
+        self.spool_dir = spool_dir
+        self.token = token
+        self.batch_events = batch_events
+        self.flush_interval = flush_interval
+        # Backpressure: сверх этого числа готовых пачек в памяти новые пачки пишутся в спул
+        self.max_memory_batches = max_memory_batches
+        # Событий, ещё не упакованных в пачку; сверх - отбрасываем (упаковщик не успевает, диск недоступен)
+        self.max_pending = max_pending
+        self.max_spool_bytes = max_spool_bytes
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.gzip_level = gzip_level
+        # Пусто - экспортируются все виды записей журнала аудита
+        self.kinds = frozenset(kinds)
+        # Префикс id уникален для процесса и запуска: event_id не повторяются между рестартами
+        self._token = f"{int(time.time() * 1000):013d}-{os.getpid()}"
+        self._seq = 0
+        self._batches = 0
+        self._pending: List[bytes] = []
+        self._ready: deque = deque()
+        self._spool: deque = deque()
+        self._spool_bytes = 0
+        self._failures = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._packer: Optional[asyncio.Task] = None
+        self._sender: Optional[asyncio.Task] = None
+        self._pack_wakeup: Optional[asyncio.Event] = None
+        self._send_wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    @property
+    def backlog(self) -> dict:
+        return {"pending_events": len(self._pending), "memory_batches": len(self._ready),
+                "spooled_batches": len(self._spool), "spooled_bytes": self._spool_bytes}
+
+    def emit(self, record: dict) -> bool:
+        """Кладёт событие в буфер; не блокирует и не ходит в сеть"""
+        if not self.enabled or (self.kinds and record.get("kind") not in self.kinds):
+            return False
+        if len(self._pending) >= self.max_pending:
+            EXPORT_EVENTS.inc("dropped")
+            return False
+        self._seq += 1
+        line = json.dumps(dict(record, event_id=f"{self._token}-{self._seq}"), separators=(",", ":"),
+                          default=str).encode()
+        self._pending.append(line)
+        if len(self._pending) >= self.batch_events and self._pack_wakeup is not None:
+            self._pack_wakeup.set()
+        return True
+
+    async def start(self) -> int:
+        """Запускает упаковщик и отправщик; возвращает число пачек, оставшихся в спуле с прошлого запуска"""
+        if not self.enabled or self._sender is not None:
+            return 0
+        self._closing = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-export")
+        resumed = await self._run(self._load_spool)
+        # Одно соединение: пачки уходят строго по одной, keep-alive переиспользуется
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=1, max_keepalive_connections=1, keepalive_expiry=60),
+        )
+        self._pack_wakeup = asyncio.Event()
+        self._send_wakeup = asyncio.Event()
+        self._packer = asyncio.create_task(self._run_packer())
+        self._sender = asyncio.create_task(self._run_sender())
+        self._update_backlog()
+        return resumed
+
+    async def close(self) -> None:
+        if self._sender is None:
+            return
+        # Задачи останавливаются флагом: cancel() во время wait_for в Python 3.11 может потеряться
+        self._closing = True
+        self._pack_wakeup.set()
+        self._send_wakeup.set()
+        await self._packer
+        await self._sender
+        self._packer = self._sender = None
+        # Неотправленное уходит на диск и будет доставлено после рестарта
+        await self._pack()
+        while self._ready and await self._try_spill(self._ready[0]):
+            self._ready.popleft()
+        if self._ready:
+            lost = sum(batch.events for batch in self._ready)
+            logger.error("Event export could not spool %d events on shutdown", lost)
+            EXPORT_EVENTS.inc("dropped", amount=lost)
+            self._ready.clear()
+        await self._client.aclose()
+        self._client = None
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._update_backlog()
+
+    async def drain(self, timeout: float) -> bool:
+        """Ждёт, пока все события будут доставлены; False - не успели за timeout"""
+        deadline = time.monotonic() + timeout
+        while self._pending or self._ready or self._spool:
+            if time.monotonic() >= deadline:
+                return False
+            if self._pack_wakeup is not None:
+                self._pack_wakeup.set()
+            await asyncio.sleep(0.01)
+        return True
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _run_packer(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._pack_wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._pack_wakeup.clear()
+            await self._pack()
+
+    async def _pack(self) -> None:
+        while self._pending:
+            # Буфер подменяется до await: события, пришедшие во время сжатия, уйдут следующей пачкой
+            lines, self._pending = self._pending[:self.batch_events], self._pending[self.batch_events:]
+            self._batches += 1
+            batch_id = f"{self._token}-{self._batches:08d}"
+            body = await self._run(self._compress, lines)
+            batch = ExportBatch(batch_id, len(lines), body)
+            if len(self._ready) < self.max_memory_batches or not await self._try_spill(batch):
+                # Спул недоступен: лучше превысить лимит памяти, чем потерять пачку
+                self._ready.append(batch)
+            self._update_backlog()
+            self._send_wakeup.set()
+
+    def _compress(self, lines: List[bytes]) -> bytes:
+        return gzip.compress(b"\n".join(lines) + b"\n", compresslevel=self.gzip_level, mtime=0)
+
+    async def _run_sender(self) -> None:
+        while not self._closing:
+            # Сначала старые пачки с диска, потом свежие из памяти
+            batch = self._spool[0] if self._spool else self._ready[0] if self._ready else None
+            if batch is None:
+                await self._send_wakeup.wait()
+                self._send_wakeup.clear()
+                continue
+            try:
+                if batch.path is not None and not batch.body:
+                    batch.body = await self._run(self._read, batch.path)
+                outcome, delay = await self._send(batch)
+                if outcome == "sent" or outcome == "rejected":
+                    await self._done(batch, outcome)
+                    self._failures = 0
+                    continue
+            except OSError as e:
+                logger.error("Event export spool access failed: %s", e)
+                outcome, delay = "failed", 0.0
+
+            # Партнёр недоступен: всё, что в памяти, уходит на диск, отправка - после паузы
+            self._failures += 1
+            while self._ready and await self._try_spill(self._ready[0]):
+                self._ready.popleft()
+            delay = max(delay, min(self.max_retry_delay, self.retry_delay * 2 ** (self._failures - 1)))
+            try:
+                await asyncio.wait_for(self._wait_closing(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _wait_closing(self) -> None:
+        while not self._closing:
+            await self._send_wakeup.wait()
+            self._send_wakeup.clear()
+
+    async def _send(self, batch: ExportBatch) -> tuple:
+        headers = {"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip",
+                   "Idempotency-Key": batch.id, "X-Event-Count": str(batch.events)}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        try:
+            response = await self._client.post(self.url, content=batch.body, headers=headers)
+        except httpx.HTTPError as e:
+            logger.warning("Event export to %s failed: %s", self.url, str(e) or type(e).__name__)
+            EXPORT_BATCHES.inc("failed")
+            return "failed", 0.0
+        finally:
+            EXPORT_SEND_LATENCY.observe(time.perf_counter() - started)
+        if response.is_success:
+            return "sent", 0.0
+        if response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES:
+            EXPORT_BATCHES.inc("throttled" if response.status_code == 429 else "failed")
+            return "failed", retry_after_seconds(response.headers.get("retry-after"))
+        # Партнёр отверг саму пачку - повтор не поможет, откладываем её для разбора
+        logger.error("Event export batch %s rejected with %d: %s", batch.id, response.status_code,
+                     response.text[:200])
+        return "rejected", 0.0
+
+    async def _done(self, batch: ExportBatch, outcome: str) -> None:
+        if batch.path is not None:
+            await self._run(self._remove, batch.path, outcome == "rejected")
+            self._spool.popleft()
+            self._spool_bytes -= len(batch.body)
+        else:
+            self._ready.popleft()
+            if outcome == "rejected":
+                await self._run(self._write, os.path.join(self.spool_dir, REJECTED_DIR), batch)
+        EXPORT_BATCHES.inc(outcome)
+        EXPORT_EVENTS.inc(outcome, amount=batch.events)
+        self._update_backlog()
+
+    async def _try_spill(self, batch: ExportBatch) -> bool:
+        try:
+            await self._spill(batch)
+        except OSError as e:
+            logger.error("Event export spool write failed: %s", e)
+            return False
+        return True
+
+    async def _spill(self, batch: ExportBatch) -> None:
+        if self._spool_bytes + len(batch.body) > self.max_spool_bytes:
+            # Диск тоже кончился: это единственное место, где события теряются
+            logger.error("Event export spool is full, dropping batch %s of %d events", batch.id, batch.events)
+            EXPORT_BATCHES.inc("dropped")
+            EXPORT_EVENTS.inc("dropped", amount=batch.events)
+            return
+        batch.path = await self._run(self._write, self.spool_dir, batch)
+        # Тело не держим в памяти: перечитаем с диска перед отправкой
+        self._spool_bytes += len(batch.body)
+        self._spool.append(batch)
+        batch.body = b""
+        EXPORT_BATCHES.inc("spilled")
+        self._update_backlog()
+
+    def _load_spool(self) -> int:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            if name.endswith(".tmp"):
+                # Запись оборвалась до rename: пачка не была подтверждена как сохранённая
+                os.remove(path)
+            elif name.startswith(SPOOL_PREFIX) and name.endswith(SPOOL_SUFFIX):
+                self._spool.append(ExportBatch(*parse_spool_name(name), path=path))
+                self._spool_bytes += os.path.getsize(path)
+        return len(self._spool)
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _write(directory: str, batch: ExportBatch) -> str:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, spool_name(batch.id, batch.events))
+        with open(path + ".tmp", "wb") as f:
+            f.write(batch.body)
+            f.flush()
+            _sync(f.fileno())
+        os.replace(path + ".tmp", path)
+        return path
+
+    def _remove(self, path: str, rejected: bool) -> None:
+        if rejected:
+            directory = os.path.join(self.spool_dir, REJECTED_DIR)
+            os.makedirs(directory, exist_ok=True)
+            os.replace(path, os.path.join(directory, os.path.basename(path)))
+        else:
+            os.remove(path)
+
+    def _update_backlog(self) -> None:
+        EXPORT_BACKLOG.set(len(self._ready), "memory")
+        EXPORT_BACKLOG.set(len(self._spool), "disk")
@@ -0,0 +1,223 @@
+"""
+Живые GPS-треки активных поездок.
+
+Каждой поездке выделяется слот в общих массивах фиксированного размера:
+кольцевой буфер на capacity точек. Пинг записывается в массивы на месте,
+без объекта на каждую точку. Пинги чаще min_interval прореживаются:
+новейшая точка перезаписывается, в истории остаётся примерно одна точка
+на интервал.
+"""
+import json
+import math
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+# Ближе этого расстояния направление движения по двум точкам не вычисляем - шум GPS
+MIN_BEARING_DISTANCE_M = 10.0
+
+NAN = float("nan")
+
+
+class GpsFix(NamedTuple):
+    ts: float
+    lat: float
+    lng: float
+    heading: float
+    speed: float
+
+    def to_dict(self) -> dict:
+        # NaN в JSON недопустим: неизвестные направление и скорость отдаются как null
+        return {field: None if value != value else value for field, value in zip(self._fields, self)}
+
+
+def _heading_and_speed(ts0: float, lat0: float, lng0: float, ts: float, lat: float, lng: float) -> Tuple[float, float]:
+    # Равнопрямоугольная проекция: на расстояниях между пингами погрешность пренебрежима
+    x = math.radians(lng - lng0) * math.cos(math.radians((lat + lat0) / 2))
+    y = math.radians(lat - lat0)
+    distance = math.hypot(x, y) * EARTH_RADIUS_M
+    if distance < MIN_BEARING_DISTANCE_M or ts <= ts0:
+        return NAN, NAN
+    return math.degrees(math.atan2(x, y)) % 360, distance / (ts - ts0)
+
+
+class GpsTracks:
+    def __init__(self, capacity: int = 60, min_interval: float = 2.0, max_age: float = 300.0,
+                 max_rides: int = 100000, max_skew: float = 30.0):
+        self.capacity = capacity
+        self.min_interval = min_interval
+        # Точка старше max_age не считается живой позицией
+        self.max_age = max_age
+        self.max_rides = max_rides
+        # Точка из будущего навсегда заслонила бы настоящие пинги: допускаем только расхождение часов
+        self.max_skew = max_skew
+        self._slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._rides = 0
+        # Точки всех поездок: слот s занимает индексы [s * capacity, (s + 1) * capacity)
+        self._ts = array("d")
+        self._lat = array("d")
+        self._lng = array("d")
+        self._heading = array("f")
+        self._speed = array("f")
+        # Позиция новейшей точки в кольце и число точек по слотам
+        self._head = array("l")
+        self._count = array("l")
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, ride_id: str) -> bool:
+        return ride_id in self._slots
+
+    def _allocate(self, ride_id: str) -> int:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._rides == len(self._head):
+                self._grow(max(64, self._rides * 2))
+            slot = self._rides
+            self._rides += 1
+        self._slots[ride_id] = slot
+        self._count[slot] = 0
+        self._head[slot] = 0
+        return slot
+
+    def _grow(self, slots: int) -> None:
+        added = slots - len(self._head)
+        points = added * self.capacity
+        for column, count in ((self._ts, points), (self._lat, points), (self._lng, points),
+                              (self._heading, points), (self._speed, points),
+                              (self._head, added), (self._count, added)):
+            column.extend(array(column.typecode, bytes(column.itemsize * count)))
+
+    def record(self, ride_id: str, ts: float, lat: float, lng: float, heading: float = NAN,
+               speed: float = NAN, now: Optional[float] = None) -> bool:
+        """False - пинг отброшен (старше новейшей точки, из будущего, вне координат или нет места)"""
+        # float() принимает "nan" и "inf": такая точка сломала бы сценарий звонка
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0) or not math.isfinite(ts):
+            return False
+        if now is not None and ts > now + self.max_skew:
+            return False
+        if not math.isfinite(heading):
+            heading = NAN
+        if not math.isfinite(speed):
+            speed = NAN
+        slot = self._slots.get(ride_id)
+        if slot is None:
+            if len(self._slots) >= self.max_rides and not self.prune(ts - self.max_age):
+                return False
+            slot = self._allocate(ride_id)
+
+        capacity = self.capacity
+        base = slot * capacity
+        count = self._count[slot]
+        head = self._head[slot]
+        timestamps = self._ts
+        if count:
+            newest_ts = timestamps[base + head]
+            if ts < newest_ts:
+                return False
+            previous = base + (head - 1) % capacity
+            if count >= 2 and ts - timestamps[previous] < self.min_interval:
+                # Прореживание: новейшая точка обновляется на месте, кольцо не сдвигается
+                anchor = previous
+            else:
+                anchor = base + head
+                head = (head + 1) % capacity
+                self._head[slot] = head
+                if count < capacity:
+                    self._count[slot] = count + 1
+            if heading != heading or speed != speed:
+                derived_heading, derived_speed = _heading_and_speed(
+                    timestamps[anchor], self._lat[anchor], self._lng[anchor], ts, lat, lng)
+                if heading != heading:
+                    heading = derived_heading
+                if speed != speed:
+                    speed = derived_speed
+        else:
+            self._count[slot] = 1
+
+        index = base + head
+        timestamps[index] = ts
+        self._lat[index] = lat
+        self._lng[index] = lng
+        self._heading[index] = heading
+        self._speed[index] = speed
+        return True
+
+    def latest(self, ride_id: str, now: Optional[float] = None) -> Optional[GpsFix]:
+        slot = self._slots.get(ride_id)
+        if slot is None or not self._count[slot]:
+            return None
+        index = slot * self.capacity + self._head[slot]
+        ts = self._ts[index]
+        if now is not None and now - ts > self.max_age:
+            return None
+        return GpsFix(ts, self._lat[index], self._lng[index], self._heading[index], self._speed[index])
+
+    def track(self, ride_id: str) -> List[GpsFix]:
+        """Точки поездки от старой к новой"""
+        slot = self._slots.get(ride_id)
+        if slot is None:
+            return []
+        capacity = self.capacity
+        base = slot * capacity
+        count = self._count[slot]
+        head = self._head[slot]
+        indices = (base + (head - offset) % capacity for offset in range(count - 1, -1, -1))
+        return [GpsFix(self._ts[i], self._lat[i], self._lng[i], self._heading[i], self._speed[i]) for i in indices]
+
+    def forget(self, ride_id: str) -> bool:
+        slot = self._slots.pop(ride_id, None)
+        if slot is None:
+            return False
+        self._count[slot] = 0
+        self._free.append(slot)
+        return True
+
+    def prune(self, older_than: float) -> int:
+        # Поездки без пингов с older_than освобождают слоты
+        stale = [ride_id for ride_id, slot in self._slots.items()
+                 if self._ts[slot * self.capacity + self._head[slot]] < older_than]
+        for ride_id in stale:
+            self.forget(ride_id)
+        return len(stale)
+
+
+def parse_ping(line: bytes, now: float) -> Optional[tuple]:
+    """
+    Пинг в JSON ({"ride_id", "lat", "lng", "heading", "speed", "ts"}) или
+    компактной CSV-строкой ride_id,ts,lat,lng[,heading[,speed]]; пустые поля - неизвестно.
+    """
+    try:
+        if line[:1] == b"{":
+            ping = json.loads(line)
+            ts = ping.get("ts")
+            heading = ping.get("heading")
+            speed = ping.get("speed")
+            return (str(ping["ride_id"]), now if ts is None else float(ts), float(ping["lat"]), float(ping["lng"]),
+                    NAN if heading is None else float(heading), NAN if speed is None else float(speed))
+        fields = line.decode().split(",")
+        if len(fields) < 4:
+            return None
+        optional = fields[4:6] + ["", ""]
+        return (fields[0], float(fields[1]) if fields[1] else now, float(fields[2]), float(fields[3]),
+                float(optional[0]) if optional[0] else NAN, float(optional[1]) if optional[1] else NAN)
+    except (ValueError, KeyError, TypeError, AttributeError, UnicodeDecodeError):
+        return None
+
+
+def ingest_lines(tracks: GpsTracks, lines: Iterable[bytes], now: float) -> Tuple[int, int]:
+    accepted = rejected = 0
+    record = tracks.record
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        ping = parse_ping(line, now)
+        if ping is not None and record(*ping, now=now):
+            accepted += 1
+        else:
+            rejected += 1
+    return accepted, rejected
@@ -0,0 +1,189 @@
+"""
+Кластеры массовых инцидентов: SOS с разных поездок, нажатые рядом друг с
+другом за короткое время (авария, беспорядки), сводятся к одному звонку.
+
+Первый SOS открывает кластер с центром в своей точке; следующие SOS в
+радиусе от центра, пока окно кластера открыто, присоединяются к нему без
+нового звонка. Как только сценарий звонка кластера собран, кластер
+закрывается: опоздавший SOS рядом открывает новый кластер со своим звонком,
+а не пропадает в уже идущем разговоре. Индекс - сетка с ячейкой не уже радиуса: поиск смотрит 3x3
+ячейки вокруг точки, вставка и поиск - O(1) от числа живых кластеров.
+Окна у всех кластеров одинаковые, поэтому устаревшие кластеры всегда в
+начале очереди и удаляются по мере вставки.
+"""
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sos_dedup import severity_rank
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+# Ближе к полюсам ячейки не сужаем: там такси не ездят, а ширина столбца ушла бы в бесконечность
+MAX_GRID_LAT = 85.0
+
+
+class ClusterMember(NamedTuple):
+    incident_id: str
+    ride_id: str
+    incident_type: str
+    severity: str
+    distance_m: float
+    joined: float
+    key: tuple = ()
+    # Запрос SOS: если звонок кластера не удастся, участник встанет в очередь своим инцидентом
+    payload: Optional[dict] = None
+
+
+class IncidentCluster:
+    __slots__ = ("id", "lat", "lng", "started", "members", "call_id", "cell")
+
+    def __init__(self, incident_id: str, lat: float, lng: float, started: float, cell: tuple):
+        # id кластера - id первого инцидента: его звонок и обслуживает весь кластер
+        self.id = incident_id
+        self.lat = lat
+        self.lng = lng
+        self.started = started
+        self.members: List[ClusterMember] = []
+        self.call_id: Optional[str] = None
+        self.cell = cell
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    @property
+    def severity(self) -> str:
+        # Звонок кластера идёт с тяжестью самого тяжёлого SOS в нём
+        return max((member.severity for member in self.members), key=severity_rank)
+
+    def escalate(self, key: tuple, severity: str) -> bool:
+        """Поднимает тяжесть участника с этим ключом SOS; False - участника нет или тяжесть не выше"""
+        for index, member in enumerate(self.members):
+            if member.key == key and severity_rank(severity) > severity_rank(member.severity):
+                payload = dict(member.payload, severity=severity) if member.payload is not None else None
+                self.members[index] = member._replace(severity=severity, payload=payload)
+                return True
+        return False
+
+    def to_dict(self) -> dict:
+        return {"cluster_id": self.id, "lat": self.lat, "lng": self.lng, "call_id": self.call_id,
+                "rides": [member.ride_id for member in self.members], "size": len(self.members)}
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    # Равнопрямоугольная проекция: на радиусах кластера погрешность меньше метра
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_M
+
+
+class IncidentClusters:
+    def __init__(self, radius_m: float = 300.0, window: float = 300.0, max_members: int = 50,
+                 max_clusters: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.radius_m = radius_m
+        self.window = window
+        self.max_members = max_members
+        self.max_clusters = max_clusters
+        self.clock = clock
+        self._cell_lat = radius_m / METERS_PER_DEGREE if radius_m > 0 else 1.0
+        # Ширина столбца по долготе на строку сетки: по краю строки, ближнему к полюсу
+        self._cell_lng: Dict[int, float] = {}
+        self._cells: Dict[tuple, List[IncidentCluster]] = {}
+        self._open: deque = deque()
+        # Кластеры по id: живут дольше окна, пока звонок кластера ещё в очереди
+        self._by_id: OrderedDict = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.radius_m > 0 and self.window > 0
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    def get(self, cluster_id: str) -> Optional[IncidentCluster]:
+        return self._by_id.get(cluster_id)
+
+    def _column_width(self, row: int) -> float:
+        width = self._cell_lng.get(row)
+        if width is None:
+            edge = min(MAX_GRID_LAT, max(abs(row), abs(row + 1)) * self._cell_lat)
+            width = self._cell_lng[row] = self._cell_lat / math.cos(math.radians(edge))
+        return width
+
+    def _cell(self, lat: float, lng: float) -> tuple:
+        row = math.floor(lat / self._cell_lat)
+        return row, math.floor(lng / self._column_width(row))
+
+    def find(self, lat: float, lng: float, now: Optional[float] = None) -> Optional[Tuple[IncidentCluster, float]]:
+        """Ближайший открытый кластер, в радиус которого попадает точка"""
+        now = self.clock() if now is None else now
+        self.prune(now)
+        row = math.floor(lat / self._cell_lat)
+        best = None
+        for neighbour_row in (row - 1, row, row + 1):
+            column = math.floor(lng / self._column_width(neighbour_row))
+            for neighbour_column in (column - 1, column, column + 1):
+                for cluster in self._cells.get((neighbour_row, neighbour_column), ()):
+                    if len(cluster.members) >= self.max_members:
+                        continue
+                    distance = distance_m(cluster.lat, cluster.lng, lat, lng)
+                    if distance <= self.radius_m and (best is None or distance < best[1]):
+                        best = cluster, distance
+        return best
+
+    def attach(self, incident_id: str, lat: float, lng: float, ride_id: str, incident_type: str,
+               severity: str, key: tuple = (), payload: Optional[dict] = None) -> Tuple[IncidentCluster, bool]:
+        """Присоединяет SOS к кластеру рядом или открывает новый; второе значение - открыт ли новый"""
+        now = self.clock()
+        found = self.find(lat, lng, now)
+        if found is not None:
+            cluster, distance = found
+            cluster.members.append(ClusterMember(incident_id, ride_id, incident_type, severity, distance, now, key,
+                                                 payload))
+            return cluster, False
+
+        cell = self._cell(lat, lng)
+        cluster = IncidentCluster(incident_id, lat, lng, now, cell)
+        cluster.members.append(ClusterMember(incident_id, ride_id, incident_type, severity, 0.0, now, key, payload))
+        self._cells.setdefault(cell, []).append(cluster)
+        self._open.append(cluster)
+        self._by_id[incident_id] = cluster
+        while len(self._by_id) > self.max_clusters:
+            _, evicted = self._by_id.popitem(last=False)
+            self._close(evicted)
+        return cluster, True
+
+    def seal(self, cluster_id: str) -> None:
+        # Сценарий звонка собран: новые SOS в него уже не попадут
+        cluster = self._by_id.get(cluster_id)
+        if cluster is not None:
+            self._close(cluster)
+
+    def forget(self, cluster_id: str) -> Optional[IncidentCluster]:
+        # Звонок кластера не удался: следующий SOS рядом должен открыть новый кластер
+        cluster = self._by_id.pop(cluster_id, None)
+        if cluster is not None:
+            self._close(cluster)
+        return cluster
+
+    def prune(self, now: Optional[float] = None) -> int:
+        now = self.clock() if now is None else now
+        expired = 0
+        while self._open and self._open[0].started + self.window <= now:
+            self._close(self._open[0])
+            expired += 1
+        return expired
+
+    def _close(self, cluster: IncidentCluster) -> None:
+        # Закрытый кластер уходит из индекса, но остаётся в _by_id для звонка из очереди
+        cell = self._cells.get(cluster.cell)
+        if cell is None or cluster not in cell:
+            return
+        cell.remove(cluster)
+        if not cell:
+            del self._cells[cluster.cell]
+        if self._open and self._open[0] is cluster:
+            self._open.popleft()
+        else:
+            self._open.remove(cluster)
@@ -0,0 +1,278 @@
+"""
+Локальная надёжная очередь инцидентов на SQLite (WAL).
+
+/api/emergency только записывает инцидент и сразу отвечает 202,
+звонок делают фоновые воркеры. Взятый в работу инцидент получает аренду
+(lease): если процесс упал посреди звонка, после истечения аренды
+инцидент снова попадает в работу - в том числе после перезапуска.
+Пока обработчик работает (в том числе ждёт слот звонка), аренда
+продлевается. Номер попытки - токен аренды: завершить или вернуть в очередь
+инцидент может только тот, кто взял его последним.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+DISPATCHING = "dispatching"
+DISPATCHED = "dispatched"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    deadline REAL
+);
+CREATE INDEX IF NOT EXISTS incidents_ready ON incidents (status, next_attempt_at);
+"""
+
+
+class PermanentIncidentError(Exception):
+    """Ошибка, которую бессмысленно повторять (например, поездка не найдена)"""
+
+
+class IncidentQueue:
+    def __init__(self, path: str, max_attempts: int = 3, retry_delay: float = 2.0,
+                 lease_seconds: float = 30.0, poll_interval: float = 0.5):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._db: Optional[sqlite3.Connection] = None
+        # SQLite пишет один поток: все операции идут через него, event loop не блокируется
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Один сигнал на каждый новый инцидент будит ровно одного свободного воркера
+        self._wakeup: Optional[asyncio.Semaphore] = None
+        self._workers: list = []
+        self._stopping = False
+        self._on_failed: Optional[Callable[[str, dict, str], None]] = None
+
+    def open(self) -> None:
+        if self._db is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="incident-queue")
+        self._executor.submit(self._connect).result()
+
+    def _connect(self) -> None:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        # NORMAL в режиме WAL переживает падение процесса, fsync делается на checkpoint
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=5000")
+        db.executescript(SCHEMA)
+        # Очереди, созданные до появления приоритетов, получают колонку дедлайна
+        columns = {row[1] for row in db.execute("PRAGMA table_info(incidents)")}
+        if "deadline" not in columns:
+            db.execute("ALTER TABLE incidents ADD COLUMN deadline REAL")
+        self._db = db
+
+    async def close(self) -> None:
+        await self.stop_workers()
+        if self._executor is not None:
+            await self._run(self._db.close)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._db = None
+
+    async def _run(self, fn, *args):
+        if self._db is None:
+            self.open()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    async def enqueue(self, payload: dict, incident_id: Optional[str] = None,
+                      deadline: Optional[float] = None) -> str:
+        incident_id = incident_id or self.new_id()
+        await self._run(self._insert, incident_id, json.dumps(payload), deadline)
+        if self._wakeup is not None:
+            self._wakeup.release()
+        return incident_id
+
+    def _insert(self, incident_id: str, payload: str, deadline: Optional[float]) -> None:
+        now = time.time()
+        self._db.execute(
+            "INSERT INTO incidents (id, status, payload, created_at, updated_at, next_attempt_at, deadline) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (incident_id, QUEUED, payload, now, now, now, now if deadline is None else deadline),
+        )
+
+    async def escalate(self, incident_id: str, deadline: float, severity: Optional[str] = None) -> bool:
+        """Переносит ожидающий инцидент на более ранний дедлайн (и тяжесть в запросе, если задана);
+        False - инцидент уже не в очереди"""
+        return await self._run(self._escalate, incident_id, deadline, severity)
+
+    def _escalate(self, incident_id: str, deadline: float, severity: Optional[str]) -> bool:
+        cursor = self._db.execute(
+            "UPDATE incidents SET deadline = MIN(COALESCE(deadline, created_at), ?), "
+            "payload = CASE WHEN ? IS NULL THEN payload ELSE json_set(payload, '$.severity', ?) END "
+            "WHERE id = ? AND status = ?",
+            (deadline, severity, severity, incident_id, QUEUED),
+        )
+        return cursor.rowcount > 0
+
+    async def get(self, incident_id: str) -> Optional[dict]:
+        return await self._run(self._select, incident_id)
+
+    def _select(self, incident_id: str) -> Optional[dict]:
+        row = self._db.execute(
+            "SELECT id, status, payload, attempts, result, error, created_at, updated_at "
+            "FROM incidents WHERE id = ?",
+            (incident_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "incident_id": row[0],
+            "status": row[1],
+            "request": json.loads(row[2]),
+            "attempts": row[3],
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    async def claim(self) -> Optional[tuple]:
+        return await self._run(self._claim)
+
+    def _claim(self) -> Optional[tuple]:
+        now = time.time()
+        # Атомарно забираем готовый инцидент с самым ранним дедлайном (тяжесть + время ожидания)
+        # или инцидент с истёкшей арендой
+        row = self._db.execute(
+            "UPDATE incidents SET status = ?, attempts = attempts + 1, lease_until = ?, updated_at = ? "
+            "WHERE id = (SELECT id FROM incidents "
+            "            WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until <= ?) "
+            "            ORDER BY COALESCE(deadline, created_at) LIMIT 1) "
+            "RETURNING id, payload, attempts",
+            (DISPATCHING, now + self.lease_seconds, now, QUEUED, now, DISPATCHING, now),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    async def renew(self, incident_id: str, attempts: int) -> bool:
+        """Продлевает аренду; False - аренду уже забрал другой воркер"""
+        return await self._run(self._renew, incident_id, attempts)
+
+    def _renew(self, incident_id: str, attempts: int) -> bool:
+        cursor = self._db.execute(
+            "UPDATE incidents SET lease_until = ? WHERE id = ? AND status = ? AND attempts = ?",
+            (time.time() + self.lease_seconds, incident_id, DISPATCHING, attempts),
+        )
+        return cursor.rowcount > 0
+
+    async def complete(self, incident_id: str, result: dict, attempts: Optional[int] = None) -> bool:
+        return await self._run(self._finish, incident_id, DISPATCHED, json.dumps(result), None, attempts)
+
+    async def fail(self, incident_id: str, error: str, attempts: int, permanent: bool = False) -> str:
+        """Новый статус инцидента; DISPATCHING - аренда потеряна, инцидентом занят другой воркер"""
+        if permanent or attempts >= self.max_attempts:
+            owned = await self._run(self._finish, incident_id, FAILED, None, error, attempts)
+            return FAILED if owned else DISPATCHING
+        owned = await self._run(self._retry, incident_id, error, time.time() + self.retry_delay * attempts, attempts)
+        return QUEUED if owned else DISPATCHING
+
+    def _finish(self, incident_id: str, status: str, result: Optional[str], error: Optional[str],
+                attempts: Optional[int] = None) -> bool:
+        cursor = self._db.execute(
+            "UPDATE incidents SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? "
+            "WHERE id = ? AND (? IS NULL OR (status = ? AND attempts = ?))",
+            (status, result, error, time.time(), incident_id, attempts, DISPATCHING, attempts),
+        )
+        return cursor.rowcount > 0
+
+    def _retry(self, incident_id: str, error: str, next_attempt_at: float, attempts: int) -> bool:
+        cursor = self._db.execute(
+            "UPDATE incidents SET status = ?, error = ?, next_attempt_at = ?, lease_until = NULL, "
+            "updated_at = ? WHERE id = ? AND status = ? AND attempts = ?",
+            (QUEUED, error, next_attempt_at, time.time(), incident_id, DISPATCHING, attempts),
+        )
+        return cursor.rowcount > 0
+
+    async def counts(self) -> dict:
+        return await self._run(self._counts)
+
+    def _counts(self) -> dict:
+        return dict(self._db.execute("SELECT status, COUNT(*) FROM incidents GROUP BY status").fetchall())
+
+    def start_workers(self, handler: Callable[[str, dict], Awaitable[dict]], concurrency: int,
+                      on_failed: Optional[Callable[[str, dict, str], None]] = None) -> None:
+        self.open()
+        self._wakeup = asyncio.Semaphore(0)
+        self._stopping = False
+        self._on_failed = on_failed
+        self._workers = [asyncio.create_task(self._worker(handler)) for _ in range(concurrency)]
+
+    async def stop_workers(self) -> None:
+        # cancel() во время wait_for в Python 3.11 может потеряться: флаг останавливает цикл воркера
+        self._stopping = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self, handler: Callable[[str, dict], Awaitable[dict]]) -> None:
+        while not self._stopping:
+            job = await self.claim()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.acquire(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            incident_id, payload, attempts = job
+            heartbeat = asyncio.create_task(self._heartbeat(incident_id, attempts))
+            try:
+                result = await handler(incident_id, payload)
+            except asyncio.CancelledError:
+                # Остановка сервиса: инцидент останется в аренде и будет подобран позже
+                raise
+            except PermanentIncidentError as e:
+                if await self.fail(incident_id, str(e), attempts, permanent=True) == FAILED:
+                    self._notify_failed(incident_id, payload, str(e))
+            except Exception as e:
+                error = str(e) or repr(e)
+                status = await self.fail(incident_id, error, attempts)
+                logger.warning("Incident %s attempt %d failed (%s): %s", incident_id, attempts, status, error)
+                if status == FAILED:
+                    self._notify_failed(incident_id, payload, error)
+            else:
+                if not await self.complete(incident_id, result, attempts):
+                    logger.warning("Incident %s attempt %d finished after its lease was taken over",
+                                   incident_id, attempts)
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, incident_id: str, attempts: int) -> None:
+        # Звонок низкой тяжести может ждать слот дольше аренды: без продления его взял бы второй воркер
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await self.renew(incident_id, attempts):
+                logger.warning("Incident %s lost its lease during attempt %d", incident_id, attempts)
+                return
+
+    def _notify_failed(self, incident_id: str, payload: dict, error: str) -> None:
+        if self._on_failed is not None:
+            self._on_failed(incident_id, payload, error)
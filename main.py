@@ -1,16 +1,285 @@
 import os
+import asyncio
+import hmac
 import json
-import requests
+import math
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 import logging
 
-app = FastAPI(title="RideGuard Emergency AI Assistant")
+from admission import AdmissionControl, CallQuotaExceeded
+from audit_log import AuditLog
+from call_events import FINAL_CALL_STATUSES, BroadcastHub, CallTracker, format_sse, is_final
+from call_recordings import MEDIA_TYPES, RecordingFetcher, iter_file, range_headers
+from config import Config
+from dispatch_centers import DispatchCenter, DispatchRegistry
+from dispatcher import AllProvidersFailed, HedgedDispatcher
+from event_export import EventExporter
+from gps_tracks import GpsTracks, ingest_lines
+from incident_clusters import IncidentCluster, IncidentClusters
+from incident_queue import IncidentQueue, PermanentIncidentError
+from metrics import GPS_PINGS, REGISTRY, STAGE_LATENCY
+from notifications import ChannelPolicy, FanoutRun, NotificationFanout, recipients_sender
+from profiling import FORMATS, ProfilerBusy, ProfilingMiddleware, RequestProfiler
+from priority_scheduler import PriorityScheduler, severity_deadline
+from provider_client import ProviderClient, ProviderError
+from reverse_geocoder import ReverseGeocoder
+from ride_store import RideStore
+from script_templates import cluster_script, script_engine
+from sos_dedup import SEVERITY_NAMES, SEVERITY_RANK, SOSDeduplicator, severity_rank
+from static_assets import AssetStore
+from twilio_fallback import (create_emergency_voice_message, create_twiml_emergency_call, create_twiml_goodbye,
+                             twilio_emergency_fallback, validate_twilio_signature, warm_twilio_client)
+
+logger = logging.getLogger(__name__)
+
+# Один клиент Bland.ai на процесс: keep-alive пул и лимит одновременных звонков
+bland_client = ProviderClient(
+    "bland",
+    Config.BLAND_API_URL,
+    max_concurrent_calls=Config.BLAND_MAX_CONCURRENT_CALLS,
+    connect_timeout=Config.BLAND_CONNECT_TIMEOUT,
+    read_timeout=Config.BLAND_READ_TIMEOUT,
+)
+
+# SMS идут напрямую в REST API Twilio: SDK синхронный, а оповещения не должны занимать потоки звонков
+sms_client = ProviderClient("twilio_sms", Config.TWILIO_API_URL)
+ops_client = ProviderClient("safety_ops", Config.SAFETY_OPS_WEBHOOK_URL)
+
+# Оповещения по SOS рассылаются параллельно звонку, у каждого канала свой дедлайн
+notifications = NotificationFanout(max_entries=Config.CALL_STATE_MAX_ENTRIES)
+
+# Bland.ai - основной провайдер, Twilio подключается, если Bland не ответил вовремя
+call_dispatcher = HedgedDispatcher(
+    ["bland", "twilio"],
+    hedge_delay=Config.CALL_HEDGE_DELAY,
+    budget=Config.CALL_DISPATCH_BUDGET,
+    failure_threshold=Config.BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=Config.BREAKER_RESET_TIMEOUT,
+)
+
+# Активные поездки держим в памяти, файл перечитывается в фоне при изменении
+ride_store = RideStore()
+
+# SOS сначала пишется в локальную очередь, звонки делают фоновые воркеры
+incident_queue = IncidentQueue(
+    Config.INCIDENT_DB_PATH,
+    max_attempts=Config.INCIDENT_MAX_ATTEMPTS,
+    retry_delay=Config.INCIDENT_RETRY_DELAY,
+    lease_seconds=Config.INCIDENT_LEASE_SECONDS,
+)
+
+# Повторные нажатия SOS в окне дедупликации возвращают уже созданный инцидент
+sos_dedup = SOSDeduplicator(ttl=Config.SOS_DEDUP_TTL, max_entries=Config.SOS_DEDUP_MAX_ENTRIES)
+
+# SOS с разных поездок рядом друг с другом за короткое время - один звонок на весь кластер
+incident_clusters = IncidentClusters(
+    radius_m=Config.CLUSTER_RADIUS_M,
+    window=Config.CLUSTER_WINDOW,
+    max_members=Config.CLUSTER_MAX_MEMBERS,
+    max_clusters=Config.CLUSTER_MAX_ACTIVE,
+)
+
+# Состояние, общее для всех воркеров uvicorn: лимит звонков, rate limit пассажиров, окно SOS
+admission = AdmissionControl(Config.SHARED_STATE_PATH, slot_lease=Config.CALL_SLOT_LEASE)
+
+# Когда лимит звонков исчерпан, слот получает инцидент с самым ранним дедлайном по тяжести
+call_scheduler = PriorityScheduler(
+    Config.CALL_CONCURRENCY_LIMIT,
+    max_waiting=Config.CALL_SCHEDULER_MAX_WAITING,
+    shed_max_rank=severity_rank(Config.CALL_SCHEDULER_SHED_SEVERITY),
+)
+
+# Статусы инцидентов и звонков в памяти; изменения рассылаются подписчикам SSE
+call_events = BroadcastHub(max_queue=Config.EVENTS_SUBSCRIBER_QUEUE)
+call_tracker = CallTracker(call_events, max_entries=Config.CALL_STATE_MAX_ENTRIES)
+
+# Журнал аудита: запросы SOS, сценарии, ответы провайдеров и тайминги пишутся в фоне пачками
+audit_log = AuditLog(
+    Config.AUDIT_LOG_DIR,
+    segment_bytes=Config.AUDIT_SEGMENT_BYTES,
+    flush_interval=Config.AUDIT_FLUSH_INTERVAL,
+    flush_bytes=Config.AUDIT_FLUSH_BYTES,
+    max_pending=Config.AUDIT_MAX_PENDING,
+    retention=Config.AUDIT_RETENTION_DAYS * 86400,
+)
+
+# Экспорт записей аудита партнёру: сжатые пачки, при недоступности приёмника - спул на диске
+event_export = EventExporter(
+    Config.EXPORT_URL,
+    spool_dir=Config.EXPORT_SPOOL_DIR,
+    token=Config.EXPORT_TOKEN,
+    batch_events=Config.EXPORT_BATCH_EVENTS,
+    flush_interval=Config.EXPORT_FLUSH_INTERVAL,
+    max_memory_batches=Config.EXPORT_MAX_MEMORY_BATCHES,
+    max_spool_bytes=Config.EXPORT_MAX_SPOOL_BYTES,
+    timeout=Config.EXPORT_TIMEOUT,
+    retry_delay=Config.EXPORT_RETRY_DELAY,
+    max_retry_delay=Config.EXPORT_MAX_RETRY_DELAY,
+    gzip_level=Config.EXPORT_GZIP_LEVEL,
+    kinds=Config.EXPORT_KINDS,
+)
+audit_log.add_listener(event_export.emit)
+
+# Записи звонков качаются у провайдера в фоне и отдаются по HTTP Range
+call_recordings = RecordingFetcher(
+    Config.RECORDINGS_DIR,
+    max_concurrent=Config.RECORDING_FETCH_CONCURRENCY,
+    chunk_bytes=Config.RECORDING_CHUNK_BYTES,
+    timeout=Config.RECORDING_FETCH_TIMEOUT,
+    max_attempts=Config.RECORDING_MAX_ATTEMPTS,
+    retry_delay=Config.RECORDING_RETRY_DELAY,
+    allowed_hosts=Config.RECORDING_HOSTS.split(","),
+    credentials={"https://api.twilio.com": (Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN)}
+    if Config.twilio_configured() else {},
+)
+
+# Живые GPS-треки поездок: сценарий звонка и маршрутизация берут новейшую точку
+gps_tracks = GpsTracks(
+    capacity=Config.GPS_TRACK_POINTS,
+    min_interval=Config.GPS_MIN_INTERVAL,
+    max_age=Config.GPS_MAX_AGE,
+    max_rides=Config.GPS_MAX_RIDES,
+    max_skew=Config.GPS_MAX_CLOCK_SKEW,
+)
+script_engine.positions = gps_tracks
+
+# Диспетчерские центры по городам; пустой реестр - все звонки на EMERGENCY_PHONE
+dispatch_registry = DispatchRegistry([])
+
+# Страница SOS и прочая статика отдаются из памяти, заранее сжатыми
+static_assets = AssetStore(Config.STATIC_DIR)
+
+# Профилирование по запросу администратора; пока сессия не взведена, запросы его не касаются
+request_profiler = RequestProfiler(
+    keep=Config.PROFILE_KEEP,
+    sample_interval=Config.PROFILE_SAMPLE_INTERVAL,
+    lag_interval=Config.LOOP_LAG_INTERVAL,
+    lag_threshold=Config.LOOP_LAG_THRESHOLD,
+    max_seconds=Config.PROFILE_MAX_SECONDS,
+)
+
+# Результат старта для /api/ready: сервис готов, когда всё прогрето и конфигурация валидна
+startup_state = {"ready": False}
+
+def load_rides() -> int:
+    try:
+        ride_store.load_file(Config.RIDE_DATA_PATH)
+    except FileNotFoundError:
+        logger.warning("Ride data file %s not found", Config.RIDE_DATA_PATH)
+    return len(ride_store)
+
+def warm_templates() -> int:
+    compiled = script_engine.precompile(Config.PRELOAD_INCIDENT_TYPES)
+    script_engine.current_time()
+    return compiled
+
+async def prune_gps_tracks() -> None:
+    # Поездки без пингов дольше GPS_MAX_AGE закончились - освобождаем их слоты
+    while True:
+        await asyncio.sleep(Config.GPS_MAX_AGE)
+        gps_tracks.prune(time.time() - Config.GPS_MAX_AGE)
+
+def recording_stored(job: dict, path: str) -> None:
+    url = f"/api/recordings/{job['call_id']}"
+    audit_log.append("recording_stored", job["incident_id"], provider=job["provider"], call_id=job["call_id"],
+                     path=path, bytes=os.path.getsize(path))
+    if job["incident_id"] and call_tracker.get(job["incident_id"]) is not None:
+        call_tracker.update(job["incident_id"], recording=url)
+
+def recording_failed(job: dict, error: str) -> None:
+    audit_log.append("recording_failed", job["incident_id"], provider=job["provider"], call_id=job["call_id"],
+                     url=job["url"], error=error)
+
+async def warm_providers() -> dict:
+    warmups = {"bland": bland_client.warm(Config.PROVIDER_WARM_CONNECTIONS)}
+    if Config.twilio_configured():
+        warmups["twilio"] = asyncio.to_thread(warm_twilio_client)
+    results = await asyncio.gather(
+        *(asyncio.wait_for(warmup, Config.WARMUP_TIMEOUT) for warmup in warmups.values()),
+        return_exceptions=True,
+    )
+    providers = {}
+    for name, result in zip(warmups, results):
+        if isinstance(result, Exception):
+            logger.warning("Provider %s warm-up failed: %s", name, str(result) or repr(result))
+            result = False
+        providers[name] = bool(result)
+    return providers
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global dispatch_registry
+    started = time.perf_counter()
+    startup_state.clear()
+    startup_state["ready"] = False
+
+    # Конфигурация проверяется один раз; ошибка не роняет процесс, но сервис не считается готовым
+    try:
+        Config.validate()
+        startup_state["config_error"] = None
+    except ValueError as e:
+        logger.error("Configuration error: %s", e)
+        startup_state["config_error"] = str(e)
+
+    await asyncio.to_thread(admission.open)
+    await asyncio.to_thread(audit_log.open)
+    audit_log.start()
+    startup_state["export_resumed"] = await event_export.start()
+    startup_state["recordings_resumed"] = await call_recordings.start(recording_stored, recording_failed)
+
+    # Сетевой прогрев провайдеров идёт параллельно с загрузкой локальных данных
+    await bland_client.start()
+    provider_warmup = asyncio.create_task(warm_providers()) if Config.PROVIDER_WARMUP else None
+    if Config.GEOCODER_PATH:
+        # Справочник нужен до загрузки поездок: адреса поездкам без адреса ищутся при загрузке
+        ride_store.geocoder = await asyncio.to_thread(
+            ReverseGeocoder.load, Config.GEOCODER_PATH, max_distance_m=Config.GEOCODER_MAX_DISTANCE_M,
+            near_m=Config.GEOCODER_NEAR_M, cache_size=Config.GEOCODER_CACHE_SIZE,
+        )
+        # Живая точка машины тоже озвучивается адресом из справочника
+        script_engine.geocoder = ride_store.geocoder
+        logger.info("Loaded %d gazetteer places", len(ride_store.geocoder))
+    startup_state["gazetteer_places"] = len(ride_store.geocoder) if ride_store.geocoder is not None else 0
+    startup_state["rides"] = await asyncio.to_thread(load_rides)
+    if Config.DISPATCH_CENTERS_PATH:
+        # Построение индекса на десятках тысяч центров занимает заметное время - не держим event loop
+        dispatch_registry = await asyncio.to_thread(DispatchRegistry.load, Config.DISPATCH_CENTERS_PATH)
+        logger.info("Loaded %d dispatch centers", len(dispatch_registry))
+    startup_state["dispatch_centers"] = len(dispatch_registry)
+    startup_state["templates"] = warm_templates()
+    startup_state["static_assets"] = await asyncio.to_thread(static_assets.load)
+    startup_state["providers"] = await provider_warmup if provider_warmup else {}
+
+    watcher = asyncio.create_task(ride_store.watch(Config.RIDE_DATA_RELOAD_INTERVAL))
+    gps_pruner = asyncio.create_task(prune_gps_tracks())
+    incident_queue.start_workers(process_incident, Config.INCIDENT_WORKERS, on_failed=forget_failed_incident)
+    startup_state["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    startup_state["ready"] = startup_state["config_error"] is None
+    logger.info("Startup finished in %.0fms: %s", startup_state["startup_ms"], startup_state)
+    yield
+    startup_state["ready"] = False
+    watcher.cancel()
+    gps_pruner.cancel()
+    request_profiler.finish()
+    await incident_queue.close()
+    await notifications.close()
+    await call_recordings.close()
+    await event_export.close()
+    await audit_log.close()
+    await admission.close()
+    await bland_client.close()
+    await sms_client.close()
+    await ops_client.close()
+
+app = FastAPI(title="RideGuard Emergency AI Assistant", lifespan=lifespan)
 
 # Добавляем CORS для работы с внешними доменами
 app.add_middleware(
@@ -21,73 +290,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def is_admin(token: Optional[str]) -> bool:
+    return bool(Config.ADMIN_TOKEN) and hmac.compare_digest((token or "").encode(), Config.ADMIN_TOKEN.encode())
+
+# Снаружи всех остальных: в профиль попадает и CORS. Без ADMIN_TOKEN заголовки не разбираются
+app.add_middleware(ProfilingMiddleware, profiler=request_profiler, authorize=is_admin,
+                   header_trigger=lambda: bool(Config.ADMIN_TOKEN))
+
 # Получаем порт из окружения для Railway
 PORT = int(os.environ.get("PORT", 8000))
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
 class EmergencyRequest(BaseModel):
+    ride_id: Optional[str] = None
     incident_type: str = "medical_emergency"
     severity: str = "high"
+    language: str = "en"
     additional_info: Optional[str] = None
 
-def load_test_data():
-    try:
-        with open("test_data.json", "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="Test data file not found")
+    @field_validator("severity", mode="before")
+    @classmethod
+    def known_severity(cls, value):
+        # Тяжесть уходит в метки метрик и приоритет очереди: только известные значения
+        severity = str(value).strip().lower()
+        if severity not in SEVERITY_RANK:
+            raise ValueError(f"severity must be one of {', '.join(SEVERITY_RANK)}")
+        return severity
 
-def create_emergency_script(data: dict, incident_type: str = "medical_emergency") -> str:
-    passenger = data["passenger"]
-    driver = data["driver"]
-    vehicle = data["vehicle"]
-    location = data["location"]
-    
-    script = f"""
-URGENT EMERGENCY CALL - PASSENGER IN DANGER
-
-This is an automated emergency call from RideGuard Safety System by inDrive Company.
-I am calling on behalf of a passenger who is currently in danger and needs immediate assistance.
-
-PASSENGER IN DISTRESS:
-- Passenger Name: {passenger['name']}
-- Passenger Phone: {passenger['phone']}
-- The passenger activated emergency SOS from the inDrive app
-
-INCIDENT DETAILS:
-- Emergency Type: {incident_type.replace('_', ' ').title()}
-- Time: {datetime.now().strftime('%H:%M %Z')}
-- Severity: HIGH PRIORITY - PASSENGER IN IMMEDIATE DANGER
-
-THREATENING DRIVER INFORMATION:
-- Driver Name: {driver['name']}
-- Driver Phone: {driver['phone']}
-- Driver License: {driver['license']}
-
-VEHICLE IDENTIFICATION:
-- Vehicle: {vehicle['year']} {vehicle['make']} {vehicle['model']}
-- Color: {vehicle['color']}
-- License Plate: {vehicle['plate']}
-
-CURRENT LOCATION:
-- Address: {location['address']}
-- GPS Coordinates: {location['gps_lat']}, {location['gps_lng']}
-- This is the exact location where the passenger needs help
-
-IMMEDIATE ACTION REQUIRED:
-The passenger is in danger and requires immediate police assistance.
-This call is made by RideGuard Safety System from inDrive Company on behalf of the passenger who pressed the emergency SOS button.
-Please dispatch police units to the location immediately.
-
-For urgent follow-up, contact the passenger directly at {passenger['phone']}.
-The driver's number is {driver['phone']}.
-
-This is an automated emergency call from inDrive's RideGuard Safety System protecting passenger safety.
-"""
-    return script.strip()
-
-async def initiate_bland_call(phone_number: str, emergency_script: str) -> dict:
+class EmergencyBatchRequest(BaseModel):
+    incidents: List[EmergencyRequest]
+
+# Участники неудавшихся кластеров, которые ещё ставятся в очередь своими инцидентами
+requeue_tasks: set = set()
+
+def get_ride_data(ride_id: Optional[str] = None):
+    if not len(ride_store):
+        raise HTTPException(status_code=500, detail="Ride data not loaded")
+    ride = ride_store.get(ride_id or ride_store.default_ride_id)
+    if ride is None:
+        raise HTTPException(status_code=404, detail=f"Ride {ride_id} not found")
+    return ride
+
+def create_emergency_script(data: dict, incident_type: str = "medical_emergency", language: str = "en",
+                            severity: str = "high") -> str:
+    started = time.perf_counter()
+    script = script_engine.render(data, incident_type, provider="bland", language=language, severity=severity)
+    STAGE_LATENCY.observe(time.perf_counter() - started, "render", "bland")
+    return script
+
+def create_cluster_script(cluster: IncidentCluster) -> str:
+    started = time.perf_counter()
+    rides = []
+    for member in cluster.members:
+        data = ride_store.get(member.ride_id)
+        if data is not None:
+            rides.append((data, member.incident_type))
+    severity = cluster.severity
+    since = datetime.fromtimestamp(time.time() - (incident_clusters.clock() - cluster.started)).strftime("%H:%M")
+    script = cluster_script(rides, cluster.lat, cluster.lng, incident_clusters.radius_m, since, severity)
+    STAGE_LATENCY.observe(time.perf_counter() - started, "render", "bland")
+    return script
+
+def webhook_url(path: str, incident_id: Optional[str], **params) -> Optional[str]:
+    # Без публичного адреса провайдер не сможет достучаться до сервиса - вебхуки не регистрируем
+    if not Config.PUBLIC_BASE_URL or not incident_id:
+        return None
+    return f"{Config.PUBLIC_BASE_URL}{path}?{urlencode(dict(params, incident_id=incident_id))}"
+
+async def initiate_bland_call(phone_number: str, emergency_script: str, language: str = "en",
+                              webhook: Optional[str] = None) -> dict:
     # Проверяем конфигурацию
     bland_api_key = os.getenv("BLAND_API_KEY")
     if not bland_api_key:
@@ -106,23 +376,134 @@ async def initiate_bland_call(phone_number: str, emergency_script: str) -> dict:
         "wait_for_greeting": True,
         "record": True,
         "max_duration": 180,
-        "language": "en"
+        "language": language
     }
+    if webhook:
+        payload["webhook"] = webhook
     
     try:
-        response = requests.post("https://api.bland.ai/v1/calls", headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        async with admission.call_slot("bland", Config.CALL_CONCURRENCY_LIMIT, Config.CALL_DISPATCH_BUDGET):
+            return await bland_client.post_json("/v1/calls", payload, headers=headers)
+    except (ProviderError, CallQuotaExceeded) as e:
         raise HTTPException(status_code=500, detail=f"Failed to initiate call: {str(e)}")
 
-async def send_sms_notification(phone_number: str, message: str) -> bool:
-    # SMS functionality removed for Railway deployment
-    return False
+async def initiate_twilio_call(phone_number: str, data, incident_type: str, language: str = "en",
+                               status_callback: Optional[str] = None, emergency_script: Optional[str] = None) -> dict:
+    async with admission.call_slot("twilio", Config.CALL_CONCURRENCY_LIMIT, Config.CALL_DISPATCH_BUDGET):
+        started = time.perf_counter()
+        try:
+            result = await twilio_emergency_fallback(phone_number, data, incident_type, language, status_callback,
+                                                     emergency_script)
+        finally:
+            STAGE_LATENCY.observe(time.perf_counter() - started, "provider_response", "twilio")
+    if not result.get("success"):
+        raise ProviderError(result.get("error", "Twilio call failed"))
+    return result
+
+async def place_emergency_call(phone_number: str, data, incident_type: str, language: str = "en",
+                               emergency_script: Optional[str] = None, incident_id: Optional[str] = None,
+                               severity: str = "high", twilio_script: Optional[str] = None):
+    """twilio_script - готовый текст для Twilio (сводный сценарий кластера); иначе Twilio рендерит свой"""
+    if emergency_script is None:
+        emergency_script = create_emergency_script(data, incident_type, language, severity)
+
+    token = {"token": Config.WEBHOOK_TOKEN} if Config.WEBHOOK_TOKEN else {}
+    bland_webhook = webhook_url("/api/webhooks/bland", incident_id, **token)
+    twilio_callback = webhook_url("/api/webhooks/twilio", incident_id)
+    calls = {
+        "bland": lambda: initiate_bland_call(phone_number, emergency_script, language, webhook=bland_webhook),
+    }
+    if Config.twilio_configured() and script_engine.supports("twilio", language):
+        calls["twilio"] = lambda: initiate_twilio_call(phone_number, data, incident_type, language, twilio_callback,
+                                                        twilio_script)
+
+    try:
+        return await call_dispatcher.dispatch(calls)
+    except AllProvidersFailed as e:
+        raise HTTPException(status_code=500, detail=f"Failed to initiate call: {str(e)}")
+
+async def send_sms_notification(phone_number: str, message: str) -> dict:
+    response = await sms_client.post_form(
+        f"/2010-04-01/Accounts/{Config.TWILIO_ACCOUNT_SID}/Messages.json",
+        {"To": phone_number, "From": Config.TWILIO_PHONE, "Body": message},
+        auth=(Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN),
+    )
+    return {"sid": response.get("sid"), "to": phone_number}
+
+async def notify_safety_ops(payload: dict) -> dict:
+    return await ops_client.post_json("", payload)
+
+def emergency_contacts(data) -> List[str]:
+    # Контакты пассажира: список номеров или объектов с полем phone
+    contacts = data["passenger"].get("emergency_contacts") or []
+    return [contact["phone"] if isinstance(contact, dict) else str(contact) for contact in contacts]
+
+def start_notifications(data, incident_type: str, severity: str, emergency_phone: str,
+                        incident_id: Optional[str], dispatcher: bool = True) -> FanoutRun:
+    incident = incident_type.replace('_', ' ').title()
+    address = data["location"]["address"]
+    dispatcher_message = (f"RideGuard EMERGENCY: {incident} reported. "
+                          f"Location: {address}. Check voice call for details.")
+    contacts_message = (f"RideGuard EMERGENCY: {data['passenger']['name']} reported {incident} during a ride. "
+                        f"Location: {address}. Vehicle: {data['vehicle']['plate']}. Emergency services are being called.")
+    sms_policy = ChannelPolicy(Config.NOTIFY_SMS_DEADLINE, Config.NOTIFY_SMS_ATTEMPTS, Config.NOTIFY_RETRY_DELAY)
+    ops_policy = ChannelPolicy(Config.NOTIFY_OPS_DEADLINE, Config.NOTIFY_OPS_ATTEMPTS, Config.NOTIFY_RETRY_DELAY)
+    sms = Config.twilio_configured()
+    contacts = emergency_contacts(data)
+    ops_payload = {
+        "incident_id": incident_id, "ride_id": data.ride_id, "incident_type": incident_type, "severity": severity,
+        "emergency_phone": emergency_phone, **describe_ride(data), "timestamp": datetime.now().isoformat(),
+    }
+    # Ненастроенный канал отмечается как skipped, остальные не ждут друг друга
+    channels = {
+        "dispatcher_sms": ((lambda: send_sms_notification(emergency_phone, dispatcher_message))
+                           if sms and dispatcher else None, sms_policy),
+        "contacts_sms": (recipients_sender(lambda phone: send_sms_notification(phone, contacts_message), contacts)
+                         if sms and contacts else None, sms_policy),
+        "safety_ops": ((lambda: notify_safety_ops(ops_payload)) if Config.SAFETY_OPS_WEBHOOK_URL else None,
+                       ops_policy),
+    }
+
+    def finished(run: FanoutRun) -> None:
+        results = run.snapshot()
+        audit_log.append("notifications", incident_id, ride_id=data.ride_id, channels=results)
+        if incident_id and call_tracker.get(incident_id) is not None:
+            call_tracker.update(incident_id, notifications=results)
+
+    # Оповещения участника кластера при присоединении не должны глушить его собственные,
+    # если звонок кластера не состоится и участник встанет в очередь своим инцидентом
+    key = incident_id if dispatcher or incident_id is None else f"{incident_id}:joined"
+    return notifications.start(key, channels, finished)
+
+def asset_response(request: Request, name: str) -> Response:
+    found = static_assets.get(name)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    asset, immutable = found
+    status, body, headers = asset.respond(request.headers.get("accept-encoding", ""),
+                                          request.headers.get("if-none-match", ""), immutable)
+    return Response(body, status_code=status, headers=headers, media_type=asset.media_type)
 
 @app.get("/")
-async def serve_demo():
-    return FileResponse("static/demo.html")
+async def serve_demo(request: Request):
+    return asset_response(request, "demo.html")
+
+@app.get("/static/{name:path}")
+async def serve_static(request: Request, name: str):
+    return asset_response(request, name)
+
+@app.get("/api/assets")
+async def asset_manifest():
+    # Адреса с хешем содержимого: их можно кэшировать навсегда (например, в WebView приложения)
+    return static_assets.manifest()
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/ready")
+async def readiness():
+    return JSONResponse(startup_state, status_code=200 if startup_state["ready"] else 503)
 
 @app.get("/api/test")
 async def test_server():
@@ -133,46 +514,622 @@ async def test_server():
         "version": "1.0.0"
     }
 
-@app.post("/api/emergency")
+def current_position(data) -> Optional[Tuple[float, float]]:
+    # Живая позиция из GPS-трека, иначе координаты из данных поездки
+    fix = gps_tracks.latest(data.ride_id, time.time()) if getattr(data, "ride_id", None) else None
+    if fix is not None:
+        return fix.lat, fix.lng
+    location = data.get("location") or {}
+    lat, lng = location.get("gps_lat"), location.get("gps_lng")
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+def resolve_emergency_phone(data) -> Tuple[str, Optional[DispatchCenter]]:
+    # Машина могла уехать из зоны другого центра - маршрутизируем по живой позиции
+    position = current_position(data)
+    center = None
+    if position is not None:
+        center = dispatch_registry.route(*position, Config.DISPATCH_MAX_DISTANCE_KM)
+    if center is not None:
+        return center.phone, center
+    emergency_phone = os.getenv("EMERGENCY_PHONE")
+    if not emergency_phone:
+        raise HTTPException(status_code=500, detail="EMERGENCY_PHONE not configured! Add it in Railway dashboard.")
+    return emergency_phone, None
+
+def describe_ride(data) -> dict:
+    return {
+        "passenger": data["passenger"]["name"],
+        "driver": data["driver"]["name"],
+        "location": data["location"]["address"],
+        "vehicle": f"{data['vehicle']['make']} {data['vehicle']['model']} ({data['vehicle']['plate']})"
+    }
+
+async def run_emergency(data, incident_type: str, language: str = "en",
+                        emergency_script: Optional[str] = None, incident_id: Optional[str] = None,
+                        severity: str = "high", arrived: Optional[float] = None,
+                        cluster: Optional[IncidentCluster] = None) -> dict:
+    emergency_phone, center = resolve_emergency_phone(data)
+    if emergency_script is None:
+        emergency_script = create_emergency_script(data, incident_type, language, severity)
+
+    # SMS и смена безопасности стартуют сразу, не дожидаясь слота и ответа провайдера звонков
+    fanout = start_notifications(data, incident_type, severity, emergency_phone, incident_id)
+
+    started = time.time()
+    try:
+        async with call_scheduler.slot(severity, arrived, key=incident_id):
+            if cluster is not None:
+                incident_clusters.seal(cluster.id)
+            twilio_script = None
+            if cluster is not None and len(cluster) > 1:
+                # Сводный сценарий собираем уже со слотом: пока звонок ждал, к кластеру могли добавиться SOS
+                emergency_script = twilio_script = create_cluster_script(cluster)
+            dispatch = await place_emergency_call(emergency_phone, data, incident_type, language, emergency_script,
+                                                  incident_id, severity, twilio_script)
+    except Exception as e:
+        audit_log.append("call_failed", incident_id, ride_id=data.ride_id, severity=severity,
+                         error=getattr(e, "detail", None) or str(e) or repr(e),
+                         elapsed_ms=round((time.time() - started) * 1000, 1))
+        raise
+    audit_log.append(
+        "call_placed", incident_id, ride_id=data.ride_id, incident_type=incident_type, severity=severity,
+        language=language, provider=dispatch.provider, emergency_phone=emergency_phone,
+        dispatch_center=center.id if center else None, script=emergency_script, response=dispatch.response,
+        cluster=cluster.to_dict() if cluster is not None and len(cluster) > 1 else None,
+        timings={
+            "queued_ms": round((started - arrived) * 1000, 1) if arrived else None,
+            "dispatch_ms": round((time.time() - started) * 1000, 1),
+            "time_to_accept_ms": round(dispatch.time_to_accept * 1000, 1),
+        },
+    )
+
+    # Ответ не ждёт остальных каналов: отдаём их состояние на момент звонка
+    channels = fanout.snapshot()
+    channels["voice"] = {"status": "sent", "provider": dispatch.provider,
+                         "elapsed_ms": round((time.time() - started) * 1000, 1)}
+    return {
+        "call_id": dispatch.response.get("call_id"),
+        "provider": dispatch.provider,
+        "time_to_accept_ms": round(dispatch.time_to_accept * 1000, 1),
+        "emergency_phone": emergency_phone,
+        "dispatch_center": center.id if center else None,
+        "sms_sent": channels["dispatcher_sms"]["status"] == "sent",
+        "notifications": channels,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+async def process_incident(incident_id: str, payload: dict) -> dict:
+    try:
+        data = get_ride_data(payload["ride_id"])
+    except HTTPException as e:
+        raise PermanentIncidentError(e.detail)
+
+    call_tracker.update(incident_id, status="dispatching", ride_id=payload["ride_id"],
+                        incident_type=payload["incident_type"], language=payload["language"])
+    cluster = incident_clusters.get(incident_id)
+    severity = cluster.severity if cluster is not None else payload["severity"]
+    result = await run_emergency(data, payload["incident_type"], payload["language"], incident_id=incident_id,
+                                 severity=severity, arrived=payload.get("received_at"), cluster=cluster)
+    sos_dedup.record_call(sos_key(payload), incident_id, result["call_id"])
+    if cluster is not None:
+        cluster.call_id = result["call_id"]
+        for member in cluster.members[1:]:
+            sos_dedup.record_call(member.key, incident_id, result["call_id"])
+    await admission.record_sos_call(sos_key(payload), incident_id, result["call_id"])
+    call_tracker.update(incident_id, status="dispatched", call_id=result["call_id"], provider=result["provider"],
+                        emergency_phone=result["emergency_phone"])
+    return result
+
+def sos_key(payload: dict) -> tuple:
+    return SOSDeduplicator.key(payload["ride_id"], payload.get("passenger_phone"), payload["incident_type"])
+
+def forget_failed_incident(incident_id: str, payload: dict, error: str) -> None:
+    # Неудавшийся инцидент не должен глушить следующее нажатие SOS
+    sos_dedup.forget(sos_key(payload), incident_id)
+    admission.forget_sos(sos_key(payload), incident_id)
+    cluster = incident_clusters.forget(incident_id)
+    members = cluster.members[1:] if cluster is not None else []
+    for member in members:
+        sos_dedup.forget(member.key, incident_id)
+        admission.forget_sos(member.key, incident_id)
+    fields = {"requeued": [member.incident_id for member in members]} if members else {}
+    call_tracker.update(incident_id, status="failed", error=error, **fields)
+    audit_log.append("incident_failed", incident_id, ride_id=payload["ride_id"], error=error, **fields)
+    if members:
+        # Звонок кластера не состоялся: каждый присоединившийся SOS получает свой звонок
+        task = asyncio.create_task(requeue_cluster_members(incident_id, members))
+        requeue_tasks.add(task)
+        task.add_done_callback(requeue_tasks.discard)
+
+async def requeue_cluster_members(cluster_id: str, members: list) -> None:
+    for member in members:
+        payload = member.payload
+        try:
+            # Пока кластер звонил, пассажир мог нажать SOS снова и уже получить свой инцидент
+            owner_id, _, _ = await admission.claim_sos(member.key, member.incident_id, severity_rank(member.severity),
+                                                       Config.SOS_DEDUP_TTL)
+            if owner_id != member.incident_id:
+                continue
+            sos_dedup.remember(member.key, member.incident_id, member.severity)
+            await incident_queue.enqueue(payload, member.incident_id,
+                                         deadline=severity_deadline(member.severity, payload["received_at"]))
+        except Exception:
+            logger.exception("Failed to requeue SOS %s from cluster %s", member.incident_id, cluster_id)
+            continue
+        audit_log.append("sos_requeued", member.incident_id, cluster_id=cluster_id, request=payload)
+        call_tracker.update(member.incident_id, status="queued", ride_id=member.ride_id,
+                            incident_type=member.incident_type, language=payload["language"])
+
+def deduplicated_response(entry, data, request: EmergencyRequest) -> dict:
+    audit_log.append("sos_deduplicated", entry.incident_id, ride_id=data.ride_id, request=request.model_dump())
+    return {
+        "success": True,
+        "message": "Emergency already reported, call is in progress",
+        "deduplicated": True,
+        "incident_id": entry.incident_id,
+        "call_id": entry.call_id,
+        "status_url": f"/api/emergency/{entry.incident_id}",
+        "events_url": f"/api/emergency/{entry.incident_id}/events",
+        "ride_id": data.ride_id,
+        "incident_type": request.incident_type,
+        "timestamp": datetime.now().isoformat(),
+        "data_used": describe_ride(data)
+    }
+
+async def join_cluster(incident_id: str, data, payload: dict, key: tuple) -> Optional[IncidentCluster]:
+    if not incident_clusters.enabled:
+        return None
+    position = current_position(data)
+    if position is None:
+        return None
+    cluster, opened = incident_clusters.attach(incident_id, *position, data.ride_id, payload["incident_type"],
+                                               payload["severity"], key, payload)
+    if not opened:
+        member = cluster.members[-1]
+        audit_log.append("sos_clustered", cluster.id, ride_id=data.ride_id, member_incident_id=incident_id,
+                         distance_m=round(member.distance_m, 1), request=payload)
+        call_tracker.update(cluster.id, cluster=cluster.to_dict())
+        # Контакты пассажира и смена безопасности узнают о каждом SOS; диспетчеру хватит звонка кластера
+        start_notifications(data, payload["incident_type"], payload["severity"], resolve_emergency_phone(data)[0],
+                            incident_id, dispatcher=False)
+        if severity_rank(member.severity) > max(severity_rank(other.severity) for other in cluster.members[:-1]):
+            # Более тяжёлый SOS поднимает звонок кластера в очереди и в ожидании слота
+            call_scheduler.escalate(cluster.id, cluster.severity, payload["received_at"])
+            await incident_queue.escalate(cluster.id, severity_deadline(cluster.severity, payload["received_at"]))
+    return cluster
+
+async def escalate_queued(entry, key: tuple, payload: dict) -> bool:
+    """Повышает тяжесть ещё не взятого воркером инцидента вместо второго звонка; False - звонок уже идёт"""
+    severity = payload["severity"]
+    cluster = incident_clusters.get(entry.incident_id)
+    # Тяжесть звонка кластера берётся из участников, одиночного инцидента - из запроса в очереди
+    if not await incident_queue.escalate(entry.incident_id, severity_deadline(severity, payload["received_at"]),
+                                         None if cluster is not None else severity):
+        return False
+    if cluster is not None:
+        cluster.escalate(key, severity)
+    entry.severity = severity
+    await admission.claim_sos(key, entry.incident_id, severity_rank(severity), Config.SOS_DEDUP_TTL)
+    audit_log.append("sos_escalated", entry.incident_id, ride_id=payload["ride_id"], severity=severity)
+    return True
+
+def clustered_response(cluster: IncidentCluster, data, request: EmergencyRequest) -> dict:
+    return {
+        "success": True,
+        "message": "Emergency joined a nearby mass incident, one call covers all affected rides",
+        "deduplicated": False,
+        "clustered": True,
+        "incident_id": cluster.id,
+        "call_id": cluster.call_id,
+        "cluster_size": len(cluster),
+        "status_url": f"/api/emergency/{cluster.id}",
+        "events_url": f"/api/emergency/{cluster.id}/events",
+        "ride_id": data.ride_id,
+        "incident_type": request.incident_type,
+        "timestamp": datetime.now().isoformat(),
+        "data_used": describe_ride(data)
+    }
+
+@app.post("/api/emergency", status_code=202)
 async def trigger_emergency(request: EmergencyRequest):
     try:
-        data = load_test_data()
-        
-        emergency_script = create_emergency_script(data, request.incident_type)
-        
-        emergency_phone = os.getenv("EMERGENCY_PHONE")
-        if not emergency_phone:
-            raise HTTPException(status_code=500, detail="EMERGENCY_PHONE not configured! Add it in Railway dashboard.")
-        
-        call_response = await initiate_bland_call(emergency_phone, emergency_script)
-        
-        sms_sent = await send_sms_notification(
-            emergency_phone,
-            f"RideGuard EMERGENCY: {request.incident_type.replace('_', ' ').title()} reported. "
-            f"Location: {data['location']['address']}. Check voice call for details."
-        )
-        
-        return JSONResponse({
-            "success": True,
-            "message": "Emergency call initiated successfully",
-            "call_id": call_response.get("call_id"),
-            "emergency_phone": emergency_phone,
-            "incident_type": request.incident_type,
-            "timestamp": datetime.now().isoformat(),
-            "sms_sent": sms_sent,
-            "data_used": {
-                "passenger": data["passenger"]["name"],
-                "driver": data["driver"]["name"],
-                "location": data["location"]["address"],
-                "vehicle": f"{data['vehicle']['make']} {data['vehicle']['model']} ({data['vehicle']['plate']})"
-            }
-        })
-    
+        return JSONResponse(await admit_emergency(request), status_code=202)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Emergency call failed: {str(e)}")
 
+async def admit_emergency(request: EmergencyRequest) -> dict:
+    """Дедупликация, лимит, кластер и запись в очередь; звонок делают воркеры очереди"""
+    if not script_engine.supports("bland", request.language):
+        raise HTTPException(status_code=400, detail=f"Unsupported language: {request.language}")
+
+    started = time.perf_counter()
+    data = get_ride_data(request.ride_id)
+    STAGE_LATENCY.observe(time.perf_counter() - started, "ingest", "")
+    
+    # Номер определяется заново при звонке, здесь только проверяем, что звонить есть куда
+    resolve_emergency_phone(data)
+    
+    payload = request.model_dump()
+    payload["received_at"] = time.time()
+    payload["ride_id"] = data.ride_id
+    payload["passenger_phone"] = data["passenger"]["phone"]
+    key = sos_key(payload)
+    
+    entry = sos_dedup.lookup(key)
+    if entry is not None:
+        if not sos_dedup.escalates(entry, request.severity):
+            return deduplicated_response(entry, data, request)
+        if await escalate_queued(entry, key, payload):
+            return dict(deduplicated_response(entry, data, request), escalated=True)
+    
+    # Запись в окне дедупликации создаём до await, чтобы параллельные нажатия её увидели.
+    # Звонок уже идёт: эскалация тяжести заменяет запись и ставит новый звонок с актуальной тяжестью.
+    incident_id = incident_queue.new_id()
+    sos_dedup.remember(key, incident_id, request.severity)
+    started = time.perf_counter()
+    try:
+        # Окно SOS общее для воркеров: нажатие могло уже попасть в другой процесс
+        owner_id, owner_severity, call_id = await admission.claim_sos(
+            key, incident_id, severity_rank(request.severity), Config.SOS_DEDUP_TTL)
+        if owner_id != incident_id:
+            entry = sos_dedup.remember(key, owner_id, SEVERITY_NAMES[owner_severity])
+            entry.call_id = call_id
+            return deduplicated_response(entry, data, request)
+
+        # Лимит новых звонков на пассажира; повторные нажатия выше сюда не доходят
+        retry_after = await admission.take_token(
+            payload["passenger_phone"] or data.ride_id, Config.PASSENGER_SOS_PER_MINUTE / 60, Config.PASSENGER_SOS_BURST)
+        if retry_after:
+            audit_log.append("sos_rate_limited", incident_id, request=payload, retry_after=retry_after)
+            raise HTTPException(status_code=429, detail="Too many emergency calls for this passenger",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+        # Рядом уже идёт массовый инцидент: SOS присоединяется к его звонку вместо нового
+        cluster = await join_cluster(incident_id, data, payload, key)
+        if cluster is not None and cluster.id != incident_id:
+            sos_dedup.remember(key, cluster.id, request.severity).call_id = cluster.call_id
+            admission.forget_sos(key, incident_id)
+            return clustered_response(cluster, data, request)
+
+        await incident_queue.enqueue(payload, incident_id,
+                                     deadline=severity_deadline(request.severity, payload["received_at"]))
+    except Exception:
+        sos_dedup.forget(key, incident_id)
+        admission.forget_sos(key, incident_id)
+        incident_clusters.forget(incident_id)
+        raise
+    STAGE_LATENCY.observe(time.perf_counter() - started, "enqueue", "")
+    audit_log.append("sos_received", incident_id, request=payload)
+    call_tracker.update(incident_id, status="queued", ride_id=data.ride_id,
+                        incident_type=request.incident_type, language=request.language)
+    
+    return {
+        "success": True,
+        "message": "Emergency accepted, call is being placed",
+        "deduplicated": False,
+        "incident_id": incident_id,
+        "status": "queued",
+        "status_url": f"/api/emergency/{incident_id}",
+        "events_url": f"/api/emergency/{incident_id}/events",
+        "ride_id": data.ride_id,
+        "incident_type": request.incident_type,
+        "timestamp": datetime.now().isoformat(),
+        "data_used": describe_ride(data)
+    }
+
+@app.get("/api/emergency/{incident_id}")
+async def get_emergency_status(incident_id: str):
+    incident = await incident_queue.get(incident_id)
+    if incident is None:
+        raise HTTPException(status_code=404, detail=f"Incident {incident_id} not found")
+    return incident
+
+def queued_incident_state(incident_id: str, incident: dict) -> dict:
+    state = {"incident_id": incident_id, "status": incident["status"], "updated_at": incident["updated_at"]}
+    if incident["result"]:
+        state.update(call_id=incident["result"].get("call_id"), provider=incident["result"].get("provider"))
+    if incident["error"]:
+        state["error"] = incident["error"]
+    return state
+
+async def queued_outcome(incident_id: str, seen: Optional[str]) -> Optional[dict]:
+    # Инцидент звонит другой воркер: его события сюда не приходят, исход виден только в очереди
+    if (call_tracker.get(incident_id) or {}).get("status") in ("dispatched", "failed"):
+        return None
+    incident = await incident_queue.get(incident_id)
+    if incident is None or incident["status"] == seen or incident["status"] not in ("dispatched", "failed"):
+        return None
+    return queued_incident_state(incident_id, incident)
+
+@app.get("/api/emergency/{incident_id}/events")
+async def stream_emergency_events(incident_id: str):
+    # Подписываемся до чтения снимка, чтобы не потерять событие между ними
+    subscription = call_events.subscribe(incident_id)
+    state = call_tracker.get(incident_id)
+    if state is None:
+        incident = await incident_queue.get(incident_id)
+        if incident is None:
+            call_events.unsubscribe(subscription)
+            raise HTTPException(status_code=404, detail=f"Incident {incident_id} not found")
+        state = queued_incident_state(incident_id, incident)
+
+    async def stream():
+        seen = state.get("status")
+        try:
+            yield format_sse("status", state)
+            final = is_final(state)
+            while not final:
+                try:
+                    frame, final = await asyncio.wait_for(subscription.get(), timeout=Config.EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    polled = await queued_outcome(incident_id, seen)
+                    if polled is None:
+                        yield ": keepalive\n\n"
+                        continue
+                    seen = polled["status"]
+                    frame, final = format_sse("status", polled), is_final(polled)
+                yield frame
+        finally:
+            call_events.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def normalize_call_status(status: str) -> str:
+    return status.lower().replace("_", "-")
+
+def webhook_authenticated(provider: str) -> bool:
+    # Без токена (Bland) или подписи (Twilio) webhook мог прислать кто угодно
+    if provider == "twilio":
+        return bool(Config.PUBLIC_BASE_URL and Config.TWILIO_AUTH_TOKEN)
+    return bool(Config.WEBHOOK_TOKEN)
+
+@app.post("/api/webhooks/bland")
+async def bland_webhook(request: Request, incident_id: Optional[str] = None, token: Optional[str] = None):
+    if Config.WEBHOOK_TOKEN and not hmac.compare_digest((token or "").encode(), Config.WEBHOOK_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid webhook token")
+    event = await request.json()
+    status = event.get("status") or event.get("queue_status")
+    if not status:
+        return {"accepted": False}
+    details = {key: event[key] for key in ("call_length", "recording_url", "answered_by") if event.get(key) is not None}
+    state = call_tracker.update_call(incident_id, event.get("call_id"), normalize_call_status(status), **details)
+    audit_log.append("call_status", incident_id, provider="bland", call_id=event.get("call_id"),
+                     call_status=normalize_call_status(status), **details)
+    # Качаем только записи звонков, о которых сервис знает, и только из проверенного webhook: URL приходит снаружи
+    if state is not None and "recording_url" in details and normalize_call_status(status) in FINAL_CALL_STATUSES \
+            and webhook_authenticated("bland"):
+        call_recordings.enqueue("bland", event.get("call_id"), details["recording_url"], state["incident_id"])
+    return {"accepted": state is not None}
+
+async def read_twilio_form(request: Request) -> dict:
+    # Twilio шлёт application/x-www-form-urlencoded; python-multipart ради этого не тянем
+    params = dict(parse_qsl((await request.body()).decode()))
+    if Config.PUBLIC_BASE_URL and Config.TWILIO_AUTH_TOKEN:
+        url = Config.PUBLIC_BASE_URL + request.url.path
+        if request.url.query:
+            url += "?" + request.url.query
+        if not validate_twilio_signature(url, params, request.headers.get("X-Twilio-Signature", "")):
+            raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+    return params
+
+@app.post("/api/webhooks/twilio")
+async def twilio_webhook(request: Request, incident_id: Optional[str] = None):
+    params = await read_twilio_form(request)
+    status = params.get("CallStatus")
+    if status:
+        details = {key: params[key] for key in ("CallDuration", "AnsweredBy") if key in params}
+        call_tracker.update_call(incident_id, params.get("CallSid"), normalize_call_status(status), **details)
+        audit_log.append("call_status", incident_id, provider="twilio", call_id=params.get("CallSid"),
+                         call_status=normalize_call_status(status), **details)
+    if params.get("RecordingStatus") == "completed" and params.get("RecordingUrl") and webhook_authenticated("twilio"):
+        state = (call_tracker.get(incident_id) if incident_id else None) or call_tracker.find_by_call(params.get("CallSid", ""))
+        if state is not None:
+            # Без расширения Twilio отдаёт WAV, MP3 в несколько раз меньше
+            call_recordings.enqueue("twilio", params.get("CallSid"), params["RecordingUrl"] + ".mp3", state["incident_id"])
+    return Response(status_code=204)
+
+@app.post("/api/twilio/gather")
+async def twilio_gather(request: Request):
+    params = await read_twilio_form(request)
+    state = call_tracker.find_by_call(params.get("CallSid", ""))
+    digits = params.get("Digits", "")
+    if state is not None:
+        call_tracker.update(state["incident_id"], last_digits=digits)
+    # 1 - повторить сообщение целиком, иначе завершаем звонок
+    if digits == "1" and state is not None and state.get("ride_id") in ride_store:
+        script = create_emergency_voice_message(get_ride_data(state["ride_id"]), state["incident_type"], state["language"])
+        return Response(create_twiml_emergency_call(script), media_type="application/xml")
+    return Response(create_twiml_goodbye(), media_type="application/xml")
+
+@app.get("/api/recordings/{call_id}")
+async def get_recording(call_id: str, request: Request, token: Optional[str] = None):
+    # Без токена записи не отдаются: в них голоса пассажиров и диспетчеров
+    if not Config.RECORDINGS_TOKEN or not hmac.compare_digest((token or "").encode(),
+                                                              Config.RECORDINGS_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid recordings token")
+    path = call_recordings.path(call_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Recording for call {call_id} not found")
+    stat = await asyncio.to_thread(os.stat, path)
+    status, start, end, headers = range_headers(stat.st_size, stat.st_mtime, request.headers.get("range", ""),
+                                                request.headers.get("if-range", ""))
+    if status == 416:
+        return Response(status_code=416, headers=headers)
+    # Файл читается кусками: перемотка в плеере не тянет запись целиком
+    return StreamingResponse(iter_file(path, start, end, Config.RECORDING_CHUNK_BYTES), status_code=status,
+                             media_type=MEDIA_TYPES[os.path.splitext(path)[1]], headers=headers)
+
+def require_admin(request: Request) -> None:
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/api/admin/profile")
+async def arm_profiler(request: Request, requests: int = 1, mode: str = "deterministic",
+                       path: str = "/api/emergency", linger: float = 0.0):
+    # linger - сколько ещё профилировать после N-го ответа: SOS звонит из фоновой очереди
+    require_admin(request)
+    if requests > Config.PROFILE_MAX_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"At most {Config.PROFILE_MAX_REQUESTS} requests per session")
+    try:
+        session = request_profiler.arm(mode, requests, path, min(linger, Config.PROFILE_MAX_SECONDS))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return session.summary()
+
+@app.get("/api/admin/profile")
+async def profiler_status(request: Request):
+    require_admin(request)
+    armed = request_profiler.armed
+    return {"armed": armed.summary() if armed else None,
+            "sessions": [session.summary() for session in reversed(request_profiler.sessions.values())]}
+
+@app.delete("/api/admin/profile")
+async def stop_profiler(request: Request):
+    require_admin(request)
+    session = request_profiler.finish()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session is armed")
+    return session.summary()
+
+@app.get("/api/admin/profile/{session_id}/{fmt}")
+async def download_profile(session_id: str, fmt: str, request: Request):
+    require_admin(request)
+    session = request_profiler.get(session_id)
+    if session is None or fmt not in FORMATS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if session.finished is None:
+        raise HTTPException(status_code=409, detail=f"Profiling session {session_id} is still running")
+    body = session.download(fmt)
+    if body is None:
+        raise HTTPException(status_code=404, detail=f"{fmt} is not available for {session.mode} profiles")
+    filename = f"rideguard-{session_id}.{'prof' if fmt == 'pstats' else 'collapsed.txt'}"
+    return Response(body, media_type="application/octet-stream" if fmt == "pstats" else "text/plain",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def check_gps_token(token: Optional[str]) -> bool:
+    # Без токена приём GPS выключен: чужой пинг подменил бы адрес в звонке диспетчеру
+    return bool(Config.GPS_INGEST_TOKEN) and hmac.compare_digest((token or "").encode(),
+                                                                 Config.GPS_INGEST_TOKEN.encode())
+
+def count_gps_pings(accepted: int, rejected: int) -> None:
+    GPS_PINGS.inc("accepted", amount=accepted)
+    GPS_PINGS.inc("rejected", amount=rejected)
+
+@app.post("/api/gps")
+async def ingest_gps(request: Request, token: Optional[str] = None):
+    if not check_gps_token(token):
+        raise HTTPException(status_code=403, detail="Invalid GPS token")
+    # Тело читается потоком: пинги попадают в треки, пока клиент ещё передаёт остальные
+    accepted = rejected = 0
+    tail = b""
+    async for chunk in request.stream():
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        if len(tail) > Config.GPS_MAX_LINE_BYTES:
+            tail = b""
+            rejected += 1
+        added, dropped = ingest_lines(gps_tracks, lines, time.time())
+        accepted += added
+        rejected += dropped
+    added, dropped = ingest_lines(gps_tracks, [tail], time.time())
+    accepted += added
+    rejected += dropped
+    count_gps_pings(accepted, rejected)
+    return {"accepted": accepted, "rejected": rejected}
+
+@app.websocket("/api/gps/ws")
+async def stream_gps(websocket: WebSocket, token: Optional[str] = None):
+    if not check_gps_token(token):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            payload = message.get("bytes") or (message.get("text") or "").encode()
+            count_gps_pings(*ingest_lines(gps_tracks, payload.split(b"\n"), time.time()))
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/api/rides/{ride_id}/track")
+async def get_ride_track(ride_id: str):
+    return {"ride_id": ride_id, "points": [fix.to_dict() for fix in gps_tracks.track(ride_id)]}
+
+async def batch_outcome(index: int, admitted: dict, subscription) -> dict:
+    # Строка результата - когда звонок инцидента принят провайдером или инцидент окончательно упал
+    incident_id = admitted["incident_id"]
+    state = dict(call_tracker.get(incident_id) or {})
+    if admitted.get("call_id"):
+        # Повторное нажатие уже звонящего инцидента
+        state["call_id"] = admitted["call_id"]
+    try:
+        while not state.get("call_id") and state.get("status") not in ("dispatched", "failed"):
+            try:
+                await asyncio.wait_for(subscription.get(), timeout=Config.EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # Инцидент другого воркера (общее окно SOS) виден только в очереди
+                incident = await incident_queue.get(incident_id)
+                if incident is not None and incident["status"] in ("dispatched", "failed"):
+                    state = dict(incident["result"] or {}, status=incident["status"], error=incident["error"])
+                    continue
+            state = call_tracker.get(incident_id) or state
+    finally:
+        call_events.unsubscribe(subscription)
+    line = {"index": index, "success": state.get("status") != "failed", "ride_id": admitted["ride_id"],
+            "incident_id": incident_id, "incident_type": admitted["incident_type"],
+            "deduplicated": admitted["deduplicated"], "clustered": admitted.get("clustered", False)}
+    if line["success"]:
+        line.update(call_id=state.get("call_id"), provider=state.get("provider"))
+    else:
+        line["error"] = state.get("error")
+    return line
+
+@app.post("/api/emergency/batch")
+async def trigger_emergency_batch(batch: EmergencyBatchRequest):
+    if len(batch.incidents) > Config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch is limited to {Config.BATCH_MAX_ITEMS} incidents")
+
+    # Каждый инцидент проходит тот же путь, что и одиночный SOS: дедупликация, лимит,
+    # кластер и надёжная очередь. Звонки делают воркеры очереди в общих слотах звонков.
+    rejected = []
+    waiting = []
+    for index, request in enumerate(batch.incidents):
+        try:
+            admitted = await admit_emergency(request)
+        except HTTPException as e:
+            rejected.append({"index": index, "success": False, "ride_id": request.ride_id, "error": e.detail})
+            continue
+        except Exception as e:
+            rejected.append({"index": index, "success": False, "ride_id": request.ride_id, "error": str(e)})
+            continue
+        # Подписка до следующего await: изменение статуса не потеряется
+        waiting.append((index, admitted, call_events.subscribe(admitted["incident_id"])))
+
+    tasks = [asyncio.create_task(batch_outcome(*item)) for item in waiting]
+
+    async def stream():
+        try:
+            for item in rejected:
+                yield json.dumps(item) + "\n"
+            # Результаты отдаём по мере готовности, не дожидаясь самого медленного звонка
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # Клиент отключился: инциденты уже в очереди, перестаём только ждать их
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
@@ -181,4 +1138,5 @@ if __name__ == "__main__":
     print(f"🚀 Starting Emergency AI Assistant on port {port}...")
     print(f"📞 Will call: {emergency_phone}")
     print(f"🔑 API Key: {'✓ Configured' if bland_api_key else '✗ Missing'}")
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # Несколько воркеров uvicorn запускает только по строке импорта
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=Config.WEB_CONCURRENCY)
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Лёгкие метрики в формате Prometheus (без внешних зависимостей).
+
+Запись метрики - поиск по dict и инкремент в списке, поэтому инструментация
+остаётся включённой в проде. Метрики пишутся из event loop, блокировки не нужны.
+"""
+from bisect import bisect_left
+from typing import Dict, Iterable, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        name = self.name + "_total"
+        for labels, value in self._values.items():
+            yield name, labels, "", value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels) -> None:
+        self._values[labels] = value
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield self.name, labels, "", value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по бакетам..., +Inf, сумма]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                yield self.name + "_bucket", labels, f'le="{_format_value(bound)}"', cumulative
+            yield self.name + "_sum", labels, "", series[-1]
+            yield self.name + "_count", labels, "", cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.label_names, labels, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "rideguard_sos_stage_seconds",
+    "Latency of SOS hot-path stages (ingest, render, provider_connect, provider_response)",
+    labels=("stage", "provider"),
+))
+TIME_TO_ACCEPT = REGISTRY.register(Histogram(
+    "rideguard_time_to_call_accepted_seconds",
+    "Time from dispatch start until a provider accepted the emergency call",
+    labels=("provider",),
+))
+PROVIDER_CALLS = REGISTRY.register(Counter(
+    "rideguard_provider_calls",
+    "Outbound provider call attempts by outcome",
+    labels=("provider", "outcome"),
+))
+CALLS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "rideguard_provider_calls_in_flight",
+    "Outbound provider calls currently in flight",
+    labels=("provider",),
+))
+SCHEDULER_WAIT = REGISTRY.register(Histogram(
+    "rideguard_call_scheduler_wait_seconds",
+    "Time an emergency call waited for a dispatch slot, by severity",
+    labels=("severity",),
+))
+CALLS_SHED = REGISTRY.register(Counter(
+    "rideguard_calls_shed",
+    "Emergency calls shed by the priority scheduler under overload",
+    labels=("severity",),
+))
+AUDIT_FLUSH_LATENCY = REGISTRY.register(Histogram(
+    "rideguard_audit_flush_seconds",
+    "Time to write and fsync one batch of audit log records",
+))
+AUDIT_DROPPED = REGISTRY.register(Counter(
+    "rideguard_audit_records_dropped",
+    "Audit log records dropped because the writer fell behind",
+))
+GPS_PINGS = REGISTRY.register(Counter(
+    "rideguard_gps_pings",
+    "Live GPS pings received from rides by outcome",
+    labels=("outcome",),
+))
+RECORDING_DOWNLOADS = REGISTRY.register(Counter(
+    "rideguard_recording_downloads",
+    "Call recording downloads by provider and outcome",
+    labels=("provider", "outcome"),
+))
+RECORDING_FETCH_LATENCY = REGISTRY.register(Histogram(
+    "rideguard_recording_fetch_seconds",
+    "Time to stream one call recording from the provider to disk",
+    labels=("provider",),
+))
+NOTIFICATIONS = REGISTRY.register(Counter(
+    "rideguard_notifications",
+    "SOS notifications by channel and final outcome",
+    labels=("channel", "outcome"),
+))
+NOTIFICATION_LATENCY = REGISTRY.register(Histogram(
+    "rideguard_notification_seconds",
+    "Time from SOS fan-out start to the final outcome of a notification channel",
+    labels=("channel",),
+))
+LOOP_LAG = REGISTRY.register(Histogram(
+    "rideguard_event_loop_lag_seconds",
+    "How late event loop timers fired while a profiling session was running",
+))
+EXPORT_BATCHES = REGISTRY.register(Counter(
+    "rideguard_export_batches",
+    "Event export batches by outcome (sent, failed, throttled, rejected, spilled, dropped)",
+    labels=("outcome",),
+))
+EXPORT_EVENTS = REGISTRY.register(Counter(
+    "rideguard_export_events",
+    "Exported events by final outcome (sent, rejected, dropped)",
+    labels=("outcome",),
+))
+EXPORT_SEND_LATENCY = REGISTRY.register(Histogram(
+    "rideguard_export_send_seconds",
+    "Time to send one compressed event batch to the partner backend",
+))
+EXPORT_BACKLOG = REGISTRY.register(Gauge(
+    "rideguard_export_backlog_batches",
+    "Event export batches waiting to be sent, in memory or spooled to disk",
+    labels=("where",),
+))
@@ -0,0 +1,168 @@
+"""
+Параллельная рассылка оповещений по SOS: SMS диспетчеру и контактам
+пассажира, сообщение дежурной смене безопасности.
+
+Каналы запускаются одновременно, у каждого свой дедлайн и политика
+повторов: медленный или упавший канал не задерживает остальные и
+звонок. Итог собирается по каналам; повторная обработка того же
+инцидента (ретрай очереди) не рассылает оповещения второй раз.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from metrics import NOTIFICATION_LATENCY, NOTIFICATIONS
+from provider_client import ProviderError
+
+# 4xx, кроме этих, повтор не исправит: неверный номер, нет доступа
+RETRYABLE_STATUSES = {408, 409, 425, 429}
+
+
+class ChannelPolicy(NamedTuple):
+    # Секунды от начала рассылки, после которых канал больше не пытаемся отправить
+    deadline: float
+    max_attempts: int = 3
+    retry_delay: float = 0.5
+
+
+class PermanentNotificationError(Exception):
+    pass
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, PermanentNotificationError):
+        return False
+    status_code = getattr(error, "status_code", None)
+    return status_code is None or status_code >= 500 or status_code in RETRYABLE_STATUSES
+
+
+class FanoutRun:
+    """Одна рассылка: результаты по каналам обновляются по мере готовности"""
+
+    def __init__(self, key: Optional[str]):
+        self.key = key
+        self.started = time.time()
+        self.results: Dict[str, dict] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.task is not None and self.task.done()
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: dict(result) for name, result in self.results.items()}
+
+    async def wait(self) -> Dict[str, dict]:
+        if self.task is not None:
+            await asyncio.shield(self.task)
+        return self.snapshot()
+
+
+class NotificationFanout:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        # Рассылки по инцидентам: и идущие, и завершённые - повтор их не запускает
+        self._runs: OrderedDict = OrderedDict()
+        self._tasks: set = set()
+
+    def __len__(self) -> int:
+        return len(self._runs)
+
+    def get(self, key: str) -> Optional[FanoutRun]:
+        return self._runs.get(key)
+
+    def start(self, key: Optional[str], channels: Dict[str, tuple],
+              on_done: Optional[Callable[[FanoutRun], None]] = None) -> FanoutRun:
+        """
+        channels - {имя: (корутинная функция без аргументов, ChannelPolicy)}; функция None -
+        канал не настроен и отмечается как skipped. key=None - рассылка без дедупликации.
+        """
+        if key is not None and key in self._runs:
+            self._runs.move_to_end(key)
+            return self._runs[key]
+
+        run = FanoutRun(key)
+        for name, (send, _) in channels.items():
+            run.results[name] = {"status": "pending" if send is not None else "skipped", "attempts": 0}
+        run.task = asyncio.create_task(self._run(run, channels, on_done))
+        # Задачи держим в модуле: клиент, отключившийся от batch, не должен обрывать рассылку
+        self._tasks.add(run.task)
+        run.task.add_done_callback(self._tasks.discard)
+        if key is not None:
+            self._runs[key] = run
+            while len(self._runs) > self.max_entries:
+                self._runs.popitem(last=False)
+        return run
+
+    async def close(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, run: FanoutRun, channels: Dict[str, tuple],
+                   on_done: Optional[Callable[[FanoutRun], None]]) -> None:
+        await asyncio.gather(*(self._run_channel(name, send, policy, run.results[name])
+                               for name, (send, policy) in channels.items() if send is not None))
+        if on_done is not None:
+            on_done(run)
+
+    async def _run_channel(self, name: str, send: Callable[[], Awaitable], policy: ChannelPolicy,
+                           result: dict) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + policy.deadline
+        for attempt in range(1, policy.max_attempts + 1):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                result["status"] = "timeout"
+                break
+            result["attempts"] = attempt
+            try:
+                response = await asyncio.wait_for(send(), remaining)
+            except asyncio.TimeoutError:
+                result.update(status="timeout", error=f"No response within the {policy.deadline}s deadline")
+                break
+            except Exception as e:
+                # Ошибка одного канала не должна ронять остальные
+                result.update(status="failed", error=str(e) or type(e).__name__)
+                if not is_retryable(e):
+                    break
+                delay = policy.retry_delay * 2 ** (attempt - 1)
+                if attempt < policy.max_attempts and loop.time() + delay < deadline:
+                    await asyncio.sleep(delay)
+                    continue
+                break
+            result.update(status="sent", response=response)
+            result.pop("error", None)
+            break
+        elapsed = loop.time() - started
+        result["elapsed_ms"] = round(elapsed * 1000, 1)
+        NOTIFICATIONS.inc(name, result["status"])
+        NOTIFICATION_LATENCY.observe(elapsed, name)
+
+
+def recipients_sender(send_one: Callable[[str], Awaitable], recipients) -> Callable[[], Awaitable]:
+    """Отправка нескольким адресатам одним каналом: повтор шлёт только тем, до кого не дошло"""
+    delivered: Dict[str, object] = {}
+
+    async def send() -> dict:
+        pending = [recipient for recipient in recipients if recipient not in delivered]
+        results = await asyncio.gather(*(send_one(recipient) for recipient in pending), return_exceptions=True)
+        errors = []
+        for recipient, result in zip(pending, results):
+            if isinstance(result, Exception):
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                delivered[recipient] = result
+        if errors:
+            # Повторяем, если хотя бы одну ошибку повтор может исправить
+            retryable = any(is_retryable(error) for error in errors)
+            raise ProviderError(f"{len(errors)} of {len(recipients)} recipients not reached: {errors[0]}",
+                                None if retryable else getattr(errors[0], "status_code", 400))
+        return {"delivered": dict(delivered)}
+
+    return send
@@ -0,0 +1,148 @@
+"""
+Приоритетный планировщик исходящих звонков.
+
+Когда лимит одновременных звонков исчерпан, ожидающие инциденты получают
+слот в порядке дедлайна: время поступления + допустимая задержка для их
+тяжести (earliest deadline first). Чем дольше ждёт инцидент низкой тяжести,
+тем раньше его дедлайн относительно новых - он не голодает бесконечно.
+При перегрузке планировщик сбрасывает самые неважные ожидающие звонки.
+Тяжесть ожидающего звонка можно поднять (к кластеру присоединился более
+тяжёлый SOS) - он переходит на более ранний дедлайн.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Hashable, Optional
+
+from metrics import CALLS_SHED, SCHEDULER_WAIT
+from sos_dedup import SEVERITY_RANK, severity_rank
+
+# Допустимая задержка звонка по тяжести, секунды
+SEVERITY_TARGETS = {"critical": 0.0, "high": 5.0, "medium": 30.0, "low": 120.0}
+
+
+def severity_deadline(severity: str, arrived: float, targets: dict = SEVERITY_TARGETS) -> float:
+    return arrived + targets.get(severity, targets["high"])
+
+
+class CallShed(Exception):
+    """Звонок сброшен планировщиком из-за перегрузки"""
+
+
+class _Waiter:
+    __slots__ = ("deadline", "seq", "rank", "severity", "future")
+
+    def __init__(self, deadline: float, seq: int, severity: str, future: asyncio.Future):
+        self.deadline = deadline
+        self.seq = seq
+        self.rank = severity_rank(severity)
+        self.severity = severity
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.deadline, self.seq) < (other.deadline, other.seq)
+
+
+class PriorityScheduler:
+    def __init__(self, capacity: int, max_waiting: int = 0, shed_max_rank: int = SEVERITY_RANK["low"],
+                 targets: Optional[dict] = None, clock: Callable[[], float] = time.time):
+        self.capacity = capacity
+        self.targets = SEVERITY_TARGETS if targets is None else targets
+        # 0 - без сброса; иначе при большем числе ожидающих сбрасываем звонки тяжести не выше shed_max_rank
+        self.max_waiting = max_waiting
+        self.shed_max_rank = shed_max_rank
+        self.clock = clock
+        self.in_use = 0
+        self._heap: list = []
+        self._waiting = 0
+        self._seq = itertools.count()
+        # Ожидающие по ключу вызывающего (id инцидента) - для escalate
+        self._keyed: Dict[Hashable, _Waiter] = {}
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    async def acquire(self, severity: str, arrived: Optional[float] = None, key: Optional[Hashable] = None) -> None:
+        now = self.clock()
+        arrived = now if arrived is None else arrived
+        if self.in_use < self.capacity and not self._waiting:
+            self.in_use += 1
+            SCHEDULER_WAIT.observe(0.0, severity)
+            return
+
+        waiter = _Waiter(severity_deadline(severity, arrived, self.targets), next(self._seq), severity,
+                         asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, waiter)
+        self._waiting += 1
+        if key is not None:
+            self._keyed[key] = waiter
+        if self.max_waiting and self._waiting > self.max_waiting:
+            self._shed()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот уже выдан, но звонящий отменён - возвращаем слот следующему
+                self.release()
+            else:
+                self._waiting -= 1
+            raise
+        finally:
+            if key is not None and self._keyed.get(key) is waiter:
+                del self._keyed[key]
+        SCHEDULER_WAIT.observe(self.clock() - now, waiter.severity)
+
+    def escalate(self, key: Hashable, severity: str, arrived: Optional[float] = None) -> bool:
+        """Поднимает тяжесть ожидающего звонка; False - звонок не ждёт или тяжесть не выше"""
+        waiter = self._keyed.get(key)
+        if waiter is None or waiter.future.done() or severity_rank(severity) <= waiter.rank:
+            return False
+        arrived = self.clock() if arrived is None else arrived
+        # Дедлайн меняется только через перестройку кучи: очередь ожидающих короткая
+        self._heap.remove(waiter)
+        waiter.deadline = min(waiter.deadline, severity_deadline(severity, arrived, self.targets))
+        waiter.rank = severity_rank(severity)
+        waiter.severity = severity
+        heapq.heapify(self._heap)
+        heapq.heappush(self._heap, waiter)
+        return True
+
+    def release(self) -> None:
+        self.in_use -= 1
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, severity: str, arrived: Optional[float] = None, key: Optional[Hashable] = None):
+        await self.acquire(severity, arrived, key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _grant(self) -> None:
+        heap = self._heap
+        while self.in_use < self.capacity and heap:
+            waiter = heapq.heappop(heap)
+            if waiter.future.done():
+                # Отменённые и сброшенные ожидающие удаляются лениво
+                continue
+            self._waiting -= 1
+            self.in_use += 1
+            waiter.future.set_result(None)
+
+    def _shed(self) -> None:
+        # Жертва - самая низкая тяжесть, среди равных - самый поздний дедлайн
+        victim = None
+        for waiter in self._heap:
+            if waiter.future.done() or waiter.rank > self.shed_max_rank:
+                continue
+            if victim is None or (waiter.rank, -waiter.deadline) < (victim.rank, -victim.deadline):
+                victim = waiter
+        if victim is None:
+            return
+        self._waiting -= 1
+        CALLS_SHED.inc(victim.severity)
+        victim.future.set_exception(CallShed(f"{victim.severity} severity call shed under overload"))
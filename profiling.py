@@ -0,0 +1,312 @@
+"""
+Профилирование горячего пути SOS по запросу администратора, без передеплоя.
+
+Профилировщик взводится на N следующих запросов (по префиксу пути) или на
+один запрос с заголовком X-Profile. Пока сессия идёт, профилируется весь
+поток event loop: обработчик, фоновые воркеры очереди, вызовы провайдеров.
+Режимы: deterministic (cProfile) и sampling (стеки потока loop раз в
+несколько мс). Параллельно меряется лаг event loop - насколько позже
+просыпается таймер, то есть сколько loop был заблокирован.
+
+Результат скачивается как pstats (`python -m pstats`, snakeviz) или как
+collapsed stacks (flamegraph.pl, speedscope). Выключенный профилировщик
+стоит лишнего await и проверки атрибута на запрос (меньше микросекунды).
+"""
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter, OrderedDict, deque
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import LOOP_LAG
+
+MODES = ("deterministic", "sampling")
+FORMATS = ("pstats", "collapsed")
+
+FuncKey = Tuple[str, int, str]
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def short_filename(filename: str) -> str:
+    # Пути из site-packages и проекта обрезаем, чтобы стеки читались
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    if filename.startswith(os.getcwd() + os.sep):
+        return os.path.relpath(filename)
+    return filename
+
+
+def frame_stack(frame) -> Tuple[FuncKey, ...]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def samples_to_pstats(samples: StackCounter, interval: float) -> dict:
+    """
+    Сэмплы в формат pstats: число вызовов - число сэмплов, где функция на стеке,
+    время - сэмплы * интервал (собственное - на вершине стека, полное - где угодно на стеке).
+    """
+    stats: Dict[FuncKey, list] = {}
+    for stack, count in samples.items():
+        seen = set()
+        for depth, func in enumerate(stack):
+            entry = stats.setdefault(func, [0, 0, 0.0, 0.0, {}])
+            if func not in seen:
+                seen.add(func)
+                entry[0] += count
+                entry[1] += count
+                entry[3] += count * interval
+            if depth:
+                caller = entry[4].setdefault(stack[depth - 1], [0, 0, 0.0, 0.0])
+                caller[0] += count
+                caller[1] += count
+                caller[3] += count * interval
+        stats[stack[-1]][2] += count * interval
+    for func, entry in stats.items():
+        if not entry[4]:
+            continue
+        for caller, values in entry[4].items():
+            values[2] = entry[2] * values[0] / entry[0]
+        entry[4] = {caller: tuple(values) for caller, values in entry[4].items()}
+    return {func: (cc, nc, tt, ct, callers) for func, (cc, nc, tt, ct, callers) in stats.items()}
+
+
+def collapsed_stacks(samples: StackCounter) -> str:
+    lines = []
+    for stack, count in samples.most_common():
+        frames = ";".join(f"{name} ({short_filename(filename)}:{line})" for filename, line, name in stack)
+        lines.append(f"{frames} {count}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+class ProfileSession:
+    def __init__(self, mode: str, requests: int, path_prefix: str, linger: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.requests = requests
+        self.path_prefix = path_prefix
+        self.linger = linger
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.completed = 0
+        self.in_flight = 0
+        self.lags: deque = deque(maxlen=100000)
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.samples: StackCounter = StackCounter()
+        self.pstats: Optional[bytes] = None
+        self.collapsed: Optional[str] = None
+
+    def record_lag(self, lag: float, threshold: float) -> None:
+        self.lags.append(lag)
+        if lag >= threshold:
+            self.blocked += 1
+            self.blocked_seconds += lag
+
+    def summary(self) -> dict:
+        lags = sorted(self.lags)
+
+        def quantile(q: float) -> Optional[float]:
+            return round(lags[min(len(lags) - 1, int(q * len(lags)))] * 1000, 2) if lags else None
+
+        end = self.finished or time.time()
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "requests": self.requests,
+            "completed": self.completed,
+            "path_prefix": self.path_prefix,
+            "state": "finished" if self.finished else "capturing" if self.started else "armed",
+            "duration_ms": round((end - self.started) * 1000, 1) if self.started else None,
+            "samples": sum(self.samples.values()) if self.mode == "sampling" else None,
+            "loop_lag_ms": {"p50": quantile(0.5), "p99": quantile(0.99), "max": quantile(1.0),
+                            "blocked": self.blocked, "blocked_ms": round(self.blocked_seconds * 1000, 1)},
+            "formats": [fmt for fmt in FORMATS if self.download(fmt) is not None],
+        }
+
+    def download(self, fmt: str):
+        return self.pstats if fmt == "pstats" else self.collapsed if fmt == "collapsed" else None
+
+
+class RequestProfiler:
+    def __init__(self, keep: int = 5, sample_interval: float = 0.005, lag_interval: float = 0.01,
+                 lag_threshold: float = 0.05, max_seconds: float = 300.0):
+        self.keep = keep
+        self.sample_interval = sample_interval
+        self.lag_interval = lag_interval
+        self.lag_threshold = lag_threshold
+        self.max_seconds = max_seconds
+        # Взведённая или идущая сессия; None - профилировщик выключен
+        self.armed: Optional[ProfileSession] = None
+        self.sessions: OrderedDict = OrderedDict()
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._sampling = threading.Event()
+        self._lag_task: Optional[asyncio.Task] = None
+        self._lag_due = 0.0
+        self._timers: list = []
+
+    def arm(self, mode: str = "deterministic", requests: int = 1, path_prefix: str = "/",
+            linger: float = 0.0) -> ProfileSession:
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {', '.join(MODES)}")
+        if requests < 1:
+            raise ValueError("requests must be at least 1")
+        if self.armed is not None:
+            raise ProfilerBusy(f"Profiling session {self.armed.id} is already armed")
+        self.armed = ProfileSession(mode, requests, path_prefix, linger)
+        return self.armed
+
+    def get(self, session_id: str) -> Optional[ProfileSession]:
+        if self.armed is not None and self.armed.id == session_id:
+            return self.armed
+        return self.sessions.get(session_id)
+
+    def matches(self, path: str) -> bool:
+        session = self.armed
+        return (session is not None and path.startswith(session.path_prefix)
+                and session.completed + session.in_flight < session.requests)
+
+    def request_started(self) -> None:
+        session = self.armed
+        session.in_flight += 1
+        if session.started is None:
+            self._start(session)
+
+    def request_finished(self, session: ProfileSession) -> None:
+        session.in_flight -= 1
+        session.completed += 1
+        if session.completed >= session.requests and session.in_flight == 0 and self.armed is session:
+            if session.linger > 0:
+                # Хвост сессии: фоновая обработка (например, звонок из очереди) уже после ответа
+                self._timers.append(asyncio.get_running_loop().call_later(session.linger, self.finish))
+            else:
+                self.finish()
+
+    def _start(self, session: ProfileSession) -> None:
+        loop = asyncio.get_running_loop()
+        session.started = time.time()
+        # Первый срок считаем сейчас: задача стартует только на следующей итерации loop,
+        # а блокировка могла начаться прямо в этом запросе
+        self._lag_due = loop.time() + self.lag_interval
+        self._lag_task = loop.create_task(self._watch_loop(session))
+        self._timers.append(loop.call_later(self.max_seconds, self.finish))
+        if session.mode == "deterministic":
+            # cProfile видит только текущий поток - это поток event loop; to_thread-работа в профиль не попадёт
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampling.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, args=(threading.get_ident(), session),
+                                             name="request-profiler", daemon=True)
+            self._sampler.start()
+
+    def finish(self) -> Optional[ProfileSession]:
+        session = self.armed
+        if session is None:
+            return None
+        self.armed = None
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+            # Таймер, срок которого уже прошёл, не успел проснуться: его опоздание - последняя блокировка
+            lag = asyncio.get_running_loop().time() - self._lag_due
+            if lag > 0:
+                self._record_lag(session, lag)
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.create_stats()
+            session.pstats = marshal.dumps(self._profile.stats)
+            self._profile = None
+        if self._sampler is not None:
+            self._sampling.set()
+            self._sampler.join()
+            self._sampler = None
+            session.pstats = marshal.dumps(samples_to_pstats(session.samples, self.sample_interval))
+            session.collapsed = collapsed_stacks(session.samples)
+        session.finished = time.time()
+        self.sessions[session.id] = session
+        while len(self.sessions) > self.keep:
+            self.sessions.popitem(last=False)
+        return session
+
+    def _sample_loop(self, thread_id: int, session: ProfileSession) -> None:
+        while not self._sampling.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                session.samples[frame_stack(frame)] += 1
+            del frame
+
+    async def _watch_loop(self, session: ProfileSession) -> None:
+        # Таймер, проснувшийся позже срока, - время, когда loop был занят чем-то синхронным
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(max(0.0, self._lag_due - loop.time()))
+            self._record_lag(session, max(0.0, loop.time() - self._lag_due))
+            self._lag_due = loop.time() + self.lag_interval
+
+    def _record_lag(self, session: ProfileSession, lag: float) -> None:
+        session.record_lag(lag, self.lag_threshold)
+        LOOP_LAG.observe(lag)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI-обёртка: считает запросы взведённой сессии. Заголовок X-Profile: deterministic|sampling
+    с верным X-Admin-Token профилирует один этот запрос, id сессии возвращается в X-Profile-Id.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler, authorize: Callable[[Optional[str]], bool],
+                 header_trigger: Callable[[], bool] = lambda: True):
+        self.app = app
+        self.profiler = profiler
+        self.authorize = authorize
+        self.header_trigger = header_trigger
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http" or (profiler.armed is None and not self.header_trigger()):
+            return await self.app(scope, receive, send)
+
+        profile_id = None
+        if profiler.armed is None:
+            headers = dict(scope["headers"])
+            mode = headers.get(b"x-profile")
+            if mode is None or not self.authorize(headers.get(b"x-admin-token", b"").decode("latin-1")):
+                return await self.app(scope, receive, send)
+            mode = mode.decode("latin-1")
+            profile_id = profiler.arm(mode if mode in MODES else MODES[0], 1, scope["path"]).id.encode()
+
+        if not profiler.matches(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        session = profiler.armed
+
+        async def send_with_id(message):
+            if profile_id is not None and message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"x-profile-id", profile_id)])
+            await send(message)
+
+        profiler.request_started()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.request_finished(session)
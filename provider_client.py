@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Tuple
+
+import httpx
+
+from metrics import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+CONNECT_EVENTS = ("connection.connect_tcp.complete", "connection.start_tls.complete")
+
+
+class ProviderError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        # HTTP-статус ответа провайдера; None - ответа не было (таймаут, обрыв соединения)
+        self.status_code = status_code
+
+
+class ProviderClient:
+    """Общий асинхронный HTTP-клиент для провайдера звонков (один на процесс)"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        max_concurrent_calls: int = 20,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 15.0,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrent_calls = max_concurrent_calls
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=read_timeout,
+            pool=read_timeout,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        # Keep-alive пул: соединения к провайдеру переиспользуются между SOS
+        limits = httpx.Limits(
+            max_connections=self.max_concurrent_calls,
+            max_keepalive_connections=self.max_concurrent_calls,
+            keepalive_expiry=60,
+        )
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=limits,
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_calls)
+
+    async def warm(self, connections: int = 1) -> int:
+        """Открывает соединения заранее (DNS, TCP, TLS), чтобы первый SOS их переиспользовал"""
+        await self.start()
+
+        async def touch() -> bool:
+            try:
+                # Статус ответа не важен - соединение остаётся в keep-alive пуле
+                await self._client.head("/")
+                return True
+            except httpx.HTTPError as e:
+                logger.warning("Warm-up request to %s failed: %s", self.name, str(e) or type(e).__name__)
+                return False
+
+        results = await asyncio.gather(*(touch() for _ in range(min(connections, self.max_concurrent_calls))))
+        return sum(results)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+    async def post_json(self, path: str, payload: dict, headers: Optional[dict] = None) -> dict:
+        return await self._post(path, json=payload, headers=headers)
+
+    async def post_form(self, path: str, data: dict, auth: Optional[Tuple[str, str]] = None) -> dict:
+        # REST API Twilio принимает form-encoded тело и Basic auth
+        return await self._post(path, data=data, auth=auth)
+
+    async def _post(self, path: str, **kwargs) -> dict:
+        if self._client is None:
+            await self.start()
+
+        # Ограничиваем число одновременных исходящих звонков
+        async with self._semaphore:
+            started = time.perf_counter()
+            connected = None
+
+            # httpcore сообщает, когда открыто новое соединение; при keep-alive этого события нет
+            async def trace(event: str, info: dict) -> None:
+                nonlocal connected
+                if event in CONNECT_EVENTS:
+                    connected = time.perf_counter()
+
+            try:
+                response = await self._client.post(path, extensions={"trace": trace}, **kwargs)
+                response.raise_for_status()
+                return response.json()
+            except httpx.HTTPError as e:
+                status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                raise ProviderError(str(e) or type(e).__name__, status_code) from e
+            finally:
+                if connected is not None:
+                    STAGE_LATENCY.observe(connected - started, "provider_connect", self.name)
+                STAGE_LATENCY.observe(time.perf_counter() - (connected or started), "provider_response", self.name)
@@ -0,0 +1,277 @@
+"""
+Офлайн обратное геокодирование: GPS поездки -> ближайший читаемый адрес из
+локального справочника (центроиды улиц, домов, мест), без сети во время SOS.
+
+Справочник собирается один раз в компактный файл: точки отсортированы по
+ячейкам сетки, координаты - int32 в микроградусах, подписи - общая таблица
+строк. Файл открывается через mmap: загрузка мгновенная, страницы общие
+для всех воркеров и подгружаются по мере обращения. Поиск обходит кольца
+ячеек вокруг точки, пока ближе найденного ничего быть не может. Частые
+районы отвечают из LRU-кеша по округлённым координатам.
+
+Переход через 180-й меридиан не поддерживается: город по обе его стороны
+в справочник не попадает. У полюсов число колец ограничено MAX_RINGS.
+
+    python reverse_geocoder.py build gazetteer.csv gazetteer.rgeo
+    python reverse_geocoder.py lookup gazetteer.rgeo 35.1856 33.3823
+"""
+import argparse
+import csv
+import json
+import math
+import mmap
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional, Tuple
+
+from incident_clusters import METERS_PER_DEGREE
+
+MAGIC = b"RGEO0001"
+# magic, размер ячейки в градусах, точек, непустых ячеек, подписей, байт в таблице строк
+HEADER = struct.Struct("<8sdQQQQ")
+MICRODEGREES = 1e6
+# ~220 м: в плотном городе десятки адресов на ячейку, в пригороде - несколько колец до ближайшего
+DEFAULT_CELL_DEG = 0.002
+# У полюса ячейка сужается по долготе и колец до max_distance_m - сотни: обход ограничен,
+# выше ~85° широты поиск по долготе не доходит до max_distance_m
+MAX_RINGS = 64
+
+_MISS = object()
+
+
+def grid_size(cell_deg: float) -> Tuple[int, int]:
+    return math.ceil(180 / cell_deg - 1e-9), math.ceil(360 / cell_deg - 1e-9)
+
+
+def place_label(row: dict) -> str:
+    # Готовая подпись или "Название, Улица Дом, Город"
+    if row.get("label"):
+        return row["label"]
+    street = " ".join(part for part in (row.get("street"), row.get("housenumber")) if part)
+    return ", ".join(part for part in (row.get("name"), street, row.get("city")) if part)
+
+
+def read_places(path: str) -> Iterator[Tuple[float, float, str]]:
+    with open(path, "r", newline="") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            payload = json.load(f)
+            rows = payload["places"] if isinstance(payload, dict) else payload
+        for row in rows:
+            label = place_label(row)
+            if label:
+                yield float(row["lat"]), float(row["lng"]), label
+
+
+def _align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def build_index(places: Iterable[Tuple[float, float, str]], cell_deg: float = DEFAULT_CELL_DEG) -> bytes:
+    """Собирает файл справочника из (lat, lng, подпись)"""
+    rows, columns = grid_size(cell_deg)
+    keys, lats, lngs, label_ids = array("q"), array("i"), array("i"), array("I")
+    labels: dict = {}
+    for lat, lng, label in places:
+        row = min(rows - 1, max(0, math.floor((lat + 90) / cell_deg)))
+        column = min(columns - 1, max(0, math.floor((lng + 180) / cell_deg)))
+        keys.append(row * columns + column)
+        lats.append(round(lat * MICRODEGREES))
+        lngs.append(round(lng * MICRODEGREES))
+        # Одинаковые подписи (точки одной улицы) хранятся один раз
+        label_ids.append(labels.setdefault(label, len(labels)))
+
+    # Внутри ячейки точки по широте: поиск идёт от широты запроса в обе стороны
+    order = sorted(range(len(keys)), key=lambda i: (keys[i] << 28) | (lats[i] + 90000000))
+    cells, starts = array("q"), array("I")
+    for position, point in enumerate(order):
+        if not cells or cells[-1] != keys[point]:
+            cells.append(keys[point])
+            starts.append(position)
+    starts.append(len(order))
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for label in labels:
+        blob += label.encode()
+        offsets.append(len(blob))
+
+    sections = [cells, starts, array("i", (lats[i] for i in order)), array("i", (lngs[i] for i in order)),
+                array("I", (label_ids[i] for i in order)), offsets, bytes(blob)]
+    out = bytearray(HEADER.pack(MAGIC, cell_deg, len(order), len(cells), len(labels), len(blob)))
+    for section in sections:
+        data = section.tobytes() if isinstance(section, array) else section
+        out += data + bytes(_align(len(data)) - len(data))
+    return bytes(out)
+
+
+class ReverseGeocoder:
+    def __init__(self, buffer, max_distance_m: float = 1000.0, near_m: float = 75.0,
+                 cache_size: int = 100000, cache_precision: int = 4):
+        self.max_distance_m = max_distance_m
+        # Дальше near_m от точки справочника адрес озвучивается как "near ..."
+        self.near_m = near_m
+        self.cache_size = cache_size
+        # 4 знака - ~11 м: все запросы в этой клетке получают один ответ из кеша
+        self.cache_precision = cache_precision
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict = OrderedDict()
+        # Поездки загружаются и в потоке (перезагрузка файла), и в event loop
+        self._lock = threading.Lock()
+        self._mmap = buffer if isinstance(buffer, mmap.mmap) else None
+
+        self._view = memoryview(buffer)
+        magic, self.cell_deg, count, cell_count, label_count, blob_size = HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            raise ValueError("Not a reverse geocoder index")
+        self._rows, self._columns = grid_size(self.cell_deg)
+        self._offset = HEADER.size
+        self._views = []
+        self._cells = self._take("q", cell_count)
+        self._starts = self._take("I", cell_count + 1)
+        self._lats = self._take("i", count)
+        self._lngs = self._take("i", count)
+        self._label_ids = self._take("I", count)
+        self._label_offsets = self._take("I", label_count + 1)
+        self._labels = self._take("B", blob_size)
+
+    def _take(self, fmt: str, count: int) -> memoryview:
+        size = count * struct.calcsize(fmt)
+        view = self._view[self._offset:self._offset + size].cast(fmt)
+        self._offset += _align(size)
+        self._views.append(view)
+        return view
+
+    def __len__(self) -> int:
+        return len(self._lats)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._view)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "ReverseGeocoder":
+        # CSV/JSON собирается в памяти; собранный файл открывается через mmap без копирования
+        if path.endswith((".csv", ".json")):
+            return cls(build_index(read_places(path)), **kwargs)
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), **kwargs)
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def label(self, index: int) -> str:
+        label_id = self._label_ids[index]
+        return bytes(self._labels[self._label_offsets[label_id]:self._label_offsets[label_id + 1]]).decode()
+
+    def nearest(self, lat: float, lng: float) -> Optional[Tuple[int, float]]:
+        """Индекс ближайшей точки справочника и расстояние в метрах; None - дальше max_distance_m"""
+        cell_deg, rows, columns = self.cell_deg, self._rows, self._columns
+        cells, starts, lats, lngs = self._cells, self._starts, self._lats, self._lngs
+        row = math.floor((lat + 90) / cell_deg)
+        column = math.floor((lng + 180) / cell_deg)
+        qlat, qlng = lat * MICRODEGREES, lng * MICRODEGREES
+        # Равнопрямоугольная проекция на широте запроса, расстояния - в микроградусах широты
+        scale = max(math.cos(math.radians(lat)), 0.01)
+        limit = self.max_distance_m / METERS_PER_DEGREE * MICRODEGREES
+        best, best_sq = -1, limit * limit
+        # Строки дальше max_distance_m по широте не смотрим: кольцо дальше растёт только по долготе
+        row_reach = math.ceil(limit / (cell_deg * MICRODEGREES))
+        ring = 0
+        while True:
+            if ring == 0:
+                ring_cells = ((row, column),)
+            else:
+                side = min(ring - 1, row_reach)
+                ring_cells = [(r, c) for r in range(row - side, row + side + 1) for c in (column - ring, column + ring)]
+                if ring <= row_reach:
+                    ring_cells += [(r, c) for r in (row - ring, row + ring)
+                                   for c in range(column - ring, column + ring + 1)]
+            for r, c in ring_cells:
+                if not (0 <= r < rows and 0 <= c < columns):
+                    continue
+                key = r * columns + c
+                i = bisect_left(cells, key)
+                if i == len(cells) or cells[i] != key:
+                    continue
+                start, stop = starts[i], starts[i + 1]
+                # В плотной ячейке тысячи точек: дальше найденного по широте не смотрим
+                middle = bisect_left(lats, qlat, start, stop)
+                for step, points in ((1, range(middle, stop)), (-1, range(middle - 1, start - 1, -1))):
+                    for point in points:
+                        dy = lats[point] - qlat
+                        if dy * dy >= best_sq:
+                            break
+                        dx = (lngs[point] - qlng) * scale
+                        distance_sq = dx * dx + dy * dy
+                        if distance_sq < best_sq:
+                            best, best_sq = point, distance_sq
+            # Вне просмотренных колец точки не ближе ring ячеек по широте или долготе
+            reach = ring * cell_deg * MICRODEGREES * scale
+            if best_sq <= reach * reach or ring >= MAX_RINGS:
+                break
+            ring += 1
+        if best < 0:
+            return None
+        return best, math.sqrt(best_sq) / MICRODEGREES * METERS_PER_DEGREE
+
+    def describe(self, lat: float, lng: float) -> Optional[str]:
+        """Адрес для сценария звонка; None - рядом в справочнике ничего нет"""
+        key = (round(lat, self.cache_precision), round(lng, self.cache_precision))
+        with self._lock:
+            cached = self._cache.get(key, _MISS)
+            if cached is not _MISS:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        # Ищем от округлённой точки: ответ не зависит от того, какой запрос первым попал в клетку
+        found = self.nearest(*key)
+        address = None
+        if found is not None:
+            index, distance = found
+            address = self.label(index) if distance <= self.near_m else f"near {self.label(index)}"
+        with self._lock:
+            self._cache[key] = address
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return address
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query an offline reverse geocoder index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="CSV/JSON gazetteer (lat,lng,label or name,street,housenumber,city)")
+    build.add_argument("source")
+    build.add_argument("target")
+    build.add_argument("--cell-deg", type=float, default=DEFAULT_CELL_DEG)
+    lookup = commands.add_parser("lookup")
+    lookup.add_argument("index")
+    lookup.add_argument("lat", type=float)
+    lookup.add_argument("lng", type=float)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        data = build_index(read_places(args.source), args.cell_deg)
+        with open(args.target, "wb") as f:
+            f.write(data)
+        print(f"{len(ReverseGeocoder(data))} places, {len(data)} bytes -> {args.target}")
+    else:
+        geocoder = ReverseGeocoder.load(args.index)
+        found = geocoder.nearest(args.lat, args.lng)
+        print(f"{geocoder.label(found[0])} ({found[1]:.0f} m)" if found else "no place within range")
+
+
+if __name__ == "__main__":
+    main()
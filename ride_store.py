@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+RIDE_SECTIONS = ("passenger", "driver", "vehicle", "location", "ride_info")
+
+
+class RideRecord:
+    """Компактная запись активной поездки (без __dict__ на каждый объект)"""
+
+    __slots__ = ("ride_id", "version") + RIDE_SECTIONS
+
+    def __init__(self, ride_id: str, passenger: dict, driver: dict, vehicle: dict,
+                 location: dict, ride_info: dict, version: int = 0):
+        self.ride_id = ride_id
+        self.passenger = passenger
+        self.driver = driver
+        self.vehicle = vehicle
+        self.location = location
+        self.ride_info = ride_info
+        self.version = version
+
+    # Записи читаются так же, как раньше читался dict из test_data.json
+    def __getitem__(self, key: str):
+        if key not in RIDE_SECTIONS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        if key not in RIDE_SECTIONS:
+            return default
+        return getattr(self, key)
+
+    def to_dict(self) -> dict:
+        return {section: getattr(self, section) for section in RIDE_SECTIONS}
+
+    def same_data(self, other: "RideRecord") -> bool:
+        return all(getattr(self, section) == getattr(other, section) for section in RIDE_SECTIONS)
+
+    @classmethod
+    def from_dict(cls, data: dict, version: int = 0) -> "RideRecord":
+        ride_info = data.get("ride_info") or {}
+        ride_id = data.get("ride_id") or ride_info.get("ride_id")
+        if not ride_id:
+            raise ValueError("Ride has no ride_id")
+        return cls(
+            str(ride_id),
+            data["passenger"],
+            data["driver"],
+            data["vehicle"],
+            data["location"],
+            ride_info,
+            version,
+        )
+
+
+class RideStore:
+    """
+    Хранилище контекста активных поездок в памяти.
+    Записи лежат в списке слотов, индекс ride_id -> номер слота даёт поиск за O(1).
+    """
+
+    def __init__(self):
+        # (слоты, индекс) подменяются вместе одним присваиванием при перезагрузке
+        self._table: tuple = ([], {})
+        self._free: list = []
+        self.default_ride_id: Optional[str] = None
+        self.path: Optional[str] = None
+        self._file_signature = None
+        # Офлайн-геокодер (ReverseGeocoder): поездкам без адреса адрес ищется по GPS при загрузке
+        self.geocoder = None
+
+    def __len__(self) -> int:
+        return len(self._table[1])
+
+    def __contains__(self, ride_id: str) -> bool:
+        return ride_id in self._table[1]
+
+    def get(self, ride_id: str) -> Optional[RideRecord]:
+        slots, index = self._table
+        slot = index.get(ride_id)
+        if slot is None:
+            return None
+        return slots[slot]
+
+    def upsert(self, data: dict) -> RideRecord:
+        record = self._with_address(RideRecord.from_dict(data))
+        slots, index = self._table
+        slot = index.get(record.ride_id)
+        if slot is not None:
+            previous = slots[slot]
+            # Версия растёт только при изменении: по ней инвалидируются кеши сценариев
+            record.version = previous.version if record.same_data(previous) else previous.version + 1
+            slots[slot] = record
+        elif self._free:
+            slot = self._free.pop()
+            slots[slot] = record
+            index[record.ride_id] = slot
+        else:
+            index[record.ride_id] = len(slots)
+            slots.append(record)
+        if self.default_ride_id is None:
+            self.default_ride_id = record.ride_id
+        return record
+
+    def remove(self, ride_id: str) -> bool:
+        slots, index = self._table
+        slot = index.pop(ride_id, None)
+        if slot is None:
+            return False
+        slots[slot] = None
+        self._free.append(slot)
+        if self.default_ride_id == ride_id:
+            self.default_ride_id = next(iter(index), None)
+        return True
+
+    def ingest(self, rides: Iterable[dict]) -> int:
+        count = 0
+        for data in rides:
+            self.upsert(data)
+            count += 1
+        return count
+
+    def replace_all(self, rides: Iterable[dict]) -> int:
+        # Строим новые слоты целиком и подменяем одной операцией,
+        # чтобы параллельный SOS никогда не увидел наполовину загруженные данные
+        slots = []
+        index = {}
+        for data in rides:
+            record = self._with_address(RideRecord.from_dict(data))
+            previous = self.get(record.ride_id)
+            if previous is not None:
+                # Перезагрузка файла не трогает версии неизменившихся поездок
+                record.version = previous.version if record.same_data(previous) else previous.version + 1
+            if record.ride_id in index:
+                slots[index[record.ride_id]] = record
+            else:
+                index[record.ride_id] = len(slots)
+                slots.append(record)
+
+        default_ride_id = self.default_ride_id if self.default_ride_id in index else next(iter(index), None)
+        self._table = (slots, index)
+        self._free = []
+        self.default_ride_id = default_ride_id
+        return len(index)
+
+    def _with_address(self, record: RideRecord) -> RideRecord:
+        location = record.location
+        if location.get("address") or location.get("gps_lat") is None or location.get("gps_lng") is None:
+            return record
+        lat, lng = float(location["gps_lat"]), float(location["gps_lng"])
+        address = self.geocoder.describe(lat, lng) if self.geocoder is not None else None
+        # Сценарий не должен остаться без адреса: без справочника диспетчер услышит координаты
+        record.location = dict(location, address=address or f"GPS coordinates {lat:.5f}, {lng:.5f}",
+                               address_source="gazetteer" if address else "gps")
+        return record
+
+    def load_file(self, path: str) -> int:
+        signature = _file_signature(path)
+        with open(path, "r") as f:
+            payload = json.load(f)
+        count = self.replace_all(_iter_rides(payload))
+        self.path = path
+        self._file_signature = signature
+        return count
+
+    def reload_if_changed(self) -> bool:
+        if not self.path:
+            return False
+        try:
+            signature = _file_signature(self.path)
+        except FileNotFoundError:
+            return False
+        if signature == self._file_signature:
+            return False
+        count = self.load_file(self.path)
+        logger.info("Reloaded %d rides from %s", count, self.path)
+        return True
+
+    async def watch(self, interval: float) -> None:
+        # Проверяем файл в фоне; горячий путь SOS диск не трогает
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception:
+                logger.exception("Failed to reload ride data from %s", self.path)
+
+
+def _file_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _iter_rides(payload):
+    # Поддерживаем одну поездку (как в test_data.json), список или {"rides": [...]}
+    if isinstance(payload, list):
+        return payload
+    if "rides" in payload:
+        return payload["rides"]
+    return [payload]
@@ -0,0 +1,159 @@
+"""
+Сборка голосового сценария из сегментов и оценка, когда диспетчер услышит главное.
+
+Сценарий - последовательность сегментов с приоритетом. Для каждого варианта
+(формулировки как написаны или отсортированные по приоритету) считается время
+речи при TTS ~150 слов в минуту до момента, когда прозвучали место, номер машины
+и тип инцидента. Из вариантов, прошедших правила провайдера, выбирается самый
+короткий.
+"""
+import re
+import string
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+SPEECH_WPM = 150
+# Диспетчеру нужно это, чтобы отправить наряд; остальное можно дослушать или спросить
+CRITICAL_FACTS = ("incident", "location", "plate")
+
+# Какой факт сообщает поле шаблона: время факта - момент, когда значение поля договорено
+FIELD_FACTS = {
+    "incident_title": "incident",
+    "incident_text": "incident",
+    "severity_label": "severity",
+    "location_address": "location",
+    "location_lat": "coordinates",
+    "vehicle_plate": "plate",
+    "vehicle_make": "vehicle",
+    "passenger_name": "passenger",
+    "passenger_phone": "callback",
+    "driver_name": "driver",
+}
+
+_formatter = string.Formatter()
+_TOKEN = re.compile(r"[^\s]+")
+_LETTERS = re.compile(r"[A-Za-z]+")
+
+
+def spoken_words(text: str) -> int:
+    """
+    Оценка числа слов, которые произнесёт TTS: токены с цифрами (телефоны,
+    номера, координаты) читаются по символу, знаки препинания не читаются.
+    """
+    words = 0
+    for token in _TOKEN.findall(text):
+        digits = sum(ch.isdigit() for ch in token)
+        if digits:
+            words += digits + len(_LETTERS.findall(token))
+        elif _LETTERS.search(token):
+            words += 1
+    return words
+
+
+class Segment(NamedTuple):
+    name: str
+    text: str
+    # Меньше - раньше в сценарии; сортировка устойчивая, равные сохраняют порядок
+    priority: int
+    # Факты, которые не видны по полям шаблона (например, что звонок автоматический)
+    facts: Tuple[str, ...] = ()
+
+
+class ScriptRules(NamedTuple):
+    required: frozenset
+    # Факты, которые должны прозвучать дважды (Twilio повторяет адрес в конце)
+    repeated: frozenset = frozenset()
+    critical_seconds: float = 20.0
+    # Автоматический звонок представляется сразу, до подробностей
+    disclosure_seconds: float = 8.0
+
+
+class ScriptTiming(NamedTuple):
+    words: int
+    seconds: float
+    # Все моменты (секунды от начала), когда факт прозвучал полностью
+    facts: Dict[str, Tuple[float, ...]]
+
+    def time_to(self, fact: str) -> float:
+        times = self.facts.get(fact)
+        return times[0] if times else float("inf")
+
+    @property
+    def time_to_critical(self) -> float:
+        return max(self.time_to(fact) for fact in CRITICAL_FACTS)
+
+
+class ScriptVariant(NamedTuple):
+    name: str
+    segments: Tuple[Segment, ...]
+    timing: ScriptTiming
+    violations: Tuple[str, ...]
+
+    @property
+    def compliant(self) -> bool:
+        return not self.violations
+
+    @property
+    def source(self) -> str:
+        return "".join(segment.text for segment in self.segments)
+
+
+def by_priority(segments: Iterable[Segment]) -> Tuple[Segment, ...]:
+    return tuple(sorted(segments, key=lambda segment: segment.priority))
+
+
+def measure(segments: Iterable[Segment], fields: dict, wpm: float = SPEECH_WPM) -> ScriptTiming:
+    parts = []
+    length = 0
+    marks = []
+    for segment in segments:
+        for literal, field, spec, _ in _formatter.parse(segment.text):
+            parts.append(literal)
+            length += len(literal)
+            if field is None:
+                continue
+            value = _formatter.format_field(fields[field], spec or "")
+            parts.append(value)
+            length += len(value)
+            if field in FIELD_FACTS:
+                marks.append((FIELD_FACTS[field], length))
+        marks.extend((fact, length) for fact in segment.facts)
+
+    text = "".join(parts)
+    seconds_per_word = 60.0 / wpm
+    facts: Dict[str, List[float]] = {}
+    for fact, offset in marks:
+        facts.setdefault(fact, []).append(round(spoken_words(text[:offset]) * seconds_per_word, 2))
+    words = spoken_words(text)
+    return ScriptTiming(words, round(words * seconds_per_word, 2),
+                        {fact: tuple(sorted(times)) for fact, times in facts.items()})
+
+
+def check(timing: ScriptTiming, rules: ScriptRules) -> Tuple[str, ...]:
+    violations = [f"missing {fact}" for fact in sorted(rules.required) if fact not in timing.facts]
+    violations += [f"{fact} not repeated" for fact in sorted(rules.repeated) if len(timing.facts.get(fact, ())) < 2]
+    if timing.time_to("disclosure") > rules.disclosure_seconds:
+        violations.append(f"disclosure at {timing.time_to('disclosure')}s > {rules.disclosure_seconds}s")
+    for fact in CRITICAL_FACTS:
+        if fact in rules.required and rules.critical_seconds < timing.time_to(fact) < float("inf"):
+            violations.append(f"{fact} at {timing.time_to(fact)}s > {rules.critical_seconds}s")
+    return tuple(violations)
+
+
+def build_variants(wordings: Dict[str, Tuple[Segment, ...]], fields: dict, rules: ScriptRules,
+                   wpm: float = SPEECH_WPM) -> List[ScriptVariant]:
+    """Каждая формулировка - как написана и по приоритету сегментов"""
+    variants = []
+    for name, segments in wordings.items():
+        for variant_name, ordered in ((name, tuple(segments)), (f"{name}-by-priority", by_priority(segments))):
+            if variant_name != name and ordered == tuple(segments):
+                continue
+            timing = measure(ordered, fields, wpm)
+            variants.append(ScriptVariant(variant_name, ordered, timing, check(timing, rules)))
+    return variants
+
+
+def choose_variant(variants: Iterable[ScriptVariant]) -> ScriptVariant:
+    compliant = [variant for variant in variants if variant.compliant]
+    if not compliant:
+        raise ValueError("No script variant satisfies the rules")
+    return min(compliant, key=lambda variant: (variant.timing.seconds, variant.timing.time_to_critical))
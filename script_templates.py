@@ -0,0 +1,457 @@
+"""
+Шаблоны голосовых сценариев экстренного звонка для Bland.ai и Twilio.
+
+Текст собирается из сегментов (script_composer): для провайдера берётся самый
+короткий вариант, где место, номер машины и тип инцидента звучат в первые секунды.
+Каждый вариант (тип инцидента, провайдер, язык) компилируется один раз,
+а неизменные для поездки части кешируются на уровне поездки: при рендере
+подставляются только время, тяжесть и координаты (живые, если есть GPS-трек).
+"""
+import math
+import string
+import textwrap
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from incident_clusters import distance_m
+from script_composer import ScriptRules, Segment, build_variants, choose_variant
+
+# Сегменты в прежних формулировках и порядке; приоритет - насколько рано диспетчеру нужен сегмент
+BLAND_EN_SEGMENTS = (
+    Segment("header", "URGENT EMERGENCY CALL - PASSENGER IN DANGER\n\n", 0),
+    Segment("disclosure", """This is an automated emergency call from RideGuard Safety System by inDrive Company.
+I am calling on behalf of a passenger who is currently in danger and needs immediate assistance.
+
+""", 0, ("disclosure",)),
+    Segment("passenger", """PASSENGER IN DISTRESS:
+- Passenger Name: {passenger_name}
+- Passenger Phone: {passenger_phone}
+- The passenger activated emergency SOS from the inDrive app
+
+""", 4),
+    Segment("incident", """INCIDENT DETAILS:
+- Emergency Type: {incident_title}
+- Time: {time}
+- Severity: {severity_label}
+
+""", 1),
+    Segment("driver", """THREATENING DRIVER INFORMATION:
+- Driver Name: {driver_name}
+- Driver Phone: {driver_phone}
+- Driver License: {driver_license}
+
+""", 5),
+    Segment("vehicle", """VEHICLE IDENTIFICATION:
+- Vehicle: {vehicle_year} {vehicle_make} {vehicle_model}
+- Color: {vehicle_color}
+- License Plate: {vehicle_plate}
+
+""", 3),
+    Segment("location", """CURRENT LOCATION:
+- Address: {location_address}
+- GPS Coordinates: {location_lat}, {location_lng}{movement_line}
+- This is the exact location where the passenger needs help
+
+""", 2),
+    Segment("action", """IMMEDIATE ACTION REQUIRED:
+The passenger is in danger and requires immediate police assistance.
+This call is made by RideGuard Safety System from inDrive Company on behalf of the passenger who pressed the emergency SOS button.
+Please dispatch police units to the location immediately.
+
+""", 6, ("action",)),
+    Segment("callback", """For urgent follow-up, contact the passenger directly at {passenger_phone}.
+The driver's number is {driver_phone}.
+
+""", 7),
+    Segment("closing", "This is an automated emergency call from inDrive's RideGuard Safety System protecting passenger safety.", 8),
+)
+
+# Те же факты без повторов: представление одной фразой, номер машины первым в блоке машины,
+# координаты отдельным сегментом
+BLAND_EN_COMPACT = (
+    Segment("disclosure", "This is an automated emergency call from inDrive's RideGuard Safety System "
+                          "for a passenger in danger.\n\n", 0, ("disclosure",)),
+    Segment("passenger", """PASSENGER:
+- Name: {passenger_name}
+- Phone: {passenger_phone}
+- Pressed SOS in the inDrive app at {time}
+
+""", 4),
+    Segment("incident", """INCIDENT:
+- Emergency Type: {incident_title}
+- Severity: {severity_label}
+
+""", 1),
+    Segment("driver", """THREATENING DRIVER:
+- Name: {driver_name}
+- Phone: {driver_phone}
+- License: {driver_license}
+
+""", 5),
+    Segment("vehicle", """VEHICLE:
+- License Plate: {vehicle_plate}
+- {vehicle_color} {vehicle_year} {vehicle_make} {vehicle_model}
+
+""", 3),
+    Segment("location", """LOCATION:
+- Address: {location_address}
+
+""", 2),
+    # Координаты диктуются по цифре и идут после номера машины
+    Segment("coordinates", """POSITION:
+- GPS Coordinates: {location_lat}, {location_lng}{movement_line}
+
+""", 3),
+    Segment("action", "Please dispatch police to the location immediately.", 6, ("action",)),
+)
+
+TWILIO_EN_SEGMENTS = (
+    Segment("header", "Emergency Alert from RideGuard Safety System.\n\n", 0),
+    Segment("incident", "This is a {incident_text} emergency.\n\n", 1),
+    Segment("passenger", "Passenger {passenger_name} requires immediate assistance.\n\n", 4),
+    Segment("location", "Location: {location_address}.{movement_sentence}\n\n", 2),
+    Segment("vehicle", "Vehicle: {vehicle_color} {vehicle_make} {vehicle_model}, license plate {vehicle_plate}.\n\n", 3),
+    Segment("driver", "Driver: {driver_name}, phone {driver_phone}.\n\n", 5),
+    Segment("callback", "Passenger phone: {passenger_phone}.\n\n", 4),
+    Segment("action", "Please dispatch emergency services immediately.\n\n", 6, ("action",)),
+    Segment("repeat", "Repeating location: {location_address}.\n\n", 7),
+    Segment("closing", "This is an automated emergency call from RideGuard.", 8, ("disclosure",)),
+)
+
+# Twilio читает текст один раз без диалога: адрес и номер повторяются в конце
+TWILIO_EN_COMPACT = (
+    Segment("disclosure", "Automated emergency call from RideGuard.\n\n", 0, ("disclosure",)),
+    Segment("passenger", "Passenger {passenger_name} needs immediate help, phone {passenger_phone}.\n\n", 4),
+    Segment("incident", "Emergency: {incident_text}.\n\n", 1),
+    Segment("driver", "Driver: {driver_name}, phone {driver_phone}.\n\n", 5),
+    Segment("vehicle", "Vehicle: license plate {vehicle_plate}, {vehicle_color} {vehicle_make} {vehicle_model}.\n\n", 3),
+    Segment("location", "Location: {location_address}.{movement_sentence}\n\n", 2),
+    Segment("action", "Please dispatch emergency services immediately.\n\n", 6, ("action",)),
+    Segment("repeat", "Repeating location: {location_address}. License plate {vehicle_plate}.", 7),
+)
+
+SCRIPT_RULES = {
+    "bland": ScriptRules(frozenset({"disclosure", "incident", "severity", "location", "coordinates", "plate",
+                                    "vehicle", "passenger", "callback", "driver", "action"})),
+    "twilio": ScriptRules(frozenset({"disclosure", "incident", "location", "plate", "vehicle", "passenger",
+                                     "callback", "driver", "action"}), repeated=frozenset({"location"})),
+}
+
+SCRIPT_WORDINGS = {
+    ("bland", "en"): {"legacy": BLAND_EN_SEGMENTS, "compact": BLAND_EN_COMPACT},
+    ("twilio", "en"): {"legacy": TWILIO_EN_SEGMENTS, "compact": TWILIO_EN_COMPACT},
+}
+
+# Типичная поездка для оценки вариантов: длины полей как у реальных данных
+SAMPLE_FIELDS = {
+    "passenger_name": "Roman Zhuchkov", "passenger_phone": "+35797935384",
+    "driver_name": "Alexey Kurdup", "driver_phone": "+35797935386", "driver_license": "Russian",
+    "vehicle_year": "2024", "vehicle_make": "BMW", "vehicle_model": "C5-series", "vehicle_color": "Burgundy",
+    "vehicle_plate": "ALEX777", "location_address": "Paphos, ABC Office",
+    "location_lat": 35.1856, "location_lng": 33.3823, "movement_line": "", "movement_sentence": "",
+    "incident_text": "taxi service emergency", "incident_title": "Taxi Service Emergency",
+    "time": "13:30", "severity_label": "HIGH PRIORITY - PASSENGER IN IMMEDIATE DANGER",
+}
+
+
+def script_variants(provider: str, language: str, fields: Optional[dict] = None) -> list:
+    return build_variants(SCRIPT_WORDINGS[(provider, language)], fields or SAMPLE_FIELDS, SCRIPT_RULES[provider])
+
+
+# Прежние сценарии целиком - для сравнения в тестах и бенчмарках
+BLAND_EN = "".join(segment.text for segment in BLAND_EN_SEGMENTS)
+TWILIO_EN = "".join(segment.text for segment in TWILIO_EN_SEGMENTS)
+
+# В работу идёт самый короткий вариант, прошедший правила провайдера
+TEMPLATES = {key: choose_variant(script_variants(*key)).source for key in SCRIPT_WORDINGS}
+
+# Сводный сценарий массового инцидента: сначала масштаб, тип и место, затем машины по одной строке
+CLUSTER_EN_HEADER = """This is an automated emergency call from inDrive's RideGuard Safety System.
+
+MASS INCIDENT: {count} passengers pressed SOS within {radius} meters of each other since {time}.
+- Reported: {incident_summary}
+- Severity: {severity_label}
+
+LOCATION:
+- Address: {location_address}
+- GPS Coordinates: {location_lat}, {location_lng}
+
+AFFECTED RIDES:
+"""
+CLUSTER_EN_RIDE = ("{index}. License plate {vehicle_plate}, {vehicle_color} {vehicle_make} {vehicle_model}; "
+                   "passenger {passenger_name}, phone {passenger_phone}; {incident_text}.\n")
+CLUSTER_EN_MORE = "And {count} more rides in the same area.\n"
+CLUSTER_EN_FOOTER = "\nPlease dispatch police and medical units to the location immediately."
+# Дольше диспетчер слушать не будет: остальные машины - одной фразой
+CLUSTER_MAX_LISTED = 10
+
+
+VOLATILE_FIELDS = frozenset({"time", "severity_label", "location_address", "location_lat", "location_lng",
+                             "movement_line", "movement_sentence"})
+# Из них поля живого GPS: без трека в сценарии остаются адрес и координаты из данных поездки
+LIVE_LOCATION_FIELDS = frozenset({"location_address", "location_lat", "location_lng",
+                                  "movement_line", "movement_sentence"})
+# Машина отъехала дальше этого от точки поездки - адрес поездки озвучивается как последний известный
+STALE_ADDRESS_M = 150.0
+
+SEVERITY_LABELS = {
+    "critical": "CRITICAL - LIFE-THREATENING, PASSENGER IN IMMEDIATE DANGER",
+    "high": "HIGH PRIORITY - PASSENGER IN IMMEDIATE DANGER",
+    "medium": "MEDIUM PRIORITY - PASSENGER NEEDS ASSISTANCE",
+    "low": "LOW PRIORITY - NON-URGENT ASSISTANCE REQUESTED",
+}
+
+
+def severity_label(severity: str) -> str:
+    # Неизвестная тяжесть озвучивается как высокая, как и в планировщике
+    return SEVERITY_LABELS.get(severity, SEVERITY_LABELS["high"])
+
+COMPASS_POINTS = ("north", "north-east", "east", "south-east", "south", "south-west", "west", "north-west")
+# Медленнее 1 м/с машина считается стоящей
+MIN_MOVING_SPEED = 1.0
+
+
+def describe_movement(fix, now: float) -> str:
+    # Неконечные значения - "неизвестно": сценарий SOS не должен падать из-за одного пинга
+    age = max(0, round(now - fix.ts)) if math.isfinite(now - fix.ts) else 0
+    known_heading = math.isfinite(fix.heading)
+    if not math.isfinite(fix.speed):
+        motion = "moving" if known_heading else "movement unknown"
+    elif fix.speed < MIN_MOVING_SPEED:
+        motion = "stationary"
+    else:
+        motion = f"moving at {fix.speed * 3.6:.0f} km/h"
+    if motion.startswith("moving") and known_heading:
+        motion += f" heading {COMPASS_POINTS[round(fix.heading / 45) % 8]}"
+    return f"Vehicle {motion}, live GPS fix {age} seconds old"
+
+_formatter = string.Formatter()
+
+
+def ride_fields(data) -> dict:
+    passenger = data["passenger"]
+    driver = data["driver"]
+    vehicle = data["vehicle"]
+    location = data["location"]
+    return {
+        "passenger_name": passenger["name"],
+        "passenger_phone": passenger["phone"],
+        "driver_name": driver["name"],
+        "driver_phone": driver["phone"],
+        "driver_license": driver["license"],
+        "vehicle_year": vehicle["year"],
+        "vehicle_make": vehicle["make"],
+        "vehicle_model": vehicle["model"],
+        "vehicle_color": vehicle["color"],
+        "vehicle_plate": vehicle["plate"],
+        "location_address": location["address"],
+        "location_lat": location["gps_lat"],
+        "location_lng": location["gps_lng"],
+    }
+
+
+def incident_fields(incident_type: str) -> dict:
+    text = incident_type.replace("_", " ")
+    return {"incident_text": text, "incident_title": text.title()}
+
+
+def cluster_script(rides: list, lat: float, lng: float, radius_m: float, since: str,
+                   severity: str = "high") -> str:
+    """rides - [(поездка, тип инцидента)] в порядке нажатия; первая задаёт адрес"""
+    counts = OrderedDict()
+    for _, incident_type in rides:
+        text = incident_fields(incident_type)["incident_text"]
+        counts[text] = counts.get(text, 0) + 1
+    parts = [CLUSTER_EN_HEADER.format(
+        count=len(rides), radius=round(radius_m), time=since, severity_label=severity_label(severity),
+        incident_summary=", ".join(f"{count} {text}" for text, count in counts.items()),
+        location_address=rides[0][0]["location"]["address"], location_lat=round(lat, 6), location_lng=round(lng, 6),
+    )]
+    for index, (data, incident_type) in enumerate(rides[:CLUSTER_MAX_LISTED], 1):
+        parts.append(CLUSTER_EN_RIDE.format(index=index, **ride_fields(data), **incident_fields(incident_type)))
+    if len(rides) > CLUSTER_MAX_LISTED:
+        parts.append(CLUSTER_EN_MORE.format(count=len(rides) - CLUSTER_MAX_LISTED))
+    parts.append(CLUSTER_EN_FOOTER)
+    return "".join(parts)
+
+
+class BoundScript:
+    """Сценарий для конкретной поездки: готовые куски текста и позиции изменяемых полей"""
+
+    __slots__ = ("parts", "slots", "live_slots", "text")
+
+    def __init__(self, pieces: list):
+        # Изменяемое поле - (имя, текст по умолчанию); поля живого GPS по умолчанию из данных поездки
+        self.parts = [piece if type(piece) is str else piece[1] for piece in pieces]
+        slots = [(i, piece[0]) for i, piece in enumerate(pieces) if type(piece) is not str]
+        self.slots = tuple(slot for slot in slots if slot[1] not in LIVE_LOCATION_FIELDS)
+        self.live_slots = tuple(slot for slot in slots if slot[1] in LIVE_LOCATION_FIELDS)
+        # Без изменяемых полей текст готов целиком
+        self.text = "".join(self.parts) if not self.slots else None
+
+    def render(self, values: dict, live: Optional[dict] = None) -> str:
+        if self.text is not None and live is None:
+            return self.text
+        parts = self.parts[:]
+        for i, name in self.slots:
+            parts[i] = values[name]
+        if live is not None:
+            for i, name in self.live_slots:
+                parts[i] = live[name]
+        return "".join(parts)
+
+
+class CompiledTemplate:
+    def __init__(self, source: str, incident_type: str):
+        source = textwrap.dedent(source).strip()
+        baked = incident_fields(incident_type)
+
+        # Разбираем шаблон один раз; поля инцидента подставляем сразу
+        pieces = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            if literal:
+                pieces.append(literal)
+            if field is None:
+                continue
+            if field in baked:
+                pieces.append(_formatter.format_field(baked[field], spec or ""))
+            else:
+                pieces.append((field, spec or ""))
+        self.pieces = tuple(_merge(pieces))
+        self.fields = frozenset(piece[0] for piece in self.pieces if type(piece) is tuple)
+
+    def bind(self, fields: dict) -> BoundScript:
+        parts = []
+        for piece in self.pieces:
+            if type(piece) is tuple:
+                name, spec = piece
+                if name not in VOLATILE_FIELDS:
+                    piece = _formatter.format_field(fields[name], spec)
+                elif name in LIVE_LOCATION_FIELDS:
+                    piece = (name, _formatter.format_field(fields.get(name, ""), spec))
+                else:
+                    piece = (name, "")
+            parts.append(piece)
+        return BoundScript(_merge(parts))
+
+
+class ScriptEngine:
+    def __init__(self, templates: Optional[dict] = None, cache_size: int = 10000, compiled_size: int = 1000):
+        self.templates = dict(TEMPLATES if templates is None else templates)
+        self.cache_size = cache_size
+        # incident_type приходит от клиента как есть: скомпилированные шаблоны - тоже LRU
+        self.compiled_size = compiled_size
+        # Источник живых координат (GpsTracks): у поездки с треком в сценарий идёт новейшая точка
+        self.positions = None
+        # Офлайн-геокодер (ReverseGeocoder): адрес живой точки вместо адреса посадки
+        self.geocoder = None
+        self._compiled: OrderedDict = OrderedDict()
+        self._bound: OrderedDict = OrderedDict()
+        self._minute = None
+        self._time_label = ""
+
+    def supports(self, provider: str, language: str) -> bool:
+        return (provider, language) in self.templates
+
+    def compile(self, incident_type: str, provider: str = "bland", language: str = "en") -> CompiledTemplate:
+        key = (incident_type, provider, language)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self._compiled.move_to_end(key)
+            return compiled
+        source = self.templates.get((provider, language))
+        if source is None:
+            raise ValueError(f"No {provider} script template for language '{language}'")
+        compiled = self._compiled[key] = CompiledTemplate(source, incident_type)
+        if len(self._compiled) > self.compiled_size:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    def bind(self, data, incident_type: str, provider: str = "bland", language: str = "en") -> BoundScript:
+        # Записи RideStore кешируются по ride_id и версии; обычный dict рендерится заново
+        ride_id = getattr(data, "ride_id", None)
+        if ride_id is None:
+            return self.compile(incident_type, provider, language).bind(ride_fields(data))
+
+        key = (ride_id, incident_type, provider, language)
+        cached = self._bound.get(key)
+        if cached is not None and cached[0] == data.version:
+            self._bound.move_to_end(key)
+            return cached[1]
+
+        bound = self.compile(incident_type, provider, language).bind(ride_fields(data))
+        self._bound[key] = (data.version, bound)
+        if len(self._bound) > self.cache_size:
+            self._bound.popitem(last=False)
+        return bound
+
+    def current_time(self) -> str:
+        # Время в сценарии с точностью до минуты - форматируем раз в минуту
+        minute = int(time.time() // 60)
+        if minute != self._minute:
+            self._time_label = datetime.now().strftime('%H:%M %Z')
+            self._minute = minute
+        return self._time_label
+
+    def live_address(self, data, lat: float, lng: float) -> str:
+        location = data["location"]
+        address = location["address"]
+        if location.get("gps_lat") is not None and location.get("gps_lng") is not None and \
+                distance_m(float(location["gps_lat"]), float(location["gps_lng"]), lat, lng) <= STALE_ADDRESS_M:
+            return address
+        # Машина уехала: адрес живой точки из справочника, без него - адрес поездки как последний известный
+        live = self.geocoder.describe(lat, lng) if self.geocoder is not None else None
+        return live or f"last known address {address}"
+
+    def live_values(self, data) -> Optional[dict]:
+        if self.positions is None:
+            return None
+        ride_id = getattr(data, "ride_id", None)
+        now = time.time()
+        fix = self.positions.latest(ride_id, now) if ride_id is not None else None
+        if fix is None:
+            return None
+        movement = describe_movement(fix, now)
+        return {"location_address": self.live_address(data, fix.lat, fix.lng),
+                "location_lat": str(round(fix.lat, 6)), "location_lng": str(round(fix.lng, 6)),
+                "movement_line": f"\n- Movement: {movement}", "movement_sentence": f" {movement}."}
+
+    def render(self, data, incident_type: str = "medical_emergency", provider: str = "bland",
+               language: str = "en", now: Optional[str] = None, severity: str = "high") -> str:
+        bound = self.bind(data, incident_type, provider, language)
+        return bound.render({
+            "time": now if now is not None else self.current_time(),
+            "severity_label": severity_label(severity),
+        }, self.live_values(data))
+
+    def render_batch(self, items: Iterable[tuple], provider: str = "bland", language: str = "en") -> list:
+        # Элементы - (поездка, тип инцидента) или (поездка, тип инцидента, тяжесть)
+        current_time = self.current_time()
+        scripts = []
+        for data, incident_type, *severity in items:
+            values = {"time": current_time, "severity_label": severity_label(severity[0] if severity else "high")}
+            scripts.append(self.bind(data, incident_type, provider, language).render(values, self.live_values(data)))
+        return scripts
+
+    def precompile(self, incident_types: Iterable[str]) -> int:
+        count = 0
+        for incident_type in incident_types:
+            for provider, language in self.templates:
+                self.compile(incident_type, provider, language)
+                count += 1
+        return count
+
+
+def _merge(pieces: Iterable) -> list:
+    merged = []
+    for piece in pieces:
+        if type(piece) is str and merged and type(merged[-1]) is str:
+            merged[-1] += piece
+        else:
+            merged.append(piece)
+    return merged
+
+
+script_engine = ScriptEngine()
@@ -0,0 +1,82 @@
+"""
+Окно дедупликации SOS: повторные нажатия кнопки в рамках одной поездки
+и одного типа инцидента не создают новый платный звонок.
+"""
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+SEVERITY_NAMES = {rank: name for name, rank in SEVERITY_RANK.items()}
+
+
+def severity_rank(severity: str) -> int:
+    # Неизвестные значения считаем высокими - лучше лишний звонок, чем пропущенный
+    return SEVERITY_RANK.get(severity, SEVERITY_RANK["high"])
+
+
+class DedupEntry:
+    __slots__ = ("incident_id", "severity", "call_id", "expires_at", "presses")
+
+    def __init__(self, incident_id: str, severity: str, expires_at: float):
+        self.incident_id = incident_id
+        self.severity = severity
+        self.call_id: Optional[str] = None
+        self.expires_at = expires_at
+        self.presses = 1
+
+
+class SOSDeduplicator:
+    def __init__(self, ttl: float = 120.0, max_entries: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(ride_id: str, passenger_phone: str, incident_type: str) -> tuple:
+        return ride_id, passenger_phone, incident_type
+
+    def lookup(self, key: tuple) -> Optional[DedupEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        entry.presses += 1
+        return entry
+
+    def remember(self, key: tuple, incident_id: str, severity: str) -> DedupEntry:
+        now = self.clock()
+        entry = DedupEntry(incident_id, severity, now + self.ttl)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._evict(now)
+        return entry
+
+    def escalates(self, entry: DedupEntry, severity: str) -> bool:
+        return severity_rank(severity) > severity_rank(entry.severity)
+
+    def record_call(self, key: tuple, incident_id: str, call_id: Optional[str]) -> None:
+        entry = self._entries.get(key)
+        if entry is not None and entry.incident_id == incident_id:
+            entry.call_id = call_id
+
+    def forget(self, key: tuple, incident_id: Optional[str] = None) -> None:
+        entry = self._entries.get(key)
+        if entry is not None and (incident_id is None or entry.incident_id == incident_id):
+            del self._entries[key]
+
+    def _evict(self, now: float) -> None:
+        # TTL одинаковый, поэтому самые старые записи всегда в начале
+        entries = self._entries
+        while entries:
+            oldest = next(iter(entries.values()))
+            if oldest.expires_at > now and len(entries) <= self.max_entries:
+                break
+            entries.popitem(last=False)
@@ -0,0 +1,146 @@
+"""
+Статика в памяти: файлы читаются один раз при старте и сжимаются заранее.
+
+Каждый файл хранится как есть, в gzip и в brotli, с ETag по содержимому.
+Адрес с хешем содержимого (demo.3f2a1b9c.html) клиент кэширует навсегда;
+обычный адрес перепроверяется через If-None-Match и получает 304 без тела.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli есть в requirements.txt; в урезанном окружении отдаём только gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+# Порядок предпочтения, если клиент принимает несколько кодировок
+PREFERRED_ENCODINGS = ("br", "gzip")
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def etag_matches(header: str, etag_base: str) -> bool:
+    # Сжатые представления одного файла отличаются только суффиксом ETag
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-", 1)[0] == etag_base:
+            return True
+    return False
+
+
+class Asset:
+    __slots__ = ("name", "hashed_name", "media_type", "etag_base", "bodies")
+
+    def __init__(self, name: str, content: bytes):
+        digest = hashlib.sha256(content).hexdigest()
+        stem, extension = os.path.splitext(name)
+        self.name = name
+        self.hashed_name = f"{stem}.{digest[:8]}{extension}"
+        self.media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.etag_base = digest[:16]
+        self.bodies: Dict[str, bytes] = {"identity": content}
+        if len(content) >= MIN_COMPRESS_SIZE and self.media_type.startswith(COMPRESSIBLE_TYPES):
+            # mtime=0 - одинаковый gzip на всех воркерах и после перезапуска
+            self._add_encoding("gzip", gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                self._add_encoding("br", brotli.compress(content, quality=11))
+
+    def _add_encoding(self, encoding: str, body: bytes) -> None:
+        if len(body) < len(self.bodies["identity"]):
+            self.bodies[encoding] = body
+
+    def select_encoding(self, accept_encoding: str) -> str:
+        if len(self.bodies) == 1 or not accept_encoding:
+            return "identity"
+        accepted = accepted_encodings(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        for encoding in PREFERRED_ENCODINGS:
+            if encoding in self.bodies and accepted.get(encoding, wildcard) > 0:
+                return encoding
+        return "identity"
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.etag_base}"' if encoding == "identity" else f'"{self.etag_base}-{encoding}"'
+
+    def respond(self, accept_encoding: str = "", if_none_match: str = "",
+                immutable: bool = False) -> Tuple[int, bytes, dict]:
+        """Статус, тело и заголовки ответа с учётом кодировки и If-None-Match"""
+        encoding = self.select_encoding(accept_encoding)
+        headers = {
+            "ETag": self.etag(encoding),
+            "Cache-Control": IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+            "Vary": "Accept-Encoding",
+        }
+        if if_none_match and etag_matches(if_none_match, self.etag_base):
+            return 304, b"", headers
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return 200, self.bodies[encoding], headers
+
+
+class AssetStore:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.loaded = False
+        self._assets: Dict[str, Asset] = {}
+        self._hashed: Dict[str, Asset] = {}
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    def load(self) -> int:
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    assets[name] = Asset(name, f.read())
+        # Словари подменяются целиком - запросы во время загрузки видят старый или новый набор
+        self._assets = assets
+        self._hashed = {asset.hashed_name: asset for asset in assets.values()}
+        self.loaded = True
+        return len(assets)
+
+    def get(self, name: str) -> Optional[Tuple[Asset, bool]]:
+        """Файл по обычному имени или по имени с хешем; второй элемент - адрес с хешем"""
+        if not self.loaded:
+            self.load()
+        asset = self._hashed.get(name)
+        if asset is not None:
+            return asset, True
+        asset = self._assets.get(name)
+        return (asset, False) if asset is not None else None
+
+    def manifest(self) -> Dict[str, str]:
+        if not self.loaded:
+            self.load()
+        return {name: f"/static/{asset.hashed_name}" for name, asset in sorted(self._assets.items())}
@@ -0,0 +1,134 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from admission import AdmissionControl, CallQuotaExceeded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_call_slots_are_shared_between_processes_and_expire(tmp_path):
+    path = str(tmp_path / "state.db")
+    clock = Clock()
+    # Два экземпляра на одном файле ведут себя как два воркера
+    first, second = AdmissionControl(path, slot_lease=30, clock=clock), AdmissionControl(path, slot_lease=30, clock=clock)
+
+    async def scenario():
+        token = await first.acquire_call_slot("bland", 2, timeout=1)
+        await second.acquire_call_slot("bland", 2, timeout=1)
+        with pytest.raises(CallQuotaExceeded):
+            await first.acquire_call_slot("bland", 2, timeout=0.05)
+        assert await second.calls_in_progress("twilio") == 0
+
+        await first.release_call_slot("bland", token)
+        await second.acquire_call_slot("bland", 2, timeout=1)
+
+        # Слоты упавшего воркера возвращаются по истечении аренды
+        clock.now += 31
+        assert await first.calls_in_progress("bland") == 0
+        async with first.call_slot("bland", 2, timeout=1):
+            assert await second.calls_in_progress("bland") == 1
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def _hold_slots(path: str, results, barrier) -> None:
+    async def run():
+        admission = AdmissionControl(path)
+        barrier.wait()
+        acquired = 0
+        for _ in range(10):
+            try:
+                await admission.acquire_call_slot("bland", 5, timeout=0)
+                acquired += 1
+            except CallQuotaExceeded:
+                pass
+        results.put(acquired)
+        await admission.close()
+
+    asyncio.run(run())
+
+
+def test_call_cap_holds_across_real_processes(tmp_path):
+    path = str(tmp_path / "state.db")
+    context = multiprocessing.get_context("spawn")
+    results, barrier = context.Queue(), context.Barrier(4)
+    processes = [context.Process(target=_hold_slots, args=(path, results, barrier)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=30)
+    assert sum(results.get(timeout=5) for _ in processes) == 5
+
+
+def test_token_bucket_limits_and_refills(tmp_path):
+    clock = Clock()
+    admission = AdmissionControl(str(tmp_path / "state.db"), clock=clock)
+
+    async def scenario():
+        assert [await admission.take_token("+100", 0.5, 2) for _ in range(2)] == [0.0, 0.0]
+        assert await admission.take_token("+100", 0.5, 2) == pytest.approx(2.0)
+        assert await admission.take_token("+200", 0.5, 2) == 0.0
+
+        clock.now += 2
+        assert await admission.take_token("+100", 0.5, 2) == 0.0
+        assert await admission.take_token("+100", 0.5, 2) > 0
+        await admission.close()
+
+    asyncio.run(scenario())
+
+
+def test_sos_window_has_one_owner_across_workers(tmp_path):
+    path = str(tmp_path / "state.db")
+    clock = Clock()
+    first, second = AdmissionControl(path, clock=clock), AdmissionControl(path, clock=clock)
+    key = ("R-1", "+100", "assault")
+
+    async def scenario():
+        assert await first.claim_sos(key, "inc-1", 2, ttl=60) == ("inc-1", 2, None)
+        await first.record_sos_call(key, "inc-1", "call-1")
+        assert await second.claim_sos(key, "inc-2", 2, ttl=60) == ("inc-1", 2, "call-1")
+        # Эскалация тяжести и истечение окна передают владение новому инциденту
+        assert await second.claim_sos(key, "inc-3", 3, ttl=60) == ("inc-3", 3, None)
+        clock.now += 61
+        assert (await first.claim_sos(key, "inc-4", 0, ttl=60))[0] == "inc-4"
+
+        first.forget_sos(key, "inc-4").result()
+        assert (await second.claim_sos(key, "inc-5", 0, ttl=60))[0] == "inc-5"
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
+
+
+def test_new_incidents_per_passenger_are_rate_limited(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    monkeypatch.setenv("EMERGENCY_PHONE", "+10000000000")
+    monkeypatch.setattr(main.Config, "PASSENGER_SOS_BURST", 1)
+    monkeypatch.setattr(main, "admission", AdmissionControl(str(tmp_path / "state.db")))
+    monkeypatch.setattr(main, "incident_queue", main.IncidentQueue(str(tmp_path / "incidents.db")))
+    main.ride_store.load_file("test_data.json")
+    client = TestClient(main.app)
+
+    first = client.post("/api/emergency", json={"incident_type": "assault"})
+    assert first.status_code == 202
+    # Повтор того же SOS дедуплицируется и токен не тратит
+    assert client.post("/api/emergency", json={"incident_type": "assault"}).json()["deduplicated"]
+
+    limited = client.post("/api/emergency", json={"incident_type": "medical_emergency"})
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) > 0
+    # Отклонённый SOS не занимает окно дедупликации
+    assert client.post("/api/emergency", json={"incident_type": "medical_emergency"}).status_code == 429
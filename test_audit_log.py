@@ -0,0 +1,96 @@
+import asyncio
+import multiprocessing
+import os
+
+from audit_log import HEADER, AuditLog, AuditReader, encode_record, segment_paths
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_records_survive_rotation_and_filters_are_exact(tmp_path):
+    directory = str(tmp_path / "audit")
+
+    async def scenario():
+        log = AuditLog(directory, segment_bytes=2048, flush_interval=0.01)
+        log.start()
+        for i in range(300):
+            log.append("call_placed" if i % 3 else "sos_received", f"inc-{i % 10}", seq=i)
+            if i % 25 == 0:
+                await asyncio.sleep(0.02)
+        # Вложенное поле с тем же именем не должно проходить фильтр
+        log.append("call_status", "inc-x", details={"kind": "sos_received", "incident_id": "inc-3"})
+        await log.close()
+
+    run(scenario())
+    assert len(segment_paths(directory)) > 3
+
+    reader = AuditReader(directory)
+    records = list(reader.replay())
+    assert [r["seq"] for r in records[:-1]] == list(range(300))
+    assert reader.torn == []
+    expected = [i for i in range(300) if i % 10 == 3 and i % 3 == 0]
+    assert [r["seq"] for r in reader.replay(kind="sos_received", incident_id="inc-3")] == expected
+    assert {r["incident_id"] for r in reader.replay(incident_id="inc-3")} == {"inc-3"}
+
+    middle = records[150]["ts"]
+    assert all(r["ts"] >= middle for r in reader.replay(since=middle))
+    assert all(r["ts"] <= middle for r in reader.replay(until=middle))
+
+
+def test_torn_tail_is_ignored_and_next_writer_starts_a_new_segment(tmp_path):
+    directory = str(tmp_path / "audit")
+
+    async def write(start, count):
+        log = AuditLog(directory)
+        for i in range(start, start + count):
+            log.append("sos_received", f"inc-{i}")
+        await log.close()
+        return log.segment
+
+    damaged = run(write(0, 5))
+    # Процесс упал посреди записи: на диске полкадра
+    frame = encode_record(0.0, {"kind": "sos_received", "incident_id": "lost"})
+    with open(damaged, "ab") as f:
+        f.write(frame[:HEADER.size + 3])
+
+    fresh = run(write(5, 5))
+    assert fresh != damaged
+
+    reader = AuditReader(directory)
+    assert [r["incident_id"] for r in reader.replay()] == [f"inc-{i}" for i in range(10)]
+    assert reader.torn == [damaged]
+
+
+def _write_and_crash(directory: str) -> None:
+    async def scenario():
+        log = AuditLog(directory, flush_interval=60)
+        log.start()
+        for i in range(100):
+            log.append("sos_received", f"inc-{i}")
+        await log.flush()
+        # Эти записи только в буфере: fsync не было
+        for i in range(100, 150):
+            log.append("sos_received", f"inc-{i}")
+        os._exit(1)
+
+    asyncio.run(scenario())
+
+
+def test_flushed_records_survive_a_crash(tmp_path):
+    directory = str(tmp_path / "audit")
+    process = multiprocessing.get_context("spawn").Process(target=_write_and_crash, args=(directory,))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 1
+
+    records = list(AuditReader(directory).replay())
+    assert [r["incident_id"] for r in records] == [f"inc-{i}" for i in range(100)]
+
+
+def test_append_drops_records_when_writer_falls_behind(tmp_path):
+    log = AuditLog(str(tmp_path / "audit"), max_pending=3)
+    assert [log.append("sos_received", f"inc-{i}") for i in range(5)] == [True, True, True, False, False]
+    assert log.pending == 3
+    assert AuditLog("").append("sos_received", "inc-1") is False
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+import tracemalloc
+
+from fastapi.testclient import TestClient
+
+import main
+from call_events import BroadcastHub, CallTracker, format_sse
+
+
+def test_one_event_fans_out_to_thousands_of_subscribers():
+    async def scenario():
+        hub = BroadcastHub(max_queue=8)
+        subscriptions = [hub.subscribe("inc-1") for _ in range(5000)]
+
+        async def listen(subscription):
+            received = []
+            while True:
+                frame, final = await subscription.get()
+                received.append(frame)
+                if final:
+                    return received
+
+        listeners = [asyncio.create_task(listen(s)) for s in subscriptions]
+        await asyncio.sleep(0)
+        assert hub.publish("inc-1", format_sse("status", {"status": "ringing"})) == 5000
+        assert hub.publish("inc-1", format_sse("status", {"status": "completed"}), final=True) == 5000
+        results = await asyncio.gather(*listeners)
+        assert all(len(received) == 2 for received in results)
+        # Кадр сериализуется один раз и общий для всех подписчиков
+        assert len({id(received[1]) for received in results}) == 1
+
+        for subscription in subscriptions:
+            hub.unsubscribe(subscription)
+        assert hub.subscribers() == 0
+
+    asyncio.run(scenario())
+
+
+def test_slow_subscribers_keep_bounded_memory():
+    async def scenario():
+        hub = BroadcastHub(max_queue=16)
+        tracemalloc.start()
+        subscriptions = [hub.subscribe("inc-1") for _ in range(3000)]
+        hub.publish("inc-1", "warmup")
+        baseline, _ = tracemalloc.get_traced_memory()
+
+        # Никто не читает: каждое новое событие вытесняет самое старое
+        for i in range(500):
+            hub.publish("inc-1", format_sse("status", {"seq": i}))
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert all(len(s) == 16 for s in subscriptions)
+        assert subscriptions[0].dropped == 485
+        assert current - baseline < 2_000_000
+        frame, _ = await subscriptions[0].get()
+        assert '"seq": 484' in frame
+
+    asyncio.run(scenario())
+
+
+def test_tracker_ignores_hedged_loser_and_early_final_events():
+    hub = BroadcastHub()
+    tracker = CallTracker(hub, max_entries=2)
+    tracker.update("inc-1", status="dispatching")
+
+    # Пока победитель неизвестен, отмена проигравшего звонка не закрывает инцидент
+    tracker.update_call("inc-1", "loser", "canceled")
+    assert tracker.get("inc-1")["status"] == "dispatching"
+    tracker.update_call("inc-1", "winner", "ringing")
+    tracker.update("inc-1", status="dispatched", call_id="winner")
+
+    assert tracker.update_call("inc-1", "loser", "completed") is None
+    assert tracker.update_call(None, "winner", "completed")["call_status"] == "completed"
+
+    tracker.update("inc-2", status="queued")
+    tracker.update("inc-3", status="queued")
+    assert tracker.get("inc-1") is None and tracker.find_by_call("winner") is None
+
+
+def test_webhooks_update_state_and_stream_ends_on_final_status(monkeypatch):
+    main.call_tracker.update("inc-hook", status="dispatched", call_id="CA123", provider="twilio",
+                             ride_id="missing", incident_type="assault", language="en")
+    client = TestClient(main.app)
+
+    response = client.post("/api/webhooks/twilio?incident_id=inc-hook", content="CallSid=CA123&CallStatus=in-progress",
+                           headers={"Content-Type": "application/x-www-form-urlencoded"})
+    assert response.status_code == 204
+    assert main.call_tracker.get("inc-hook")["call_status"] == "in-progress"
+
+    response = client.post("/api/twilio/gather", content="CallSid=CA123&Digits=2",
+                           headers={"Content-Type": "application/x-www-form-urlencoded"})
+    assert "<Hangup />" in response.text
+    assert main.call_tracker.get("inc-hook")["last_digits"] == "2"
+
+    enqueued = []
+    monkeypatch.setattr(main.call_recordings, "enqueue", lambda *args: enqueued.append(args))
+    # Без PUBLIC_BASE_URL подпись Twilio не проверить: URL записи из такого webhook не качаем
+    client.post("/api/webhooks/twilio?incident_id=inc-hook",
+                content="CallSid=CA123&RecordingStatus=completed&RecordingUrl=http://169.254.169.254/latest",
+                headers={"Content-Type": "application/x-www-form-urlencoded"})
+    assert enqueued == []
+
+    monkeypatch.setattr(main.Config, "WEBHOOK_TOKEN", "secret")
+    assert client.post("/api/webhooks/bland?incident_id=inc-hook", json={"status": "completed"}).status_code == 403
+    response = client.post("/api/webhooks/bland?incident_id=inc-hook&token=secret",
+                           json={"call_id": "CA123", "status": "completed", "call_length": 1.5,
+                                 "recording_url": "https://media.bland.ai/CA123.mp3"})
+    assert response.json() == {"accepted": True}
+    assert enqueued == [("bland", "CA123", "https://media.bland.ai/CA123.mp3", "inc-hook")]
+
+    with client.stream("GET", "/api/emergency/inc-hook/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        lines = [line for line in response.iter_lines() if line.startswith("data: ")]
+    state = json.loads(lines[-1][len("data: "):])
+    assert (state["call_status"], state["call_length"]) == ("completed", 1.5)
+    assert main.call_events.subscribers() == 0
+
+
+def test_stream_sees_outcome_of_incident_called_by_another_worker(monkeypatch, tmp_path):
+    path = str(tmp_path / "incidents.db")
+    monkeypatch.setattr(main, "incident_queue", main.IncidentQueue(path))
+    monkeypatch.setattr(main.Config, "EVENTS_KEEPALIVE", 0.05)
+    incident_id = asyncio.run(main.incident_queue.enqueue({"ride_id": "R-1"}))
+    # Второй процесс с той же очередью: его трекер и хаб событий этому воркеру не видны
+    other = main.IncidentQueue(path)
+
+    async def fail_elsewhere():
+        claimed, _, attempts = await other.claim()
+        await other.fail(claimed, "All providers failed", attempts, permanent=True)
+        await other.close()
+
+    elsewhere = threading.Timer(0.2, asyncio.run, (fail_elsewhere(),))
+    elsewhere.start()
+    client = TestClient(main.app)
+    with client.stream("GET", f"/api/emergency/{incident_id}/events") as response:
+        states = [json.loads(line[len("data: "):]) for line in response.iter_lines() if line.startswith("data: ")]
+    elsewhere.join()
+    # Окончательный исход из очереди закрывает поток
+    assert [state["status"] for state in states] == ["queued", "failed"]
+    assert states[1]["error"] == "All providers failed"
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import json
+import os
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.fake_providers import BackgroundServer, create_fake_recordings_app, recording_bytes
+from call_recordings import RecordingFetcher, parse_range, range_headers
+from config import Config
+
+MB = 1024 * 1024
+
+
+def test_range_parsing():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=990-5000", 1000) == (990, 999)
+    # Несколько диапазонов и мусор игнорируются - отдаётся весь файл
+    assert parse_range("bytes=0-1,5-6", 1000) is None
+    assert parse_range("items=0-1", 1000) is None
+    assert parse_range("bytes=a-b", 1000) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=1000-", 1000)
+
+    status, start, end, headers = range_headers(1000, 1.0, "bytes=10-19")
+    assert (status, start, end) == (206, 10, 19)
+    assert headers["Content-Range"] == "bytes 10-19/1000" and headers["Content-Length"] == "10"
+    assert range_headers(1000, 1.0, "bytes=10-19", if_range='"stale"')[0] == 200
+    assert range_headers(1000, 1.0, "bytes=10-19", if_range=headers["ETag"])[0] == 206
+    assert range_headers(1000, 1.0, "bytes=2000-")[0] == 416
+
+
+def test_downloads_stream_to_disk_with_bounded_memory(tmp_path):
+    size = 8 * MB
+    expected = hashlib.sha256(recording_bytes(0, size)).hexdigest()
+    stored, failed = [], []
+
+    async def scenario(url: str):
+        fetcher = RecordingFetcher(str(tmp_path), max_concurrent=2, chunk_bytes=64 * 1024, retry_delay=0,
+                                   allowed_hosts=["127.0.0.1"])
+        await fetcher.start(lambda job, path: stored.append(path), lambda job, error: failed.append(error))
+        # Первая загрузка отдельно: ленивые импорты не должны попасть в замер
+        assert fetcher.enqueue("bland", "call-0", f"{url}/recordings/call-0.mp3", "inc-0")
+        await fetcher.wait()
+        tracemalloc.start()
+        for i in range(1, 4):
+            assert fetcher.enqueue("bland", f"call-{i}", f"{url}/recordings/call-{i}.mp3", f"inc-{i}")
+        assert not fetcher.enqueue("bland", "call-1", f"{url}/recordings/call-1.mp3")
+        assert fetcher.enqueue("bland", "call-404", f"{url}/recordings/missing.mp3")
+        await fetcher.wait()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        await fetcher.close()
+        return fetcher, peak
+
+    app = create_fake_recordings_app(size=size, chunk_delay=0.001)
+    with BackgroundServer(app) as server:
+        fetcher, peak = asyncio.run(scenario(server.url))
+
+    assert len(stored) == 4 and len(failed) == 1 and "404" in failed[0]
+    # В памяти не больше нескольких кусков на загрузку, а не запись целиком
+    assert peak < 2 * MB
+    assert app.state.peak_in_flight <= 2
+    # Запись, которой нет у провайдера, не повторяется
+    assert [name for name, _ in app.state.requests].count("missing") == 1
+    for i in range(4):
+        with open(fetcher.path(f"call-{i}"), "rb") as f:
+            assert hashlib.sha256(f.read()).hexdigest() == expected
+    assert sorted(os.listdir(tmp_path)) == [f"call-{i}.mp3" for i in range(4)]
+
+
+def test_interrupted_download_resumes_after_restart(tmp_path):
+    size = 4 * MB
+    # Прошлый запуск успел скачать 1 МБ и остановился
+    (tmp_path / "CA1.part").write_bytes(recording_bytes(0, MB))
+
+    async def scenario(url: str):
+        (tmp_path / "CA1.job").write_text(json.dumps(
+            {"provider": "twilio", "call_id": "CA1", "url": f"{url}/recordings/CA1.mp3", "incident_id": "inc-1"}))
+        fetcher = RecordingFetcher(str(tmp_path), retry_delay=0, allowed_hosts=["127.0.0.1"])
+        assert await fetcher.start() == 1
+        await fetcher.wait()
+        await fetcher.close()
+        return fetcher
+
+    # Вдобавок первая загрузка обрывается на середине
+    app = create_fake_recordings_app(size=size, drop_after=MB)
+    with BackgroundServer(app) as server:
+        fetcher = asyncio.run(scenario(server.url))
+
+    assert app.state.requests == [("CA1", MB), ("CA1", 2 * MB)]
+    with open(fetcher.path("CA1"), "rb") as f:
+        assert f.read() == recording_bytes(0, size)
+    assert os.listdir(tmp_path) == ["CA1.mp3"]
+
+
+def test_downloads_only_from_allowed_hosts_and_keep_credentials_on_origin(tmp_path):
+    failed = []
+
+    async def scenario(url: str):
+        port = url.rsplit(":", 1)[1]
+        fetcher = RecordingFetcher(str(tmp_path), retry_delay=0, allowed_hosts=["127.0.0.1", ".localhost"],
+                                   credentials={url: ("AC1", "secret")})
+        await fetcher.start(on_failed=lambda job, error: failed.append(error))
+        # URL из webhook не должен вести во внутреннюю сеть
+        assert not fetcher.enqueue("twilio", "CA0", "http://169.254.169.254/latest/meta-data")
+        assert not fetcher.enqueue("twilio", "CA0", "file:///etc/passwd")
+        # API провайдера отвечает редиректом на CDN: туда запрос уходит без учётных данных
+        assert fetcher.enqueue("twilio", "CA1", f"{url}/redirect/CA1.mp3?to=http://localhost:{port}/recordings/CA1.mp3")
+        # Редирект на хост не из списка не выполняется
+        assert fetcher.enqueue("twilio", "CA2", f"{url}/redirect/CA2.mp3?to=http://169.254.169.254/CA2.mp3")
+        await fetcher.wait()
+        await fetcher.close()
+        return fetcher
+
+    app = create_fake_recordings_app(size=64 * 1024)
+    with BackgroundServer(app) as server:
+        fetcher = asyncio.run(scenario(server.url))
+
+    assert fetcher.path("CA1") is not None and fetcher.path("CA2") is None
+    assert len(failed) == 1 and "not allowed" in failed[0]
+    # Basic auth только на origin провайдера, CDN получает запрос без него
+    assert [header for name, header in app.state.authorization if name == "CA1"] == ["Basic QUMxOnNlY3JldA==", None]
+
+
+def test_recording_endpoint_serves_ranges(monkeypatch, tmp_path):
+    content = recording_bytes(0, 300 * 1024)
+    (tmp_path / "CA42.mp3").write_bytes(content)
+    monkeypatch.setattr(main, "call_recordings", RecordingFetcher(str(tmp_path)))
+    client = TestClient(main.app)
+    # Токен не настроен - записи не отдаются никому
+    monkeypatch.setattr(Config, "RECORDINGS_TOKEN", "")
+    assert client.get("/api/recordings/CA42").status_code == 403
+    assert client.get("/api/recordings/CA42?token=").status_code == 403
+
+    monkeypatch.setattr(Config, "RECORDINGS_TOKEN", "secret")
+    assert client.get("/api/recordings/CA42").status_code == 403
+    assert client.get("/api/recordings/CA42?token=secreT").status_code == 403
+    assert client.get("/api/recordings/CA43?token=secret").status_code == 404
+
+    full = client.get("/api/recordings/CA42?token=secret")
+    assert full.status_code == 200 and full.content == content
+    assert full.headers["content-type"] == "audio/mpeg" and full.headers["accept-ranges"] == "bytes"
+
+    partial = client.get("/api/recordings/CA42?token=secret", headers={"Range": "bytes=100000-199999"})
+    assert partial.status_code == 206 and partial.content == content[100000:200000]
+    assert partial.headers["content-range"] == f"bytes 100000-199999/{len(content)}"
+
+    tail = client.get("/api/recordings/CA42?token=secret", headers={"Range": "bytes=-10"})
+    assert tail.content == content[-10:]
+    outside = client.get("/api/recordings/CA42?token=secret", headers={"Range": f"bytes={len(content)}-"})
+    assert outside.status_code == 416 and outside.headers["content-range"] == f"bytes */{len(content)}"
@@ -0,0 +1,52 @@
+import json
+import random
+
+from dispatch_centers import DispatchCenter, DispatchRegistry, haversine_km
+
+
+def random_registry(count: int, seed: int = 1):
+    rnd = random.Random(seed)
+    centers = [DispatchCenter(str(i), f"DC {i}", f"+1555{i:07d}", rnd.uniform(-80, 80),
+                              rnd.uniform(-180, 180), rnd.uniform(50, 800)) for i in range(count)]
+    return rnd, centers, DispatchRegistry(centers)
+
+
+def test_nearest_and_jurisdiction_match_linear_scan():
+    rnd, centers, registry = random_registry(3000)
+    for _ in range(200):
+        lat, lng = rnd.uniform(-90, 90), rnd.uniform(-180, 180)
+        center, distance = registry.nearest(lat, lng)
+        expected = min(centers, key=lambda c: haversine_km(lat, lng, c.lat, c.lng))
+        assert center is expected
+        assert abs(distance - haversine_km(lat, lng, center.lat, center.lng)) < 1e-6
+
+        covering = [(haversine_km(lat, lng, c.lat, c.lng), c) for c in centers
+                    if haversine_km(lat, lng, c.lat, c.lng) <= c.radius_km]
+        match = registry.find_jurisdiction(lat, lng)
+        assert (match[0] if match else None) is (min(covering, key=lambda x: x[0])[1] if covering else None)
+
+
+def test_route_prefers_covering_center_across_antimeridian():
+    registry = DispatchRegistry([
+        DispatchCenter("fiji", "", "+1", -17.7, 179.9, 30),
+        DispatchCenter("samoa", "", "+2", -17.7, -179.8, 5),
+        DispatchCenter("far", "", "+3", 10.0, 10.0, 10),
+    ])
+    # Ближе всего samoa, но точка вне её радиуса - звонок уходит в fiji
+    assert registry.nearest(-17.7, -179.9)[0].id == "samoa"
+    assert registry.route(-17.7, -179.9).id == "fiji"
+    assert registry.route(0.0, 0.0) is None
+    assert registry.route(10.5, 10.0, max_distance_km=100).id == "far"
+    assert DispatchRegistry([]).route(0.0, 0.0, 100) is None
+
+
+def test_load_json_and_csv(tmp_path):
+    json_path = tmp_path / "centers.json"
+    json_path.write_text(json.dumps({"centers": [
+        {"id": 1, "name": "Paphos", "phone": "+15550000001", "lat": 34.77, "lng": 32.42, "radius_km": 40},
+    ]}))
+    csv_path = tmp_path / "centers.csv"
+    csv_path.write_text("id,name,phone,lat,lng,radius_km\nNIC,Nicosia,+15550000002,35.17,33.36,30\n")
+
+    assert DispatchRegistry.load(str(json_path)).route(34.75, 32.45).name == "Paphos"
+    assert DispatchRegistry.load(str(csv_path)).route(35.1856, 33.3823).phone == "+15550000002"
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from dispatcher import AllProvidersFailed, CircuitBreaker, HedgedDispatcher
+
+
+class FakeProvider:
+    """Локальный фейковый провайдер с задержкой и ошибками"""
+
+    def __init__(self, name: str, latency: float = 0.0, fail: bool = False):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    async def __call__(self) -> dict:
+        self.started += 1
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError(f"{self.name} unavailable")
+        self.completed += 1
+        return {"call_id": f"{self.name}-{self.started}"}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_dispatcher(**kwargs) -> HedgedDispatcher:
+    options = dict(hedge_delay=0.05, budget=1.0, failure_threshold=2, reset_timeout=60)
+    options.update(kwargs)
+    return HedgedDispatcher(["bland", "twilio"], **options)
+
+
+def test_fast_primary_wins_without_hedging():
+    bland, twilio = FakeProvider("bland", 0.01), FakeProvider("twilio", 0.01)
+    result = run(make_dispatcher().dispatch({"bland": bland, "twilio": twilio}))
+
+    assert result.provider == "bland"
+    assert result.response["call_id"] == "bland-1"
+    assert not result.hedged
+    assert twilio.started == 0
+    assert result.time_to_accept < 0.05
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled():
+    bland, twilio = FakeProvider("bland", 0.5), FakeProvider("twilio", 0.01)
+    result = run(make_dispatcher().dispatch({"bland": bland, "twilio": twilio}))
+
+    assert result.provider == "twilio"
+    assert result.hedged
+    assert result.cancelled == ["bland"]
+    assert bland.cancelled == 1
+    # Принят примерно через hedge_delay + задержку Twilio, а не через 0.5 с
+    assert result.time_to_accept < 0.2
+
+
+def test_failing_primary_falls_back_immediately():
+    bland, twilio = FakeProvider("bland", fail=True), FakeProvider("twilio", 0.01)
+    result = run(make_dispatcher(hedge_delay=10).dispatch({"bland": bland, "twilio": twilio}))
+
+    assert result.provider == "twilio"
+    assert "bland unavailable" in result.errors["bland"]
+    assert result.time_to_accept < 0.1
+
+
+def test_open_breaker_skips_provider_without_waiting():
+    dispatcher = make_dispatcher(hedge_delay=10)
+    bland, twilio = FakeProvider("bland", fail=True), FakeProvider("twilio")
+    for _ in range(2):
+        run(dispatcher.dispatch({"bland": bland, "twilio": twilio}))
+    assert dispatcher.breakers["bland"].state == CircuitBreaker.OPEN
+
+    result = run(dispatcher.dispatch({"bland": bland, "twilio": twilio}))
+    assert bland.started == 2
+    assert result.provider == "twilio"
+    assert result.errors["bland"] == "circuit open"
+
+
+def test_all_failed_and_budget_exceeded():
+    with pytest.raises(AllProvidersFailed) as error:
+        run(make_dispatcher().dispatch({"bland": FakeProvider("bland", fail=True),
+                                        "twilio": FakeProvider("twilio", fail=True)}))
+    assert set(error.value.errors) == {"bland", "twilio"}
+
+    slow = FakeProvider("bland", latency=1.0)
+    with pytest.raises(AllProvidersFailed) as error:
+        run(make_dispatcher(budget=0.1).dispatch({"bland": slow}))
+    assert error.value.errors == {"bland": "latency budget exceeded"}
+    assert slow.cancelled == 1
+
+
+def test_breaker_half_open_trial():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] = 11
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_always_slow_primary_trips_its_breaker():
+    dispatcher = make_dispatcher()
+    bland, twilio = FakeProvider("bland", 0.5), FakeProvider("twilio", 0.01)
+    for _ in range(2):
+        assert run(dispatcher.dispatch({"bland": bland, "twilio": twilio})).provider == "twilio"
+    assert dispatcher.breakers["bland"].state == CircuitBreaker.OPEN
+
+    # Дальше звонок не ждёт hedge_delay на медленном провайдере
+    result = run(dispatcher.dispatch({"bland": bland, "twilio": twilio}))
+    assert bland.started == 2 and not result.hedged and result.time_to_accept < 0.04
+
+    # Проигравший гонку раньше hedge_delay штраф не получает
+    fast = make_dispatcher(hedge_delay=0.05)
+    fast.providers = ["twilio", "bland"]
+    run(fast.dispatch({"twilio": FakeProvider("twilio", fail=True), "bland": FakeProvider("bland", 0.01)}))
+    assert fast.breakers["bland"].failures == 0
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import main
+from admission import AdmissionControl
+from config import Config
+
+
+def ride(ride_id: str, phone: str) -> dict:
+    return {
+        "passenger": {"name": f"Passenger {ride_id}", "phone": phone},
+        "driver": {"name": "Driver", "phone": "+10000000002", "license": "CY"},
+        "vehicle": {"make": "BMW", "model": "C5", "year": "2024", "plate": f"P-{ride_id}", "color": "Red"},
+        "location": {"gps_lat": 35.18 + int(ride_id[-1]) * 0.1, "gps_lng": 33.38, "address": "Paphos"},
+        "ride_info": {"ride_id": ride_id},
+    }
+
+
+def test_batch_admits_through_queue_and_streams_results(monkeypatch, tmp_path):
+    monkeypatch.setenv("EMERGENCY_PHONE", "+10000000000")
+    monkeypatch.setattr(Config, "PROVIDER_WARMUP", False)
+    monkeypatch.setattr(main, "admission", AdmissionControl(str(tmp_path / "state.db")))
+    monkeypatch.setattr(main, "incident_queue", main.IncidentQueue(str(tmp_path / "incidents.db")))
+    monkeypatch.setattr(main, "audit_log", main.AuditLog(str(tmp_path / "audit")))
+    monkeypatch.setattr(main, "call_recordings", main.RecordingFetcher(str(tmp_path / "recordings")))
+
+    scripts = []
+
+    # Фейковый Bland: первый инцидент самый медленный
+    async def fake_bland_call(phone_number, emergency_script, language="en", webhook=None):
+        scripts.append(emergency_script)
+        await asyncio.sleep(0.3 if "P-B-0" in emergency_script else 0.01)
+        return {"call_id": f"call-{len(scripts)}"}
+
+    monkeypatch.setattr(main, "initiate_bland_call", fake_bland_call)
+
+    with TestClient(main.app) as client:
+        main.ride_store.ingest(ride(f"B-{i}", f"+1000000010{i}") for i in range(4))
+        response = client.post("/api/emergency/batch", json={
+            "incidents": [{"ride_id": f"B-{i}", "incident_type": "assault"} for i in range(4)]
+                         + [{"ride_id": "missing"}, {"ride_id": "B-1", "incident_type": "assault"}],
+        })
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert lines[0] == {"index": 4, "success": False, "ride_id": "missing", "error": "Ride missing not found"}
+        assert [line["index"] for line in lines[1:]][-1] == 0
+        assert all(line["success"] and line["call_id"] and line["incident_id"] for line in lines[1:])
+        # Повторное нажатие в том же пакете не ставит второй звонок
+        by_index = {line["index"]: line for line in lines}
+        assert by_index[5]["deduplicated"] and by_index[5]["incident_id"] == by_index[1]["incident_id"]
+        assert len(scripts) == 4
+        assert all("Emergency Type: Assault" in script for script in scripts)
+        # Инциденты пакета лежат в надёжной очереди, как и одиночные SOS
+        status = client.get(f"/api/emergency/{by_index[0]['incident_id']}").json()
+        assert status["status"] == "dispatched"
+
+
+def test_batch_size_validated(monkeypatch):
+    monkeypatch.setattr(Config, "BATCH_MAX_ITEMS", 1)
+    client = TestClient(main.app)
+    response = client.post("/api/emergency/batch", json={"incidents": [{"ride_id": "a"}, {"ride_id": "b"}]})
+    assert response.status_code == 400
+
+
+def test_unknown_severity_rejected():
+    client = TestClient(main.app)
+    assert client.post("/api/emergency", json={"severity": "urgent"}).status_code == 422
+    response = client.post("/api/emergency/batch", json={"incidents": [{"severity": "High"}, {"severity": "x"}]})
+    assert response.status_code == 422
+    assert [error["loc"] for error in response.json()["detail"]] == [["body", "incidents", 1, "severity"]]
+    assert main.EmergencyRequest(severity=" Critical ").severity == "critical"
@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+from audit_log import AuditLog
+from benchmarks.fake_providers import BackgroundServer, create_fake_sink_app
+from event_export import REJECTED_DIR, EventExporter
+
+
+def exporter_for(url: str, spool_dir: str, **kwargs) -> EventExporter:
+    options = dict(batch_events=50, flush_interval=0.05, max_memory_batches=2, retry_delay=0.02,
+                   max_retry_delay=0.2, timeout=2.0)
+    options.update(kwargs)
+    return EventExporter(url + "/events", spool_dir=spool_dir, **options)
+
+
+def test_flaky_throttling_sink_gets_every_event_with_bounded_memory(tmp_path):
+    app = create_fake_sink_app(latency=0.005, error_rate=0.15, throttle_every=4, retry_after=0.02, seed=24)
+    peak_memory = 0
+
+    async def scenario(url: str):
+        nonlocal peak_memory
+        exporter = exporter_for(url, str(tmp_path / "spool"))
+        await exporter.start()
+        for i in range(2000):
+            exporter.emit({"kind": "sos_received", "incident_id": f"inc-{i}"})
+            if i == 600:
+                app.state.down = True
+            if i == 1400:
+                app.state.down = False
+            if i % 50 == 0:
+                await asyncio.sleep(0.01)
+                peak_memory = max(peak_memory, exporter.backlog["memory_batches"])
+        delivered = await exporter.drain(30)
+        await exporter.close()
+        return delivered
+
+    with BackgroundServer(app) as server:
+        assert asyncio.run(scenario(server.url))
+
+    received = {event["incident_id"] for event in app.state.events}
+    assert received == {f"inc-{i}" for i in range(2000)}
+    # Пачки не больше batch_events, повторы - только целыми пачками с тем же Idempotency-Key
+    assert all(count <= 50 for _, count, _ in app.state.batches)
+    assert len({event["event_id"] for event in app.state.events}) == 2000
+    # Пока приёмник лежал, память держалась в лимите, остальное ушло в спул
+    assert peak_memory <= 2
+    assert app.state.peak_in_flight == 1
+    assert os.listdir(tmp_path / "spool") == []
+
+
+def test_unsent_batches_survive_restart_through_disk_spool(tmp_path):
+    app = create_fake_sink_app(latency=0.005)
+    app.state.down = True
+    spool = str(tmp_path / "spool")
+
+    async def first_run(url: str):
+        exporter = exporter_for(url, spool)
+        await exporter.start()
+        for i in range(300):
+            exporter.emit({"kind": "call_status", "incident_id": f"inc-{i}"})
+        await asyncio.sleep(0.3)
+        await exporter.close()
+        return exporter.backlog
+
+    async def second_run(url: str):
+        exporter = exporter_for(url, spool)
+        resumed = await exporter.start()
+        delivered = await exporter.drain(10)
+        await exporter.close()
+        return resumed, delivered
+
+    with BackgroundServer(app) as server:
+        backlog = asyncio.run(first_run(server.url))
+        assert backlog["memory_batches"] == 0 and backlog["spooled_batches"] == 6
+        assert app.state.events == []
+
+        app.state.down = False
+        resumed, delivered = asyncio.run(second_run(server.url))
+
+    assert resumed == 6 and delivered
+    assert sorted(int(event["incident_id"][4:]) for event in app.state.events) == list(range(300))
+    assert os.listdir(spool) == []
+
+
+def test_rejected_batch_is_set_aside_and_audit_records_reach_exporter(tmp_path):
+    app = create_fake_sink_app(latency=0.005)
+    app.state.reject = True
+    spool = tmp_path / "spool"
+
+    async def scenario(url: str):
+        exporter = exporter_for(url, str(spool), kinds=("sos_received",))
+        # Журнал аудита выключен, но слушатели всё равно получают записи
+        audit = AuditLog("")
+        audit.add_listener(exporter.emit)
+        await exporter.start()
+        audit.append("sos_received", "inc-bad", ride_id="R-1")
+        audit.append("call_status", "inc-bad", status="completed")
+        assert await exporter.drain(5)
+        app.state.reject = False
+        audit.append("sos_received", "inc-good", ride_id="R-2")
+        assert await exporter.drain(5)
+        await exporter.close()
+
+    with BackgroundServer(app) as server:
+        asyncio.run(scenario(server.url))
+
+    assert [(event["incident_id"], event["kind"], event["ride_id"]) for event in app.state.events] == [
+        ("inc-good", "sos_received", "R-2")]
+    assert "ts" in app.state.events[0]
+    rejected = os.listdir(spool / REJECTED_DIR)
+    assert len(rejected) == 1 and rejected[0].endswith("_1.ndjson.gz")
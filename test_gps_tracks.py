@@ -0,0 +1,108 @@
+import math
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from gps_tracks import GpsTracks, ingest_lines, parse_ping
+from script_templates import ScriptEngine, describe_movement
+from test_script_templates import load_ride
+
+
+def test_ring_buffer_downsamples_and_keeps_newest_point():
+    tracks = GpsTracks(capacity=4, min_interval=1.0)
+    for i in range(20):
+        assert tracks.record("R-1", 100 + i * 0.25, 35.0 + i * 0.0001, 33.0, 0.0, 10.0)
+    # Старше новейшей точки - отбрасываем
+    assert not tracks.record("R-1", 99.0, 35.0, 33.0)
+    assert not tracks.record("R-1", 200.0, 95.0, 33.0)
+    # Пинг из будущего дальше допустимого расхождения часов не заслоняет живую позицию
+    assert not tracks.record("R-1", 104.75 + tracks.max_skew + 1, 35.0, 33.0, now=104.75)
+
+    points = tracks.track("R-1")
+    assert len(points) == 4
+    assert points[-1] == tracks.latest("R-1")
+    assert points[-1].ts == 104.75 and math.isclose(points[-1].lat, 35.0019)
+    # В истории примерно одна точка в секунду, а не каждый пинг; новейшая обновляется на месте
+    history = points[:-1]
+    assert all(b.ts - a.ts >= 0.75 for a, b in zip(history, history[1:]))
+
+    assert tracks.latest("R-1", now=104.75 + tracks.max_age + 1) is None
+    assert tracks.forget("R-1") and tracks.latest("R-1") is None
+    assert tracks.track("R-1") == []
+
+
+def test_heading_and_speed_are_derived_when_missing():
+    tracks = GpsTracks(min_interval=0.5)
+    tracks.record("R-1", 0.0, 35.0, 33.0)
+    tracks.record("R-1", 10.0, 35.001, 33.001)
+    fix = tracks.latest("R-1")
+    assert 35 < fix.heading < 45
+    assert 13 < fix.speed < 15
+
+    assert tracks.prune(older_than=5.0) == 0
+    assert tracks.prune(older_than=11.0) == 1 and len(tracks) == 0
+
+
+def test_parse_json_and_csv_pings():
+    assert parse_ping(b'{"ride_id": "R-1", "lat": 35.1, "lng": 33.2, "speed": 4}', now=5.0)[:4] == ("R-1", 5.0, 35.1, 33.2)
+    ride_id, ts, lat, lng, heading, speed = parse_ping(b"R-2,7.5,35.1,33.2,,", now=5.0)
+    assert (ride_id, ts, lat, lng) == ("R-2", 7.5, 35.1, 33.2) and math.isnan(heading) and math.isnan(speed)
+    assert parse_ping(b"R-2,x,35.1,33.2", now=5.0) is None
+    assert parse_ping(b'{"lat": 1}', now=5.0) is None
+
+    tracks = GpsTracks()
+    assert ingest_lines(tracks, [b"R-1,1,35,33,90,12", b"", b"garbage", b"R-1,2,35,33"], now=5.0) == (2, 1)
+
+
+def test_streamed_pings_reach_the_emergency_script(monkeypatch):
+    monkeypatch.setattr(main, "gps_tracks", GpsTracks())
+    monkeypatch.setattr(main.Config, "GPS_INGEST_TOKEN", "gps-secret")
+    monkeypatch.setattr(main.script_engine, "positions", main.gps_tracks)
+    store, record = load_ride()
+    now = time.time()
+
+    def body():
+        # Тело приходит кусками, строки рвутся на границах кусков
+        payload = "".join(f"{record.ride_id},{now - 10 + i},35.{1000 + i},33.4,90,15\n" for i in range(10)).encode()
+        for start in range(0, len(payload), 7):
+            yield payload[start:start + 7]
+
+    client = TestClient(main.app)
+    assert client.post("/api/gps", content=b"").status_code == 403
+    response = client.post("/api/gps", params={"token": "gps-secret"}, content=body())
+    assert response.json() == {"accepted": 10, "rejected": 0}
+    with client.websocket_connect("/api/gps/ws?token=gps-secret") as websocket:
+        websocket.send_text(f'{{"ride_id": "{record.ride_id}", "ts": {now}, "lat": 35.2, "lng": 33.5}}\n'
+                            f'{{"ride_id": "{record.ride_id}", "ts": {now + 3600}, "lat": 36.0, "lng": 34.0}}\nbad')
+    track = client.get(f"/api/rides/{record.ride_id}/track").json()["points"]
+    assert track[-1]["lat"] == 35.2 and track[-1]["speed"] is not None
+
+    script = main.script_engine.render(record, "assault")
+    assert "GPS Coordinates: 35.2, 33.5" in script
+    assert "- Movement: Vehicle moving at" in script and "heading" in script
+    # Машина далеко от точки поездки: адрес поездки озвучивается как последний известный
+    address = record.location["address"]
+    assert f"- Address: last known address {address}" in script
+
+    # Без живого трека сценарий берёт координаты из данных поездки
+    assert "- Movement:" not in ScriptEngine().render(record, "assault")
+
+
+def test_non_finite_pings_do_not_break_the_script(monkeypatch):
+    monkeypatch.setattr(main.script_engine, "positions", GpsTracks())
+    store, record = load_ride()
+    now = time.time()
+    lines = [f"{record.ride_id},nan,35.2,33.5".encode(),
+             f"{record.ride_id},{now},inf,33.5".encode(),
+             f'{{"ride_id": "{record.ride_id}", "ts": {now}, "lat": 35.2, "lng": NaN}}'.encode(),
+             f"{record.ride_id},{now},35.2,33.5,inf,nan".encode()]
+    assert ingest_lines(main.script_engine.positions, lines, now) == (1, 3)
+    fix = main.script_engine.positions.latest(record.ride_id)
+    assert math.isnan(fix.heading) and math.isnan(fix.speed)
+
+    script = main.script_engine.render(record, "assault")
+    assert "- Movement: Vehicle movement unknown, live GPS fix" in script
+    # Даже точка в обход record не роняет сценарий
+    broken = fix._replace(ts=math.nan, heading=math.inf, speed=math.inf)
+    assert describe_movement(broken, now) == "Vehicle movement unknown, live GPS fix 0 seconds old"
@@ -0,0 +1,207 @@
+import asyncio
+import random
+import sqlite3
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import twilio_fallback
+from admission import AdmissionControl
+from dispatcher import HedgedDispatcher
+from incident_clusters import IncidentClusters, distance_m
+from sos_dedup import SOSDeduplicator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_nearby_sos_join_cluster_until_window_or_size_runs_out():
+    clock = Clock()
+    clusters = IncidentClusters(radius_m=300, window=60, max_members=3, clock=clock)
+
+    first, opened = clusters.attach("inc-1", 35.1856, 33.3823, "R-1", "assault", "high")
+    assert opened and first.id == "inc-1"
+    # ~200 м к северу - тот же кластер, ~1 км - новый
+    joined, opened = clusters.attach("inc-2", 35.1874, 33.3823, "R-2", "assault", "high")
+    assert joined is first and not opened and round(first.members[1].distance_m) == 200
+    assert clusters.attach("inc-3", 35.1946, 33.3823, "R-3", "assault", "high")[1]
+
+    clusters.attach("inc-4", 35.1857, 33.3824, "R-4", "medical_emergency", "critical")
+    assert [member.ride_id for member in first.members] == ["R-1", "R-2", "R-4"]
+    # Кластер полон - следующий SOS рядом открывает свой
+    assert clusters.attach("inc-5", 35.1856, 33.3823, "R-5", "assault", "high")[0].id == "inc-5"
+
+    clock.now = 61
+    assert clusters.attach("inc-6", 35.1856, 33.3823, "R-6", "assault", "high")[0].id == "inc-6"
+    assert len(clusters) == 1
+    # Закрытый кластер остаётся доступен звонку из очереди
+    assert clusters.get("inc-1") is first
+    clusters.forget("inc-6")
+    assert len(clusters) == 0 and clusters.get("inc-6") is None
+
+
+def test_grid_lookup_matches_brute_force():
+    rng = random.Random(23)
+    clusters = IncidentClusters(radius_m=250, window=1e9, max_members=10 ** 6, max_clusters=10 ** 6)
+    # Широты от экватора до севера Норвегии: ширина ячейки по долготе меняется со строкой
+    for lat0 in (0.0, 35.18, 69.6):
+        centers = []
+        for i in range(300):
+            lat, lng = lat0 + rng.uniform(-0.05, 0.05), 33.38 + rng.uniform(-0.05, 0.05)
+            found = clusters.find(lat, lng)
+            expected = min((distance_m(c.lat, c.lng, lat, lng), c.id) for c in centers) if centers else None
+            if expected is None or expected[0] > 250:
+                assert found is None
+                centers.append(clusters.attach(f"{lat0}-{i}", lat, lng, "R", "assault", "high")[0])
+            else:
+                assert found[0].id == expected[1]
+
+
+@pytest.mark.parametrize("provider", ["bland", "twilio"])
+def test_mass_sos_places_one_call_listing_all_rides(monkeypatch, tmp_path, provider):
+    monkeypatch.setenv("EMERGENCY_PHONE", "+10000000000")
+    monkeypatch.setattr(main, "admission", AdmissionControl(str(tmp_path / "state.db")))
+    monkeypatch.setattr(main, "incident_queue", main.IncidentQueue(str(tmp_path / "incidents.db")))
+    monkeypatch.setattr(main, "incident_clusters", IncidentClusters(radius_m=300, window=300))
+    monkeypatch.setattr(main, "sos_dedup", SOSDeduplicator(ttl=60))
+
+    def ride(ride_id: str, lat: float, plate: str) -> dict:
+        return {
+            "passenger": {"name": f"Passenger {ride_id}", "phone": f"+1000000{ride_id[-3:]}"},
+            "driver": {"name": "Driver", "phone": "+10000000002", "license": "CY"},
+            "vehicle": {"make": "BMW", "model": "C5", "year": "2024", "plate": plate, "color": "Red"},
+            "location": {"gps_lat": lat, "gps_lng": 33.3823, "address": "Limassol, Seafront"},
+            "ride_info": {"ride_id": ride_id},
+        }
+
+    main.ride_store.ingest([ride("C-101", 35.1856, "CL-101"), ride("C-102", 35.1866, "CL-102"),
+                            ride("C-103", 35.1846, "CL-103"), ride("C-104", 35.2856, "CL-104")])
+    client = TestClient(main.app)
+    responses = [client.post("/api/emergency", json={"ride_id": ride_id, "incident_type": "assault",
+                                                     "severity": "critical" if ride_id == "C-103" else "high"}).json()
+                 for ride_id in ("C-101", "C-102", "C-103", "C-104")]
+
+    primary = responses[0]["incident_id"]
+    assert not responses[0].get("clustered")
+    assert [response["incident_id"] for response in responses[1:3]] == [primary, primary]
+    assert responses[2]["clustered"] and responses[2]["cluster_size"] == 3
+    # Дальняя поездка (~11 км) получает свой инцидент
+    assert responses[3]["incident_id"] != primary and not responses[3].get("clustered")
+    # Повторное нажатие участника кластера дедуплицируется в звонок кластера
+    repeat = client.post("/api/emergency", json={"ride_id": "C-102", "incident_type": "assault"}).json()
+    assert repeat["deduplicated"] and repeat["incident_id"] == primary
+
+    # Critical SOS в кластере переносит ожидающий звонок кластера на дедлайн critical
+    with sqlite3.connect(tmp_path / "incidents.db") as db:
+        deadline = db.execute("SELECT deadline FROM incidents WHERE id = ?", (primary,)).fetchone()[0]
+    assert deadline <= time.time()
+
+    scripts = []
+
+    async def fake_bland_call(phone_number, emergency_script, language="en", webhook=None):
+        if provider != "bland":
+            raise main.ProviderError("Bland unavailable")
+        scripts.append(emergency_script)
+        return {"call_id": "call-cluster"}
+
+    async def fake_twilio_call(phone_number, emergency_script, status_callback=None):
+        scripts.append(emergency_script)
+        return {"success": True, "call_id": "call-cluster", "provider": "twilio"}
+
+    monkeypatch.setattr(main, "initiate_bland_call", fake_bland_call)
+    if provider == "twilio":
+        # Bland отказал - Twilio озвучивает тот же сводный сценарий кластера
+        for name, value in (("TWILIO_ACCOUNT_SID", "AC1"), ("TWILIO_AUTH_TOKEN", "t"), ("TWILIO_PHONE", "+1")):
+            monkeypatch.setattr(main.Config, name, value)
+        monkeypatch.setattr(main, "call_dispatcher", HedgedDispatcher(["bland", "twilio"], hedge_delay=0.01))
+        monkeypatch.setattr(twilio_fallback, "initiate_twilio_emergency_call_async", fake_twilio_call)
+    payload = {"ride_id": "C-101", "incident_type": "assault", "language": "en", "severity": "high",
+               "passenger_phone": "+1000000101", "received_at": None}
+    result = asyncio.run(main.process_incident(primary, payload))
+
+    assert result["call_id"] == "call-cluster" and len(scripts) == 1
+    assert "MASS INCIDENT: 3 passengers" in scripts[0] and "3 assault" in scripts[0]
+    assert "Severity: CRITICAL" in scripts[0]
+    assert all(plate in scripts[0] for plate in ("CL-101", "CL-102", "CL-103"))
+    assert "CL-104" not in scripts[0]
+    assert main.incident_clusters.get(primary).call_id == "call-cluster"
+
+    # Звонок кластера уже идёт: SOS рядом не теряется в нём, а получает свой инцидент
+    main.ride_store.ingest([ride("C-105", 35.1857, "CL-105")])
+    late = client.post("/api/emergency", json={"ride_id": "C-105", "incident_type": "assault"}).json()
+    assert late["incident_id"] != primary and not late.get("clustered")
+
+
+def test_failed_cluster_call_requeues_each_member(monkeypatch, tmp_path):
+    monkeypatch.setenv("EMERGENCY_PHONE", "+10000000000")
+    monkeypatch.setattr(main, "admission", AdmissionControl(str(tmp_path / "state.db")))
+    monkeypatch.setattr(main, "incident_queue", main.IncidentQueue(str(tmp_path / "incidents.db")))
+    monkeypatch.setattr(main, "incident_clusters", IncidentClusters(radius_m=300, window=300))
+    notified = []
+    monkeypatch.setattr(main, "start_notifications",
+                        lambda data, incident_type, severity, phone, incident_id, dispatcher=True:
+                        notified.append((data.ride_id, incident_id, dispatcher)))
+
+    rides = [{
+        "passenger": {"name": f"Passenger {i}", "phone": f"+100000002{i}"},
+        "driver": {"name": "Driver", "phone": "+10000000002", "license": "CY"},
+        "vehicle": {"make": "BMW", "model": "C5", "year": "2024", "plate": f"F-{i}", "color": "Red"},
+        "location": {"gps_lat": 35.1856 + i * 0.0005, "gps_lng": 33.3823, "address": "Limassol"},
+        "ride_info": {"ride_id": f"F-{i}"},
+    } for i in range(3)]
+    main.ride_store.ingest(rides)
+    client = TestClient(main.app)
+    responses = [client.post("/api/emergency", json={"ride_id": f"F-{i}", "incident_type": "assault"}).json()
+                 for i in range(3)]
+    primary = responses[0]["incident_id"]
+    assert all(response["incident_id"] == primary for response in responses)
+    # Присоединившиеся SOS сразу оповещают контакты пассажира, но не диспетчера
+    assert notified == [("F-1", notified[0][1], False), ("F-2", notified[1][1], False)]
+    members = [incident_id for _, incident_id, _ in notified]
+
+    async def fail_cluster_call():
+        main.forget_failed_incident(primary, {"ride_id": "F-0", "passenger_phone": "+1000000020",
+                                              "incident_type": "assault"}, "all providers failed")
+        await asyncio.gather(*main.requeue_tasks)
+
+    asyncio.run(fail_cluster_call())
+    assert main.call_tracker.get(primary)["requeued"] == members
+    for member in members:
+        assert client.get(f"/api/emergency/{member}").json()["status"] == "queued"
+    # Повторное нажатие участника ведёт к его собственному инциденту, а не к упавшему кластеру
+    repeat = client.post("/api/emergency", json={"ride_id": "F-1", "incident_type": "assault"}).json()
+    assert repeat["deduplicated"] and repeat["incident_id"] == members[0]
+
+
+def test_requeued_member_notifies_dispatcher_after_joined_notifications(monkeypatch):
+    for name, value in (("TWILIO_ACCOUNT_SID", "AC1"), ("TWILIO_AUTH_TOKEN", "t"), ("TWILIO_PHONE", "+1")):
+        monkeypatch.setattr(main.Config, name, value)
+    monkeypatch.setattr(main, "notifications", main.NotificationFanout())
+    sent = []
+
+    async def fake_sms(phone_number, message):
+        sent.append(phone_number)
+        return {"sid": "SM1", "to": phone_number}
+
+    monkeypatch.setattr(main, "send_sms_notification", fake_sms)
+    main.ride_store.load_file("test_data.json")
+    data = main.get_ride_data()
+
+    async def join_then_requeue():
+        # При присоединении к кластеру диспетчеру не пишем, звонок кластера ещё не упал
+        joined = main.start_notifications(data, "assault", "high", "+10000000000", "member-1", dispatcher=False)
+        await joined.wait()
+        # Звонок кластера упал, участник звонит своим инцидентом - диспетчер получает SMS
+        own = main.start_notifications(data, "assault", "high", "+10000000000", "member-1")
+        assert own is not joined
+        return (await own.wait())["dispatcher_sms"]
+
+    assert asyncio.run(join_then_requeue())["status"] == "sent"
+    assert "+10000000000" in sent
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+from incident_queue import DISPATCHED, FAILED, QUEUED, IncidentQueue, PermanentIncidentError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_enqueue_claim_complete(tmp_path):
+    async def scenario():
+        queue = IncidentQueue(str(tmp_path / "q.db"))
+        incident_id = await queue.enqueue({"ride_id": "R-1"})
+        assert (await queue.get(incident_id))["status"] == QUEUED
+
+        claimed_id, payload, attempts = await queue.claim()
+        assert (claimed_id, payload, attempts) == (incident_id, {"ride_id": "R-1"}, 1)
+        assert await queue.claim() is None
+
+        await queue.complete(incident_id, {"call_id": "c-1"})
+        incident = await queue.get(incident_id)
+        await queue.close()
+        return incident
+
+    incident = run(scenario())
+    assert incident["status"] == DISPATCHED
+    assert incident["result"] == {"call_id": "c-1"}
+
+
+def test_incident_survives_restart_and_is_retried(tmp_path):
+    path = str(tmp_path / "q.db")
+
+    async def crash_mid_dispatch():
+        queue = IncidentQueue(path, lease_seconds=0.05)
+        incident_id = await queue.enqueue({"ride_id": "R-1"})
+        assert await queue.claim() is not None
+        # Процесс "упал": ни complete, ни fail не вызваны
+        await queue.close()
+        return incident_id
+
+    incident_id = run(crash_mid_dispatch())
+    time.sleep(0.1)
+
+    async def restart():
+        queue = IncidentQueue(path, lease_seconds=0.05, poll_interval=0.01)
+        handled = []
+
+        async def handler(incident_id, payload):
+            handled.append(incident_id)
+            return {"call_id": "after-restart"}
+
+        queue.start_workers(handler, concurrency=2)
+        for _ in range(100):
+            incident = await queue.get(incident_id)
+            if incident["status"] == DISPATCHED:
+                break
+            await asyncio.sleep(0.01)
+        await queue.close()
+        return handled, incident
+
+    handled, incident = run(restart())
+    assert handled == [incident_id]
+    assert incident["attempts"] == 2
+    assert incident["result"] == {"call_id": "after-restart"}
+
+
+def test_workers_retry_then_fail(tmp_path):
+    async def scenario():
+        queue = IncidentQueue(str(tmp_path / "q.db"), max_attempts=3, retry_delay=0.01, poll_interval=0.01)
+        calls = []
+
+        async def handler(incident_id, payload):
+            calls.append(payload["kind"])
+            if payload["kind"] == "permanent":
+                raise PermanentIncidentError("Ride not found")
+            raise RuntimeError("provider down")
+
+        flaky = await queue.enqueue({"kind": "flaky"})
+        permanent = await queue.enqueue({"kind": "permanent"})
+        queue.start_workers(handler, concurrency=1)
+        for _ in range(200):
+            if (await queue.counts()).get(FAILED) == 2:
+                break
+            await asyncio.sleep(0.01)
+        results = await queue.get(flaky), await queue.get(permanent)
+        await queue.close()
+        return calls, results
+
+    calls, (flaky, permanent) = run(scenario())
+    assert flaky["status"] == FAILED and flaky["attempts"] == 3
+    assert flaky["error"] == "provider down"
+    assert permanent["status"] == FAILED and permanent["attempts"] == 1
+    assert calls.count("flaky") == 3
+
+
+def test_claim_order_follows_severity_deadline(tmp_path):
+    async def scenario():
+        queue = IncidentQueue(str(tmp_path / "q.db"))
+        now = time.time()
+        await queue.enqueue({"n": "low"}, deadline=now + 120)
+        await queue.enqueue({"n": "critical"}, deadline=now)
+        await queue.enqueue({"n": "high"}, deadline=now + 5)
+        claimed = [(await queue.claim())[1]["n"] for _ in range(3)]
+        await queue.close()
+        return claimed
+
+    assert run(scenario()) == ["critical", "high", "low"]
+
+
+def test_lease_is_renewed_while_handler_waits_and_owner_is_checked(tmp_path):
+    async def scenario():
+        queue = IncidentQueue(str(tmp_path / "q.db"), lease_seconds=0.15, poll_interval=0.01)
+        calls = []
+
+        async def handler(incident_id, payload):
+            calls.append(incident_id)
+            # Дольше аренды: например, ждём слот звонка за более тяжёлыми инцидентами
+            await asyncio.sleep(0.6)
+            return {"call_id": "c-1"}
+
+        incident_id = await queue.enqueue({"ride_id": "R-1"})
+        queue.start_workers(handler, concurrency=2)
+        for _ in range(100):
+            if (await queue.counts()).get(DISPATCHED):
+                break
+            await asyncio.sleep(0.02)
+        incident = await queue.get(incident_id)
+
+        # Опоздавший владелец старой аренды не может завершить инцидент
+        await queue.stop_workers()
+        stale = await queue.enqueue({"ride_id": "R-2"})
+        await queue._run(queue._db.execute, "UPDATE incidents SET status = 'dispatching', attempts = 2, "
+                                            "lease_until = 0 WHERE id = ?", (stale,))
+        assert not await queue.complete(stale, {"call_id": "late"}, attempts=1)
+        assert await queue.fail(stale, "late", attempts=1) == "dispatching"
+        assert await queue.complete(stale, {"call_id": "owner"}, attempts=2)
+        await queue.close()
+        return calls, incident
+
+    calls, incident = run(scenario())
+    assert len(calls) == 1
+    assert incident["status"] == DISPATCHED and incident["attempts"] == 1
@@ -46,13 +46,29 @@ def test_emergency_endpoint():
         print(f"⏱️  Response time: {end_time - start_time:.2f} seconds")
         print(f"📊 Status code: {response.status_code}")
         
-        if response.status_code == 200:
+        if response.status_code == 202:
             data = response.json()
+            print(f"📨 Incident accepted: {data.get('incident_id', 'N/A')}")
+            
+            # Звонок делает фоновый воркер - ждём результат
+            incident = {}
+            for _ in range(60):
+                incident = requests.get(f"{BASE_URL}{data['status_url']}", timeout=10).json()
+                if incident.get("status") in ("dispatched", "failed"):
+                    break
+                time.sleep(0.5)
+            print(f"⏱️  Time to call accepted: {time.time() - start_time:.2f} seconds")
+            
+            if incident.get("status") != "dispatched":
+                print(f"❌ Emergency call not placed: {incident.get('status')} {incident.get('error')}")
+                return False
+            
+            result = incident["result"]
             print("✅ Emergency endpoint test successful!")
-            print(f"📞 Call ID: {data.get('call_id', 'N/A')}")
-            print(f"📱 Emergency phone: {data.get('emergency_phone', 'N/A')}")
-            print(f"🕒 Timestamp: {data.get('timestamp', 'N/A')}")
-            print(f"📧 SMS sent: {data.get('sms_sent', False)}")
+            print(f"📞 Call ID: {result.get('call_id', 'N/A')}")
+            print(f"📱 Emergency phone: {result.get('emergency_phone', 'N/A')}")
+            print(f"🕒 Timestamp: {result.get('timestamp', 'N/A')}")
+            print(f"📧 SMS sent: {result.get('sms_sent', False)}")
             
             if 'data_used' in data:
                 print("📋 Data used in emergency call:")
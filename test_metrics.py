@@ -0,0 +1,37 @@
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_prometheus_text_format():
+    registry = Registry()
+    histogram = registry.register(Histogram("sos_stage_seconds", "Stage latency",
+                                            labels=("stage",), buckets=(0.01, 0.1)))
+    counter = registry.register(Counter("provider_calls", "Calls", labels=("provider", "outcome")))
+    gauge = registry.register(Gauge("in_flight", "In flight", labels=("provider",)))
+
+    histogram.observe(0.005, "render")
+    histogram.observe(0.01, "render")
+    histogram.observe(0.5, "render")
+    counter.inc("bland", "success")
+    counter.inc("bland", "success")
+    gauge.inc("bland")
+    gauge.inc("bland")
+    gauge.dec("bland")
+
+    text = registry.render()
+    assert "# TYPE sos_stage_seconds histogram" in text
+    assert 'sos_stage_seconds_bucket{stage="render",le="0.01"} 2' in text
+    assert 'sos_stage_seconds_bucket{stage="render",le="0.1"} 2' in text
+    assert 'sos_stage_seconds_bucket{stage="render",le="+Inf"} 3' in text
+    assert 'sos_stage_seconds_sum{stage="render"} 0.515' in text
+    assert 'sos_stage_seconds_count{stage="render"} 3' in text
+    assert "# TYPE provider_calls counter" in text
+    assert 'provider_calls_total{provider="bland",outcome="success"} 2' in text
+    assert 'in_flight{provider="bland"} 1' in text
+    assert histogram.count("render") == 3
+
+
+def test_label_values_escaped():
+    registry = Registry()
+    counter = registry.register(Counter("errors", "Errors", labels=("reason",)))
+    counter.inc('bad "quote"\n')
+    assert 'errors_total{reason="bad \\"quote\\"\\n"} 1' in registry.render()
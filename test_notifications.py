@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import main
+from benchmarks.fake_providers import BackgroundServer, create_fake_bland_app, create_fake_twilio_app
+from notifications import ChannelPolicy, NotificationFanout, PermanentNotificationError, recipients_sender
+from provider_client import ProviderClient, ProviderError
+from ride_store import RideRecord
+
+
+def test_channels_run_concurrently_with_own_deadlines_and_retries():
+    calls = {"flaky": 0, "rejected": 0}
+    done = []
+
+    async def fast():
+        await asyncio.sleep(0.01)
+        return {"sid": "fast"}
+
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def flaky():
+        calls["flaky"] += 1
+        if calls["flaky"] < 3:
+            raise ProviderError("503 Service Unavailable", 503)
+        return {"sid": "flaky"}
+
+    async def rejected():
+        calls["rejected"] += 1
+        raise ProviderError("400 invalid phone number", 400)
+
+    async def scenario():
+        fanout = NotificationFanout()
+        channels = {
+            "fast": (fast, ChannelPolicy(1.0)),
+            "slow": (slow, ChannelPolicy(0.2)),
+            "flaky": (flaky, ChannelPolicy(1.0, max_attempts=3, retry_delay=0.01)),
+            "rejected": (rejected, ChannelPolicy(1.0, retry_delay=0.01)),
+            "unconfigured": (None, ChannelPolicy(1.0)),
+        }
+        started = time.perf_counter()
+        run = fanout.start("inc-1", channels, done.append)
+        # Повтор того же инцидента возвращает идущую рассылку, а не шлёт заново
+        assert fanout.start("inc-1", channels) is run
+        await asyncio.sleep(0.05)
+        early = run.snapshot()
+        results = await run.wait()
+        return early, results, time.perf_counter() - started
+
+    early, results, elapsed = asyncio.run(scenario())
+
+    assert early["fast"]["status"] == "sent" and early["slow"]["status"] == "pending"
+    assert results["fast"]["response"] == {"sid": "fast"}
+    assert results["slow"]["status"] == "timeout" and results["slow"]["attempts"] == 1
+    assert results["flaky"]["status"] == "sent" and results["flaky"]["attempts"] == 3
+    assert results["rejected"] == dict(results["rejected"], status="failed", attempts=1)
+    assert results["unconfigured"] == {"status": "skipped", "attempts": 0}
+    # Медленный канал ограничен своим дедлайном, остальные его не ждали
+    assert elapsed < 0.5
+    assert calls == {"flaky": 3, "rejected": 1}
+    assert len(done) == 1
+
+
+def test_recipients_retry_only_undelivered():
+    attempts = []
+
+    async def send_one(phone):
+        attempts.append(phone)
+        if phone == "+2" and attempts.count("+2") == 1:
+            raise ProviderError("timed out")
+        if phone == "+3":
+            raise PermanentNotificationError("unsubscribed")
+        return phone + "-ok"
+
+    async def scenario():
+        send = recipients_sender(send_one, ["+1", "+2"])
+        run = NotificationFanout().start(None, {"contacts": (send, ChannelPolicy(1.0, retry_delay=0.01))})
+        permanent = NotificationFanout().start(None, {"contacts": (recipients_sender(send_one, ["+3"]),
+                                                                   ChannelPolicy(1.0, retry_delay=0.01))})
+        return await run.wait(), await permanent.wait()
+
+    results, permanent = asyncio.run(scenario())
+    assert results["contacts"]["response"] == {"delivered": {"+1": "+1-ok", "+2": "+2-ok"}}
+    assert attempts.count("+1") == 1 and attempts.count("+2") == 2
+    assert permanent["contacts"]["status"] == "failed" and permanent["contacts"]["attempts"] == 1
+
+
+def test_sms_and_voice_do_not_wait_for_slow_channel(monkeypatch):
+    monkeypatch.setenv("EMERGENCY_PHONE", "+10000000000")
+    monkeypatch.setenv("BLAND_API_KEY", "test")
+    for name, value in (("TWILIO_ACCOUNT_SID", "ACtest"), ("TWILIO_AUTH_TOKEN", "token"),
+                        ("TWILIO_PHONE", "+10000000009"), ("SAFETY_OPS_WEBHOOK_URL", "http://ops.invalid"),
+                        ("NOTIFY_OPS_DEADLINE", 0.5)):
+        monkeypatch.setattr(main.Config, name, value)
+    monkeypatch.setattr(main, "notifications", NotificationFanout())
+
+    # Смена безопасности не отвечает дольше своего дедлайна
+    async def slow_ops(payload):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(main, "notify_safety_ops", slow_ops)
+    data = RideRecord.from_dict({
+        "passenger": {"name": "Anna", "phone": "+10000000001",
+                      "emergency_contacts": ["+10000000101", {"name": "Bob", "phone": "+10000000102"}]},
+        "driver": {"name": "Driver", "phone": "+10000000002", "license": "CY"},
+        "vehicle": {"make": "BMW", "model": "C5", "year": "2024", "plate": "N-21", "color": "Red"},
+        "location": {"gps_lat": 35.18, "gps_lng": 33.38, "address": "Paphos"},
+        "ride_info": {"ride_id": "N-21"},
+    })
+
+    twilio_app = create_fake_twilio_app(latency=0.1)
+    with BackgroundServer(create_fake_bland_app(latency=0.05)) as voice, BackgroundServer(twilio_app) as sms:
+        monkeypatch.setattr(main, "bland_client", ProviderClient("bland", voice.url))
+        monkeypatch.setattr(main, "sms_client", ProviderClient("twilio_sms", sms.url))
+
+        async def scenario():
+            started = time.perf_counter()
+            result = await main.run_emergency(data, "assault", incident_id="inc-21")
+            responded = time.perf_counter() - started
+            channels = await main.notifications.get("inc-21").wait()
+            await main.bland_client.close()
+            await main.sms_client.close()
+            return result, responded, channels
+
+        result, responded, channels = asyncio.run(scenario())
+
+    assert result["call_id"] and responded < 0.5
+    assert result["notifications"]["voice"]["status"] == "sent"
+    assert result["notifications"]["safety_ops"]["status"] == "pending"
+    assert channels["dispatcher_sms"]["status"] == "sent"
+    assert channels["contacts_sms"]["response"]["delivered"].keys() == {"+10000000101", "+10000000102"}
+    assert channels["safety_ops"]["status"] == "timeout"
+    messages = twilio_app.state.messages
+    assert sorted(message["To"] for message in messages) == ["+10000000000", "+10000000101", "+10000000102"]
+    assert all(message["From"] == "+10000000009" for message in messages)
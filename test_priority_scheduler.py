@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from priority_scheduler import CallShed, PriorityScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def start_waiters(scheduler, requests):
+    order = []
+
+    async def call(name, severity, arrived):
+        async with scheduler.slot(severity, arrived):
+            order.append(name)
+
+    tasks = [asyncio.create_task(call(*request)) for request in requests]
+    await asyncio.sleep(0)
+    return order, tasks
+
+
+def test_slots_go_to_earliest_deadline_and_old_low_severity_ages_up():
+    async def scenario():
+        clock = Clock()
+        scheduler = PriorityScheduler(capacity=1, clock=clock)
+        await scheduler.acquire("high")
+
+        order, tasks = await start_waiters(scheduler, [
+            ("low-fresh", "low", clock.now),
+            ("medium", "medium", clock.now),
+            ("critical", "critical", clock.now),
+            # low ждёт уже 200 секунд - его дедлайн раньше свежих high и medium
+            ("low-aged", "low", clock.now - 200),
+            ("high", "high", clock.now),
+        ])
+        assert scheduler.waiting == 5
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["low-aged", "critical", "high", "medium", "low-fresh"]
+
+
+def test_overload_sheds_lowest_severity_only():
+    async def scenario():
+        scheduler = PriorityScheduler(capacity=1, max_waiting=2)
+        await scheduler.acquire("critical")
+        order, tasks = await start_waiters(scheduler, [
+            ("low", "low", None),
+            ("high-1", "high", None),
+            ("high-2", "high", None),
+            ("critical", "critical", None),
+        ])
+        # Сверх лимита ожидания остались только звонки, которые сбрасывать нельзя
+        assert scheduler.waiting == 3
+        with pytest.raises(CallShed):
+            await tasks[0]
+        scheduler.release()
+        await asyncio.gather(*tasks[1:])
+        return order
+
+    assert asyncio.run(scenario()) == ["critical", "high-1", "high-2"]
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        scheduler = PriorityScheduler(capacity=1)
+        await scheduler.acquire("high")
+        order, tasks = await start_waiters(scheduler, [("first", "high", None), ("second", "low", None)])
+        tasks[0].cancel()
+        await asyncio.sleep(0)
+        assert scheduler.waiting == 1
+        scheduler.release()
+        await tasks[1]
+        assert (order, scheduler.in_use, scheduler.waiting) == (["second"], 0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_escalated_waiter_moves_to_earlier_deadline():
+    async def scenario():
+        clock = Clock()
+        scheduler = PriorityScheduler(capacity=1, clock=clock)
+        await scheduler.acquire("high")
+        order = []
+
+        async def call(name, severity, key=None):
+            async with scheduler.slot(severity, clock.now, key=key):
+                order.append(name)
+
+        tasks = [asyncio.create_task(call("high", "high")), asyncio.create_task(call("cluster", "low", "inc-1"))]
+        await asyncio.sleep(0)
+        # К кластеру присоединился critical SOS
+        assert scheduler.escalate("inc-1", "critical", clock.now)
+        assert not scheduler.escalate("inc-1", "medium") and not scheduler.escalate("unknown", "critical")
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        assert not scheduler.escalate("inc-1", "critical")
+        return order
+
+    assert asyncio.run(scenario()) == ["cluster", "high"]
@@ -0,0 +1,74 @@
+import marshal
+import pstats
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+from profiling import ProfilingMiddleware, RequestProfiler, samples_to_pstats
+
+
+def test_admin_arms_deterministic_profile_for_next_requests(monkeypatch, tmp_path):
+    monkeypatch.setattr(main.Config, "ADMIN_TOKEN", "admin")
+    admin = {"X-Admin-Token": "admin"}
+    client = TestClient(main.app)
+
+    assert client.post("/api/admin/profile", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    armed = client.post("/api/admin/profile?requests=2&path=/api/test", headers=admin).json()
+    assert armed["state"] == "armed"
+    assert client.post("/api/admin/profile", headers=admin).status_code == 409
+
+    for _ in range(3):
+        assert client.get("/api/test").status_code == 200
+    status = client.get("/api/admin/profile", headers=admin).json()
+    assert status["armed"] is None
+    session = status["sessions"][0]
+    assert session["completed"] == 2 and session["formats"] == ["pstats"]
+
+    response = client.get(f"/api/admin/profile/{armed['id']}/pstats", headers=admin)
+    assert response.status_code == 200
+    (tmp_path / "profile.prof").write_bytes(response.content)
+    stats = pstats.Stats(str(tmp_path / "profile.prof"))
+    assert [func for func in stats.stats if func[2] == "test_server"]
+    assert client.get(f"/api/admin/profile/{armed['id']}/collapsed", headers=admin).status_code == 404
+
+
+def test_header_profiles_one_request_with_samples_and_loop_lag(tmp_path):
+    app = FastAPI()
+
+    @app.get("/block")
+    async def block_loop():
+        # Синхронная работа внутри async-обработчика держит event loop
+        time.sleep(0.15)
+        return {"ok": True}
+
+    profiler = RequestProfiler(sample_interval=0.002, lag_interval=0.005, lag_threshold=0.05)
+    app.add_middleware(ProfilingMiddleware, profiler=profiler, authorize=lambda token: token == "admin")
+
+    with TestClient(app) as client:
+        assert "x-profile-id" not in client.get("/block", headers={"X-Profile": "sampling"}).headers
+        response = client.get("/block", headers={"X-Profile": "sampling", "X-Admin-Token": "admin"})
+        assert response.status_code == 200
+
+    session = profiler.get(response.headers["x-profile-id"])
+    summary = session.summary()
+    assert summary["state"] == "finished" and summary["samples"] > 10
+    assert summary["loop_lag_ms"]["blocked"] >= 1 and summary["loop_lag_ms"]["max"] >= 100
+    blocked = [line for line in session.collapsed.splitlines() if "block_loop (" in line]
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in blocked) > 10
+
+    (tmp_path / "sampled.prof").write_bytes(session.pstats)
+    stats = pstats.Stats(str(tmp_path / "sampled.prof"))
+    (func,) = [func for func in stats.stats if func[2] == "block_loop"]
+    cc, nc, tt, ct, callers = stats.stats[func]
+    assert ct >= 0.1 and callers
+
+
+def test_samples_to_pstats_attributes_self_and_cumulative_time():
+    root, mid, leaf = ("a.py", 1, "root"), ("a.py", 5, "mid"), ("a.py", 9, "leaf")
+    stats = samples_to_pstats({(root, mid, leaf): 3, (root, mid): 1}, interval=0.01)
+    assert stats[leaf][:4] == (3, 3, 0.03, 0.03) and set(stats[leaf][4]) == {mid}
+    assert stats[mid][:4] == (4, 4, 0.01, 0.04)
+    assert stats[root][2:5] == (0.0, 0.04, {})
+    assert marshal.loads(marshal.dumps(stats)) == stats
@@ -77,11 +77,11 @@ def test_emergency_endpoint(process):
             timeout=15
         )
         
-        if response.status_code == 200:
+        if response.status_code == 202:
             data = response.json()
             print("✅ Emergency endpoint working")
-            print(f"   Call ID: {data.get('call_id', 'N/A')}")
-            print(f"   Emergency Phone: {data.get('emergency_phone', 'N/A')}")
+            print(f"   Incident ID: {data.get('incident_id', 'N/A')}")
+            print(f"   Status: {data.get('status_url', 'N/A')}")
             return True
         else:
             print(f"❌ Emergency endpoint failed with status {response.status_code}")
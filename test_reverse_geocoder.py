@@ -0,0 +1,97 @@
+import random
+import time
+
+from incident_clusters import distance_m
+from reverse_geocoder import ReverseGeocoder, build_index, place_label, read_places
+from gps_tracks import GpsTracks
+from ride_store import RideStore
+from script_templates import ScriptEngine
+
+
+def test_index_file_lookup_matches_brute_force(tmp_path):
+    rng = random.Random(25)
+    places = []
+    # Экватор, Кипр и север Норвегии: ширина ячейки в метрах меняется с широтой
+    for lat0 in (0.0, 35.18, 69.6):
+        places += [(lat0 + rng.uniform(-0.03, 0.03), 33.38 + rng.uniform(-0.03, 0.03), f"Street {lat0} {i}")
+                   for i in range(1500)]
+    path = tmp_path / "gazetteer.rgeo"
+    path.write_bytes(build_index(places))
+    geocoder = ReverseGeocoder.load(str(path), max_distance_m=2000)
+    assert len(geocoder) == 4500
+
+    for _ in range(1500):
+        lat = rng.choice((0.0, 35.18, 69.6)) + rng.uniform(-0.04, 0.04)
+        lng = 33.38 + rng.uniform(-0.04, 0.04)
+        index, distance = geocoder.nearest(lat, lng)
+        expected = min(distance_m(p_lat, p_lng, lat, lng) for p_lat, p_lng, _ in places)
+        assert abs(distance - expected) < 0.5
+    # Дальше max_distance_m адреса нет
+    assert geocoder.nearest(35.5, 33.38) is None and geocoder.describe(35.5, 33.38) is None
+    # У полюса обход колец ограничен, а не растёт до сотен колец
+    started = time.perf_counter()
+    assert geocoder.nearest(89.9, 10.0) is None
+    assert time.perf_counter() - started < 0.05
+    geocoder.close()
+
+
+def test_describe_formats_near_addresses_and_caches_hot_areas(tmp_path):
+    source = tmp_path / "gazetteer.csv"
+    source.write_text("lat,lng,name,street,housenumber,city\n"
+                      "35.18560,33.38230,,Makariou Avenue,12,Limassol\n"
+                      "35.19000,33.38230,Molos Park,,,Limassol\n")
+    assert place_label({"street": "Makariou Avenue", "housenumber": "12", "city": "Limassol"}) == \
+        "Makariou Avenue 12, Limassol"
+    assert len(list(read_places(str(source)))) == 2
+    geocoder = ReverseGeocoder.load(str(source), near_m=75)
+
+    assert geocoder.describe(35.18565, 33.38230) == "Makariou Avenue 12, Limassol"
+    # ~220 м от ближайшей точки
+    assert geocoder.describe(35.18760, 33.38230) == "near Makariou Avenue 12, Limassol"
+    assert geocoder.describe(35.18995, 33.38231) == "Molos Park, Limassol"
+    assert geocoder.misses == 3 and geocoder.hits == 0
+    # Та же клетка ~11 м - ответ из кеша
+    assert geocoder.describe(35.18566, 33.38232) == "Makariou Avenue 12, Limassol"
+    assert geocoder.hits == 1
+
+
+def test_rides_without_address_get_spoken_address(tmp_path):
+    source = tmp_path / "gazetteer.json"
+    source.write_text('{"places": [{"lat": 35.1856, "lng": 33.3823, "label": "Makariou Avenue 12, Limassol"}]}')
+
+    def ride(ride_id: str, lat: float, address: str = None) -> dict:
+        location = {"gps_lat": lat, "gps_lng": 33.3823}
+        if address:
+            location["address"] = address
+        return {
+            "passenger": {"name": "Passenger", "phone": "+10000000001"},
+            "driver": {"name": "Driver", "phone": "+10000000002", "license": "CY"},
+            "vehicle": {"make": "BMW", "model": "C5", "year": "2024", "plate": "GEO-1", "color": "Red"},
+            "location": location,
+            "ride_info": {"ride_id": ride_id},
+        }
+
+    store = RideStore()
+    store.ingest([ride("G-0", 35.1856)])
+    assert store.get("G-0").location["address"] == "GPS coordinates 35.18560, 33.38230"
+
+    store.geocoder = ReverseGeocoder.load(str(source))
+    store.ingest([ride("G-1", 35.1856), ride("G-2", 35.1856, "Paphos, ABC Office"), ride("G-3", 36.0)])
+    assert store.get("G-1").location["address"] == "Makariou Avenue 12, Limassol"
+    assert store.get("G-1").location["address_source"] == "gazetteer"
+    assert store.get("G-2").location["address"] == "Paphos, ABC Office"
+    assert store.get("G-3").location["address_source"] == "gps"
+
+    script = ScriptEngine().render(store.get("G-1"), "assault", now="12:00")
+    assert "Makariou Avenue 12, Limassol" in script
+
+    # Машина уехала от адреса поездки: сценарий называет адрес живой точки
+    engine = ScriptEngine()
+    engine.positions = GpsTracks()
+    engine.geocoder = store.geocoder
+    engine.positions.record("G-2", time.time(), 35.1857, 33.3823)
+    assert "- Address: Paphos, ABC Office" in engine.render(store.get("G-2"), "assault")
+    engine.positions.record("G-2", time.time(), 35.1880, 33.3823)
+    assert "- Address: near Makariou Avenue 12, Limassol" in engine.render(store.get("G-2"), "assault")
+    engine.positions.record("G-2", time.time(), 36.0, 33.3823)
+    assert "- Address: last known address Paphos, ABC Office" in engine.render(store.get("G-2"), "assault")
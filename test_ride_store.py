@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from ride_store import RideRecord, RideStore
+
+
+def make_ride(ride_id: str, plate: str = "ALEX777") -> dict:
+    return {
+        "passenger": {"name": "Passenger", "phone": "+10000000001"},
+        "driver": {"name": "Driver", "phone": "+10000000002", "license": "CY"},
+        "vehicle": {"make": "BMW", "model": "C5", "year": "2024", "plate": plate, "color": "Red"},
+        "location": {"gps_lat": 35.18, "gps_lng": 33.38, "address": "Paphos"},
+        "ride_info": {"ride_id": ride_id},
+    }
+
+
+def test_bulk_ingest_and_lookup():
+    store = RideStore()
+    assert store.ingest(make_ride(f"R-{i}") for i in range(1000)) == 1000
+
+    record = store.get("R-500")
+    assert record.ride_id == "R-500"
+    assert record["vehicle"]["plate"] == "ALEX777"
+    assert store.get("missing") is None
+    assert store.default_ride_id == "R-0"
+
+
+def test_upsert_bumps_version_and_remove_reuses_slot():
+    store = RideStore()
+    store.upsert(make_ride("A"))
+    assert store.upsert(make_ride("A", plate="NEW1")).version == 1
+    assert store.get("A")["vehicle"]["plate"] == "NEW1"
+
+    store.upsert(make_ride("B"))
+    assert store.remove("A")
+    store.upsert(make_ride("C"))
+    assert len(store) == 2
+    assert store.get("A") is None
+    assert store.get("C").ride_id == "C"
+
+
+def test_record_behaves_like_ride_dict():
+    record = RideRecord.from_dict(make_ride("X"))
+    assert record["location"]["address"] == "Paphos"
+    assert record.get("incident") is None
+    with pytest.raises(KeyError):
+        record["incident"]
+    assert not hasattr(record, "__dict__")
+
+
+def test_reload_when_file_changes(tmp_path):
+    path = tmp_path / "rides.json"
+    path.write_text(json.dumps(make_ride("R-1")))
+
+    store = RideStore()
+    assert store.load_file(str(path)) == 1
+    assert not store.reload_if_changed()
+
+    path.write_text(json.dumps({"rides": [make_ride("R-1"), make_ride("R-2")]}))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert store.reload_if_changed()
+    assert len(store) == 2
+    # Неизменившаяся поездка сохраняет версию, и кеш её сценария остаётся валидным
+    assert store.get("R-1").version == 0
+
+    path.write_text(json.dumps({"rides": [make_ride("R-1", plate="NEW1"), make_ride("R-2")]}))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000))
+    assert store.reload_if_changed()
+    assert store.get("R-1").version == 1 and store.get("R-2").version == 0
+
+
+def test_loads_repo_test_data():
+    store = RideStore()
+    store.load_file(os.path.join(os.path.dirname(__file__), "test_data.json"))
+    assert store.default_ride_id == "RG-2024-1215-001"
@@ -0,0 +1,47 @@
+import pytest
+
+from script_composer import ScriptRules, Segment, build_variants, by_priority, choose_variant, measure, spoken_words
+
+FIELDS = {"incident_text": "robbery", "location_address": "Main Street 5", "vehicle_plate": "XY"}
+SEGMENTS = (
+    Segment("intro", "Automated call from RideGuard. ", 0, ("disclosure",)),
+    Segment("filler", "Thank you for listening to this message from our safety team. ", 5),
+    Segment("plate", "Plate {vehicle_plate}. ", 2),
+    Segment("location", "Location {location_address}. ", 1),
+    Segment("incident", "Incident {incident_text}. ", 1),
+)
+RULES = ScriptRules(frozenset({"disclosure", "incident", "location", "plate"}), critical_seconds=12,
+                    disclosure_seconds=5)
+
+
+def test_spoken_words_and_timing():
+    # Цифры читаются по одной, знаки препинания не читаются
+    assert spoken_words("Call +357 99 - now") == 7
+    assert spoken_words("Plate ALEX777, GPS 35.18") == 10
+
+    timing = measure(SEGMENTS, FIELDS, wpm=60)
+    assert timing.words == 23 and timing.seconds == 23.0
+    assert timing.time_to("disclosure") == 4.0
+    assert timing.time_to("plate") == 17.0
+    assert timing.facts["location"] == (21.0,)
+    assert timing.time_to_critical == 23.0
+
+    ordered = by_priority(SEGMENTS)
+    assert [segment.name for segment in ordered] == ["intro", "location", "incident", "plate", "filler"]
+    assert measure(ordered, FIELDS, wpm=60).time_to_critical == 12.0
+
+
+def test_shortest_compliant_variant_wins():
+    short = tuple(segment for segment in SEGMENTS if segment.name != "filler")
+    variants = {variant.name: variant for variant in
+                build_variants({"full": SEGMENTS, "short": short}, FIELDS, RULES, wpm=60)}
+    assert set(variants) == {"full", "full-by-priority", "short", "short-by-priority"}
+    assert variants["full"].violations == ("incident at 23.0s > 12s", "location at 21.0s > 12s",
+                                           "plate at 17.0s > 12s")
+    # Порядок по приоритету исправляет полный вариант, но короткий всё равно быстрее
+    assert variants["full-by-priority"].compliant
+    chosen = choose_variant(variants.values())
+    assert chosen.name.startswith("short") and chosen.timing.seconds == 12.0
+
+    with pytest.raises(ValueError):
+        choose_variant(build_variants({"full": SEGMENTS}, FIELDS, RULES._replace(critical_seconds=1), wpm=60))
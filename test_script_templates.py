@@ -0,0 +1,94 @@
+import os
+from unittest import mock
+
+import pytest
+
+from benchmarks.bench_script_templates import legacy_create_emergency_script
+from ride_store import RideStore
+from script_templates import BLAND_EN, TEMPLATES, ScriptEngine, script_variants
+
+FIXED_TIME = "13:30 "
+
+
+def load_ride():
+    store = RideStore()
+    store.load_file(os.path.join(os.path.dirname(__file__), "test_data.json"))
+    return store, store.get(store.default_ride_id)
+
+
+def test_legacy_bland_variant_matches_legacy_output():
+    _, record = load_ride()
+    engine = ScriptEngine({("bland", "en"): BLAND_EN})
+    with mock.patch("benchmarks.bench_script_templates.datetime") as fake_datetime:
+        fake_datetime.now.return_value.strftime.return_value = FIXED_TIME
+        expected = legacy_create_emergency_script(record.to_dict(), "taxi_service_emergency")
+
+    assert engine.render(record, "taxi_service_emergency", now=FIXED_TIME) == expected
+    assert engine.render(record.to_dict(), "taxi_service_emergency", now=FIXED_TIME) == expected
+
+
+def test_twilio_script_fills_all_fields():
+    _, record = load_ride()
+    script = ScriptEngine().render(record, "medical_emergency", provider="twilio")
+    assert script.startswith("Automated emergency call from RideGuard.")
+    assert "Emergency: medical emergency." in script
+    assert script.count("Paphos, ABC Office") == 2
+    assert "{" not in script
+
+
+def test_ride_cache_invalidated_by_new_version():
+    store, record = load_ride()
+    engine = ScriptEngine()
+    assert "ALEX777" in engine.render(record, "medical_emergency")
+
+    data = record.to_dict()
+    data["vehicle"] = dict(data["vehicle"], plate="NEW777")
+    updated = store.upsert(data)
+    script = engine.render(updated, "medical_emergency")
+    assert "NEW777" in script and "ALEX777" not in script
+
+
+def test_batch_render_and_unknown_language():
+    store, record = load_ride()
+    engine = ScriptEngine()
+    scripts = engine.render_batch([(record, "medical_emergency"), (record, "robbery")])
+    assert "Medical Emergency" in scripts[0]
+    assert "Robbery" in scripts[1]
+
+    assert not engine.supports("bland", "xx")
+    with pytest.raises(ValueError):
+        engine.render(record, "medical_emergency", language="xx")
+
+
+def test_severity_label_follows_the_incident():
+    _, record = load_ride()
+    engine = ScriptEngine()
+    assert "Severity: CRITICAL - LIFE-THREATENING" in engine.render(record, "assault", severity="critical")
+    assert "Severity: LOW PRIORITY" in engine.render(record, "assault", severity="low")
+    assert "Severity: HIGH PRIORITY" in engine.render(record, "assault", severity="unknown")
+    scripts = engine.render_batch([(record, "assault", "medium"), (record, "assault")])
+    assert "MEDIUM PRIORITY" in scripts[0] and "HIGH PRIORITY" in scripts[1]
+
+
+def test_critical_facts_are_spoken_first():
+    _, record = load_ride()
+    for provider in ("bland", "twilio"):
+        variants = {variant.name: variant for variant in script_variants(provider, "en")}
+        chosen = min((v for v in variants.values() if v.compliant), key=lambda v: v.timing.seconds)
+        assert TEMPLATES[(provider, "en")] == chosen.source
+        # Прежний сценарий не проходит правила: адрес или представление звучат слишком поздно
+        assert not variants["legacy"].compliant
+        assert chosen.timing.time_to_critical < variants["legacy"].timing.time_to_critical
+        assert chosen.timing.time_to_critical <= 20
+
+    script = ScriptEngine().render(record, "assault")
+    assert script.index("Paphos, ABC Office") < script.index("ALEX777") < script.index("Roman Zhuchkov")
+
+
+def test_compiled_templates_are_bounded_for_arbitrary_incident_types():
+    _, record = load_ride()
+    engine = ScriptEngine(compiled_size=8)
+    for i in range(100):
+        engine.render(record, f"client_type_{i}")
+    assert len(engine._compiled) == 8
+    assert "Client Type 99" in engine.render(record, "client_type_99")
@@ -0,0 +1,112 @@
+import pytest
+
+from sos_dedup import SOSDeduplicator
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_repeat_press_returns_existing_incident_until_ttl():
+    clock = Clock()
+    dedup = SOSDeduplicator(ttl=60, clock=clock)
+    key = dedup.key("R-1", "+100", "assault")
+
+    assert dedup.lookup(key) is None
+    dedup.remember(key, "inc-1", "high")
+    dedup.record_call(key, "inc-1", "call-1")
+
+    clock.now = 59
+    entry = dedup.lookup(key)
+    assert (entry.incident_id, entry.call_id, entry.presses) == ("inc-1", "call-1", 2)
+
+    clock.now = 61
+    assert dedup.lookup(key) is None
+    assert len(dedup) == 0
+
+
+def test_escalation_and_other_incident_types():
+    dedup = SOSDeduplicator()
+    key = dedup.key("R-1", "+100", "assault")
+    entry = dedup.remember(key, "inc-1", "medium")
+
+    assert not dedup.escalates(entry, "low")
+    assert not dedup.escalates(entry, "medium")
+    assert dedup.escalates(entry, "critical")
+
+    dedup.remember(key, "inc-2", "critical")
+    assert dedup.lookup(key).incident_id == "inc-2"
+    # Устаревший инцидент не перезаписывает call_id нового
+    dedup.record_call(key, "inc-1", "stale")
+    assert dedup.lookup(key).call_id is None
+
+    assert dedup.lookup(dedup.key("R-1", "+100", "medical_emergency")) is None
+
+
+def test_memory_bounded_by_eviction():
+    clock = Clock()
+    dedup = SOSDeduplicator(ttl=10, max_entries=100, clock=clock)
+    for i in range(1000):
+        dedup.remember(dedup.key(f"R-{i}", "+1", "assault"), f"inc-{i}", "high")
+    assert len(dedup) == 100
+    assert dedup.lookup(dedup.key("R-0", "+1", "assault")) is None
+    assert dedup.lookup(dedup.key("R-999", "+1", "assault")).incident_id == "inc-999"
+
+    clock.now = 11
+    dedup.remember(dedup.key("R-new", "+1", "assault"), "inc-new", "high")
+    assert len(dedup) == 1
+
+
+def test_forget_only_matching_incident():
+    dedup = SOSDeduplicator()
+    key = dedup.key("R-1", "+100", "assault")
+    dedup.remember(key, "inc-2", "high")
+    dedup.forget(key, "inc-1")
+    assert dedup.lookup(key) is not None
+    dedup.forget(key, "inc-2")
+    assert dedup.lookup(key) is None
+
+
+# Без кластеров тяжесть поднимается в запросе из очереди, с кластером - у его участника
+@pytest.mark.parametrize("radius_m", [0, 300])
+def test_escalation_of_queued_sos_places_one_call(monkeypatch, tmp_path, radius_m):
+    import asyncio
+
+    from fastapi.testclient import TestClient
+
+    import main
+    from admission import AdmissionControl
+    from incident_clusters import IncidentClusters
+
+    monkeypatch.setenv("EMERGENCY_PHONE", "+10000000000")
+    monkeypatch.setattr(main, "admission", AdmissionControl(str(tmp_path / "state.db")))
+    monkeypatch.setattr(main, "incident_queue", main.IncidentQueue(str(tmp_path / "incidents.db")))
+    monkeypatch.setattr(main, "incident_clusters", IncidentClusters(radius_m=radius_m, window=300))
+    monkeypatch.setattr(main, "sos_dedup", SOSDeduplicator(ttl=60))
+    main.ride_store.load_file("test_data.json")
+    client = TestClient(main.app)
+
+    first = client.post("/api/emergency", json={"incident_type": "assault", "severity": "low"}).json()
+    escalated = client.post("/api/emergency", json={"incident_type": "assault", "severity": "critical"}).json()
+    # Звонок ещё в очереди: тяжесть поднимается у него, второй инцидент не создаётся
+    assert escalated["incident_id"] == first["incident_id"] and escalated["escalated"]
+    assert asyncio.run(main.incident_queue.counts()).get("queued") == 1
+
+    scripts = []
+
+    async def fake_bland_call(phone_number, emergency_script, language="en", webhook=None):
+        scripts.append(emergency_script)
+        return {"call_id": "call-1"}
+
+    monkeypatch.setattr(main, "initiate_bland_call", fake_bland_call)
+
+    async def drain():
+        while (claimed := await main.incident_queue.claim()) is not None:
+            await main.process_incident(claimed[0], claimed[1])
+
+    asyncio.run(drain())
+    assert len(scripts) == 1 and "CRITICAL" in scripts[0]
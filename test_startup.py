@@ -0,0 +1,56 @@
+import asyncio
+
+import httpx
+
+import main
+from benchmarks.fake_providers import BackgroundServer, create_fake_bland_app
+from config import Config
+from metrics import STAGE_LATENCY
+
+
+def test_lifespan_warms_up_and_reports_ready(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, "BLAND_API_KEY", "test-key")
+    monkeypatch.setattr(Config, "EMERGENCY_PHONE", "+10000000000")
+    monkeypatch.setattr(Config, "PROVIDER_WARM_CONNECTIONS", 1)
+    monkeypatch.setattr(main, "incident_queue", main.IncidentQueue(str(tmp_path / "incidents.db")))
+    monkeypatch.setattr(main, "audit_log", main.AuditLog(str(tmp_path / "audit")))
+    monkeypatch.setattr(main, "call_recordings", main.RecordingFetcher(str(tmp_path / "recordings")))
+
+    async def scenario(fake_url: str):
+        monkeypatch.setattr(main.bland_client, "base_url", fake_url)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://rideguard") as client:
+            assert (await client.get("/api/ready")).status_code == 503
+            async with main.app.router.lifespan_context(main.app):
+                response = await client.get("/api/ready")
+                assert response.status_code == 200
+                state = response.json()
+                assert state["providers"] == {"bland": True}
+                assert state["rides"] >= 1 and state["templates"] >= 3
+
+                # Первый звонок идёт по уже открытому соединению
+                connects = STAGE_LATENCY.count("provider_connect", "bland")
+                await main.bland_client.post_json("/v1/calls", {"phone_number": "+10000000000"})
+                assert STAGE_LATENCY.count("provider_connect", "bland") == connects
+            assert (await client.get("/api/ready")).status_code == 503
+
+    with BackgroundServer(create_fake_bland_app(latency=0.01)) as fake_bland:
+        asyncio.run(scenario(fake_bland.url))
+
+
+def test_invalid_config_keeps_service_not_ready(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, "BLAND_API_KEY", "")
+    monkeypatch.setattr(Config, "PROVIDER_WARMUP", False)
+    monkeypatch.setattr(main, "incident_queue", main.IncidentQueue(str(tmp_path / "incidents.db")))
+    monkeypatch.setattr(main, "audit_log", main.AuditLog(str(tmp_path / "audit")))
+    monkeypatch.setattr(main, "call_recordings", main.RecordingFetcher(str(tmp_path / "recordings")))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with main.app.router.lifespan_context(main.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://rideguard") as client:
+                response = await client.get("/api/ready")
+        assert response.status_code == 503
+        assert "BLAND_API_KEY" in response.json()["config_error"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+import gzip
+
+from fastapi.testclient import TestClient
+
+import main
+from static_assets import Asset, AssetStore
+
+HTML = b"<html><body>" + b"<button>SOS</button>" * 100 + b"</body></html>"
+
+
+def test_encoding_follows_accept_encoding():
+    asset = Asset("demo.html", HTML)
+    assert asset.select_encoding("") == "identity"
+    assert asset.select_encoding("gzip, deflate") == "gzip"
+    assert asset.select_encoding("gzip;q=0, identity") == "identity"
+    assert asset.select_encoding("*") == "gzip"
+    assert asset.select_encoding("br;q=1.0, *;q=0") == ("br" if "br" in asset.bodies else "identity")
+
+    status, body, headers = asset.respond("gzip")
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == HTML
+
+    # Несжимаемые и маленькие файлы хранятся только как есть
+    assert list(Asset("logo.png", b"\x89PNG" * 200).bodies) == ["identity"]
+    assert list(Asset("tiny.css", b"a{}").bodies) == ["identity"]
+
+
+def test_etag_revalidation_and_hashed_urls(tmp_path):
+    (tmp_path / "demo.html").write_bytes(HTML)
+    (tmp_path / "js").mkdir()
+    (tmp_path / "js" / "app.js").write_bytes(b"console.log('sos');")
+    store = AssetStore(str(tmp_path))
+    assert store.load() == 2
+
+    manifest = store.manifest()
+    asset, immutable = store.get(manifest["demo.html"].rsplit("/", 1)[1])
+    assert immutable and asset.name == "demo.html"
+    assert store.get("js/app.js")[1] is False
+    assert store.get("missing.css") is None
+
+    _, _, headers = asset.respond("gzip")
+    # ETag сжатой версии подходит и для несжатой: содержимое одно
+    assert asset.respond("", headers["ETag"])[0] == 304
+    assert asset.respond("gzip", 'W/"0000", ' + headers["ETag"])[:2] == (304, b"")
+    assert asset.respond("gzip", '"0000"')[0] == 200
+
+
+def test_sos_page_is_served_compressed_with_validators():
+    client = TestClient(main.app)
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.num_bytes_downloaded < len(response.content) / 2
+
+    revalidated = client.get("/", headers={"If-None-Match": response.headers["etag"]})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+
+    hashed_url = client.get("/api/assets").json()["demo.html"]
+    cached = client.get(hashed_url)
+    assert cached.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert cached.content == response.content
+    assert client.get("/static/../main.py").status_code == 404
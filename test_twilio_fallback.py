@@ -0,0 +1,71 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+import twilio_fallback
+from benchmarks.fake_providers import BackgroundServer, create_fake_twilio_app
+from config import Config
+
+
+def test_import_does_not_load_twilio_sdk():
+    code = "import sys, twilio_fallback; print('twilio' in sys.modules)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=twilio_fallback.__file__.rsplit("/", 1)[0])
+    assert output.strip() == b"False"
+
+
+def test_cached_twiml_matches_sdk_document():
+    from twilio.twiml.voice_response import VoiceResponse
+
+    script = "Passenger <Roman> & driver \"Alexey\" at Paphos"
+    expected = VoiceResponse()
+    expected.say(script, voice='alice', language='en-US')
+    expected.pause(length=2)
+    expected.say("Press 1 to repeat this message, or stay on the line for emergency services.",
+                 voice='alice', language='en-US')
+    expected.gather(action='/api/twilio/gather', method='POST', num_digits=1, timeout=10)
+    expected.say("Thank you. This emergency call has been logged. Emergency services have been notified.",
+                 voice='alice', language='en-US')
+    expected.hangup()
+
+    assert twilio_fallback.create_twiml_emergency_call(script) == str(expected)
+
+
+@pytest.fixture
+def fake_twilio(monkeypatch):
+    app = create_fake_twilio_app(latency=0.05)
+    with BackgroundServer(app) as server:
+        monkeypatch.setattr(Config, "TWILIO_ACCOUNT_SID", "ACtest")
+        monkeypatch.setattr(Config, "TWILIO_AUTH_TOKEN", "token")
+        monkeypatch.setattr(Config, "TWILIO_PHONE", "+10000000001")
+        monkeypatch.setattr(Config, "TWILIO_API_URL", server.url)
+        monkeypatch.setattr(twilio_fallback, "_client", None)
+        yield app
+        twilio_fallback._client = None
+
+
+def test_calls_share_one_client_and_run_off_loop(fake_twilio):
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(
+            twilio_fallback.initiate_twilio_emergency_call_async("+10000000000", "script") for _ in range(4)
+        ))
+        ticking.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(scenario())
+    assert all(result["success"] and result["call_id"].startswith("CAfake") for result in results)
+    assert fake_twilio.state.calls == 4
+    # Event loop продолжал работать, пока SDK ждал ответа
+    assert ticks >= 5
+    client = twilio_fallback.get_twilio_client()
+    assert twilio_fallback.get_twilio_client() is client
@@ -1,58 +1,143 @@
-from twilio.rest import Client
-from twilio.twiml import VoiceResponse
-import config
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from xml.sax.saxutils import escape
+from config import Config
+from script_templates import script_engine
+
+# SDK Twilio импортируется только при первом звонке через Twilio,
+# чтобы не замедлять старт сервиса, когда резервный провайдер не нужен
+_client = None
+_client_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_twiml_shell: Optional[Tuple[str, str]] = None
+
+SCRIPT_MARKER = "__RIDEGUARD_EMERGENCY_SCRIPT__"
+
+def _build_twiml_shell() -> Tuple[str, str]:
+    from twilio.twiml.voice_response import VoiceResponse
 
-def create_twiml_emergency_call(emergency_script: str) -> str:
     response = VoiceResponse()
-    
+
     response.say(
-        emergency_script,
+        SCRIPT_MARKER,
         voice='alice',
         language='en-US'
     )
-    
+
     response.pause(length=2)
-    
+
     response.say(
         "Press 1 to repeat this message, or stay on the line for emergency services.",
         voice='alice',
         language='en-US'
     )
-    
+
     gather = response.gather(
         action='/api/twilio/gather',
         method='POST',
         num_digits=1,
         timeout=10
     )
-    
+
     response.say(
         "Thank you. This emergency call has been logged. Emergency services have been notified.",
         voice='alice',
         language='en-US'
     )
-    
+
+    response.hangup()
+
+    head, tail = str(response).split(SCRIPT_MARKER)
+    return head, tail
+
+def create_twiml_emergency_call(emergency_script: str) -> str:
+    global _twiml_shell
+    # Статичная часть TwiML строится один раз, подставляется только текст сценария
+    if _twiml_shell is None:
+        _twiml_shell = _build_twiml_shell()
+    head, tail = _twiml_shell
+    return head + escape(emergency_script) + tail
+
+def create_twiml_goodbye() -> str:
+    from twilio.twiml.voice_response import VoiceResponse
+
+    response = VoiceResponse()
+    response.say(
+        "Thank you. Emergency services have been notified.",
+        voice='alice',
+        language='en-US'
+    )
     response.hangup()
-    
     return str(response)
 
-def initiate_twilio_emergency_call(phone_number: str, emergency_script: str) -> dict:
-    if not all([config.TWILIO_ACCOUNT_SID, config.TWILIO_AUTH_TOKEN, config.TWILIO_PHONE]):
+def validate_twilio_signature(url: str, params: dict, signature: str) -> bool:
+    from twilio.request_validator import RequestValidator
+
+    return RequestValidator(Config.TWILIO_AUTH_TOKEN).validate(url, params, signature)
+
+def get_twilio_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from twilio.http.http_client import TwilioHttpClient
+                from twilio.rest import Client
+
+                # Один клиент на процесс: requests.Session внутри держит keep-alive пул
+                http_client = TwilioHttpClient(pool_connections=True, timeout=Config.TWILIO_HTTP_TIMEOUT)
+                client = Client(Config.TWILIO_ACCOUNT_SID, Config.TWILIO_AUTH_TOKEN, http_client=http_client)
+                client.api.base_url = Config.TWILIO_API_URL
+                _client = client
+    return _client
+
+def warm_twilio_client() -> bool:
+    # Импорт SDK, сборка TwiML и TLS-соединение к API - всё, что иначе досталось бы первому звонку
+    client = get_twilio_client()
+    create_twiml_emergency_call("")
+    session = client.http_client.session
+    if session is None:
+        return False
+    session.head(Config.TWILIO_API_URL, timeout=Config.TWILIO_HTTP_TIMEOUT)
+    return True
+
+def get_twilio_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=Config.TWILIO_MAX_WORKERS, thread_name_prefix="twilio")
+    return _executor
+
+def initiate_twilio_emergency_call(phone_number: str, emergency_script: str,
+                                   status_callback: Optional[str] = None) -> dict:
+    if not Config.twilio_configured():
         raise Exception("Twilio credentials not properly configured")
-    
+
     try:
-        client = Client(config.TWILIO_ACCOUNT_SID, config.TWILIO_AUTH_TOKEN)
-        
+        client = get_twilio_client()
+
         twiml = create_twiml_emergency_call(emergency_script)
-        
+
+        options = {}
+        if status_callback:
+            options = {
+                "status_callback": status_callback,
+                "status_callback_event": ["initiated", "ringing", "answered", "completed"],
+                "status_callback_method": "POST",
+                # Готовая запись приходит отдельным событием на тот же вебхук
+                "recording_status_callback": status_callback,
+                "recording_status_callback_event": ["completed"],
+            }
+
         call = client.calls.create(
             twiml=twiml,
             to=phone_number,
-            from_=config.TWILIO_PHONE,
+            from_=Config.TWILIO_PHONE,
             record=True,
-            timeout=30
+            timeout=30,
+            **options
         )
-        
+
         return {
             "success": True,
             "call_id": call.sid,
@@ -60,45 +145,28 @@ def initiate_twilio_emergency_call(phone_number: str, emergency_script: str) ->
             "provider": "twilio",
             "message": "Emergency call initiated via Twilio"
         }
-        
+
     except Exception as e:
         raise Exception(f"Twilio emergency call failed: {str(e)}")
 
-def create_emergency_voice_message(data: dict, incident_type: str = "medical_emergency") -> str:
-    passenger = data["passenger"]
-    driver = data["driver"]
-    vehicle = data["vehicle"]
-    location = data["location"]
-    
-    simplified_script = f"""
-    Emergency Alert from RideGuard Safety System.
-    
-    This is a {incident_type.replace('_', ' ')} emergency.
-    
-    Passenger {passenger['name']} requires immediate assistance.
-    
-    Location: {location['address']}.
-    
-    Vehicle: {vehicle['color']} {vehicle['make']} {vehicle['model']}, license plate {vehicle['plate']}.
-    
-    Driver: {driver['name']}, phone {driver['phone']}.
-    
-    Passenger phone: {passenger['phone']}.
-    
-    Please dispatch emergency services immediately.
-    
-    Repeating location: {location['address']}.
-    
-    This is an automated emergency call from RideGuard.
-    """
-    
-    return simplified_script.strip()
-
-async def twilio_emergency_fallback(phone_number: str, data: dict, incident_type: str = "medical_emergency") -> dict:
-    emergency_message = create_emergency_voice_message(data, incident_type)
-    
+async def initiate_twilio_emergency_call_async(phone_number: str, emergency_script: str,
+                                               status_callback: Optional[str] = None) -> dict:
+    # SDK Twilio синхронный - выполняем в ограниченном пуле потоков, а не в event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_twilio_executor(), initiate_twilio_emergency_call,
+                                      phone_number, emergency_script, status_callback)
+
+def create_emergency_voice_message(data: dict, incident_type: str = "medical_emergency", language: str = "en") -> str:
+    return script_engine.render(data, incident_type, provider="twilio", language=language)
+
+async def twilio_emergency_fallback(phone_number: str, data: dict, incident_type: str = "medical_emergency", language: str = "en",
+                                    status_callback: Optional[str] = None,
+                                    emergency_script: Optional[str] = None) -> dict:
+    # Готовый сценарий (сводный по кластеру) озвучивается как есть
+    emergency_message = emergency_script or create_emergency_voice_message(data, incident_type, language)
+
     try:
-        result = initiate_twilio_emergency_call(phone_number, emergency_message)
+        result = await initiate_twilio_emergency_call_async(phone_number, emergency_message, status_callback)
         return result
     except Exception as e:
         return {
@@ -106,4 +174,4 @@ async def twilio_emergency_fallback(phone_number: str, data: dict, incident_type
             "error": str(e),
             "provider": "twilio",
             "message": "Twilio fallback call failed"
-        }
\ No newline at end of file
+        }